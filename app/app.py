@@ -1,7 +1,7 @@
 # Name: app.py
-# Version: 0.1.74
+# Version: 0.1.76
 # Created: 971201
-# Modified: 250703
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin & AI Assistant
 # Description: Python script for ParcoRTLS backend - Updated to use centralized configuration
@@ -11,6 +11,8 @@
 # Dependent: TRUE
 
 # /home/parcoadmin/parco_fastapi/app/app.py
+# Version: 0.1.76 - Expose pagination headers (X-Next-Cursor, X-Page-Size) through CORS, bumped from 0.1.75
+# Version: 0.1.75 - Flush the shared event_log writer on shutdown, bumped from 0.1.74
 # Version: 0.1.74 - Updated to use centralized configuration instead of hardcoded IP addresses, bumped from 0.1.73
 # Version: 0.1.73 - create zone types and device types in TETSE to store and retrieve virtual data
 # Version: 0.1.70 - Added in tetse_zone for the Rule Buider
@@ -62,6 +64,8 @@ from routes.zoneviewer_routes import router as zoneviewer_router
 from routes import maps, maps_upload
 from routes.components import router as components_router
 from routes.event import router as event_router
+from routes.pagination import NEXT_CURSOR_HEADER, PAGE_SIZE_HEADER
+from manager.event_writer import get_event_log_writer
 from manager.websocket_control import app as control_app
 from manager.websocket_realtime import app as realtime_app
 from routes.websocket_event import router as websocket_event_router
@@ -138,6 +142,7 @@ async def lifespan(app: FastAPI):
     yield  # Application runs here
     
     # Shutdown logic
+    await get_event_log_writer().stop()
     logger.info("Closing async database connections...")
     if hasattr(app.state, "async_db_pools"):
         for db_type, pool in app.state.async_db_pools.items():
@@ -208,6 +213,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, PAGE_SIZE_HEADER],
 )
 
 # Include routers for HTTP routes
@@ -1,7 +1,7 @@
 # Name: db.py
-# Version: 0.1.1
+# Version: 0.1.3
 # Created: 971201
-# Modified: 250718
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin + Claude
 # Description: Python script for ParcoRTLS backend - Fixed usp_region_add type casting
@@ -11,17 +11,46 @@
 # Dependent: TRUE
 
 # /home/parcoadmin/parco_fastapi/app/database/db.py
+# Version: 0.1.3 - call_stored_procedure runs once with cached pg_proc signatures and stable SQL for asyncpg's per-connection prepared statement cache, debug previews built only when DEBUG is enabled, bumped from 0.1.2
+# Version: 0.1.2 - Added notify_channel helper for PostgreSQL NOTIFY, bumped from 0.1.1
 # Version: 0.1.1 - Fixed usp_region_add type casting for zone 451/425 trigger creation
 # Version: 0.1.7 - Fixed circular import by moving app import inside functions
 import asyncpg
 import asyncio
 from fastapi import HTTPException
 import logging
-from typing import Any, Optional, List, Dict, Union
+from typing import Any, Optional, List, Dict, Tuple, Union
 from config import DB_CONFIGS_ASYNC
 
 logger = logging.getLogger(__name__)
 
+# Signatures that never come from pg_proc
+PINNED_PROCEDURE_SIGNATURES: Dict[str, Tuple[str, ...]] = {
+    # usp_region_add(p_i_rgn integer, p_i_zn integer, p_x_nm_rgn character varying,
+    #                p_n_max_x real, p_n_max_y real, p_n_max_z real,
+    #                p_n_min_x real, p_n_min_y real, p_n_min_z real, p_i_trg integer)
+    # Zone 451/425 trigger creation needs these exact casts
+    "usp_region_add": ("integer", "integer", "character varying",
+                       "real", "real", "real",
+                       "real", "real", "real", "integer"),
+}
+
+# (db_type, procedure, arg count) -> argument types used to cast the parameters,
+# read once from pg_proc. None means no unambiguous signature was found and the
+# call falls back to uncast placeholders.
+_procedure_signatures: Dict[Tuple[str, str, int], Optional[Tuple[str, ...]]] = {}
+
+# (db_type, procedure, arg count) -> SQL text. Identical text lets asyncpg reuse
+# the prepared statement it keeps per connection instead of re-parsing the call.
+_procedure_sql: Dict[Tuple[str, str, int], str] = {}
+
+PROCEDURE_SIGNATURE_QUERY = """
+    SELECT p.pronargs, p.pronargdefaults, p.provariadic <> 0 AS variadic,
+           p.proargtypes::regtype[]::text[] AS arg_types
+    FROM pg_proc p
+    WHERE p.proname = $1 AND pg_function_is_visible(p.oid)
+"""
+
 class DatabaseError(Exception):
     def __init__(self, message: str, status_code: int = 500):
         self.message = message
@@ -72,8 +101,7 @@ async def get_async_db_pool(db_type: str = "maint") -> Optional[asyncpg.Pool]:
                 raise HTTPException(status_code=503, detail=f"Unexpected error connecting to {db_type}: {str(e)}")
     raise HTTPException(status_code=503, detail=f"Failed to connect to {db_type}")
 
-async def call_stored_procedure(db_type: str, procedure_name: str, *args, pool: Optional[asyncpg.Pool] = None) -> Union[List[Dict[str, Any]], Any]:
-    """Call a stored procedure and return its results, with fallback for missing procedures."""
+async def _resolve_pool(db_type: str, pool: Optional[asyncpg.Pool]) -> asyncpg.Pool:
     if pool is None:
         from app import app  # Moved import inside function to avoid circular import
         pool = app.state.async_db_pools.get(db_type)
@@ -83,37 +111,82 @@ async def call_stored_procedure(db_type: str, procedure_name: str, *args, pool:
             if not pool:
                 raise HTTPException(status_code=503, detail=f"Database {db_type} is unavailable")
             app.state.async_db_pools[db_type] = pool
+    return pool
+
+async def _load_signature(connection, procedure_name: str, nargs: int) -> Optional[Tuple[str, ...]]:
+    """Read the argument types of the single visible overload that accepts nargs arguments."""
+    if "." in procedure_name or not procedure_name.isidentifier():
+        return None
+    try:
+        rows = await connection.fetch(PROCEDURE_SIGNATURE_QUERY, procedure_name.lower())
+    except asyncpg.PostgresError as e:
+        logger.warning(f"Could not read signature of {procedure_name}: {str(e)}")
+        return None
+    matches = [
+        row for row in rows
+        if not row["variadic"] and row["pronargs"] - row["pronargdefaults"] <= nargs <= row["pronargs"]
+    ]
+    if len(matches) != 1:
+        # Missing or overloaded: let PostgreSQL resolve the call as before
+        return None
+    arg_types = tuple(matches[0]["arg_types"][:nargs])
+    if any(arg_type.startswith("any") or arg_type in ("record", "cstring", "internal") for arg_type in arg_types):
+        # Polymorphic and pseudo types cannot be used as casts
+        return None
+    return arg_types
+
+async def _procedure_query(connection, db_type: str, procedure_name: str, nargs: int) -> str:
+    key = (db_type, procedure_name, nargs)
+    query = _procedure_sql.get(key)
+    if query is not None:
+        return query
+
+    signature = PINNED_PROCEDURE_SIGNATURES.get(procedure_name)
+    if signature is not None and len(signature) != nargs:
+        signature = None
+    if signature is None and nargs:
+        if key not in _procedure_signatures:
+            _procedure_signatures[key] = await _load_signature(connection, procedure_name, nargs)
+        signature = _procedure_signatures[key]
+
+    if signature:
+        placeholders = ", ".join(f"${i + 1}::{arg_type}" for i, arg_type in enumerate(signature))
+    else:
+        placeholders = ", ".join(f"${i + 1}" for i in range(nargs))
+    query = f"SELECT * FROM {procedure_name}({placeholders})"
+    _procedure_sql[key] = query
+    return query
+
+def clear_procedure_cache(procedure_name: Optional[str] = None):
+    """Forget cached signatures and SQL, for one procedure or all of them."""
+    for cache in (_procedure_sql, _procedure_signatures):
+        for key in list(cache):
+            if procedure_name is None or key[1] == procedure_name:
+                del cache[key]
+
+async def call_stored_procedure(db_type: str, procedure_name: str, *args, pool: Optional[asyncpg.Pool] = None) -> Union[List[Dict[str, Any]], Any]:
+    """
+    Call a stored procedure and return its results, with fallback for missing procedures.
+
+    The procedure runs exactly once: rows come back as a list of dicts, and a call
+    that returns no rows yields the success message.
+    """
+    pool = await _resolve_pool(db_type, pool)
 
     async with pool.acquire() as connection:
         try:
-            # FIXED: Special handling for usp_region_add with explicit type casting
-            if procedure_name == "usp_region_add":
-                # usp_region_add(p_i_rgn integer, p_i_zn integer, p_x_nm_rgn character varying, 
-                #                p_n_max_x real, p_n_max_y real, p_n_max_z real, 
-                #                p_n_min_x real, p_n_min_y real, p_n_min_z real, p_i_trg integer)
-                query = """
-                    SELECT * FROM usp_region_add(
-                        $1::integer, $2::integer, $3::character varying, 
-                        $4::real, $5::real, $6::real, 
-                        $7::real, $8::real, $9::real, $10::integer
-                    )
-                """
-                logger.debug(f"Executing usp_region_add with explicit type casting: {query} with args: {args}")
-            else:
-                # Default behavior for other functions
-                placeholders = ", ".join([f"${i+1}" for i in range(len(args))])
-                query = f"SELECT * FROM {procedure_name}({placeholders})"
+            query = await _procedure_query(connection, db_type, procedure_name, len(args))
+            if logger.isEnabledFor(logging.DEBUG):
                 logger.debug(f"Executing query: {query} with args: {args}")
-            
+
             rows = await connection.fetch(query, *args)
-            logger.debug(f"Query result: {rows}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Query result: {rows}")
             if rows:
                 return [dict(row) for row in rows]
-            value = await connection.fetchval(query, *args)
-            if value is not None:
-                return value
             return {"message": f"Procedure {procedure_name} executed successfully"}
         except asyncpg.UndefinedFunctionError as e:
+            clear_procedure_cache(procedure_name)
             error_msg = f"Stored procedure {procedure_name} does not exist in {db_type}: {str(e)}"
             logger.warning(error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
@@ -130,33 +203,30 @@ async def execute_raw_query(db_type: str, query: str, *args, pool: Optional[asyn
     """
     Execute a raw SQL query and return the results.
     Logs are now sanitized to avoid logging binary (bytea) fields.
+    The sanitized preview is only built when DEBUG logging is enabled.
     """
-    if pool is None:
-        from app import app  # Moved import inside function to avoid circular import
-        pool = app.state.async_db_pools.get(db_type)
-        if not pool:
-            logger.warning(f"No connection pool available for {db_type}. Attempting to create one.")
-            pool = await get_async_db_pool(db_type)
-            if not pool:
-                raise HTTPException(status_code=503, detail=f"Database {db_type} is unavailable")
-            app.state.async_db_pools[db_type] = pool
+    pool = await _resolve_pool(db_type, pool)
 
     async with pool.acquire() as connection:
         try:
-            logger.debug(f"Executing raw query: {query} with args: {args}")
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug(f"Executing raw query: {query} with args: {args}")
             rows = await connection.fetch(query, *args)
+            results = [dict(row) for row in rows]
 
-            # 🔐 Sanitize binary results before logging
-            def sanitize(row):
-                return {
-                    k: (f"<{len(v)} bytes>" if isinstance(v, (bytes, bytearray)) else v)
-                    for k, v in dict(row).items()
-                }
+            if debug:
+                # 🔐 Sanitize binary results before logging
+                def sanitize(row):
+                    return {
+                        k: (f"<{len(v)} bytes>" if isinstance(v, (bytes, bytearray)) else v)
+                        for k, v in row.items()
+                    }
 
-            safe_preview = [sanitize(row) for row in rows]
-            logger.debug(f"Raw query result (sanitized): {safe_preview}")
+                safe_preview = [sanitize(row) for row in results]
+                logger.debug(f"Raw query result (sanitized): {safe_preview}")
 
-            return [dict(row) for row in rows]
+            return results
         except asyncpg.PostgresError as e:
             error_msg = f"Error executing raw query in {db_type}: {str(e)}"
             logger.error(error_msg)
@@ -166,6 +236,16 @@ async def execute_raw_query(db_type: str, query: str, *args, pool: Optional[asyn
             logger.error(error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
 
+async def notify_channel(db_type: str, channel: str, payload: str = "") -> bool:
+    """Send a PostgreSQL NOTIFY; failures are logged and never raised to the caller."""
+    try:
+        await execute_raw_query(db_type, "SELECT pg_notify($1, $2)", channel, payload)
+        logger.debug(f"Sent NOTIFY on {channel} with payload '{payload}'")
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to NOTIFY {channel} in {db_type}: {str(e)}")
+        return False
+
 async def close_db_pools():
     from app import app  # Moved import inside function to avoid circular import
     if hasattr(app.state, "async_db_pools"):
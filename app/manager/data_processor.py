@@ -1,7 +1,7 @@
 # Name: data_processor.py
-# Version: 0.1.0
+# Version: 0.1.1
 # Created: 971201
-# Modified: 250502
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: Python script for ParcoRTLS backend
@@ -10,6 +10,7 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.1 - Raw position history kept in TagRingBuffer ring buffers with idle-tag expiry, bumped from 0.1.0
 # Version: 250327 /home/parcoadmin/parco_fastapi/app/manager/data_processor.py 1.0.2
 # 
 # Data Processor Module for Manager
@@ -22,16 +23,18 @@
 #
 # Licensed under AGPL-3.0: https://www.gnu.org/licenses/agpl-3.0.en.html
 
+import time
 from typing import Dict, List, Tuple
 from .models import GISData
+from .tag_history import TagHistoryStore
 
 class DataProcessor:
     def __init__(self, min_cnf: float = 50.0):  # CHANGED: Configurable, default 50
         self.last_tag: Dict[str, float] = {}  # ID: TS for duplicate check
-        self.tag_history: Dict[str, List[GISData]] = {}  # Raw position history
+        self.max_history: int = 5  # Fixed window for now
+        self.tag_history = TagHistoryStore(capacity=self.max_history, window_seconds=None)  # Raw position ring buffers
         self.raw_ave: Dict[str, Tuple[float, float]] = {}  # 2D raw average (X, Y)
         self.cnf_threshold: float = min_cnf  # CHANGED: Use parameter
-        self.max_history: int = 5  # Fixed window for now
 
     def filter_data(self, msg: GISData) -> bool:
         """Returns True if data passes filters, False if filtered out."""
@@ -44,12 +47,15 @@ class DataProcessor:
 
     def compute_raw_average(self, msg: GISData) -> None:
         """Computes 2D raw average over last 5 positions."""
-        if msg.id not in self.tag_history:
-            self.tag_history[msg.id] = []
-        self.tag_history[msg.id].append(msg)
-        if len(self.tag_history[msg.id]) > self.max_history:
-            self.tag_history[msg.id].pop(0)
-        if len(self.tag_history[msg.id]) == self.max_history:
-            x_sum = sum(pos.x for pos in self.tag_history[msg.id])
-            y_sum = sum(pos.y for pos in self.tag_history[msg.id])
-            self.raw_ave[msg.id] = (x_sum / self.max_history, y_sum / self.max_history)
\ No newline at end of file
+        ring = self.tag_history.add(msg.id, msg.x, msg.y, msg.z)
+        if ring.is_full():
+            x, y, _ = ring.mean()
+            self.raw_ave[msg.id] = (x, y)
+
+    def expire_idle(self) -> List[str]:
+        """Drops history, averages and duplicate-check state for idle tags."""
+        expired = self.tag_history.expire_idle(time.monotonic())
+        for tag_id in expired:
+            self.raw_ave.pop(tag_id, None)
+            self.last_tag.pop(tag_id, None)
+        return expired
\ No newline at end of file
@@ -1,7 +1,7 @@
 # Name: datastream.py
-# Version: 0.1.1
+# Version: 0.1.3
 # Created: 971201
-# Modified: 250703
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: Python script for ParcoRTLS backend
@@ -10,6 +10,8 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.3 - Removed imports left unused by the StreamFramer rewrite, bumped from 0.1.2
+# Version: 0.1.2 - live_data_arrived frames the stream incrementally (StreamFramer) and builds PositionRecords from the parsed element, triggers checked through a ZoneTriggerIndex, bumped from 0.1.1
 # Version: 250327 /home/parcoadmin/parco_fastapi/app/manager/datastream.py 1.0.1
 # 
 # Datastream Module for Manager
@@ -36,14 +38,14 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_server_host
 
-from .enums import ConnectionState, TriggerDirections, RequestType, ResponseType  # Updated: Added ResponseType
-from .models import Tag, GISData, HeartBeat, Request, Response
+from .enums import ConnectionState, TriggerDirections, TriggerState, RequestType, ResponseType  # Updated: Added ResponseType
+from .models import Tag, HeartBeat, Request, Response, PositionRecord
 from .trigger import Trigger
-from .utils import FASTAPI_BASE_URL, MessageUtilities, track_metrics
+from .trigger_index import ZoneTriggerIndex
+from .stream_framer import StreamFramer, XML_FRAME
+from .utils import FASTAPI_BASE_URL, track_metrics
 from .region import Region3D, Region3DCollection
 from .events import StreamDataEventArgs, StreamHeartbeatEventArgs, StreamResponseEventArgs, StreamConnectionEventArgs
-import json
-from datetime import datetime  # Updated: Moved to top for clarity
 
 logger = logging.getLogger(__name__)
 
@@ -56,17 +58,21 @@ class DataStream:
         self.tcp_ip = tcp_ip
         self.port = port
         self.websocket = None  # type: ignore
-        self.buffer = ""
+        self.framer = StreamFramer()
         self.is_connected = False
         self.connection_state = ConnectionState.NotKnown
         self.stream_callback: Optional[Callable[[StreamDataEventArgs], Union[None, Awaitable[None]]]] = None
         self.heartbeat_callback: Optional[Callable[[StreamHeartbeatEventArgs], Union[None, Awaitable[None]]]] = None
         self.response_callback: Optional[Callable[[StreamResponseEventArgs], Union[None, Awaitable[None]]]] = None
         self.connection_callback: Optional[Callable[[StreamConnectionEventArgs], Union[None, Awaitable[None]]]] = None
+        # Receives each position as a PositionRecord, the same object the Manager ingest path uses
+        self.record_callback: Optional[Callable[[PositionRecord], Union[None, Awaitable[None]]]] = None
         self.triggers: List[Trigger] = []
+        self.trigger_index: Optional[ZoneTriggerIndex] = None
 
     def add_trigger(self, trigger: Trigger):
         self.triggers.append(trigger)
+        self.trigger_index = None  # Rebuilt on the next position
 
     async def load_triggers(self, zone_id: int):
         """Fetch triggers for a given zone and create runtime Trigger instances."""
@@ -202,9 +208,7 @@ class DataStream:
         try:
             while self.is_connected and self.websocket:
                 data = await self.websocket.recv()
-                # Handle both string and bytes data
-                if isinstance(data, bytes):
-                    data = data.decode('utf-8')
+                # The framer takes str or bytes as received
                 await self.live_data_arrived(data)
         except websockets.exceptions.ConnectionClosed:
             self.is_connected = False
@@ -223,125 +227,105 @@ class DataStream:
                     await result
 
     async def live_data_arrived(self, data: Union[str, bytes, bytearray, memoryview]):
-        # Convert data to string if it's not already
-        if isinstance(data, bytes):
-            data_str = data.decode('utf-8')
-        elif isinstance(data, bytearray):
-            data_str = data.decode('utf-8')
-        elif isinstance(data, memoryview):
-            data_str = bytes(data).decode('utf-8')
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        for kind, payload, raw in self.framer.feed(data):
+            try:
+                if kind == XML_FRAME:
+                    await self._xml_frame_arrived(payload, raw)  # type: ignore
+                else:
+                    await self._json_frame_arrived(payload)  # type: ignore
+            except Exception as ex:
+                # One bad frame must not drop the rest of the burst
+                logger.error(f"Error handling {kind} frame: {str(ex)}")
+
+    async def _xml_frame_arrived(self, root: ET.Element, raw: bytes):
+        msg_type = root.findtext("type")
+        if msg_type == "HeartBeat":
+            hb = HeartBeat.from_element(root)
+            if self.websocket:
+                await self.websocket.send(raw.decode('utf-8'))  # Echo back XML
+            if self.heartbeat_callback:
+                result = self.heartbeat_callback(StreamHeartbeatEventArgs(heartbeat=hb))
+                if asyncio.iscoroutine(result):
+                    await result
+        elif msg_type == "response":
+            resp = Response.from_element(root)
+            if self.response_callback:
+                result = self.response_callback(StreamResponseEventArgs(response=resp))
+                if asyncio.iscoroutine(result):
+                    await result
         else:
-            data_str = str(data)
-        
-        # Existing XML handling
-        self.buffer += data_str
-        temp = ""
-        messages = self.buffer.split(MessageUtilities.XMLDefTag)
-
-        for i in range(len(messages)):
-            msg = messages[i]
-            if len(msg) > 0 and MessageUtilities.ParcoEndTag in msg:
-                if i == len(messages) - 1:
-                    end_tag_pos = msg.index(MessageUtilities.ParcoEndTag) + len(MessageUtilities.ParcoEndTag)
-                    if len(msg) > end_tag_pos:
-                        temp = msg[end_tag_pos:]
-                        msg = msg[:end_tag_pos]
-
-                if "<type>HeartBeat</type>" in msg:
-                    hb = HeartBeat.from_xml(MessageUtilities.XMLDefTag + msg)
-                    if self.websocket:
-                        await self.websocket.send(MessageUtilities.XMLDefTag + msg)  # Echo back XML
-                    if self.heartbeat_callback:
-                        result = self.heartbeat_callback(StreamHeartbeatEventArgs(heartbeat=hb))
-                        if asyncio.iscoroutine(result):
-                            await result
-                elif "<type>response</type>" in msg:
-                    resp = Response.from_xml(MessageUtilities.XMLDefTag + msg)
-                    if self.response_callback:
-                        result = self.response_callback(StreamResponseEventArgs(response=resp))
-                        if asyncio.iscoroutine(result):
-                            await result
-                elif "<type>HeartBeat</type>" not in msg:
-                    gis_data = GISData.from_xml(MessageUtilities.XMLDefTag + msg)
-                    tag = Tag(
-                        id=gis_data.id,
-                        x=gis_data.x,
-                        y=gis_data.y,
-                        z=gis_data.z,
-                        timestamp_utc=gis_data.ts,
-                        msg_type=gis_data.type,
-                        battery=gis_data.bat,
-                        conf_factor=gis_data.cnf,
-                        gwid=gis_data.gwid,
-                        data=gis_data.data,
-                        send_payload_data=False
-                    )
-                    if self.stream_callback:
-                        result = self.stream_callback(StreamDataEventArgs(tag=tag))
-                        if asyncio.iscoroutine(result):
-                            await result
-                    for trigger in self.triggers:
-                        await trigger.check_trigger(tag)
-
-        self.buffer = temp if temp else MessageUtilities.XMLDefTag + messages[-1] if messages[-1] and MessageUtilities.ParcoEndTag not in messages[-1] else ""
-
-        # NEW: JSON handling
-        try:
-            json_data = json.loads(data_str)  # Attempt to parse as JSON
-            msg_type = json_data.get("type", "")
-            if msg_type == "HeartBeat":
-                hb = HeartBeat(ticks=json_data["ts"])
-                if self.websocket:
-                    await self.websocket.send(hb.to_json())  # Echo back JSON
-                if self.heartbeat_callback:
-                    result = self.heartbeat_callback(StreamHeartbeatEventArgs(heartbeat=hb))
-                    if asyncio.iscoroutine(result):
-                        await result
-            elif msg_type == "response":
-                resp = Response(
-                    response_type=ResponseType(json_data["request"]),
-                    req_id=json_data["reqid"],
-                    message=json_data.get("msg", "")
-                )
-                if self.response_callback:
-                    result = self.response_callback(StreamResponseEventArgs(response=resp))
-                    if asyncio.iscoroutine(result):
-                        await result
-            else:  # Assume GISData
-                gis = json_data["gis"]
-                gis_data = GISData(
-                    id=gis["id"],
-                    type=msg_type,
-                    ts=datetime.fromisoformat(gis["ts"]),
-                    x=gis["x"],
-                    y=gis["y"],
-                    z=gis["z"],
-                    bat=gis["bat"],
-                    cnf=gis["cnf"],
-                    gwid=gis["gwid"],
-                    data=json_data.get("data", "")
-                )
-                tag = Tag(
-                    id=gis_data.id,
-                    x=gis_data.x,
-                    y=gis_data.y,
-                    z=gis_data.z,
-                    timestamp_utc=gis_data.ts,
-                    msg_type=gis_data.type,
-                    battery=gis_data.bat,
-                    conf_factor=gis_data.cnf,
-                    gwid=gis_data.gwid,
-                    data=gis_data.data,
-                    send_payload_data=False
-                )
-                if self.stream_callback:
-                    result = self.stream_callback(StreamDataEventArgs(tag=tag))
-                    if asyncio.iscoroutine(result):
-                        await result
-                for trigger in self.triggers:
-                    await trigger.check_trigger(tag)
-        except json.JSONDecodeError:
-            pass  # If not JSON, fall back to XML handling
+            await self._position_arrived(PositionRecord.from_element(root))
+
+    async def _json_frame_arrived(self, json_data: dict):
+        msg_type = json_data.get("type", "")
+        if msg_type == "HeartBeat":
+            hb = HeartBeat(ticks=json_data["ts"])
+            if self.websocket:
+                await self.websocket.send(hb.to_json())  # Echo back JSON
+            if self.heartbeat_callback:
+                result = self.heartbeat_callback(StreamHeartbeatEventArgs(heartbeat=hb))
+                if asyncio.iscoroutine(result):
+                    await result
+        elif msg_type == "response":
+            resp = Response(
+                response_type=ResponseType(json_data["request"]),
+                req_id=json_data["reqid"],
+                message=json_data.get("msg", "")
+            )
+            if self.response_callback:
+                result = self.response_callback(StreamResponseEventArgs(response=resp))
+                if asyncio.iscoroutine(result):
+                    await result
+        else:  # Assume GISData
+            await self._position_arrived(PositionRecord.from_json(json_data))
+
+    async def _position_arrived(self, record: PositionRecord):
+        if self.record_callback:
+            result = self.record_callback(record)
+            if asyncio.iscoroutine(result):
+                await result
+        if not self.stream_callback and not self.triggers:
+            return
+
+        # Values were converted while parsing, so the Tag skips validation
+        tag = Tag.model_construct(
+            id=record.id,
+            x=record.x,
+            y=record.y,
+            z=record.z,
+            timestamp_utc=record.ts,
+            msg_type=record.type,
+            battery=record.bat,
+            conf_factor=record.cnf,
+            gwid=record.gwid,
+            data=record.data,
+            send_payload_data=False
+        )
+        if self.stream_callback:
+            result = self.stream_callback(StreamDataEventArgs(tag=tag))
+            if asyncio.iscoroutine(result):
+                await result
+        await self._check_triggers(tag)
+
+    async def _check_triggers(self, tag: Tag):
+        if not self.triggers:
+            return
+        if self.trigger_index is None:
+            self.trigger_index = ZoneTriggerIndex(0, self.triggers)
+        index = self.trigger_index
+
+        # Same evaluation as TriggerManager.evaluate_triggers: full test for box
+        # candidates, outside-sensitive triggers only advance their state
+        candidates = index.candidates(tag.x, tag.y, tag.z)
+        positions = candidates.union(
+            p for p in index.outside_sensitive
+            if p not in candidates and not index.triggers[p].is_settled_outside(tag.id)
+        )
+        for position in sorted(positions):
+            known_state = None if position in candidates else TriggerState.OutSide
+            await index.triggers[position].check_trigger(tag, known_state)
 
 # Example Usage of DataStream with Trigger
 async def main():
@@ -0,0 +1,167 @@
+# Name: db_pools.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Process-wide asyncpg pool registry and cached tlkresources lookups for ParcoRTLS WebSocket servers
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+Shared database pools for the ParcoRTLS WebSocket servers.
+
+Each server creates its pools once in its FastAPI lifespan through
+db_pool_registry and reuses them for every client connection, instead of
+opening and closing a whole asyncpg pool inside the WebSocket handler.
+
+tlkresources lookups done on every WebSocket connect are answered from a
+small TTL cache so a reconnect storm turns into a handful of queries.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing for WebSocket servers (lookups are short and infrequent)
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 5
+
+# Seconds a tlkresources lookup stays cached
+RESOURCE_CACHE_TTL = 60.0
+
+class DBPoolRegistry:
+    """
+    Registry of long-lived asyncpg pools keyed by connection string.
+    """
+
+    def __init__(self):
+        self.pools: Dict[str, asyncpg.Pool] = {}
+        self.lock = asyncio.Lock()
+        self.resource_cache: Dict[Tuple[str, int], Tuple[float, Optional[asyncpg.Record]]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    async def get_pool(self, conn_string: str, min_size: int = POOL_MIN_SIZE,
+                       max_size: int = POOL_MAX_SIZE) -> asyncpg.Pool:
+        """
+        Get the shared pool for a connection string, creating it on first use.
+
+        Args:
+            conn_string: PostgreSQL connection string
+            min_size: Minimum pool size when the pool is created
+            max_size: Maximum pool size when the pool is created
+
+        Returns:
+            asyncpg.Pool: Shared pool
+        """
+        pool = self.pools.get(conn_string)
+        if pool is not None:
+            return pool
+        async with self.lock:
+            pool = self.pools.get(conn_string)
+            if pool is None:
+                pool = await asyncpg.create_pool(conn_string, min_size=min_size, max_size=max_size)
+                self.pools[conn_string] = pool  # type: ignore
+                logger.debug(f"Created shared DB pool ({len(self.pools)} total)")
+        return pool  # type: ignore
+
+    async def close_all(self):
+        """Close every registered pool and clear cached lookups."""
+        async with self.lock:
+            for pool in self.pools.values():
+                try:
+                    await pool.close()
+                except Exception as e:
+                    logger.error(f"Error closing shared DB pool: {str(e)}")
+            self.pools.clear()
+        self.resource_cache.clear()
+        logger.debug("Closed all shared DB pools")
+
+    async def list_resources(self, conn_string: str, resource_type: int) -> List[asyncpg.Record]:
+        """
+        List tlkresources rows of one resource type.
+
+        Args:
+            conn_string: Maintenance database connection string
+            resource_type: tlkresources.i_typ_res value
+
+        Returns:
+            List[asyncpg.Record]: Rows with x_nm_res and i_typ_res
+        """
+        pool = await self.get_pool(conn_string)
+        async with pool.acquire() as conn:
+            return await conn.fetch(
+                "SELECT X_NM_RES, i_typ_res FROM tlkresources WHERE i_typ_res = $1", resource_type)
+
+    async def get_resource(self, conn_string: str, manager_name: str,
+                           resource_type: int) -> Optional[asyncpg.Record]:
+        """
+        Look up a manager in tlkresources, served from cache within the TTL.
+
+        Missing managers are cached too, so repeated connects to an unknown
+        name do not hit the database either.
+
+        Args:
+            conn_string: Maintenance database connection string
+            manager_name: tlkresources.x_nm_res value
+            resource_type: tlkresources.i_typ_res value
+
+        Returns:
+            asyncpg.Record: Row with i_typ_res, or None if not found
+        """
+        key = (manager_name, resource_type)
+        cached = self.resource_cache.get(key)
+        now = time.monotonic()
+        if cached is not None and now - cached[0] < RESOURCE_CACHE_TTL:
+            self.cache_hits += 1
+            return cached[1]
+
+        self.cache_misses += 1
+        pool = await self.get_pool(conn_string)
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT i_typ_res FROM tlkresources WHERE X_NM_RES = $1 AND i_typ_res = $2",
+                manager_name, resource_type)
+        self.resource_cache[key] = (now, row)
+        return row
+
+    def invalidate_resources(self, manager_name: Optional[str] = None):
+        """
+        Drop cached tlkresources lookups.
+
+        Args:
+            manager_name: Only drop entries for this manager; None drops all
+        """
+        if manager_name is None:
+            self.resource_cache.clear()
+        else:
+            for key in [k for k in self.resource_cache if k[0] == manager_name]:
+                del self.resource_cache[key]
+        logger.debug(f"Invalidated tlkresources cache for {manager_name or 'all managers'}")
+
+    def get_stats(self) -> dict:
+        """
+        Get pool and cache statistics.
+
+        Returns:
+            dict: Pool sizes and cache counters
+        """
+        return {
+            'pools': [
+                {'size': pool.get_size(), 'idle': pool.get_idle_size()}
+                for pool in self.pools.values()
+            ],
+            'resource_cache_entries': len(self.resource_cache),
+            'resource_cache_hits': self.cache_hits,
+            'resource_cache_misses': self.cache_misses
+        }
+
+# Process-wide registry instance
+db_pool_registry = DBPoolRegistry()
@@ -0,0 +1,313 @@
+# Name: event_writer.py
+# Version: 0.1.1
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Batched event_log writer for TETSE events with generated IDs returned to callers
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+# Version: 0.1.1 - A batch rejected for its data is bisected so only the bad rows fail, COPY fallback only on
+#                  COPY-specific errors, stop() lets an in-flight flush finish before cancelling, bumped from 0.1.0
+
+"""
+Event Log Writer Module for ParcoRTLS
+
+Collects event_log rows from every caller in the process and writes them in
+bulk on the shared ParcoRTLSData pool:
+
+- add() and add_many() queue rows and wait for their event_log IDs
+- the writer flushes as soon as it is idle, so a lone event is written at
+  once, while events arriving during a flush go out together in the next one
+  (up to batch_size rows per round trip)
+- IDs are taken from event_log_id_seq in one query per flush, then the rows
+  are written with copy_records_to_table; executemany is the fallback when
+  the server does not accept the COPY itself
+- a batch rejected because of its data (unknown event_type_id, numeric
+  overflow, ...) is split in halves until only the offending rows fail, so one
+  caller's bad event never fails the others; any other database error fails
+  the whole batch
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Writer defaults
+BATCH_SIZE = 1000
+MAX_BUFFER = 20000
+
+EVENT_LOG_TABLE = "event_log"
+EVENT_LOG_COLUMNS = ["id", "entity_id", "event_type_id", "reason_id", "value", "unit", "ts"]
+EVENT_LOG_ID_QUERY = "SELECT nextval('event_log_id_seq') FROM generate_series(1, $1)"
+EVENT_LOG_INSERT = """
+    INSERT INTO event_log (id, entity_id, event_type_id, reason_id, value, unit, ts)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+"""
+
+# (entity_id, event_type_id, reason_id, value, unit, ts)
+EventRow = Tuple[str, int, Optional[int], Optional[float], Optional[str], Optional[datetime]]
+
+# Errors caused by the rows themselves; the batch is bisected to find them
+ROW_ERRORS = (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError)
+
+# Errors where COPY itself is refused and executemany may still work
+COPY_FALLBACK_ERRORS = (asyncpg.FeatureNotSupportedError, asyncpg.BadCopyFileFormatError)
+
+class EventLogWriterFull(Exception):
+    """Raised by add() when the writer already holds max_buffer rows."""
+
+class EventLogWriter:
+    """
+    Group-commit writer for the event_log table.
+    """
+
+    def __init__(self, pool_factory: Callable[[], Awaitable[asyncpg.Pool]], batch_size: int = BATCH_SIZE,
+                 max_buffer: int = MAX_BUFFER):
+        """
+        Initialize the writer.
+
+        Args:
+            pool_factory: Coroutine function returning the ParcoRTLSData pool
+            batch_size: Largest number of rows written per round trip
+            max_buffer: Queued rows at which add() rejects new events
+        """
+        self.pool_factory = pool_factory
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+
+        self.buffer: List[Tuple[tuple, asyncio.Future]] = []
+        self.flush_needed = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.use_copy = True
+
+        # Metrics
+        self.rows_enqueued = 0
+        self.rows_written = 0
+        self.rows_rejected = 0
+        self.rows_failed = 0
+        self.flush_count = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.max_batch = 0
+
+    def start(self):
+        """Start the flush task (add() also starts it on first use)."""
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_loop())
+            logger.debug("Event log writer started")
+
+    @staticmethod
+    def _row(row: EventRow) -> tuple:
+        entity_id, event_type_id, reason_id, value, unit, ts = row
+        return (
+            str(entity_id),
+            int(event_type_id),
+            reason_id,
+            Decimal(str(value)) if value is not None else None,
+            unit,
+            ts or datetime.now(timezone.utc)
+        )
+
+    async def add(self, entity_id: str, event_type_id: int, reason_id: Optional[int] = None,
+                  value: Optional[float] = None, unit: Optional[str] = None,
+                  ts: Optional[datetime] = None) -> int:
+        """
+        Write one event.
+
+        Returns:
+            int: event_log ID of the new row
+
+        Raises:
+            EventLogWriterFull: When the writer is saturated
+            Exception: The database error when the flush failed
+        """
+        return (await self.add_many([(entity_id, event_type_id, reason_id, value, unit, ts)]))[0]
+
+    async def add_many(self, rows: Sequence[EventRow]) -> List[int]:
+        """
+        Write several events; they share flushes with other callers.
+
+        Args:
+            rows: (entity_id, event_type_id, reason_id, value, unit, ts) tuples
+
+        Returns:
+            List[int]: event_log IDs, in the order of rows
+
+        Raises:
+            EventLogWriterFull: When the writer is saturated
+            Exception: The database error when a flush failed
+        """
+        if not rows:
+            return []
+        if len(self.buffer) + len(rows) > self.max_buffer:
+            self.rows_rejected += len(rows)
+            raise EventLogWriterFull(f"Event log writer is full ({len(self.buffer)} rows queued)")
+
+        self.start()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for row in rows:
+            future = loop.create_future()
+            self.buffer.append((self._row(row), future))
+            futures.append(future)
+        self.rows_enqueued += len(rows)
+        self.flush_needed.set()
+        return list(await asyncio.gather(*futures))
+
+    async def _flush_loop(self):
+        """Flush whenever rows are waiting."""
+        while True:
+            await self.flush_needed.wait()
+            self.flush_needed.clear()
+            while self.buffer:
+                await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Write up to batch_size buffered rows.
+
+        Returns:
+            int: Number of rows written
+        """
+        async with self.flush_lock:
+            if not self.buffer:
+                return 0
+            batch = self.buffer[:self.batch_size]
+            del self.buffer[:self.batch_size]
+
+            started = time.perf_counter()
+            try:
+                pool = await self.pool_factory()
+                async with pool.acquire() as conn:
+                    ids = [row[0] for row in await conn.fetch(EVENT_LOG_ID_QUERY, len(batch))]
+                    records = [(event_id,) + row for event_id, (row, _future) in zip(ids, batch)]
+                    rejected = await self._write_isolated(conn, records)
+            except asyncio.CancelledError:
+                # Nobody will write these rows now; release their callers
+                for _row, future in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                self.rows_failed += len(batch)
+                logger.error(f"Failed to write {len(batch)} event_log rows: {str(e)}")
+                for _row, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return 0
+
+            for event_id, (_row, future) in zip(ids, batch):
+                if future.done():
+                    continue
+                if event_id in rejected:
+                    future.set_exception(rejected[event_id])
+                else:
+                    future.set_result(event_id)
+
+            written = len(batch) - len(rejected)
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            self.flush_count += 1
+            self.rows_written += written
+            self.rows_failed += len(rejected)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.max_batch = max(self.max_batch, len(batch))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Wrote {written} event_log rows in {elapsed_ms:.1f} ms")
+            return written
+
+    async def _write(self, conn: asyncpg.Connection, records: List[tuple]):
+        """Write records in one statement; COPY and executemany are both all-or-nothing."""
+        if self.use_copy:
+            try:
+                await conn.copy_records_to_table(EVENT_LOG_TABLE, records=records, columns=EVENT_LOG_COLUMNS)
+                return
+            except COPY_FALLBACK_ERRORS as e:
+                logger.warning(f"COPY into event_log refused, falling back to executemany: {str(e)}")
+                self.use_copy = False
+        await conn.executemany(EVENT_LOG_INSERT, records)
+
+    async def _write_isolated(self, conn: asyncpg.Connection, records: List[tuple]) -> Dict[int, Exception]:
+        """
+        Write records, bisecting a batch rejected for its data until only the bad rows are left.
+
+        Returns:
+            Dict[int, Exception]: event_log ID -> error for the rows that were not written
+
+        Raises:
+            Exception: Errors not caused by the rows (connection, permissions, ...)
+        """
+        try:
+            await self._write(conn, records)
+            return {}
+        except ROW_ERRORS as e:
+            if len(records) == 1:
+                logger.warning(f"Rejected event_log row for entity {records[0][1]} "
+                               f"(event_type_id={records[0][2]}): {str(e)}")
+                return {records[0][0]: e}
+        half = len(records) // 2
+        rejected = await self._write_isolated(conn, records[:half])
+        rejected.update(await self._write_isolated(conn, records[half:]))
+        return rejected
+
+    async def stop(self):
+        """Stop the flush task and write any remaining rows."""
+        if self.flush_task is not None:
+            # A flush in progress holds the lock with its rows already out of the
+            # buffer; let it finish so the task is only ever cancelled while idle
+            async with self.flush_lock:
+                self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        while self.buffer:
+            await self.flush()
+        logger.debug("Event log writer stopped")
+
+    def get_stats(self) -> dict:
+        """
+        Get writer statistics.
+
+        Returns:
+            dict: Queue depth, row counters and flush latency
+        """
+        return {
+            'queue_depth': len(self.buffer),
+            'rows_enqueued': self.rows_enqueued,
+            'rows_written': self.rows_written,
+            'rows_rejected': self.rows_rejected,
+            'rows_failed': self.rows_failed,
+            'flush_count': self.flush_count,
+            'max_batch': self.max_batch,
+            'avg_batch': round(self.rows_written / self.flush_count, 1) if self.flush_count else 0.0,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+            'using_copy': self.use_copy
+        }
+
+_event_log_writer: Optional[EventLogWriter] = None
+
+def get_event_log_writer() -> EventLogWriter:
+    """
+    Get the process-wide event_log writer on the shared ParcoRTLSData pool.
+
+    Returns:
+        EventLogWriter: Shared writer
+    """
+    global _event_log_writer
+    if _event_log_writer is None:
+        from routes.tetse_data import get_data_pool
+        _event_log_writer = EventLogWriter(get_data_pool)
+    return _event_log_writer
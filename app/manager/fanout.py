@@ -0,0 +1,253 @@
+# Name: fanout.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Non-blocking fan-out engine with per-client bounded send queues for ParcoRTLS Manager
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+Fan-out Engine Module for ParcoRTLS Manager
+
+Broadcasting used to await send_json on every client in turn, so one slow
+dashboard delayed every other client and the ingest coroutine itself. Here
+each WebSocket gets a bounded send queue drained by its own writer task:
+
+- A message is serialized once and the same text frame is queued for every
+  recipient
+- publish() never awaits a socket, so broadcast cost for the caller does not
+  depend on how fast any client reads
+- When a client's queue is full the slow-consumer policy applies:
+  "drop_oldest" discards the oldest queued frame, "disconnect" closes the client
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, Optional
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Slow consumer policies
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_DISCONNECT = "disconnect"
+
+# Fan-out defaults
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_POLICY = POLICY_DROP_OLDEST
+
+def serialize_message(message: Any) -> str:
+    """
+    Serialize a message the same way Starlette's send_json does.
+
+    Args:
+        message: dict to serialize, or an already serialized str
+
+    Returns:
+        str: JSON text frame
+    """
+    if isinstance(message, str):
+        return message
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+class ClientSendQueue:
+    """
+    Bounded outbound queue and writer task for a single WebSocket.
+    """
+
+    def __init__(self, websocket: WebSocket, label: str, max_size: int, policy: str,
+                 on_failed: Callable[['ClientSendQueue'], None]):
+        self.websocket = websocket
+        self.label = label
+        self.max_size = max_size
+        self.policy = policy
+        self.on_failed = on_failed
+        self.frames: Deque[str] = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.sent_count = 0
+        self.dropped_count = 0
+        self.high_water = 0
+        self.writer_task = asyncio.create_task(self._writer())
+
+    def offer(self, frame: str) -> bool:
+        """
+        Queue a frame without waiting.
+
+        Returns:
+            bool: True if queued, False if the client was dropped or disconnected
+        """
+        if self.closed:
+            return False
+        if len(self.frames) >= self.max_size:
+            if self.policy == POLICY_DISCONNECT:
+                logger.warning(f"Disconnecting slow client {self.label}: send queue full ({self.max_size})")
+                self.close(disconnect=True)
+                return False
+            self.frames.popleft()
+            self.dropped_count += 1
+        self.frames.append(frame)
+        if len(self.frames) > self.high_water:
+            self.high_water = len(self.frames)
+        self.ready.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                if not self.frames:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                frame = self.frames.popleft()
+                await self.websocket.send_text(frame)
+                self.sent_count += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Send failed for client {self.label}: {str(e)}")
+            self.closed = True
+            self.on_failed(self)
+
+    def close(self, disconnect: bool = False):
+        """
+        Stop the writer task.
+
+        Args:
+            disconnect: Also close the WebSocket (slow consumer policy)
+        """
+        if self.closed and self.writer_task.done():
+            return
+        self.closed = True
+        self.frames.clear()
+        if not self.writer_task.done():
+            self.writer_task.cancel()
+        if disconnect:
+            asyncio.create_task(self._close_socket())
+            self.on_failed(self)
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=1008, reason="Slow consumer")
+        except Exception as e:
+            logger.debug(f"Error closing slow client {self.label}: {str(e)}")
+
+    def get_stats(self) -> dict:
+        return {
+            'queued': len(self.frames),
+            'sent': self.sent_count,
+            'dropped': self.dropped_count,
+            'high_water': self.high_water
+        }
+
+class FanoutEngine:
+    """
+    Per-client send queues keyed by WebSocket identity.
+
+    Queues are created lazily on the first publish to a WebSocket and removed
+    by unregister() or automatically when a send fails.
+    """
+
+    def __init__(self, max_queue_size: int = DEFAULT_QUEUE_SIZE, policy: str = DEFAULT_POLICY,
+                 on_client_failed: Optional[Callable[[WebSocket], None]] = None):
+        """
+        Initialize the fan-out engine.
+
+        Args:
+            max_queue_size: Frames held per client before the slow-consumer policy applies
+            policy: POLICY_DROP_OLDEST or POLICY_DISCONNECT
+            on_client_failed: Called with the WebSocket when a client is dropped
+        """
+        if policy not in (POLICY_DROP_OLDEST, POLICY_DISCONNECT):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        self.on_client_failed = on_client_failed
+        self.queues: Dict[int, ClientSendQueue] = {}
+        self.published_count = 0
+        self.failed_clients = 0
+        self.retired_sent = 0
+        self.retired_dropped = 0
+
+    def _queue_for(self, websocket: WebSocket, label: str) -> ClientSendQueue:
+        queue = self.queues.get(id(websocket))
+        if queue is None or queue.closed:
+            queue = ClientSendQueue(websocket, label, self.max_queue_size, self.policy, self._handle_failed)
+            self.queues[id(websocket)] = queue
+        return queue
+
+    def _retire(self, queue: ClientSendQueue):
+        """Keep counters of a removed queue in the engine totals."""
+        self.retired_sent += queue.sent_count
+        self.retired_dropped += queue.dropped_count
+
+    def _handle_failed(self, queue: ClientSendQueue):
+        if self.queues.get(id(queue.websocket)) is queue:
+            del self.queues[id(queue.websocket)]
+            self._retire(queue)
+        self.failed_clients += 1
+        if self.on_client_failed:
+            try:
+                self.on_client_failed(queue.websocket)
+            except Exception as e:
+                logger.error(f"on_client_failed callback error for {queue.label}: {str(e)}")
+
+    def publish(self, websockets: Iterable[WebSocket], message: Any, label: str = "") -> int:
+        """
+        Serialize a message once and queue it for every WebSocket.
+
+        Args:
+            websockets: Recipients
+            message: dict or pre-serialized JSON text
+            label: Topic or client description used in logs
+
+        Returns:
+            int: Number of clients the frame was queued for
+        """
+        frame = serialize_message(message)
+        queued = 0
+        for websocket in websockets:
+            if self._queue_for(websocket, label).offer(frame):
+                queued += 1
+        self.published_count += 1
+        return queued
+
+    def unregister(self, websocket: WebSocket):
+        """Stop the writer for a WebSocket and drop its pending frames."""
+        queue = self.queues.pop(id(websocket), None)
+        if queue is not None:
+            queue.close()
+            self._retire(queue)
+
+    def close_all(self):
+        """Stop every writer task."""
+        for queue in list(self.queues.values()):
+            queue.close()
+            self._retire(queue)
+        self.queues.clear()
+
+    def get_stats(self) -> dict:
+        """
+        Get fan-out statistics.
+
+        Returns:
+            dict: Engine counters and aggregate per-client queue figures
+        """
+        queues = list(self.queues.values())
+        return {
+            'policy': self.policy,
+            'max_queue_size': self.max_queue_size,
+            'active_queues': len(queues),
+            'messages_published': self.published_count,
+            'failed_clients': self.failed_clients,
+            'frames_queued': sum(len(q.frames) for q in queues),
+            'frames_sent': self.retired_sent + sum(q.sent_count for q in queues),
+            'frames_dropped': self.retired_dropped + sum(q.dropped_count for q in queues),
+            'max_high_water': max((q.high_water for q in queues), default=0)
+        }
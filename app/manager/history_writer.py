@@ -0,0 +1,263 @@
+# Name: history_writer.py
+# Version: 0.1.2
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Buffered COPY-based positionhistory writer for ParcoRTLS Manager
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+# Version: 0.1.2 - A batch rejected for its data is bisected so only the bad rows fail, COPY fallback only on
+#                  COPY-specific errors, stop() lets an in-flight flush finish before cancelling, bumped from 0.1.1
+# Version: 0.1.1 - add() accepts PositionRecord rows, bumped from 0.1.0
+
+"""
+Position History Writer Module for ParcoRTLS Manager
+
+Collects positionhistory rows in memory and writes them in bulk with asyncpg
+copy_records_to_table, falling back to executemany when the server does not
+accept the COPY itself. A flush happens when the buffer reaches the batch size
+or the flush interval elapses, whichever comes first.
+
+A batch rejected because of its data (bad value, constraint violation) is split
+in halves until only the offending rows fail; the rest of the batch is written.
+
+When the buffer is full, add() waits for the next flush to free space
+(backpressure on the ingest path) and drops the row only if that wait times out.
+"""
+
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple, Union
+import asyncpg
+from manager.models import PositionRecord
+from manager.event_writer import COPY_FALLBACK_ERRORS, ROW_ERRORS
+
+# Row errors, plus values asyncpg cannot encode for their column
+HISTORY_ROW_ERRORS = ROW_ERRORS + (ValueError,)
+
+logger = logging.getLogger(__name__)
+
+# Writer defaults
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.5
+MAX_BUFFER = 20000
+BACKPRESSURE_TIMEOUT = 2.0
+
+POSITION_HISTORY_TABLE = "positionhistory"
+POSITION_HISTORY_COLUMNS = ["x_id_dev", "d_pos_bgn", "n_x", "n_y", "n_z", "cnf", "gwid", "bat"]
+POSITION_HISTORY_INSERT = """
+    INSERT INTO positionhistory (X_ID_DEV, D_POS_BGN, N_X, N_Y, N_Z, CNF, GWID, BAT)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+"""
+
+class PositionHistoryWriter:
+    """
+    Buffered bulk writer for the positionhistory table.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, max_buffer: int = MAX_BUFFER):
+        """
+        Initialize the writer.
+
+        Args:
+            pool: Historical database pool
+            batch_size: Row count that triggers an immediate flush
+            flush_interval: Maximum seconds a row waits in the buffer
+            max_buffer: Row count at which add() starts applying backpressure
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self.buffer: List[Tuple] = []
+        self.flush_lock = asyncio.Lock()
+        self.flush_needed = asyncio.Event()
+        self.space_available = asyncio.Event()
+        self.space_available.set()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.use_copy = True
+
+        # Metrics
+        self.rows_enqueued = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_failed = 0
+        self.flush_count = 0
+        self.backpressure_waits = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.max_queue_depth = 0
+
+    def start(self):
+        """Start the periodic flush task."""
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_loop())
+            logger.debug("Position history writer started")
+
+    async def add(self, msg_data: Union[PositionRecord, dict]) -> bool:
+        """
+        Buffer one position row.
+
+        Args:
+            msg_data: PositionRecord, or dictionary with keys id, ts, x, y, z, cnf, gwid, bat
+
+        Returns:
+            bool: True if buffered, False if dropped after backpressure timeout
+        """
+        if isinstance(msg_data, PositionRecord):
+            row = msg_data.history_row()
+        else:
+            row = (
+                msg_data['id'],
+                msg_data['ts'],
+                msg_data['x'],
+                msg_data['y'],
+                msg_data['z'],
+                msg_data['cnf'],
+                msg_data['gwid'],
+                str(msg_data['bat'])
+            )
+
+        if len(self.buffer) >= self.max_buffer:
+            self.backpressure_waits += 1
+            self.space_available.clear()
+            self.flush_needed.set()
+            try:
+                await asyncio.wait_for(self.space_available.wait(), timeout=BACKPRESSURE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.rows_dropped += 1
+                logger.warning(f"Position history buffer full ({self.max_buffer}), dropped row for tag {row[0]}")
+                return False
+
+        self.buffer.append(row)
+        self.rows_enqueued += 1
+        depth = len(self.buffer)
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        if depth >= self.batch_size:
+            self.flush_needed.set()
+        return True
+
+    async def _flush_loop(self):
+        """Flush on batch size or flush interval, whichever comes first."""
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_needed.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Write all buffered rows.
+
+        Returns:
+            int: Number of rows written
+        """
+        async with self.flush_lock:
+            if not self.buffer:
+                return 0
+            rows, self.buffer = self.buffer, []
+            self.space_available.set()
+
+            started = time.perf_counter()
+            try:
+                async with self.pool.acquire() as conn:
+                    rejected = await self._write_isolated(conn, rows)
+            except Exception as e:
+                self.rows_failed += len(rows)
+                logger.error(f"Failed to flush {len(rows)} position history rows: {str(e)}")
+                return 0
+
+            written = len(rows) - rejected
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            self.flush_count += 1
+            self.rows_written += written
+            self.rows_failed += rejected
+            self.last_flush_ms = elapsed_ms
+            self.total_flush_ms += elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            logger.debug(f"Flushed {written} position history rows in {elapsed_ms:.1f} ms")
+            return written
+
+    async def _write(self, conn: asyncpg.Connection, rows: List[Tuple]):
+        """Write rows in one statement; COPY and executemany are both all-or-nothing."""
+        if self.use_copy:
+            try:
+                await conn.copy_records_to_table(
+                    POSITION_HISTORY_TABLE,
+                    records=rows,
+                    columns=POSITION_HISTORY_COLUMNS
+                )
+                return
+            except COPY_FALLBACK_ERRORS as e:
+                logger.warning(f"COPY into positionhistory refused, falling back to executemany: {str(e)}")
+                self.use_copy = False
+        await conn.executemany(POSITION_HISTORY_INSERT, rows)
+
+    async def _write_isolated(self, conn: asyncpg.Connection, rows: List[Tuple]) -> int:
+        """
+        Write rows, bisecting a batch rejected for its data until only the bad rows are left.
+
+        Returns:
+            int: Number of rows that were not written
+
+        Raises:
+            Exception: Errors not caused by the rows (connection, permissions, ...)
+        """
+        try:
+            await self._write(conn, rows)
+            return 0
+        except HISTORY_ROW_ERRORS as e:
+            if len(rows) == 1:
+                logger.warning(f"Rejected position history row for tag {rows[0][0]} at {rows[0][1]}: {str(e)}")
+                return 1
+        half = len(rows) // 2
+        rejected = await self._write_isolated(conn, rows[:half])
+        return rejected + await self._write_isolated(conn, rows[half:])
+
+    async def stop(self):
+        """Stop the flush task and write any remaining rows."""
+        if self.flush_task is not None:
+            # A flush in progress holds the lock with its rows already out of the
+            # buffer; let it finish so the task is only ever cancelled while idle
+            async with self.flush_lock:
+                self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        written = await self.flush()
+        logger.debug(f"Position history writer stopped, final flush wrote {written} rows")
+
+    def get_stats(self) -> dict:
+        """
+        Get writer statistics.
+
+        Returns:
+            dict: Queue depth, row counters and flush latency
+        """
+        return {
+            'queue_depth': len(self.buffer),
+            'max_queue_depth': self.max_queue_depth,
+            'rows_enqueued': self.rows_enqueued,
+            'rows_written': self.rows_written,
+            'rows_dropped': self.rows_dropped,
+            'rows_failed': self.rows_failed,
+            'flush_count': self.flush_count,
+            'backpressure_waits': self.backpressure_waits,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+            'avg_flush_ms': round(self.total_flush_ms / self.flush_count, 3) if self.flush_count else 0.0,
+            'using_copy': self.use_copy
+        }
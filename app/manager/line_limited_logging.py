@@ -1,7 +1,7 @@
 # Name: line_limited_logging.py
-# Version: 0.1.0
+# Version: 0.1.1
 # Created: 250519
-# Modified: 250519
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: Custom logging handler for line-limited logs
@@ -10,40 +10,95 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.1 - Records go through a QueueHandler to a writer thread that batches writes and flushes once per burst,
+#                  rotation by line count and/or size tracked incrementally, flush() is a no-op for callers,
+#                  log_level_from_env for PARCO_LOG_LEVEL, bumped from 0.1.0
+
+"""
+Queued file logging for ParcoRTLS
+
+The handlers here never touch the file on the calling thread. emit() formats
+the record and puts it on a queue; a QueueListener thread writes the lines
+through a buffered file and flushes once the queue is empty, so a burst of
+records costs one flush instead of one per record.
+
+Rotation is decided by the writer from counters it keeps as it writes (lines
+and bytes); the existing file is only measured once, in the writer thread,
+when it is first opened.
+
+Callers that still call file_handler.flush() after a log call get a no-op.
+"""
+
+import atexit
 import logging
+import logging.handlers
 import os
-from typing import Optional
+import queue
+import threading
+from typing import List, Optional
+
+QUEUE_MAX_RECORDS = 100000  # Records waiting for the writer before new ones are dropped
+COUNT_CHUNK_BYTES = 1 << 20
+
+def log_level_from_env(default: int = logging.DEBUG) -> int:
+    """
+    Get the log level from PARCO_LOG_LEVEL (DEBUG, INFO, ...), or default when unset.
+
+    With INFO or above, hot-path debug calls guarded by isEnabledFor cost nothing.
+    """
+    level = logging.getLevelName(os.getenv("PARCO_LOG_LEVEL", "").strip().upper())
+    return level if isinstance(level, int) else default
+
+class _RotatingWriter(logging.Handler):
+    """
+    Buffered file writer with line/size rotation; only used from the listener thread.
+    """
 
-class LineLimitedFileHandler(logging.Handler):
-    def __init__(self, filename: str, max_lines: int = 999, backup_count: int = 4):
+    def __init__(self, filename: str, max_lines: Optional[int], max_bytes: Optional[int], backup_count: int):
         super().__init__()
         self.filename = filename
         self.max_lines = max_lines
+        self.max_bytes = max_bytes
         self.backup_count = backup_count
         self.current_lines = 0
-        self.file = None
-        self.open_file()
-
-    def open_file(self):
-        """Opens the log file in append mode and counts existing lines."""
-        if os.path.exists(self.filename):
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                self.current_lines = sum(1 for _ in f)
+        self.current_bytes = 0
+        self.counted = False
+        # Opened here so a bad path fails in the caller, like logging.FileHandler
         self.file = open(self.filename, 'a', encoding='utf-8')
 
+    def _measure(self):
+        """Measure the existing file once, in the writer thread."""
+        self.current_bytes = self.file.tell()
+        if self.max_lines is not None and self.current_bytes:
+            with open(self.filename, 'rb') as f:
+                lines = 0
+                chunk = f.read(COUNT_CHUNK_BYTES)
+                while chunk:
+                    lines += chunk.count(b'\n')
+                    chunk = f.read(COUNT_CHUNK_BYTES)
+            self.current_lines = lines
+        self.counted = True
+
     def emit(self, record: logging.LogRecord):
-        """Writes a log record and rotates if max_lines is reached."""
         try:
-            msg = self.format(record)
-            self.current_lines += 1
-            self.file.write(msg + '\n')
-            self.file.flush()
-
-            if self.current_lines >= self.max_lines:
+            if self.file is None:
+                return
+            if not self.counted:
+                self._measure()
+            line = self.format(record) + '\n'
+            self.file.write(line)
+            self.current_lines += line.count('\n')
+            self.current_bytes += len(line)
+            if ((self.max_lines is not None and self.current_lines >= self.max_lines) or
+                    (self.max_bytes is not None and self.current_bytes >= self.max_bytes)):
                 self.rotate()
-        except Exception as e:
+        except Exception:
             self.handleError(record)
 
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
     def rotate(self):
         """Rotates log files, keeping up to backup_count archives."""
         self.file.close()
@@ -58,13 +113,94 @@ class LineLimitedFileHandler(logging.Handler):
         # Move current log to .1
         if os.path.exists(self.filename):
             os.rename(self.filename, f"{self.filename}.1")
-        # Reset current_lines and reopen file
+        # A new file starts empty, nothing to count
         self.current_lines = 0
-        self.open_file()
+        self.current_bytes = 0
+        self.file = open(self.filename, 'a', encoding='utf-8')
 
     def close(self):
-        """Closes the file handle."""
         if self.file:
             self.file.close()
             self.file = None
-        super().close()
\ No newline at end of file
+        super().close()
+
+class _BatchingQueueListener(logging.handlers.QueueListener):
+    """QueueListener that flushes its handlers only when the queue runs dry."""
+
+    def handle(self, record: logging.LogRecord):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+_listeners: List[_BatchingQueueListener] = []
+_listeners_lock = threading.Lock()
+
+def _stop_listeners():
+    with _listeners_lock:
+        for listener in _listeners:
+            try:
+                listener.stop()
+            except Exception:
+                pass
+        _listeners.clear()
+
+atexit.register(_stop_listeners)
+
+class QueuedFileHandler(logging.handlers.QueueHandler):
+    """
+    File handler whose writes happen on a background writer thread.
+
+    Set the formatter on this handler as usual; the line is formatted in the
+    caller and written verbatim by the writer.
+    """
+
+    def __init__(self, filename: str, max_lines: Optional[int] = None, max_bytes: Optional[int] = None,
+                 backup_count: int = 4):
+        """
+        Initialize the handler and start its writer thread.
+
+        Args:
+            filename: Log file path
+            max_lines: Rotate after this many lines (None for no line limit)
+            max_bytes: Rotate after this many bytes (None for no size limit)
+            backup_count: Rotated files kept
+        """
+        super().__init__(queue.Queue(maxsize=QUEUE_MAX_RECORDS))
+        self.filename = filename
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped_records = 0
+        self.writer = _RotatingWriter(filename, max_lines, max_bytes, backup_count)
+        self.listener = _BatchingQueueListener(self.queue, self.writer)
+        self.listener.start()
+        with _listeners_lock:
+            _listeners.append(self.listener)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block the event loop on logging
+            self.dropped_records += 1
+
+    def flush(self):
+        """No-op: the writer thread flushes after each burst."""
+
+    def close(self):
+        """Drain pending records, then close the file."""
+        listener = getattr(self, 'listener', None)
+        if listener is not None:
+            with _listeners_lock:
+                if listener in _listeners:
+                    _listeners.remove(listener)
+            if listener._thread is not None:
+                listener.stop()
+            self.writer.close()
+            self.listener = None
+        super().close()
+
+class LineLimitedFileHandler(QueuedFileHandler):
+    def __init__(self, filename: str, max_lines: int = 999, backup_count: int = 4, max_bytes: Optional[int] = None):
+        super().__init__(filename, max_lines=max_lines, max_bytes=max_bytes, backup_count=backup_count)
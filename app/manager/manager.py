@@ -1,7 +1,7 @@
 # Name: manager.py
-# Version: 0.1.24
+# Version: 0.1.32
 # Created: 971201
-# Modified: 250716
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: AI Assistant + Claude
 # Description: Streamlined Python script for ParcoRTLS backend + Event Engine (TETSE) WebSocket support with RTLS message filtering
@@ -11,6 +11,14 @@
 # Dependent: TRUE
 
 # /home/parcoadmin/parco_fastapi/app/manager/manager.py
+# Version: 0.1.32 - Trigger reloads of an already loaded zone no longer block parser_data_arrived, bumped from 0.1.31
+# Version: 0.1.31 - Added broadcast_events_instance for batched event fan-out, bumped from 0.1.30
+# Version: 0.1.30 - Log through QueuedFileHandler, level from PARCO_LOG_LEVEL, debug output in parser_data_arrived built only when enabled, bumped from 0.1.29
+# Version: 0.1.29 - Added on_position_processed hook so subclasses reuse the processed record, bumped from 0.1.28
+# Version: 0.1.28 - Reload zone triggers only when the zone state is missing or invalidated, attach maint pool to the trigger handler, bumped from 0.1.27
+# Version: 0.1.27 - Pass PositionRecord straight to store_position_history, bumped from 0.1.26
+# Version: 0.1.26 - Flush buffered position history on shutdown, report history writer stats, bumped from 0.1.25
+# Version: 0.1.25 - Flush and stop the shared MQTT publisher on shutdown, report its stats, bumped from 0.1.24
 # Version: 0.1.24 - Added RTLS message filtering integration for database-driven routing, bumped from 0.1.23
 # Version: 0.1.23 - Fully modularized manager with all components extracted, bumped from 0.1.22
 # Version: 0.1.22 - Modularized database operations into manager_database.py, bumped from 0.1.21
@@ -43,7 +51,7 @@ from fastapi import WebSocket
 
 # Core imports
 from manager.enums import eMode, eRunState
-from manager.models import GISData
+from manager.models import GISData, PositionRecord
 
 # Modular component imports
 from manager.manager_database import ManagerDatabase
@@ -51,6 +59,8 @@ from manager.manager_heartbeat import ManagerHeartbeat
 from manager.manager_data import ManagerData
 from manager.manager_triggers import ManagerTriggers
 from manager.manager_clients import ManagerClients
+from manager.mqtt_publisher import get_mqtt_publisher
+from manager.line_limited_logging import QueuedFileHandler, log_level_from_env
 
 # Ensure log directory exists
 LOG_DIR = "/home/parcoadmin/parco_fastapi/logs"
@@ -58,18 +68,18 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 # Configure logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(log_level_from_env(logging.DEBUG))
 
 # StreamHandler for console output
 stream_handler = logging.StreamHandler()
 stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
 
-# FileHandler for persistent logging
+# Queued file handler for persistent logging (written by a background thread)
 try:
-    file_handler = logging.FileHandler(os.path.join(LOG_DIR, "manager.log"))
+    file_handler = QueuedFileHandler(os.path.join(LOG_DIR, "manager.log"))
 except Exception as e:
     logger.error(f"Failed to create manager.log: {e}, falling back to manager_fallback.log")
-    file_handler = logging.FileHandler(os.path.join(LOG_DIR, "manager_fallback.log"))
+    file_handler = QueuedFileHandler(os.path.join(LOG_DIR, "manager_fallback.log"))
 file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
 
 # Set handlers
@@ -130,7 +140,6 @@ class Manager:
         self.kill_list = self.client_manager.kill_list
         
         logger.debug(f"Initialized streamlined Manager with name={name}, zone_id={zone_id}")
-        file_handler.flush()
 
     async def start(self) -> bool:
         """
@@ -140,7 +149,6 @@ class Manager:
             bool: True if started successfully, False otherwise
         """
         logger.debug(f"Manager {self.name} starting: Setting run_state to Starting, zone_id={self.zone_id}")
-        file_handler.flush()
         
         try:
             self.start_date = datetime.now()
@@ -148,7 +156,6 @@ class Manager:
             
             logger.info("------- Manager Started --------")
             logger.info(f"Manager starting with zone_id: {self.zone_id}")
-            file_handler.flush()
             
             # 1. Initialize database and load configuration
             if not await self.database.initialize_connection_strings():
@@ -169,13 +176,13 @@ class Manager:
             # 2. Create database pool
             if not await self.database.create_database_pool():
                 logger.error("Failed to create database pool")
-                file_handler.flush()
                 raise Exception("Database pool creation failed")
             
             logger.debug("Database initialization complete")
-            file_handler.flush()
             
-            # 3. Load triggers for the current zone
+            # 3. Load triggers for the current zone (bulk SQL on the maint pool when available)
+            if self.database.conn_string:
+                await self.triggers.attach_database(self.database.conn_string)
             current_zone_id = self.get_current_zone_id()
             if current_zone_id is not None:
                 if not await self.triggers.load_triggers(zone_id=current_zone_id):
@@ -185,7 +192,6 @@ class Manager:
             else:
                 logger.warning(f"Skipping trigger loading because zone_id is None for manager {self.name}")
             
-            file_handler.flush()
             
             # 4. Start heartbeat loop
             if not await self.heartbeat.start_heartbeat_loop(self):
@@ -196,7 +202,6 @@ class Manager:
             # 5. Start data monitoring
             asyncio.create_task(self.data.start_monitoring(self))
             logger.debug("Data monitoring started")
-            file_handler.flush()
             
             # 5.5. Initialize RTLS message filtering for database-driven routing
             try:
@@ -204,18 +209,15 @@ class Manager:
                 logger.info(f"RTLS message filtering initialized for manager {self.name}")
             except Exception as e:
                 logger.warning(f"RTLS message filtering not available for manager {self.name}: {str(e)}")
-            file_handler.flush()
             
             # 6. Set run state to started
             self.run_state = eRunState.Started
             logger.debug(f"Run state set to {self.run_state}")
-            file_handler.flush()
             
             return True
             
         except Exception as e:
             logger.error(f"Start Error: {str(e)}")
-            file_handler.flush()
             self.run_state = eRunState.Stopped
             return False
 
@@ -227,7 +229,6 @@ class Manager:
             bool: True if shutdown completed successfully
         """
         logger.info("Manager shutting down...")
-        file_handler.flush()
         
         try:
             # Set run state to stopped (this will stop loops)
@@ -239,16 +240,21 @@ class Manager:
             # Shutdown all clients
             await self.client_manager.shutdown_all_clients()
             
-            # Close database connections
+            # Flush queued MQTT trigger events and close the broker connection
+            await get_mqtt_publisher().stop()
+            
+            # Stop listening for trigger changes
+            await self.triggers.close()
+            
+            # Write buffered position history, then close database connections
+            await self.database.flush_position_history()
             await self.database.close_connections()
             
             logger.info("Manager shutdown complete")
-            file_handler.flush()
             return True
             
         except Exception as e:
             logger.error(f"Error during manager shutdown: {str(e)}")
-            file_handler.flush()
             return False
 
     async def parser_data_arrived(self, sm: dict) -> bool:
@@ -264,28 +270,33 @@ class Manager:
         NEW: Now supports RTLS message filtering for selective routing to 
         Dashboard, RealTime, and Logging based on database configuration.
         """
-        logger.debug(f"Parser data arrived: {sm}")
-        file_handler.flush()
+        # Checked once per message; the f-strings below are only built when DEBUG is on
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Parser data arrived: {sm}")
         
         try:
             zone_id = sm.get('zone_id', self.zone_id)
-            logger.debug(f"Extracted zone_id from sm: {zone_id}, manager zone_id: {self.zone_id}")
+            if debug:
+                logger.debug(f"Extracted zone_id from sm: {zone_id}, manager zone_id: {self.zone_id}")
             
             # Process GIS data (now includes optional RTLS filtering)
             msg = await self.data.process_gis_data(sm, zone_id)
+            self.on_position_processed(msg, sm)
             
             # Check RTLS filtering decisions for routing
             should_log = self.data.should_log_message(msg)
             should_dashboard = self.data.should_send_to_dashboard(msg)
             should_realtime = self.data.should_send_realtime(msg)
             
-            logger.debug(f"RTLS filtering for tag {msg.id}: log={should_log}, dashboard={should_dashboard}, realtime={should_realtime}")
+            if debug:
+                logger.debug(f"RTLS filtering for tag {msg.id}: log={should_log}, dashboard={should_dashboard}, realtime={should_realtime}")
             
-            # Load triggers if needed for this zone
-            if not any(t.zone_id == zone_id for t in self.triggers.triggers):
-                logger.debug(f"No triggers loaded for zone {zone_id}, loading now")
-                await self.triggers.load_triggers(zone_id)
-                logger.debug(f"Loaded triggers for zone {zone_id} based on GISData message")
+            # Load triggers if this zone was never loaded or was invalidated (empty zones stay cached);
+            # only a first load is awaited, a reload runs in the background
+            if self.triggers.needs_load(zone_id):
+                logger.debug(f"Trigger state for zone {zone_id} missing or stale, loading")
+                await self.triggers.ensure_zone_loaded(zone_id)
             
             # Compute averaging if enabled
             if self.is_ave:
@@ -293,13 +304,10 @@ class Manager:
             
             # Store position data (skip for simulation data AND respect RTLS filtering)
             if msg.type != "Sim POTTER" and self.database.is_database_ready() and should_log:
-                msg_data = {
-                    'id': msg.id, 'ts': msg.ts, 'x': msg.x, 'y': msg.y, 
-                    'z': msg.z, 'cnf': msg.cnf, 'gwid': msg.gwid, 'bat': msg.bat
-                }
-                await self.database.store_position_history(msg_data)
-                logger.debug(f"Position logged for tag {msg.id} (RTLS filtering: log={should_log})")
-            elif not should_log:
+                await self.database.store_position_history(msg)
+                if debug:
+                    logger.debug(f"Position logged for tag {msg.id} (RTLS filtering: log={should_log})")
+            elif not should_log and debug:
                 logger.debug(f"Position not logged for tag {msg.id} (filtered by RTLS routing rules)")
             
             # Create tag object and evaluate triggers
@@ -310,8 +318,9 @@ class Manager:
             for event in events:
                 if should_dashboard or should_realtime:
                     await self.client_manager.broadcast_trigger_event(event, msg.id)
-                    logger.debug(f"Trigger event broadcast for tag {msg.id} (RTLS filtering: dashboard={should_dashboard}, realtime={should_realtime})")
-                else:
+                    if debug:
+                        logger.debug(f"Trigger event broadcast for tag {msg.id} (RTLS filtering: dashboard={should_dashboard}, realtime={should_realtime})")
+                elif debug:
                     logger.debug(f"Trigger event not broadcast for tag {msg.id} (filtered by RTLS routing rules)")
             
             # Broadcast averaged data if available (respect RTLS filtering)
@@ -319,17 +328,30 @@ class Manager:
                 ave_data = await self.data.get_averaged_data(msg.id, zone_id, msg.sequence or 0)
                 if ave_data:
                     await self.client_manager.broadcast_averaged_data(msg.id, ave_data)
-                    logger.debug(f"Averaged data broadcast for tag {msg.id} (RTLS filtering enabled)")
-            elif self.is_ave and not (should_dashboard or should_realtime):
+                    if debug:
+                        logger.debug(f"Averaged data broadcast for tag {msg.id} (RTLS filtering enabled)")
+            elif self.is_ave and not (should_dashboard or should_realtime) and debug:
                 logger.debug(f"Averaged data not broadcast for tag {msg.id} (filtered by RTLS routing rules)")
             
             return True
             
         except Exception as e:
             logger.error(f"ParserDataArrived Error: {str(e)}")
-            file_handler.flush()
             return False
 
+    def on_position_processed(self, msg: PositionRecord, sm: dict) -> None:
+        """
+        Hook called with every position record accepted by parser_data_arrived.
+        
+        Subclasses override it to consume the processed record instead of
+        running process_gis_data a second time. Must not block.
+        
+        Args:
+            msg: Processed position record (routing info attached when filtering is on)
+            sm: Raw message dictionary
+        """
+        pass
+
     async def process_sim_message(self, sm: dict) -> bool:
         """
         Process simulation message.
@@ -341,7 +363,6 @@ class Manager:
             bool: True if processed successfully
         """
         logger.debug(f"Processing sim message: {sm}")
-        file_handler.flush()
         
         try:
             processed_sm = await self.data.process_sim_message(sm)
@@ -349,13 +370,11 @@ class Manager:
             
         except Exception as e:
             logger.error(f"ProcessSimMessage Error: {str(e)}")
-            file_handler.flush()
             return False
 
     def get_current_zone_id(self) -> int:
         """Get the current zone ID."""
         logger.debug(f"Returning current zone_id: {self.zone_id}")
-        file_handler.flush()
         return getattr(self, 'zone_id')
 
     # Client Management Methods (for backward compatibility)
@@ -371,6 +390,10 @@ class Manager:
         """Broadcast event to entity subscribers (instance method)."""
         return await self.client_manager.broadcast_event(entity_id, data)
 
+    def broadcast_events_instance(self, events) -> int:
+        """Broadcast a batch of (entity_id, data) events to their subscribers."""
+        return self.client_manager.broadcast_events(events)
+
     # Static Methods (for backward compatibility with existing code)
     @staticmethod
     async def add_client(reqid: str, websocket: WebSocket):
@@ -391,6 +414,10 @@ class Manager:
         """Load triggers for a zone (delegates to trigger handler)."""
         return await self.triggers.load_triggers(zone_id)
 
+    def invalidate_triggers(self, zone_id: int | None = None):
+        """Force a trigger reload for a zone, or all zones, on the next message."""
+        self.triggers.invalidate_zone(zone_id)
+
     async def close_client(self, client):
         """Close an SDK client (delegates to heartbeat handler)."""
         await self.heartbeat._close_client(self, client)
@@ -480,12 +507,14 @@ class Manager:
             },
             'database': {
                 'ready': self.database.is_database_ready(),
-                'connection_strings': self.database.get_connection_strings()
+                'connection_strings': self.database.get_connection_strings(),
+                'history_writer': self.database.get_history_writer_stats()
             },
             'heartbeat': self.heartbeat.get_heartbeat_stats(),
             'data': self.data.get_data_stats(),
             'triggers': self.triggers.get_trigger_stats(),
-            'clients': self.client_manager.get_client_stats()
+            'clients': self.client_manager.get_client_stats(),
+            'mqtt': get_mqtt_publisher().get_stats()
         }
         
         # Add RTLS filtering statistics if available
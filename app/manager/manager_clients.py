@@ -1,7 +1,7 @@
 # Name: manager_clients.py
-# Version: 0.1.0
+# Version: 0.1.5
 # Created: 250703
-# Modified: 250703
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: AI Assistant
 # Description: Client manager handler module for ParcoRTLS Manager - Extracted from manager.py v0.1.22
@@ -10,6 +10,13 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.5 - Trigger events reach SDK clients through SDKClient.enqueue (their own delivery task) instead of the fan-out queues, bumped from 0.1.4
+# Version: 0.1.4 - Added broadcast_events to fan out a batch of entity events in one pass, bumped from 0.1.3
+# Version: 0.1.3 - get_sdk_client_info includes per-client delivery queue stats, bumped from 0.1.2
+# Version: 0.1.2 - Prefix index for ws_ave_ subscribers replaces startswith scan in broadcast_averaged_data, bumped from 0.1.1
+
+# Version: 0.1.1 - Queue broadcasts through per-client FanoutEngine send queues, serialize once, bumped from 0.1.0
+
 """
 Client Manager Handler Module for ParcoRTLS Manager
 
@@ -21,15 +28,27 @@ This module handles all client management operations for the Manager class inclu
 - Average data distribution to subscribed clients
 
 Extracted from manager.py v0.1.22 for better modularity and maintainability.
+
+Broadcasts are queued through a FanoutEngine: each message is serialized once
+and handed to per-client bounded send queues, so a slow client never blocks
+the caller or the other recipients.
+
+Averaged-data subscribers are found through a prefix index maintained as
+topics are added and removed, so a broadcast costs O(subscribers of the tag)
+rather than a startswith() scan over every topic.
 """
 
 import logging
-from typing import Dict, List
+from typing import Dict, Iterable, List, Set, Tuple
 from fastapi import WebSocket
 from manager.sdk_client import SDKClient
+from manager.fanout import FanoutEngine, DEFAULT_QUEUE_SIZE, DEFAULT_POLICY, serialize_message
 
 logger = logging.getLogger(__name__)
 
+# Topic prefix for averaged-data subscriptions (ws_ave_{tag_id}...)
+AVE_TOPIC_PREFIX = "ws_ave_"
+
 class ManagerClients:
     """
     Handles all client management operations for the Manager class.
@@ -39,12 +58,15 @@ class ManagerClients:
     part of the main Manager class.
     """
     
-    def __init__(self, manager_name: str):
+    def __init__(self, manager_name: str, send_queue_size: int = DEFAULT_QUEUE_SIZE,
+                 slow_client_policy: str = DEFAULT_POLICY):
         """
         Initialize the client manager.
         
         Args:
             manager_name: Name of the manager instance for logging
+            send_queue_size: Frames queued per client before the slow-client policy applies
+            slow_client_policy: "drop_oldest" or "disconnect"
         """
         self.manager_name = manager_name
         
@@ -53,6 +75,12 @@ class ManagerClients:
         self.clients: Dict[str, List[WebSocket]] = {}  # Instance-level clients for TETSE WebSocket
         self.kill_list: List[SDKClient] = []
         
+        # Averaged-data topic index: tag ID prefix -> reqids starting with ws_ave_{prefix}
+        self.ave_topic_index: Dict[str, Set[str]] = {}
+        
+        # Outbound per-client send queues
+        self.fanout = FanoutEngine(send_queue_size, slow_client_policy, self._on_client_send_failed)
+        
         logger.debug(f"Initialized ManagerClients for manager: {manager_name}")
 
     # WebSocket Client Management
@@ -69,8 +97,7 @@ class ManagerClients:
         """
         try:
             logger.debug(f"Adding WebSocket client for reqid {reqid}")
-            if reqid not in self.clients:
-                self.clients[reqid] = []
+            self._ensure_topic(reqid)
             self.clients[reqid].append(websocket)
             logger.debug(f"After adding client, total clients: {sum(len(clients) for clients in self.clients.values())}")
             return True
@@ -95,7 +122,9 @@ class ManagerClients:
                 if websocket in self.clients[reqid]:
                     self.clients[reqid].remove(websocket)
                 if not self.clients[reqid]:
-                    del self.clients[reqid]
+                    self._drop_topic(reqid)
+            if not self._is_tracked(websocket):
+                self.fanout.unregister(websocket)
             logger.debug(f"After removing client, total clients: {sum(len(clients) for clients in self.clients.values())}")
             return True
         except Exception as e:
@@ -134,7 +163,8 @@ class ManagerClients:
         """
         try:
             if client_id in self.sdk_clients:
-                del self.sdk_clients[client_id]
+                client = self.sdk_clients.pop(client_id)
+                self.fanout.unregister(client.websocket)
                 logger.debug(f"Removed SDK client {client_id}, total SDK clients: {len(self.sdk_clients)}")
                 return True
             return False
@@ -159,42 +189,36 @@ class ManagerClients:
         """
         Broadcast trigger event to relevant SDK and WebSocket clients.
         
+        The message is serialized once and queued for every recipient;
+        SDK clients get it through their own delivery queue (SDKClient.enqueue),
+        other WebSocket clients through their fan-out writer task.
+        
         Args:
             event_message: Trigger event message to broadcast
             msg_id: Message/tag ID for filtering
             
         Returns:
-            int: Number of clients message was sent to
+            int: Number of clients the message was queued for
         """
-        sent_count = 0
-        
         try:
-            # Send to SDK clients
+            frame = serialize_message(event_message)
+            queued = 0
             for client_id, client in self.sdk_clients.items():
-                try:
-                    if not client.is_closing and client.contains_tag(msg_id):
-                        await client.websocket.send_json(event_message)
-                        logger.info(f"Sent TriggerEvent to SDK client {client_id}: {event_message}")
-                        sent_count += 1
-                    else:
-                        logger.debug(f"Skipping SDK client {client_id}: closing={client.is_closing}, contains_tag={client.contains_tag(msg_id)}")
-                except Exception as e:
-                    logger.error(f"Failed to send TriggerEvent to SDK client {client_id}: {str(e)}")
-
-            # Send to WebSocket clients
-            for reqid, clients in self.clients.items():
-                for client in clients:
-                    try:
-                        await client.send_json(event_message)
-                        logger.debug(f"Sent TriggerEvent to WebSocket client {reqid}: {event_message}")
-                        sent_count += 1
-                    except Exception as e:
-                        logger.error(f"Failed to send TriggerEvent to WebSocket client {reqid}: {str(e)}")
-                        
+                if not client.is_closing and client.contains_tag(msg_id):
+                    if client.enqueue(frame):
+                        queued += 1
+                else:
+                    logger.debug(f"Skipping SDK client {client_id}: closing={client.is_closing}")
+            recipients = []
+            for clients in self.clients.values():
+                recipients.extend(clients)
+            
+            queued += self.fanout.publish(recipients, frame, "TriggerEvent")
+            logger.debug(f"Queued TriggerEvent for tag {msg_id} to {queued} clients")
+            return queued
         except Exception as e:
             logger.error(f"Failed to broadcast trigger event: {str(e)}")
-            
-        return sent_count
+            return 0
 
     async def broadcast_averaged_data(self, tag_id: str, ave_data: dict) -> int:
         """
@@ -205,31 +229,22 @@ class ManagerClients:
             ave_data: Averaged data to broadcast
             
         Returns:
-            int: Number of clients message was sent to
+            int: Number of clients the message was queued for
         """
-        sent_count = 0
-        
         try:
-            topic = f"ws_ave_{tag_id}"
-            logger.debug(f"Broadcasting averaged data for tag ID:{tag_id} on topic {topic}")
+            topic = f"{AVE_TOPIC_PREFIX}{tag_id}"
+            recipients = []
+            for reqid in self.ave_topic_index.get(str(tag_id), ()):
+                recipients.extend(self.clients.get(reqid, ()))
+            if not recipients:
+                return 0
             
-            for reqid, clients in list(self.clients.items()):
-                if reqid.startswith(topic):
-                    for client in clients:
-                        try:
-                            await client.send_json(ave_data)
-                            logger.debug(f"Sent AveragedData to WebSocket client {reqid}: {ave_data}")
-                            sent_count += 1
-                        except Exception as e:
-                            logger.error(f"Failed to send AveragedData to WebSocket client {reqid}: {str(e)}")
-                            clients.remove(client)
-                            if not clients:
-                                del self.clients[reqid]
-                                
+            queued = self.fanout.publish(recipients, ave_data, topic)
+            logger.debug(f"Queued AveragedData for tag ID:{tag_id} to {queued} clients")
+            return queued
         except Exception as e:
             logger.error(f"Failed to broadcast averaged data: {str(e)}")
-            
-        return sent_count
+            return 0
 
     async def broadcast_event(self, entity_id: str, data: dict) -> int:
         """
@@ -240,30 +255,114 @@ class ManagerClients:
             data: Event data to broadcast
             
         Returns:
-            int: Number of clients message was sent to
+            int: Number of clients the message was queued for
         """
-        sent_count = 0
-        
         try:
             topic = f"ws_event_{entity_id}"
-            logger.debug(f"Broadcasting event for {entity_id}: {data}")
-            
             if topic not in self.clients:
                 logger.debug(f"No active subscribers for topic {topic}")
                 return 0
-                
-            for client in self.clients[topic]:
-                try:
-                    await client.send_json(data)
-                    logger.debug(f"Sent event to client on topic {topic}")
-                    sent_count += 1
-                except Exception as e:
-                    logger.error(f"Failed to send event to client on topic {topic}: {str(e)}")
-                    
+            
+            queued = self.fanout.publish(self.clients[topic], data, topic)
+            logger.debug(f"Queued event for {entity_id} to {queued} clients")
+            return queued
         except Exception as e:
             logger.error(f"Failed to broadcast event: {str(e)}")
+            return 0
+
+    def broadcast_events(self, events: Iterable[Tuple[str, dict]]) -> int:
+        """
+        Broadcast a batch of events to the clients subscribed to their entities.
+        
+        Events are queued in order without yielding between them; entities
+        without subscribers are skipped without logging each one.
+        
+        Args:
+            events: (entity_id, data) pairs
             
-        return sent_count
+        Returns:
+            int: Number of client deliveries queued
+        """
+        queued = 0
+        count = 0
+        for entity_id, data in events:
+            count += 1
+            clients = self.clients.get(f"ws_event_{entity_id}")
+            if not clients:
+                continue
+            try:
+                queued += self.fanout.publish(clients, data, f"ws_event_{entity_id}")
+            except Exception as e:
+                logger.error(f"Failed to broadcast event for {entity_id}: {str(e)}")
+        logger.debug(f"Queued {count} events to {queued} client deliveries")
+        return queued
+
+    # Topic Index
+    def _ensure_topic(self, reqid: str):
+        """
+        Create the client list for a topic and index it on first use.
+        
+        An averaged-data topic ws_ave_{suffix} is registered under every prefix
+        of its suffix, which matches the reqid.startswith(f"ws_ave_{tag_id}")
+        semantics broadcast_averaged_data has always had.
+        
+        Args:
+            reqid: Topic / request ID
+        """
+        if reqid in self.clients:
+            return
+        self.clients[reqid] = []
+        if reqid.startswith(AVE_TOPIC_PREFIX):
+            suffix = reqid[len(AVE_TOPIC_PREFIX):]
+            for end in range(len(suffix) + 1):
+                self.ave_topic_index.setdefault(suffix[:end], set()).add(reqid)
+
+    def _drop_topic(self, reqid: str) -> List[WebSocket]:
+        """
+        Remove a topic and its index entries.
+        
+        Args:
+            reqid: Topic / request ID
+            
+        Returns:
+            List[WebSocket]: Clients that were on the topic
+        """
+        removed = self.clients.pop(reqid, [])
+        if reqid.startswith(AVE_TOPIC_PREFIX):
+            suffix = reqid[len(AVE_TOPIC_PREFIX):]
+            for end in range(len(suffix) + 1):
+                reqids = self.ave_topic_index.get(suffix[:end])
+                if reqids is not None:
+                    reqids.discard(reqid)
+                    if not reqids:
+                        del self.ave_topic_index[suffix[:end]]
+        return removed
+
+    def _is_tracked(self, websocket: WebSocket) -> bool:
+        """Check whether a WebSocket is still referenced by any topic or SDK client."""
+        for clients in self.clients.values():
+            if any(client is websocket for client in clients):
+                return True
+        return any(client.websocket is websocket for client in self.sdk_clients.values())
+
+    def _on_client_send_failed(self, websocket: WebSocket):
+        """
+        Drop a client whose send queue failed or was disconnected as a slow consumer.
+        
+        Args:
+            websocket: WebSocket connection that failed
+        """
+        for reqid, clients in list(self.clients.items()):
+            remaining = [client for client in clients if client is not websocket]
+            if len(remaining) != len(clients):
+                logger.debug(f"Removing failed WebSocket client from {reqid}")
+                if remaining:
+                    self.clients[reqid] = remaining
+                else:
+                    self._drop_topic(reqid)
+        for client in self.sdk_clients.values():
+            if client.websocket is websocket:
+                self.mark_sdk_client_for_removal(client)
 
     # Client Cleanup and Maintenance
     async def cleanup_disconnected_clients(self) -> int:
@@ -294,7 +393,10 @@ class ManagerClients:
                 if active_clients:
                     self.clients[reqid] = active_clients
                 else:
-                    del self.clients[reqid]
+                    self._drop_topic(reqid)
+                for client in clients:
+                    if not self._is_tracked(client):
+                        self.fanout.unregister(client)
                     
         except Exception as e:
             logger.error(f"Failed to cleanup disconnected clients: {str(e)}")
@@ -330,6 +432,7 @@ class ManagerClients:
                             await client.close()
                         # Remove from tracking
                         del self.sdk_clients[client.client_id]
+                        self.fanout.unregister(client.websocket)
                         removed_count += 1
                         logger.debug(f"Removed SDK client {client.client_id} from kill list")
                 except Exception as e:
@@ -421,6 +524,8 @@ class ManagerClients:
             'total_sdk_clients': len(self.sdk_clients),
             'websocket_topics': len(self.clients),
             'clients_marked_for_removal': len(self.kill_list),
+            'fanout': self.fanout.get_stats(),
+            'indexed_ave_prefixes': len(self.ave_topic_index),
             'topic_breakdown': {reqid: len(clients) for reqid, clients in self.clients.items()}
         }
 
@@ -440,7 +545,8 @@ class ManagerClients:
                     'failed_heartbeat': getattr(client, 'failed_heartbeat', False),
                     'heartbeat': getattr(client, 'heartbeat', 0),
                     'zone_id': getattr(client, 'zone_id', None),
-                    'tag_count': len(getattr(client, 'tags', [])) if hasattr(client, 'tags') else 0
+                    'tag_count': len(getattr(client, 'tags', [])) if hasattr(client, 'tags') else 0,
+                    'delivery': client.get_stats()
                 }
             except Exception as e:
                 client_info[client_id] = {'error': str(e)}
@@ -513,6 +619,9 @@ class ManagerClients:
         try:
             logger.info("Shutting down all clients...")
             
+            # Stop writer tasks before closing sockets
+            self.fanout.close_all()
+            
             # Close all SDK clients
             for client_id, client in list(self.sdk_clients.items()):
                 try:
@@ -535,6 +644,7 @@ class ManagerClients:
                         logger.error(f"Failed to close WebSocket client in {reqid}: {str(e)}")
                         
             self.clients.clear()
+            self.ave_topic_index.clear()
             self.kill_list.clear()
             
             logger.info("All clients shutdown complete")
@@ -576,7 +686,10 @@ class ManagerClients:
         """
         if topic in self.clients:
             count = len(self.clients[topic])
-            del self.clients[topic]
+            removed = self._drop_topic(topic)
+            for client in removed:
+                if not self._is_tracked(client):
+                    self.fanout.unregister(client)
             logger.debug(f"Cleared {count} clients from topic {topic}")
             return count
         return 0
@@ -593,8 +706,7 @@ class ManagerClients:
             bool: True if subscription successful
         """
         try:
-            if topic not in self.clients:
-                self.clients[topic] = []
+            self._ensure_topic(topic)
             if websocket not in self.clients[topic]:
                 self.clients[topic].append(websocket)
                 logger.debug(f"Subscribed client to topic {topic}")
@@ -619,7 +731,9 @@ class ManagerClients:
             if topic in self.clients and websocket in self.clients[topic]:
                 self.clients[topic].remove(websocket)
                 if not self.clients[topic]:
-                    del self.clients[topic]
+                    self._drop_topic(topic)
+                if not self._is_tracked(websocket):
+                    self.fanout.unregister(websocket)
                 logger.debug(f"Unsubscribed client from topic {topic}")
                 return True
             return False
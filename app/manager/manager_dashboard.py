@@ -1,7 +1,7 @@
 # Name: manager_dashboard.py
-# Version: 0.1.1
+# Version: 0.1.2
 # Created: 250712
-# Modified: 250712
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin + Claude
 # Description: Dedicated Dashboard Manager for ParcoRTLS - Customer-facing dashboard data broker - Fixed import and database issues
@@ -10,6 +10,8 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.2 - Consume processed position records via on_position_processed, per-tag coalescing bounded buffer, single routing pass per message, bumped from 0.1.1
+
 """
 Dashboard Manager for ParcoRTLS
 
@@ -25,13 +27,19 @@ Key Features:
 
 Data Flow:
 Hardware → DashboardManager → websocket_dashboard.py:8008 → Customer frontends
+
+Positions are taken from the base manager after it has processed them (no second
+process_gis_data pass) and buffered per tag; within a tick only the latest
+position of a tag is kept. Each tick the batch is prepared once and routed
+through every customer's decision table, then broadcast per customer.
 """
 
 import asyncio
 import logging
 import json
 from datetime import datetime
-from typing import Dict, List, Optional, Any, Set
+import time
+from typing import Dict, List, Optional, Any, Set, Tuple
 from dataclasses import dataclass
 
 # Centralized configuration
@@ -61,7 +69,7 @@ logger = logging.getLogger(__name__)
 
 # Core manager imports
 from .manager import Manager
-from .models import GISData, Tag
+from .models import GISData, Tag, PositionRecord
 from .enums import eRunState
 
 # Message routing - conditional import for graceful fallback
@@ -97,6 +105,8 @@ logger = logging.getLogger(__name__)
 DASHBOARD_RESOURCE_TYPE = 8008
 DASHBOARD_PORT = 8008
 DASHBOARD_STREAM_TYPE = "Dashboard"
+DASHBOARD_TICK = 0.25                # Seconds between dashboard pushes; positions coalesce per tag within a tick
+DASHBOARD_MAX_PENDING_TAGS = 5000    # Distinct tags buffered per tick before new tags are dropped
 
 @dataclass
 class DashboardCustomer:
@@ -128,12 +138,20 @@ class DashboardManager(Manager):
         
         # Dashboard-specific attributes
         self.dashboard_customers: Dict[int, DashboardCustomer] = {}
-        self.message_queue: asyncio.Queue = asyncio.Queue()
         self.processing_task: Optional[asyncio.Task] = None
         
+        # Latest processed position per tag waiting for the next tick, with its sensor payload
+        self.pending_positions: Dict[str, Tuple[PositionRecord, str]] = {}
+        self.pending_event = asyncio.Event()
+        self.tick_interval = DASHBOARD_TICK
+        self.max_pending_tags = DASHBOARD_MAX_PENDING_TAGS
+        
         # Performance tracking
         self.messages_processed = 0
         self.messages_routed = 0
+        self.messages_coalesced = 0
+        self.messages_dropped = 0
+        self.batches_sent = 0
         self.customers_active = 0
         
         logger.info(f"Dashboard Manager '{name}' initialized for zone {zone_id}")
@@ -269,93 +287,106 @@ class DashboardManager(Manager):
         self.customers_active = 1
         logger.info("Loaded default dashboard customer")
 
-    async def parser_data_arrived(self, sm: dict) -> bool:
+    def on_position_processed(self, msg: PositionRecord, sm: dict) -> None:
         """
-        Override base manager data processing for dashboard-specific handling.
+        Buffer a position record processed by the base manager for the next tick.
         
         Args:
-            sm: Raw message dictionary
-            
-        Returns:
-            bool: True if processed successfully
+            msg: Processed position record
+            sm: Raw message dictionary (source of the sensor payload)
         """
-        # Process message using base manager logic first
-        success = await super().parser_data_arrived(sm)
-        if not success:
-            return False
-        
-        # Add to dashboard processing queue
-        await self.message_queue.put(sm)
         self.messages_processed += 1
         
-        return True
+        if msg.id in self.pending_positions:
+            # Only the latest position of a tag is pushed per tick
+            self.messages_coalesced += 1
+        elif len(self.pending_positions) >= self.max_pending_tags:
+            self.messages_dropped += 1
+            if self.messages_dropped % 1000 == 1:
+                logger.warning(f"Dashboard buffer full ({self.max_pending_tags} tags), dropped {self.messages_dropped} positions so far")
+            return
+        
+        self.pending_positions[msg.id] = (msg, sm.get('sensor_payload', ''))
+        self.pending_event.set()
 
     async def _process_message_queue(self):
         """
-        Process messages from the queue for dashboard clients.
+        Push buffered positions to dashboard clients once per tick.
         """
         logger.info("Started dashboard message processing loop")
         
         while self.run_state == eRunState.Started:
             try:
-                # Get message from queue with timeout
-                sm = await asyncio.wait_for(self.message_queue.get(), timeout=1.0)
-                
-                # Process message for each customer
-                await self._process_dashboard_message(sm)
-                
+                # Wait for positions, waking up regularly to check the run state
+                await asyncio.wait_for(self.pending_event.wait(), timeout=1.0)
             except asyncio.TimeoutError:
-                # Normal timeout - continue loop
                 continue
+            
+            tick_start = time.monotonic()
+            try:
+                self.pending_event.clear()
+                batch = list(self.pending_positions.values())
+                self.pending_positions = {}
+                await self._process_dashboard_batch(batch)
             except Exception as e:
-                logger.error(f"Error processing dashboard message: {str(e)}")
-                await asyncio.sleep(1)
+                logger.error(f"Error processing dashboard messages: {str(e)}")
+            
+            # Let positions accumulate (and coalesce) until the next tick
+            remaining = self.tick_interval - (time.monotonic() - tick_start)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
 
-    async def _process_dashboard_message(self, sm: dict):
+    async def _process_dashboard_batch(self, batch: List[Tuple[PositionRecord, str]]):
         """
-        Process a single message for all dashboard customers.
+        Route one tick of positions for all dashboard customers and broadcast them.
+        
+        Each position is prepared (payload parsing and categorization) once and
+        then looked up in every customer's routing decision table.
         
         Args:
-            sm: Raw message dictionary
+            batch: (position record, sensor payload) pairs, one per tag
         """
-        try:
-            # Create GISData from raw message
-            msg = await self.data.process_gis_data(sm, sm.get('zone_id', self.zone_id))
+        if not batch:
+            return
+        
+        customers = [c for c in self.dashboard_customers.values() if c.is_active and c.message_router]
+        if not (HAS_MESSAGE_ROUTER and RouteAction and customers):
+            # Fallback: basic message processing without routing
+            await self._broadcast_basic_message([msg for msg, _payload in batch])
+            self.messages_routed += len(batch)
+            return
+        
+        for customer in customers:
+            await customer.message_router.ensure_configuration()
+        
+        # Parse payloads with a router that needs them, if any does
+        preparer = next((c.message_router for c in customers if c.message_router.payload_needed),
+                        customers[0].message_router)
+        
+        customer_messages: Dict[int, List[Any]] = {}
+        for msg, sensor_payload in batch:
+            try:
+                rtls_message, mask = await preparer.prepare_message(msg, sensor_payload)
+            except Exception as e:
+                logger.error(f"Failed to prepare dashboard message for tag {msg.id}: {str(e)}")
+                continue
             
-            if HAS_MESSAGE_ROUTER and RouteAction:
-                # Process message for each active customer with message routing
-                routed_messages = []
-                for customer_id, customer in self.dashboard_customers.items():
-                    if not customer.is_active or not customer.message_router:
-                        continue
-                    
-                    # Apply customer-specific routing
-                    routed_message = await customer.message_router.process_gis_message(
-                        msg, 
-                        sm.get('sensor_payload', '')
-                    )
-                    
-                    if routed_message and RouteAction.DASHBOARD in routed_message.actions:
-                        routed_messages.append(routed_message)
-                
-                # Broadcast to dashboard WebSocket if we have routed messages
-                if routed_messages:
-                    await self._broadcast_to_dashboard(routed_messages)
-                    self.messages_routed += len(routed_messages)
-            else:
-                # Fallback: basic message processing without routing
-                await self._broadcast_basic_message(msg)
-                self.messages_routed += 1
-                
-        except Exception as e:
-            logger.error(f"Failed to process dashboard message: {str(e)}")
+            for customer in customers:
+                routed_message = customer.message_router.route_prepared(rtls_message, mask)
+                if routed_message and RouteAction.DASHBOARD in routed_message.actions:
+                    customer_messages.setdefault(customer.customer_id, []).append(routed_message)
+        
+        # Broadcast to dashboard WebSocket if we have routed messages
+        if customer_messages:
+            await self._broadcast_to_dashboard(customer_messages)
+            self.messages_routed += sum(len(messages) for messages in customer_messages.values())
 
-    async def _broadcast_basic_message(self, msg: GISData):
+    async def _broadcast_basic_message(self, msgs: List[PositionRecord]):
         """
-        Fallback method to broadcast basic message without routing.
+        Fallback method to broadcast basic messages without routing.
         
         Args:
-            msg: GISData message to broadcast
+            msgs: Position records to broadcast
         """
         try:
             # Create basic dashboard message for all customers
@@ -372,38 +403,31 @@ class DashboardManager(Manager):
                     'confidence': msg.cnf,
                     'battery': msg.bat,
                     'gateway_id': msg.gwid
-                }]
+                } for msg in msgs]
             }
             
             # Broadcast to all customers
             if HAS_DASHBOARD_WEBSOCKET and websocket_dashboard:
                 target_customers = set(self.dashboard_customers.keys())
                 await websocket_dashboard.broadcast_dashboard_message(basic_data, target_customers)
+                self.batches_sent += 1
             else:
                 logger.debug("Dashboard WebSocket not available - message not broadcast")
                 
         except Exception as e:
             logger.error(f"Failed to broadcast basic message: {str(e)}")
 
-    async def _broadcast_to_dashboard(self, routed_messages: List[Any]):
+    async def _broadcast_to_dashboard(self, customer_messages: Dict[int, List[Any]]):
         """
         Broadcast routed messages to dashboard WebSocket clients.
         
         Args:
-            routed_messages: List of messages routed for dashboard display
+            customer_messages: Messages routed for dashboard display, by customer ID
         """
         try:
             if not HAS_DASHBOARD_WEBSOCKET or not websocket_dashboard:
                 logger.debug("Dashboard WebSocket not available - skipping broadcast")
                 return
-                
-            # Group messages by customer
-            customer_messages: Dict[int, List[Any]] = {}
-            for routed_msg in routed_messages:
-                customer_id = routed_msg.customer_id
-                if customer_id not in customer_messages:
-                    customer_messages[customer_id] = []
-                customer_messages[customer_id].append(routed_msg)
             
             # Send to each customer's dashboard clients
             for customer_id, messages in customer_messages.items():
@@ -418,6 +442,7 @@ class DashboardManager(Manager):
                 # Use the broadcast function from websocket_dashboard.py
                 target_customers = {customer_id}
                 await websocket_dashboard.broadcast_dashboard_message(dashboard_data, target_customers)
+                self.batches_sent += 1
                 
         except Exception as e:
             logger.error(f"Failed to broadcast to dashboard: {str(e)}")
@@ -470,7 +495,12 @@ class DashboardManager(Manager):
                 'customers_active': self.customers_active,
                 'messages_processed': self.messages_processed,
                 'messages_routed': self.messages_routed,
-                'queue_size': self.message_queue.qsize(),
+                'messages_coalesced': self.messages_coalesced,
+                'messages_dropped': self.messages_dropped,
+                'batches_sent': self.batches_sent,
+                'queue_size': len(self.pending_positions),
+                'queue_limit': self.max_pending_tags,
+                'tick_interval': self.tick_interval,
                 'routing_rate': (self.messages_routed / max(self.messages_processed, 1)) * 100
             },
             'customer_stats': {
@@ -1,7 +1,7 @@
 # Name: manager_data.py
-# Version: 0.1.1
+# Version: 0.1.4
 # Created: 250703
-# Modified: 250712
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: AI Assistant + ParcoAdmin + Claude
 # Description: Data processing handler module for ParcoRTLS Manager with RTLS message filtering integration
@@ -10,6 +10,12 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.4 - Debug output in process_gis_data only built when DEBUG is enabled, bumped from 0.1.3
+
+# Version: 0.1.3 - process_gis_data returns a __slots__ PositionRecord; triggers use it directly instead of a pydantic Tag, bumped from 0.1.2
+
+# Version: 0.1.2 - Averaging history moved to TagHistoryStore ring buffers with running sums and idle-tag expiry, bumped from 0.1.1
+
 """
 Data Processing Handler Module for ParcoRTLS Manager
 
@@ -23,14 +29,18 @@ This module handles all data processing operations for the Manager class includi
 
 Extracted from manager.py v0.1.22 for better modularity and maintainability.
 NEW: Added protocol-agnostic RTLS message filtering integration.
+
+Averaging history is held in TagHistoryStore ring buffers (x/y/z/time only,
+running sums) and idle tags are expired by the monitoring loop.
 """
 
 import asyncio
 import logging
 from datetime import datetime, timezone
 from typing import Dict, List, Optional
-from manager.models import GISData, Ave, Tag
+from manager.models import GISData, Ave, Tag, PositionRecord
 from manager.data_processor import DataProcessor
+from manager.tag_history import TagHistoryStore
 
 logger = logging.getLogger(__name__)
 
@@ -60,15 +70,12 @@ class ManagerData:
 
         # Averaging attributes (existing functionality preserved)
         self.ave_hash: Dict[str, Ave] = {}
-        self.tag_averages: Dict[str, List[Ave]] = {}
-        self.tag_averages_2d: Dict[str, List[Ave]] = {}
-        self.tag_averages_3d: Dict[str, List[Ave]] = {}
-        self.tag_timestamps: Dict[str, List[datetime]] = {}
-        self.tag_timestamps_2d: Dict[str, List[datetime]] = {}
-        self.tag_timestamps_3d: Dict[str, List[datetime]] = {}
+        # Last 5 samples per tag within a 30 s window; 2D and 3D averages share it
+        self.tag_history = TagHistoryStore(capacity=5, window_seconds=30.0, idle_expiry=300.0)
         
         # Rate monitoring (existing functionality preserved)
         self.tag_rate: Dict[str, int] = {}
+        self.tag_sample_counts: Dict[str, int] = {}
         self.last_rate_time = asyncio.get_event_loop().time()
         
         logger.debug(f"Initialized ManagerData for manager: {manager_name}")
@@ -94,7 +101,7 @@ class ManagerData:
         except Exception as e:
             logger.error(f"Failed to initialize RTLS message filtering: {e}")
 
-    async def process_gis_data(self, sm: dict, zone_id: int) -> GISData:
+    async def process_gis_data(self, sm: dict, zone_id: int) -> PositionRecord:
         """
         Process incoming GIS data from various sources.
         
@@ -103,7 +110,8 @@ class ManagerData:
             zone_id: Zone ID for the data
             
         Returns:
-            GISData: Processed GIS data object
+            PositionRecord: Processed position record (GISData-compatible attributes;
+                            use to_gisdata() where a pydantic model is required)
             
         Raises:
             ValueError: If data validation fails
@@ -111,25 +119,15 @@ class ManagerData:
         Note: All existing functionality preserved. Optional message filtering
               applied at the end if enabled.
         """
-        logger.debug(f"Processing GIS data: {sm}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Processing GIS data: {sm}")
         
         try:
-            # Create GISData object (existing functionality - preserved exactly)
-            msg = GISData(
-                id=sm['ID'],
-                type=sm['Type'],
-                ts=sm['TS'],
-                x=sm['X'],
-                y=sm['Y'],
-                z=sm['Z'],
-                bat=sm['Bat'],
-                cnf=sm['CNF'],
-                gwid=sm['GWID'],
-                data=sm.get('data', ""),  # Extract sensor payload if present
-                sequence=sm.get('Sequence')
-            )
-            msg.zone_id = zone_id
-            logger.debug(f"Set msg.zone_id to {msg.zone_id}")
+            # Lightweight record; pydantic models are only built at API boundaries
+            msg = PositionRecord.from_raw(sm, zone_id)
+            if debug:
+                logger.debug(f"Set msg.zone_id to {msg.zone_id}")
             
             # Existing validation (preserved exactly)
             if not msg.validate():
@@ -140,7 +138,8 @@ class ManagerData:
             
             # Existing averaging computation (preserved exactly)
             self.processor.compute_raw_average(msg)
-            logger.debug(f"Raw average computed for tag ID:{msg.id} over 5 positions (2D)")
+            if debug:
+                logger.debug(f"Raw average computed for tag ID:{msg.id} over 5 positions (2D)")
             
             # NEW: Apply optional RTLS message filtering
             if self.message_filter:
@@ -152,12 +151,13 @@ class ManagerData:
                     routed_message = await self.message_filter.filter_message(msg, sensor_payload or "")
                     
                     if routed_message:
-                        logger.debug(f"Message routed for tag {msg.id} with actions: {[a.value for a in routed_message.actions]}")
+                        if debug:
+                            logger.debug(f"Message routed for tag {msg.id} with actions: {[a.value for a in routed_message.actions]}")
                         
                         # Store routing information for later use by WebSocket handlers
                         # This allows WebSocket servers to check routing decisions
                         setattr(msg, '_routing_info', routed_message)  # type: ignore
-                    else:
+                    elif debug:
                         logger.debug(f"Message filtered out for tag {msg.id}")
                         # Note: We still return the message for backward compatibility
                         # WebSocket handlers can check for _routing_info to see if filtered
@@ -375,38 +375,18 @@ class ManagerData:
             return False
 
         try:
-            # Initialize averaging structures if needed
-            if msg.id not in self.tag_averages:
-                self.tag_averages[msg.id] = []
-                self.tag_timestamps[msg.id] = []
-            if msg.id not in self.tag_averages_2d:
-                self.tag_averages_2d[msg.id] = []
-                self.tag_timestamps_2d[msg.id] = []
-            if msg.id not in self.tag_averages_3d:
-                self.tag_averages_3d[msg.id] = []
-                self.tag_timestamps_3d[msg.id] = []
-
-            current_time = datetime.now(timezone.utc)
-
-            # 3D Averaging (default 5 samples)
-            self.tag_averages_3d[msg.id].append(msg)  # type: ignore
-            self.tag_timestamps_3d[msg.id].append(current_time)
-            while self.tag_timestamps_3d[msg.id] and (current_time - self.tag_timestamps_3d[msg.id][0]).total_seconds() > 30:
-                self.tag_averages_3d[msg.id].pop(0)
-                self.tag_timestamps_3d[msg.id].pop(0)
-            if len(self.tag_averages_3d[msg.id]) >= 5:
-                ave = Ave.average(self.tag_averages_3d[msg.id][-5:])  # type: ignore
+            ring = self.tag_history.add(msg.id, msg.x, msg.y, msg.z)
+            self.tag_sample_counts[msg.id] = self.tag_sample_counts.get(msg.id, 0) + 1
+
+            # Averages need the last 5 samples, all within the 30 s window
+            if ring.is_full():
+                # 3D Averaging (default 5 samples)
+                ave = Ave.from_ring(ring)
                 self.ave_hash[msg.id] = ave
                 logger.debug(f"Computed 3D average for tag ID:{msg.id}: x={ave.x}, y={ave.y}, z={ave.z}")
 
-            # 2D Averaging (default 5 samples)
-            self.tag_averages_2d[msg.id].append(msg)  # type: ignore
-            self.tag_timestamps_2d[msg.id].append(current_time)
-            while self.tag_timestamps_2d[msg.id] and (current_time - self.tag_timestamps_2d[msg.id][0]).total_seconds() > 30:
-                self.tag_averages_2d[msg.id].pop(0)
-                self.tag_timestamps_2d[msg.id].pop(0)
-            if len(self.tag_averages_2d[msg.id]) >= 5:
-                ave_2d = Ave.average_2d(self.tag_averages_2d[msg.id][-5:])  # type: ignore
+                # 2D Averaging (default 5 samples)
+                ave_2d = Ave.from_ring(ring, two_d=True)
                 self.ave_hash[msg.id] = ave_2d
                 logger.debug(f"Computed 2D average for tag ID:{msg.id}: x={ave_2d.x}, y={ave_2d.y}")
                 
@@ -465,19 +445,34 @@ class ManagerData:
         try:
             current_time = asyncio.get_event_loop().time()
             if current_time - self.last_rate_time >= 60:
-                self.tag_rate = {}
-                for tag_id, timestamps in self.tag_timestamps.items():
-                    while timestamps and (current_time - timestamps[0].timestamp()) > 60:
-                        timestamps.pop(0)
-                    rate = len(timestamps)
-                    self.tag_rate[tag_id] = rate
+                self.tag_rate = dict(self.tag_sample_counts)
+                self.tag_sample_counts.clear()
+                for tag_id, rate in self.tag_rate.items():
                     logger.debug(f"Tag {tag_id} rate: {rate} updates per minute")
                 self.last_rate_time = current_time
+            self.expire_idle_tags()
             return True
         except Exception as e:
             logger.error(f"Failed to monitor tag rates: {str(e)}")
             return False
 
+    def expire_idle_tags(self) -> int:
+        """
+        Drop averaging state for tags that stopped reporting.
+        
+        Returns:
+            int: Number of tags expired
+        """
+        expired = self.tag_history.expire_idle()
+        for tag_id in expired:
+            self.ave_hash.pop(tag_id, None)
+            self.tag_rate.pop(tag_id, None)
+            self.tag_sample_counts.pop(tag_id, None)
+        expired_raw = self.processor.expire_idle()
+        if expired or expired_raw:
+            logger.debug(f"Expired idle tags: {len(expired)} averaging, {len(expired_raw)} raw")
+        return len(expired)
+
     async def start_monitoring(self, manager_instance):
         """
         Start the tag data monitoring loop.
@@ -495,19 +490,22 @@ class ManagerData:
                 logger.error(f"MonitorTagData Error: {str(e)}")
                 await asyncio.sleep(10)
 
-    def create_tag_object(self, msg: GISData) -> Tag:
+    def create_tag_object(self, msg: PositionRecord | GISData) -> PositionRecord | Tag:
         """
-        Create a Tag object from GIS data.
+        Get the object used for trigger processing.
+        
+        Triggers only read id, x, y and z, so a PositionRecord is used as is;
+        a Tag model is built only for GISData input.
         
         Args:
-            msg: GIS data message
+            msg: Position record or GIS data message
             
         Returns:
-            Tag: Tag object for trigger processing
+            PositionRecord | Tag: Object with id, x, y, z for trigger processing
         """
-        tag = Tag(id=msg.id, x=msg.x, y=msg.y, z=msg.z)
-        logger.debug(f"Created Tag object: id={tag.id}, position=({tag.x}, {tag.y}, {tag.z})")
-        return tag
+        if isinstance(msg, PositionRecord):
+            return msg
+        return Tag.model_construct(id=msg.id, x=msg.x, y=msg.y, z=msg.z)
 
     def get_data_stats(self) -> dict:
         """
@@ -518,11 +516,12 @@ class ManagerData:
         """
         stats = {
             'tags_with_averages': len(self.ave_hash),
-            'tags_2d_tracking': len(self.tag_averages_2d),
-            'tags_3d_tracking': len(self.tag_averages_3d),
+            'tags_2d_tracking': len(self.tag_history),
+            'tags_3d_tracking': len(self.tag_history),
             'current_rates': dict(self.tag_rate),
             'last_rate_update': self.last_rate_time,
-            'total_tags_tracked': len(self.tag_timestamps)
+            'total_tags_tracked': len(self.tag_history),
+            'idle_tags_expired': self.tag_history.expired_count
         }
         
         # Add filtering statistics if available
@@ -542,24 +541,16 @@ class ManagerData:
         if tag_id is not None:
             # Clear specific tag
             self.ave_hash.pop(tag_id, None)
-            self.tag_averages.pop(tag_id, None)
-            self.tag_averages_2d.pop(tag_id, None)
-            self.tag_averages_3d.pop(tag_id, None)
-            self.tag_timestamps.pop(tag_id, None)
-            self.tag_timestamps_2d.pop(tag_id, None)
-            self.tag_timestamps_3d.pop(tag_id, None)
+            self.tag_history.discard(tag_id)
             self.tag_rate.pop(tag_id, None)
+            self.tag_sample_counts.pop(tag_id, None)
             logger.debug(f"Cleared data for tag: {tag_id}")
         else:
             # Clear all tags
             self.ave_hash.clear()
-            self.tag_averages.clear()
-            self.tag_averages_2d.clear()
-            self.tag_averages_3d.clear()
-            self.tag_timestamps.clear()
-            self.tag_timestamps_2d.clear()
-            self.tag_timestamps_3d.clear()
+            self.tag_history.clear()
             self.tag_rate.clear()
+            self.tag_sample_counts.clear()
             logger.debug("Cleared all tag data")
 
     def validate_data_integrity(self) -> bool:
@@ -570,25 +561,11 @@ class ManagerData:
             bool: True if data is consistent, False otherwise
         """
         try:
-            # Check that all tag IDs are consistent across structures
-            all_tag_ids = set()
-            all_tag_ids.update(self.tag_averages.keys())
-            all_tag_ids.update(self.tag_averages_2d.keys())
-            all_tag_ids.update(self.tag_averages_3d.keys())
-            all_tag_ids.update(self.tag_timestamps.keys())
-            all_tag_ids.update(self.tag_timestamps_2d.keys())
-            all_tag_ids.update(self.tag_timestamps_3d.keys())
-            
-            # Verify each tag has corresponding timestamp arrays
-            for tag_id in all_tag_ids:
-                if tag_id in self.tag_averages and tag_id not in self.tag_timestamps:
-                    logger.warning(f"Tag {tag_id} missing timestamps")
-                    return False
-                if tag_id in self.tag_averages_2d and tag_id not in self.tag_timestamps_2d:
-                    logger.warning(f"Tag {tag_id} missing 2D timestamps")
-                    return False
-                if tag_id in self.tag_averages_3d and tag_id not in self.tag_timestamps_3d:
-                    logger.warning(f"Tag {tag_id} missing 3D timestamps")
+            # Check that every ring buffer's bookkeeping is within bounds
+            for tag_id in self.tag_history:
+                ring = self.tag_history.get(tag_id)
+                if ring is None or not 0 <= ring.count <= ring.capacity:
+                    logger.warning(f"Tag {tag_id} history buffer out of bounds")
                     return False
                     
             logger.debug("Data integrity validation passed")
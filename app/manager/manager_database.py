@@ -1,7 +1,7 @@
 # Name: manager_database.py
-# Version: 0.1.1
+# Version: 0.1.3
 # Created: 250703
-# Modified: 250704
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: AI Assistant
 # Description: Database handler module for ParcoRTLS Manager - Updated with centralized IP configuration
@@ -10,6 +10,10 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.3 - store_position_history accepts PositionRecord, bumped from 0.1.2
+
+# Version: 0.1.2 - store_position_history buffers rows into PositionHistoryWriter (COPY batches), bumped from 0.1.1
+
 """
 Database Handler Module for ParcoRTLS Manager
 
@@ -17,7 +21,7 @@ This module handles all database operations for the Manager class including:
 - Connection string initialization using database-driven configuration
 - Database pool management
 - Configuration loading from database
-- Position history storage
+- Position history storage (buffered, bulk COPY writes)
 - Database queries and updates
 
 Extracted from manager.py v0.1.21 for better modularity and maintainability.
@@ -28,12 +32,14 @@ import asyncpg
 import sys
 import os
 import logging
-from typing import Optional
+from typing import Optional, Union
 
 # Add path for centralized configuration and db_config_helper
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_server_host, get_db_configs_sync
 from db_config_helper import config_helper  # type: ignore
+from manager.history_writer import PositionHistoryWriter
+from manager.models import PositionRecord
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +62,7 @@ class ManagerDatabase:
         self.conn_string: Optional[str] = None
         self.hist_conn_string: Optional[str] = None
         self.db_pool: Optional[asyncpg.Pool] = None
+        self.history_writer: Optional[PositionHistoryWriter] = None
         
         # Configuration attributes that will be loaded from database
         self.sdk_ip: Optional[str] = None
@@ -110,6 +117,8 @@ class ManagerDatabase:
                 return False
                 
             self.db_pool = await asyncpg.create_pool(self.hist_conn_string)
+            self.history_writer = PositionHistoryWriter(self.db_pool)
+            self.history_writer.start()
             logger.debug("Database pool created successfully")
             return True
         except Exception as e:
@@ -171,43 +180,41 @@ class ManagerDatabase:
             self.mode = emode_enum.Subscription if emode_enum else None
             return False
 
-    async def store_position_history(self, msg_data: dict) -> bool:
+    async def store_position_history(self, msg_data: Union[PositionRecord, dict]) -> bool:
         """
-        Store position data in the position history table.
+        Queue position data for the position history table.
+        
+        Rows are buffered and written in bulk by the history writer; this call
+        only waits when the buffer is full (backpressure).
         
         Args:
-            msg_data: Dictionary containing message data with keys:
+            msg_data: PositionRecord, or dictionary containing message data with keys:
                      id, ts, x, y, z, cnf, gwid, bat
                      
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if queued, False otherwise
         """
-        if not self.db_pool:
+        if not self.db_pool or not self.history_writer:
             logger.error("Database pool not available for position history storage")
             return False
             
         try:
-            async with self.db_pool.acquire() as conn:  # type: ignore
-                await conn.execute(
-                    """
-                    INSERT INTO positionhistory (X_ID_DEV, D_POS_BGN, N_X, N_Y, N_Z, CNF, GWID, BAT)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                    """,
-                    msg_data['id'], 
-                    msg_data['ts'], 
-                    msg_data['x'], 
-                    msg_data['y'], 
-                    msg_data['z'], 
-                    msg_data['cnf'], 
-                    msg_data['gwid'], 
-                    str(msg_data['bat'])
-                )
-                logger.debug(f"Stored position data for tag ID:{msg_data['id']} in positionhistory")
-                return True
+            return await self.history_writer.add(msg_data)
         except Exception as e:
             logger.error(f"Failed to store position history: {str(e)}")
             return False
 
+    async def flush_position_history(self) -> int:
+        """
+        Write all buffered position history rows immediately.
+        
+        Returns:
+            int: Number of rows written
+        """
+        if not self.history_writer:
+            return 0
+        return await self.history_writer.flush()
+
     async def update_trigger_zone(self, trigger_id: int, new_zone_id: int) -> bool:
         """
         Update the zone for a portable trigger.
@@ -240,6 +247,9 @@ class ManagerDatabase:
         Close all database connections and pools.
         """
         try:
+            if self.history_writer:
+                await self.history_writer.stop()
+                self.history_writer = None
             if self.db_pool:
                 await self.db_pool.close()
                 self.db_pool = None
@@ -265,6 +275,15 @@ class ManagerDatabase:
         """
         return self.db_pool is not None
 
+    def get_history_writer_stats(self) -> dict:
+        """
+        Get position history writer statistics.
+        
+        Returns:
+            dict: Writer statistics or empty dict if the writer is not running
+        """
+        return self.history_writer.get_stats() if self.history_writer else {}
+
     def get_config_values(self) -> dict:
         """
         Get all loaded configuration values.
@@ -1,7 +1,7 @@
 # Name: manager_heartbeat.py
-# Version: 0.1.2
+# Version: 0.1.3
 # Created: 971201
-# Modified: 250716
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin & AI Assistant
 # Description: Heartbeat handler module for ParcoRTLS Manager - Fixed excessive port health monitoring console messages with response time thresholds
@@ -10,6 +10,8 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.3 - Concurrent non-blocking port health sweep through the shared PortProber with per-port backoff, bumped from 0.1.2
+
 """
 Heartbeat Handler Module for ParcoRTLS Manager
 
@@ -18,7 +20,7 @@ This module handles all heartbeat operations for the Manager class including:
 - Rate limiting for clients
 - Client cleanup and failure handling
 - SDK and WebSocket client heartbeat processing
-- Port health monitoring for dynamic scaling
+- Port health monitoring for dynamic scaling (concurrent non-blocking probes)
 
 Extracted from manager.py v0.1.22 for better modularity and maintainability.
 """
@@ -33,8 +35,8 @@ from fastapi import WebSocket
 from manager.models import HeartBeat, Response, ResponseType
 from manager.sdk_client import SDKClient
 import asyncpg
-import socket
 import time
+from manager.port_prober import port_prober, PROBED, BACKED_OFF
 
 logger = logging.getLogger(__name__)
 
@@ -310,6 +312,8 @@ class ManagerHeartbeat:
         """
         Check if a port is healthy by attempting to connect to it.
         
+        Uses a non-blocking connect, so a dead port never stalls the event loop.
+        
         Args:
             port: Port number to check
             ip_address: IP address to connect to
@@ -317,43 +321,28 @@ class ManagerHeartbeat:
         Returns:
             tuple: (is_healthy, response_time_ms)
         """
-        start_time = time.time()
-        
         # Get port-specific timeout from database config
         port_info = self.port_health_monitor.get(port, {})
         timeout = port_info.get('monitor_timeout', self.PORT_HEALTH_TIMEOUT)
         
-        try:
-            # Create socket connection with timeout
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
-            
-            # Attempt connection
-            result = sock.connect_ex((ip_address, port))
-            sock.close()
-            
-            end_time = time.time()
-            response_time_ms = (end_time - start_time) * 1000
-            
-            is_healthy = (result == 0)
-            
-            # Only log based on response time thresholds (no more excessive logging)
-            if is_healthy:
-                if response_time_ms >= self.PORT_HEALTH_UNHEALTHY_THRESHOLD:
-                    logger.warning(f"Port {port} health check: SLOW ({response_time_ms:.2f}ms)")
-                elif response_time_ms >= self.PORT_HEALTH_WARNING_THRESHOLD:
-                    logger.info(f"Port {port} health check: WARNING ({response_time_ms:.2f}ms)")
-                # No logging for fast responses (0-199ms) - this fixes the excessive console spam
-            else:
-                logger.debug(f"Port {port} health check: UNHEALTHY - connection failed ({response_time_ms:.2f}ms)")
-                
-            return is_healthy, response_time_ms
-            
-        except Exception as e:
-            end_time = time.time()
-            response_time_ms = (end_time - start_time) * 1000
-            logger.debug(f"Port {port} health check failed: {str(e)} ({response_time_ms:.2f}ms)")
-            return False, response_time_ms
+        if not ip_address:
+            logger.debug(f"Port {port} health check failed: no IP address configured")
+            return False, 0.0
+        
+        is_healthy, response_time_ms, _source = await port_prober.probe(ip_address, port, timeout, force=True)
+        self._log_port_result(port, is_healthy, response_time_ms)
+        return is_healthy, response_time_ms
+
+    def _log_port_result(self, port: int, is_healthy: bool, response_time_ms: float):
+        """Log a port check only when it crosses a response time threshold or fails."""
+        if is_healthy:
+            if response_time_ms >= self.PORT_HEALTH_UNHEALTHY_THRESHOLD:
+                logger.warning(f"Port {port} health check: SLOW ({response_time_ms:.2f}ms)")
+            elif response_time_ms >= self.PORT_HEALTH_WARNING_THRESHOLD:
+                logger.info(f"Port {port} health check: WARNING ({response_time_ms:.2f}ms)")
+            # No logging for fast responses (0-199ms) - this fixes the excessive console spam
+        else:
+            logger.debug(f"Port {port} health check: UNHEALTHY - connection failed ({response_time_ms:.2f}ms)")
 
     async def update_port_health_stats(self, port: int, is_healthy: bool, response_time_ms: float):
         """
@@ -521,13 +510,34 @@ class ManagerHeartbeat:
         logger.debug("Exiting heartbeat_loop")
 
     async def _perform_port_health_checks(self):
-        """Perform health checks on all monitored ports."""
+        """
+        Perform health checks on all monitored ports concurrently.
+        
+        The sweep takes about one connect timeout regardless of the number of
+        ports. Ports in backoff keep their last state without a new failure
+        being counted; results probed by another manager in the same process
+        within the prober TTL are reused.
+        """
         if not self.port_health_initialized:
             return
-            
-        for port, port_info in self.port_health_monitor.items():
+        
+        targets = []
+        for port, port_info in list(self.port_health_monitor.items()):
+            if port_info['ip_address']:
+                targets.append((port_info['ip_address'], port, port_info.get('monitor_timeout', self.PORT_HEALTH_TIMEOUT)))
+            else:
+                await self.update_port_health_stats(port, False, 0.0)
+        
+        sweep_start = time.perf_counter()
+        results = await port_prober.probe_many(targets)
+        logger.debug(f"Port health sweep of {len(targets)} ports took {(time.perf_counter() - sweep_start) * 1000:.1f}ms")
+        
+        for port, (is_healthy, response_time, source) in results.items():
+            if source == BACKED_OFF:
+                continue
             try:
-                is_healthy, response_time = await self.check_port_health(port, port_info['ip_address'])
+                if source == PROBED:
+                    self._log_port_result(port, is_healthy, response_time)
                 await self.update_port_health_stats(port, is_healthy, response_time)
             except Exception as e:
                 logger.error(f"Error checking port {port} health: {str(e)}")
@@ -713,6 +723,7 @@ class ManagerHeartbeat:
                 'scaling_candidates': scaling_candidates,
                 'scaling_range': f"{self.SCALING_PORT_RANGE_START}-{self.SCALING_PORT_RANGE_END}",
                 'last_database_error': database_error_info,
+                'prober': port_prober.get_stats(),
                 'port_stats': port_health_stats
             }
         }
\ No newline at end of file
@@ -1,7 +1,7 @@
 # Name: manager_triggers.py
-# Version: 0.1.1
+# Version: 0.1.7
 # Created: 250703
-# Modified: 250703
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: AI Assistant
 # Description: Trigger engine handler module for ParcoRTLS Manager - Extracted from manager.py v0.1.22
@@ -10,14 +10,24 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.7 - Zone reloads keep unchanged Trigger objects and carry tag state/portable position over by i_trg, run in the background
+#                  once a zone has been loaded, and only follow NOTIFY (TTL reload only without a change listener), bumped from 0.1.6
+# Version: 0.1.6 - Portable trigger zone picked by the same smallest vertex box rule with or without the maint pool, bumped from 0.1.5
+# Version: 0.1.5 - Per-candidate debug output in evaluate_triggers only built when DEBUG is enabled, bumped from 0.1.4
+# Version: 0.1.4 - Resolve portable trigger zones from the shared in-memory zone geometry index instead of an HTTP call per message, bumped from 0.1.3
+# Version: 0.1.3 - Bulk SQL trigger loading on the maint pool with per-zone load state, shared in-flight loads and LISTEN/NOTIFY invalidation, bumped from 0.1.2
+# Version: 0.1.2 - Added per-zone spatial index so evaluate_triggers only tests candidate triggers, bumped from 0.1.1
+
 """
 Trigger Engine Handler Module for ParcoRTLS Manager
 
 This module handles all trigger operations for the Manager class including:
-- Trigger loading from database via FastAPI service
+- Trigger loading from the maint database in bulk (FastAPI service as fallback)
+- Per-zone load state so zones without triggers are not reloaded on every message
+- Zone reloads that keep per-tag trigger state, in the background of the message path
 - Trigger evaluation and firing
-- Portable trigger management and movement
-- Zone-based trigger filtering
+- Portable trigger management and movement (zone resolved from the in-memory zone index)
+- Zone-based trigger filtering through a per-zone spatial index
 - Event message generation and broadcasting
 
 Extracted from manager.py v0.1.22 for better modularity and maintainability.
@@ -25,20 +35,31 @@ Extracted from manager.py v0.1.22 for better modularity and maintainability.
 
 import asyncio
 import logging
+import time
 import traceback
 import httpx
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional, Set
 from manager.models import Tag
-from manager.enums import TriggerDirections
+from manager.enums import TriggerDirections, TriggerState
 from manager.trigger import Trigger
 from manager.portable_trigger import PortableTrigger
 from manager.region import Region3D, Region3DCollection
 from manager.utils import FASTAPI_BASE_URL
 from manager.fastapi_service import FastAPIService
+from manager.trigger_index import TriggerSpatialIndex
+from manager.trigger_loader import TriggerChangeListener, fetch_zone_triggers
+from manager.db_pools import db_pool_registry
+from manager.zone_index import zone_index_cache
 
 logger = logging.getLogger(__name__)
 
+# Seconds a zone's loaded trigger set (including an empty one) is trusted when no
+# change listener is running (FastAPI fallback), and the retry delay after a failed
+# load. With the listener a loaded zone is only reloaded on NOTIFY.
+ZONE_LOAD_TTL = 300.0
+ZONE_RETRY_DELAY = 10.0
+
 class ManagerTriggers:
     """
     Handles all trigger operations for the Manager class.
@@ -56,14 +77,122 @@ class ManagerTriggers:
         """
         self.manager_name = manager_name
         self.triggers: List[Trigger] = []
+        self.spatial_index = TriggerSpatialIndex()
         self.service = FastAPIService()
         
+        # Zone ID -> monotonic time after which the zone must be loaded again
+        self.zone_valid_until: Dict[int, float] = {}
+        self.zone_loads: Dict[int, asyncio.Task] = {}
+        # Zones whose triggers were loaded at least once; they keep serving during a reload
+        self.zones_loaded: Set[int] = set()
+        self.maint_pool = None
+        self.change_listener: Optional[TriggerChangeListener] = None
+        self.sql_load_count = 0
+        self.http_load_count = 0
+        self.failed_load_count = 0
+        
         logger.debug(f"Initialized ManagerTriggers for manager: {manager_name}")
 
+    async def attach_database(self, conn_string: str) -> bool:
+        """
+        Load triggers straight from the maint database and listen for changes.
+        
+        Args:
+            conn_string: Maint database connection string
+            
+        Returns:
+            bool: True if the pool is available, False to keep using the FastAPI service
+        """
+        try:
+            self.maint_pool = await db_pool_registry.get_pool(conn_string)
+            if self.change_listener is None:
+                self.change_listener = TriggerChangeListener(conn_string, self.invalidate_zone)
+                self.change_listener.start()
+            return True
+        except Exception as e:
+            logger.warning(f"Maint pool unavailable, loading triggers through FastAPI service: {str(e)}")
+            self.maint_pool = None
+            return False
+
+    async def close(self):
+        """Stop the change listener."""
+        if self.change_listener is not None:
+            await self.change_listener.stop()
+            self.change_listener = None
+
+    def needs_load(self, zone_id: int) -> bool:
+        """
+        Check whether a zone's triggers have to be (re)loaded.
+        
+        Args:
+            zone_id: Zone ID
+            
+        Returns:
+            bool: True if the zone was never loaded, was invalidated or its state expired
+        """
+        return time.monotonic() >= self.zone_valid_until.get(zone_id, 0.0)
+
+    async def ensure_zone_loaded(self, zone_id: int) -> bool:
+        """
+        Load a zone's triggers unless its cached state is still valid.
+        
+        Concurrent callers for the same zone share a single load. Only the first
+        load of a zone is awaited; a reload runs in the background while the
+        zone's current triggers keep being evaluated.
+        
+        Args:
+            zone_id: Zone ID
+            
+        Returns:
+            bool: True if the zone has a loaded trigger set after the call
+        """
+        if not self.needs_load(zone_id):
+            return True
+        task = self.zone_loads.get(zone_id)
+        if task is None:
+            task = asyncio.create_task(self.load_triggers(zone_id))
+            self.zone_loads[zone_id] = task
+            task.add_done_callback(lambda _t: self.zone_loads.pop(zone_id, None))
+        if zone_id in self.zones_loaded:
+            return True
+        return await asyncio.shield(task)
+
+    def invalidate_zone(self, zone_id: Optional[int] = None):
+        """
+        Mark a zone, or every zone, for reload on its next message.
+        
+        The zone's triggers stay in place until the reload replaces them.
+        
+        Args:
+            zone_id: Zone ID, None for all zones
+        """
+        if zone_id is None:
+            self.zone_valid_until.clear()
+            logger.info("Trigger state invalidated for all zones")
+        else:
+            self.zone_valid_until.pop(zone_id, None)
+            logger.info(f"Trigger state invalidated for zone {zone_id}")
+
+    async def _fetch_triggers_data(self, zone_id: int) -> List[dict]:
+        if self.maint_pool is not None:
+            try:
+                triggers_data = await fetch_zone_triggers(self.maint_pool, zone_id)
+                self.sql_load_count += 1
+                return triggers_data
+            except Exception as e:
+                logger.warning(f"Bulk trigger query failed for zone {zone_id}, falling back to FastAPI service: {str(e)}")
+        triggers_data = await self.service.get_triggers_by_zone(zone_id)
+        self.http_load_count += 1
+        return triggers_data
+
     async def load_triggers(self, zone_id: int) -> bool:
         """
         Load triggers for a specific zone from the database.
         
+        Triggers whose definition did not change are kept as they are, so their
+        per-tag state and (portable) position survive the reload. A changed
+        trigger takes over the tag state and position of the one it replaces.
+        
         Args:
             zone_id: Zone ID to load triggers for
             
@@ -73,25 +202,63 @@ class ManagerTriggers:
         logger.debug(f"Loading triggers for zone {zone_id}")
         
         try:
-            triggers_data = await self.service.get_triggers_by_zone(zone_id)
+            triggers_data = await self._fetch_triggers_data(zone_id)
             logger.debug(f"Retrieved triggers data for zone {zone_id}: {triggers_data}")
 
-            # Clear existing triggers for this zone
-            self.triggers = [t for t in self.triggers if t.zone_id != zone_id]
-            logger.debug(f"Cleared existing triggers for zone {zone_id}, remaining triggers: {len(self.triggers)}")
-
+            previous = {t.i_trg: t for t in self.triggers if t.zone_id == zone_id}
+            loaded = []
             for trigger_data in triggers_data:
                 trigger = await self._create_trigger_from_data(trigger_data, zone_id)
-                if trigger:
-                    self.triggers.append(trigger)
-                    logger.info(f"Loaded trigger {trigger.name} (ID: {trigger.i_trg}) for zone {zone_id} with direction {trigger.direction}")
+                if not trigger:
+                    continue
+                old = previous.get(trigger.i_trg)
+                if old is not None and self._trigger_signature(old) == self._trigger_signature(trigger):
+                    loaded.append(old)
+                    continue
+                if old is not None:
+                    self._carry_trigger_state(old, trigger)
+                loaded.append(trigger)
+                logger.info(f"Loaded trigger {trigger.name} (ID: {trigger.i_trg}) for zone {zone_id} with direction {trigger.direction}")
 
+            # Swap in the zone's new trigger set in one step
+            self.triggers = [t for t in self.triggers if t.zone_id != zone_id] + loaded
+            logger.debug(f"Zone {zone_id} now has {len(loaded)} triggers, total triggers: {len(self.triggers)}")
+
+            self._rebuild_zone_index(zone_id)
+            # Remember the result, also when the zone has no triggers
+            self.zones_loaded.add(zone_id)
+            if self.change_listener is not None:
+                self.zone_valid_until[zone_id] = float('inf')
+            else:
+                self.zone_valid_until[zone_id] = time.monotonic() + ZONE_LOAD_TTL
             return True
             
         except Exception as e:
             logger.error(f"Failed to fetch triggers for zone {zone_id}: {str(e)}\n{traceback.format_exc()}")
+            self.failed_load_count += 1
+            self.zone_valid_until[zone_id] = time.monotonic() + ZONE_RETRY_DELAY
             return False
 
+    @staticmethod
+    def _trigger_signature(trigger: Trigger) -> tuple:
+        """Definition of a trigger as loaded; equal signatures mean nothing changed."""
+        if isinstance(trigger, PortableTrigger):
+            # Portable regions follow their tag, so only the shape is compared
+            return (True, trigger.name, trigger.direction, trigger.assigned_tag_id,
+                    trigger.radius, trigger.z_min, trigger.z_max)
+        return (False, trigger.name, trigger.direction, tuple(
+            (r.min_x, r.max_x, r.min_y, r.max_y, r.min_z, r.max_z, tuple(r.vertices or ()))
+            for r in trigger.regions
+        ))
+
+    @staticmethod
+    def _carry_trigger_state(old: Trigger, new: Trigger):
+        """Move per-tag state, callback and portable position from a replaced trigger."""
+        new.states = old.states
+        new.trigger_callback = old.trigger_callback
+        if isinstance(old, PortableTrigger) and isinstance(new, PortableTrigger) and old.regions.count():
+            new.regions.move_to(*old.regions.regions[0].box_centroid())
+
     async def _create_trigger_from_data(self, trigger_data: dict, zone_id: int) -> Trigger | None:
         """
         Create a trigger object from database data.
@@ -140,8 +307,11 @@ class ManagerTriggers:
                 logger.debug(f"Created PortableTrigger {trigger_name} for tag {assigned_tag_id}")
                 return trigger
             else:
-                # Load trigger details for static triggers
-                trigger_details = await self.service.get_trigger_details(trigger_id)
+                # Bulk-loaded rows carry their vertices; otherwise fetch details for static triggers
+                if "vertices" in trigger_data:
+                    trigger_details = {"vertices": trigger_data["vertices"]}
+                else:
+                    trigger_details = await self.service.get_trigger_details(trigger_id)
                 logger.debug(f"Trigger details for {trigger_id}: {trigger_details}")
 
                 regions = Region3DCollection()
@@ -200,22 +370,36 @@ class ManagerTriggers:
         events = []
         
         try:
-            logger.debug(f"Checking {len(self.triggers)} triggers for tag {tag.id} at ({tag.x}, {tag.y}, {tag.z})")
+            zone_index = self.spatial_index.get_zone(msg_zone_id)
+            if zone_index is None:
+                return events
+
+            candidates = zone_index.candidates(tag.x, tag.y, tag.z)
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug(f"Checking {len(candidates)} of {len(zone_index)} triggers for tag {tag.id} at ({tag.x}, {tag.y}, {tag.z})")
+
+            # Candidates get the full containment test; outside-sensitive triggers whose
+            # box does not contain the point only need their state machine advanced
+            positions = candidates.union(
+                p for p in zone_index.outside_sensitive
+                if p not in candidates and not zone_index.triggers[p].is_settled_outside(tag.id)
+            )
             
-            for trigger in self.triggers:
-                # Skip triggers not in the current zone
-                if trigger.zone_id != msg_zone_id:
-                    logger.debug(f"Skipping trigger {trigger.name} (ID: {trigger.i_trg}) - zone mismatch (trigger zone: {trigger.zone_id}, message zone: {msg_zone_id})")
-                    continue
-                
+            for position in sorted(positions):
+                trigger = zone_index.triggers[position]
+                known_state = None if position in candidates else TriggerState.OutSide
+
                 # Handle portable trigger movement
                 if trigger.is_portable and tag.id == getattr(trigger, 'assigned_tag_id', None):  # type: ignore
                     await self._handle_portable_trigger_movement(trigger, tag, database_handler)
                 
                 # Evaluate trigger
-                logger.debug(f"Evaluating trigger {trigger.name} (ID: {trigger.i_trg}) with direction {trigger.direction.name}")
-                trigger_fired = await trigger.check_trigger(tag)
-                logger.debug(f"Trigger {trigger.name} (ID: {trigger.i_trg}) fired: {trigger_fired}")
+                if debug:
+                    logger.debug(f"Evaluating trigger {trigger.name} (ID: {trigger.i_trg}) with direction {trigger.direction.name}")
+                trigger_fired = await trigger.check_trigger(tag, known_state)
+                if debug:
+                    logger.debug(f"Trigger {trigger.name} (ID: {trigger.i_trg}) fired: {trigger_fired}")
                 
                 if trigger_fired:
                     # Suppress WhileIn events for tags triggering their own portable triggers
@@ -245,23 +429,15 @@ class ManagerTriggers:
             database_handler: Database handler for zone updates
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{FASTAPI_BASE_URL}/api/zones_by_point",
-                    params={"x": tag.x, "y": tag.y, "z": tag.z}
-                )
-                response.raise_for_status()
-                zones = response.json()
-                if zones:
-                    new_zone_id = min(
-                        zones,
-                        key=lambda z: (z["n_max_x"] - z["n_min_x"]) * (z["n_max_y"] - z["n_min_y"])
-                    )["zone_id"]
-                    if new_zone_id != trigger.zone_id:
-                        trigger.zone_id = new_zone_id
-                        await database_handler.update_trigger_zone(trigger.i_trg, new_zone_id)
-                        logger.debug(f"Updated portable trigger {trigger.name} to zone {new_zone_id}")
-                        
+            new_zone_id = await self._resolve_zone(tag)
+            if new_zone_id is not None and new_zone_id != trigger.zone_id:
+                old_zone_id = trigger.zone_id
+                trigger.zone_id = new_zone_id
+                self._rebuild_zone_index(old_zone_id)
+                self._rebuild_zone_index(new_zone_id)
+                await database_handler.update_trigger_zone(trigger.i_trg, new_zone_id)
+                logger.debug(f"Updated portable trigger {trigger.name} to zone {new_zone_id}")
+            
             # Move trigger to tag position
             # Check if this is a PortableTrigger instance to satisfy type checker
             if isinstance(trigger, PortableTrigger):
@@ -273,6 +449,41 @@ class ManagerTriggers:
                 
         except Exception as e:
             logger.error(f"Failed to update zone for trigger {trigger.name}: {str(e)}")
+
+    async def _resolve_zone(self, tag: Tag) -> int | None:
+        """
+        Find the most specific zone containing a tag position: the zone with the
+        smallest vertex bounding box that contains it.
+        
+        Uses the in-process zone geometry index when the maint pool is attached,
+        otherwise asks the FastAPI /api/zones_by_point endpoint; both apply the
+        same rule to the same candidates.
+        
+        Args:
+            tag: Tag whose position is resolved
+            
+        Returns:
+            int: Zone ID, or None when no zone contains the position
+        """
+        if self.maint_pool is not None:
+            index = await zone_index_cache.get(self.maint_pool.fetch)
+            zone = index.smallest_vertex_zone(tag.x, tag.y, tag.z)
+            return zone.zone_id if zone else None
+
+        async with httpx.AsyncClient() as client:
+            response = await client.get(
+                f"{FASTAPI_BASE_URL}/api/zones_by_point",
+                params={"x": tag.x, "y": tag.y, "z": tag.z}
+            )
+            response.raise_for_status()
+            zones = response.json()
+        if not zones:
+            return None
+        return min(
+            zones,
+            key=lambda z: (z["n_max_x"] - z["n_min_x"]) * (z["n_max_y"] - z["n_min_y"])
+        )["zone_id"]
+
     def _create_trigger_event(self, trigger: Trigger, tag: Tag, zone_id: int) -> dict:
         """
         Create a trigger event message.
@@ -314,6 +525,21 @@ class ManagerTriggers:
         logger.info(f"Reloading triggers for zone {zone_id}")
         return await self.load_triggers(zone_id)
 
+    def _rebuild_zone_index(self, zone_id: int | None):
+        """
+        Rebuild the spatial index for one zone from the loaded trigger list.
+        
+        Args:
+            zone_id: Zone ID whose trigger set changed
+        """
+        if zone_id is None:
+            return
+        zone_triggers = self.get_triggers_for_zone(zone_id)
+        if zone_triggers:
+            self.spatial_index.rebuild_zone(zone_id, zone_triggers)
+        else:
+            self.spatial_index.drop_zone(zone_id)
+
     def get_triggers_for_zone(self, zone_id: int) -> List[Trigger]:
         """
         Get all triggers for a specific zone.
@@ -371,6 +597,9 @@ class ManagerTriggers:
         """
         initial_count = len(self.triggers)
         self.triggers = [t for t in self.triggers if t.zone_id != zone_id]
+        self.spatial_index.drop_zone(zone_id)
+        self.zone_valid_until.pop(zone_id, None)
+        self.zones_loaded.discard(zone_id)
         removed_count = initial_count - len(self.triggers)
         logger.debug(f"Cleared {removed_count} triggers for zone {zone_id}")
         return removed_count
@@ -384,6 +613,9 @@ class ManagerTriggers:
         """
         count = len(self.triggers)
         self.triggers.clear()
+        self.spatial_index.clear()
+        self.zone_valid_until.clear()
+        self.zones_loaded.clear()
         logger.debug(f"Cleared all {count} triggers")
         return count
 
@@ -404,7 +636,16 @@ class ManagerTriggers:
             'portable_triggers': portable_count,
             'static_triggers': static_count,
             'zones_with_triggers': len(zones),
-            'zone_list': sorted([z for z in zones if z is not None])
+            'zone_list': sorted([z for z in zones if z is not None]),
+            'spatial_index': self.spatial_index.get_stats(),
+            'zones_cached': len(self.zone_valid_until),
+            'loads': {
+                'sql': self.sql_load_count,
+                'http': self.http_load_count,
+                'failed': self.failed_load_count
+            },
+            'change_listener': self.change_listener.get_stats() if self.change_listener else None,
+            'zone_index': zone_index_cache.get_stats()
         }
 
     def validate_trigger_integrity(self) -> bool:
@@ -1,7 +1,7 @@
 # Name: models.py
-# Version: 0.1.3
+# Version: 0.1.8
 # Created: 971201
-# Modified: 250703
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin & TC
 # Description: Python script for ParcoRTLS backend
@@ -11,6 +11,11 @@
 # Dependent: TRUE
 
 # /home/parcoadmin/parco_fastapi/app/manager/models.py
+# Version: 0.1.8 - _to_datetime reads epochs above 2e10 as milliseconds like pydantic, out-of-range epochs raise a clear ValueError, bumped from 0.1.7
+# Version: 0.1.7 - _to_datetime accepts numeric-string epoch timestamps, bumped from 0.1.6
+# Version: 0.1.6 - Added from_element parsers (PositionRecord, HeartBeat, Response) for pre-parsed stream frames and PositionRecord.from_json, bumped from 0.1.5
+# Version: 0.1.5 - Added PositionRecord __slots__ internal position record with zero-revalidation to_gisdata()/to_tag(), bumped from 0.1.4
+# Version: 0.1.4 - Added Ave.from_ring for O(1) averages from TagRingBuffer running sums, bumped from 0.1.3
 # Version: 0.1.1 - Added Config to Request model to allow extra fields for backward compatibility, bumped from 0.1.0
 # Version: 0.1.0 - Added zone_id field to GISData, bumped from 1.0.3
 # Previous: Added Sequence field to GISData (1.0.2)
@@ -26,14 +31,17 @@
 # Licensed under AGPL-3.0: https://www.gnu.org/licenses/agpl-3.0.en.html
 
 from dataclasses import dataclass
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timezone
+from typing import List, Optional, TYPE_CHECKING
 from pydantic import BaseModel
 import xml.etree.ElementTree as ET
 from .utils import MessageUtilities
 from .enums import RequestType, ResponseType
 import json
 
+if TYPE_CHECKING:
+    from .tag_history import TagRingBuffer
+
 class Tag(BaseModel):
     id: str
     x: float = 0.0
@@ -166,6 +174,173 @@ class GISData(BaseModel):
             data["zone_id"] = self.zone_id
         return json.dumps(data)
 
+# Epoch values beyond this are milliseconds, the cut-off pydantic uses for datetime
+MS_EPOCH_THRESHOLD = 2e10
+
+def _from_epoch(value: float) -> datetime:
+    seconds = value / 1000 if abs(value) > MS_EPOCH_THRESHOLD else value
+    try:
+        return datetime.fromtimestamp(seconds, tz=timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        raise ValueError(f"TS value out of range for a unix timestamp: {value!r}")
+
+def _to_datetime(value) -> datetime:
+    """Coerce a raw TS value the way the GISData model does for common inputs."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return _from_epoch(number)
+    if isinstance(value, (int, float)):
+        return _from_epoch(value)
+    raise ValueError(f"Invalid TS value: {value!r}")
+
+class PositionRecord:
+    """
+    Internal position record for the manager ingest path.
+
+    A plain __slots__ object with the GISData field names, so code that reads
+    GISData or Tag attributes (routing, triggers, averaging) accepts it as is.
+    It is built without pydantic validation; to_gisdata() and to_tag() give the
+    public models where an API still needs them.
+    """
+
+    __slots__ = ('id', 'type', 'ts', 'x', 'y', 'z', 'bat', 'cnf', 'gwid', 'data',
+                 'sequence', 'zone_id', '_routing_info')
+
+    def __init__(self, id: str, type: str, ts: datetime, x: float, y: float, z: float,
+                 bat: int = -1, cnf: float = -1.0, gwid: str = "", data: str = "",
+                 sequence: Optional[int] = None, zone_id: Optional[int] = None):
+        self.id = id
+        self.type = type
+        self.ts = ts
+        self.x = x
+        self.y = y
+        self.z = z
+        self.bat = bat
+        self.cnf = cnf
+        self.gwid = gwid
+        self.data = data
+        self.sequence = sequence
+        self.zone_id = zone_id
+        self._routing_info = None
+
+    @classmethod
+    def from_raw(cls, sm: dict, zone_id: Optional[int] = None) -> 'PositionRecord':
+        """
+        Build a record from a raw parser/simulator message dictionary.
+
+        Raises:
+            KeyError: If a required key is missing
+            ValueError: If a value cannot be converted
+        """
+        sequence = sm.get('Sequence')
+        return cls(
+            id=str(sm['ID']),
+            type=str(sm['Type']),
+            ts=_to_datetime(sm['TS']),
+            x=float(sm['X']),
+            y=float(sm['Y']),
+            z=float(sm['Z']),
+            bat=int(sm['Bat']),
+            cnf=float(sm['CNF']),
+            gwid=str(sm['GWID']),
+            data=sm.get('data', "") or "",
+            sequence=int(sequence) if sequence is not None else None,
+            zone_id=zone_id
+        )
+
+    @classmethod
+    def from_element(cls, root: ET.Element, zone_id: Optional[int] = None) -> 'PositionRecord':
+        """
+        Build a record from a parsed <parco> GIS element, with GISData.from_xml defaults.
+
+        Raises:
+            ValueError: If the gis element is missing or a value cannot be converted
+        """
+        gis = root.find("gis")
+        if gis is None:
+            raise ValueError("Invalid GISData XML: missing 'gis' element")
+        sequence = root.findtext("sequence")
+        zone_text = root.findtext("zone_id")
+        ts = gis.findtext("ts")
+        x = gis.findtext("x")
+        y = gis.findtext("y")
+        z = gis.findtext("z")
+        bat = gis.findtext("bat")
+        cnf = gis.findtext("cnf")
+        return cls(
+            id=gis.findtext("id") or "",
+            type=root.findtext("type") or "",
+            ts=datetime.fromisoformat(ts) if ts else datetime.now(),
+            x=float(x) if x else 0.0,
+            y=float(y) if y else 0.0,
+            z=float(z) if z else 0.0,
+            bat=int(bat) if bat else -1,
+            cnf=float(cnf) if cnf else -1.0,
+            gwid=gis.findtext("gwid") or "",
+            data=root.findtext("data") or "",
+            sequence=int(sequence) if sequence else None,
+            zone_id=int(zone_text) if zone_text else zone_id
+        )
+
+    @classmethod
+    def from_json(cls, json_data: dict) -> 'PositionRecord':
+        """
+        Build a record from a decoded GISData JSON message (the to_json format).
+
+        Raises:
+            KeyError: If a required key is missing
+            ValueError: If a value cannot be converted
+        """
+        gis = json_data["gis"]
+        sequence = json_data.get("Sequence")
+        return cls(
+            id=str(gis["id"]),
+            type=str(json_data.get("type", "")),
+            ts=_to_datetime(gis["ts"]),
+            x=float(gis["x"]),
+            y=float(gis["y"]),
+            z=float(gis["z"]),
+            bat=int(gis["bat"]),
+            cnf=float(gis["cnf"]),
+            gwid=str(gis["gwid"]),
+            data=json_data.get("data", "") or "",
+            sequence=int(sequence) if sequence is not None else None,
+            zone_id=json_data.get("zone_id")
+        )
+
+    def validate(self) -> bool:
+        """Validates that all required fields are present and not None."""
+        required = [self.id, self.type, self.ts, self.x, self.y, self.z, self.bat, self.cnf, self.gwid]
+        return all(field is not None for field in required)
+
+    def history_row(self) -> tuple:
+        """Row for the positionhistory table (id, ts, x, y, z, cnf, gwid, bat)."""
+        return (self.id, self.ts, self.x, self.y, self.z, self.cnf, self.gwid, str(self.bat))
+
+    def to_gisdata(self) -> GISData:
+        """GISData model with the same values, constructed without re-validation."""
+        return GISData.model_construct(
+            id=self.id, type=self.type, ts=self.ts, x=self.x, y=self.y, z=self.z,
+            bat=self.bat, cnf=self.cnf, gwid=self.gwid, data=self.data,
+            sequence=self.sequence, zone_id=self.zone_id
+        )
+
+    def to_tag(self) -> Tag:
+        """Tag model for this position, constructed without re-validation."""
+        return Tag.model_construct(id=self.id, x=self.x, y=self.y, z=self.z)
+
+    def to_json(self) -> str:
+        """Converts the record to the GISData JSON format."""
+        return self.to_gisdata().to_json()
+
+    def __repr__(self) -> str:
+        return f"PositionRecord(id={self.id!r}, x={self.x}, y={self.y}, z={self.z}, zone_id={self.zone_id})"
+
 class HeartBeat(BaseModel):
     ticks: int
 
@@ -177,7 +352,10 @@ class HeartBeat(BaseModel):
 
     @classmethod
     def from_xml(cls, xml_str: str):
-        root = ET.fromstring(xml_str)
+        return cls.from_element(ET.fromstring(xml_str))
+
+    @classmethod
+    def from_element(cls, root: ET.Element):
         ts_elem = root.find("ts")
         return cls(ticks=int(ts_elem.text) if ts_elem is not None and ts_elem.text else 0)
 
@@ -255,7 +433,10 @@ class Response(BaseModel):
 
     @classmethod
     def from_xml(cls, xml_str: str):
-        root = ET.fromstring(xml_str)
+        return cls.from_element(ET.fromstring(xml_str))
+
+    @classmethod
+    def from_element(cls, root: ET.Element):
         request_elem = root.find("request")
         req_id_elem = root.find("reqid")
         msg_elem = root.find("msg")
@@ -304,4 +485,10 @@ class Ave:
         sum_x = sum(item.x for item in items)
         sum_y = sum(item.y for item in items)
         count = len(items)
-        return Ave(sum_x / count, sum_y / count, 0.0)
\ No newline at end of file
+        return Ave(sum_x / count, sum_y / count, 0.0)
+
+    @staticmethod
+    def from_ring(ring: 'TagRingBuffer', two_d: bool = False) -> 'Ave':
+        """Average position from a TagRingBuffer's running sums (O(1))."""
+        x, y, z = ring.mean()
+        return Ave(x, y, 0.0 if two_d else z)
\ No newline at end of file
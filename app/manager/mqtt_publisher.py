@@ -0,0 +1,247 @@
+# Name: mqtt_publisher.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Persistent, batched asynchronous MQTT publisher for ParcoRTLS Manager trigger events
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+MQTT Publisher Module for ParcoRTLS Manager
+
+Replaces per-event paho.mqtt.publish.single calls (one TCP connection per
+message, executed on the event loop) with a single long-lived broker
+connection:
+
+- enqueue() is synchronous and returns immediately
+- A bounded outbound queue drops the oldest message on overflow
+- A drain task publishes queued messages in batches from a worker thread
+- paho's network thread reconnects with exponential backoff
+- Counters for enqueued, published, dropped and failed messages
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+import paho.mqtt.client as mqtt
+from manager.utils import MQTT_BROKER
+
+logger = logging.getLogger(__name__)
+
+# Publisher defaults
+MQTT_PORT = 1883
+MQTT_KEEPALIVE = 60
+MAX_QUEUE_SIZE = 10000
+BATCH_SIZE = 200
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+class MQTTPublisher:
+    """
+    Asynchronous MQTT publisher with a persistent broker connection.
+
+    Messages are buffered in a bounded deque and drained by a single asyncio
+    task. The drain task waits while the broker is unreachable, so a broker
+    outage costs queue space rather than event loop time.
+    """
+
+    def __init__(self, broker: str = MQTT_BROKER, port: int = MQTT_PORT,
+                 max_queue_size: int = MAX_QUEUE_SIZE, batch_size: int = BATCH_SIZE):
+        """
+        Initialize the publisher. The connection is opened lazily on first use.
+
+        Args:
+            broker: MQTT broker hostname
+            port: MQTT broker port
+            max_queue_size: Maximum number of messages held while waiting to publish
+            batch_size: Maximum number of messages handed to paho per drain cycle
+        """
+        self.broker = broker
+        self.port = port
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+
+        self.queue: Deque[Tuple[str, str, int]] = deque()
+        self.client: Optional[mqtt.Client] = None
+        self.drain_task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wakeup = asyncio.Event()
+        self.connected = asyncio.Event()
+
+        # Counters
+        self.enqueued_count = 0
+        self.published_count = 0
+        self.dropped_count = 0
+        self.failed_count = 0
+        self.connect_count = 0
+        self.disconnect_count = 0
+        self.batch_count = 0
+
+    def enqueue(self, topic: str, payload: str, qos: int = 0) -> bool:
+        """
+        Queue a message for publishing and return immediately.
+
+        Args:
+            topic: MQTT topic
+            payload: Message payload
+            qos: MQTT quality of service level
+
+        Returns:
+            bool: True if queued without dropping an older message
+        """
+        if not self._ensure_started():
+            self.failed_count += 1
+            return False
+
+        dropped = False
+        if len(self.queue) >= self.max_queue_size:
+            self.queue.popleft()
+            self.dropped_count += 1
+            dropped = True
+            if self.dropped_count % 1000 == 1:
+                logger.warning(f"MQTT outbound queue full ({self.max_queue_size}), dropped {self.dropped_count} messages so far")
+
+        self.queue.append((topic, payload, qos))
+        self.enqueued_count += 1
+        self.wakeup.set()
+        return not dropped
+
+    def _ensure_started(self) -> bool:
+        """Start the broker connection and drain task on the running loop."""
+        if self.drain_task is not None and not self.drain_task.done():
+            return True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.error("MQTTPublisher.enqueue called without a running event loop")
+            return False
+
+        self.loop = loop
+        if self.client is None:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+            self.client.on_connect = self._on_connect
+            self.client.on_disconnect = self._on_disconnect
+            self.client.reconnect_delay_set(min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY)
+            try:
+                self.client.connect_async(self.broker, self.port, MQTT_KEEPALIVE)
+                self.client.loop_start()
+                logger.info(f"MQTT publisher connecting to {self.broker}:{self.port}")
+            except Exception as e:
+                logger.error(f"Failed to start MQTT publisher: {str(e)}")
+
+        self.drain_task = loop.create_task(self._drain_loop())
+        return True
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        # Runs on paho's network thread
+        if reason_code.is_failure:
+            logger.warning(f"MQTT broker refused connection: {reason_code}")
+            return
+        self.connect_count += 1
+        logger.info(f"MQTT publisher connected to {self.broker}:{self.port}")
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.connected.set)
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        # Runs on paho's network thread; paho reconnects with backoff on its own
+        self.disconnect_count += 1
+        logger.warning(f"MQTT publisher disconnected: {reason_code}")
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.connected.clear)
+
+    async def _drain_loop(self):
+        """Publish queued messages in batches while the broker is connected."""
+        while True:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            await self.connected.wait()
+
+            batch = []
+            while self.queue and len(batch) < self.batch_size:
+                batch.append(self.queue.popleft())
+            if not batch:
+                continue
+
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._publish_batch, batch)
+                self.batch_count += 1
+            except Exception as e:
+                self.failed_count += len(batch)
+                logger.error(f"Failed to publish MQTT batch of {len(batch)}: {str(e)}")
+
+    def _publish_batch(self, batch: List[Tuple[str, str, int]]):
+        """Hand a batch of messages to paho (runs in a worker thread)."""
+        for topic, payload, qos in batch:
+            result = self.client.publish(topic, payload, qos=qos)  # type: ignore
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self.published_count += 1
+            else:
+                self.failed_count += 1
+
+    async def stop(self, flush_timeout: float = 2.0):
+        """
+        Flush pending messages and close the broker connection.
+
+        Args:
+            flush_timeout: Seconds to wait for the queue to drain
+        """
+        if self.drain_task is not None and self.connected.is_set():
+            try:
+                async def _wait_empty():
+                    while self.queue:
+                        await asyncio.sleep(0.05)
+                await asyncio.wait_for(_wait_empty(), timeout=flush_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"MQTT publisher stopped with {len(self.queue)} unsent messages")
+
+        if self.drain_task is not None:
+            self.drain_task.cancel()
+            try:
+                await self.drain_task
+            except asyncio.CancelledError:
+                pass
+            self.drain_task = None
+
+        if self.client is not None:
+            self.client.disconnect()
+            self.client.loop_stop()
+            self.client = None
+        self.wakeup = asyncio.Event()
+        self.connected = asyncio.Event()
+        logger.info("MQTT publisher stopped")
+
+    def get_stats(self) -> dict:
+        """
+        Get publisher statistics.
+
+        Returns:
+            dict: Queue depth and message counters
+        """
+        return {
+            'connected': self.connected.is_set(),
+            'queue_depth': len(self.queue),
+            'max_queue_size': self.max_queue_size,
+            'enqueued': self.enqueued_count,
+            'published': self.published_count,
+            'dropped': self.dropped_count,
+            'failed': self.failed_count,
+            'batches': self.batch_count,
+            'connects': self.connect_count,
+            'disconnects': self.disconnect_count
+        }
+
+# Process-wide publisher shared by all triggers
+_publisher: Optional[MQTTPublisher] = None
+
+def get_mqtt_publisher() -> MQTTPublisher:
+    """Get the process-wide MQTT publisher, creating it on first use."""
+    global _publisher
+    if _publisher is None:
+        _publisher = MQTTPublisher()
+    return _publisher
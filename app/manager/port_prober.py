@@ -0,0 +1,211 @@
+# Name: port_prober.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Non-blocking concurrent TCP port health prober with per-port backoff for ParcoRTLS Manager
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+Port Prober Module for ParcoRTLS Manager
+
+asyncio-native replacement for the blocking socket.connect_ex port check:
+
+- each probe is asyncio.open_connection under asyncio.wait_for, so a dead
+  port never blocks the event loop
+- probe_many() runs a whole sweep concurrently (bounded by a semaphore), so a
+  sweep takes about one timeout instead of the sum of all timeouts
+- a port that keeps failing is backed off exponentially and its last result is
+  reported without probing until the backoff expires
+- results are cached per (host, port) for a short TTL and shared by every
+  manager in the process through the port_prober singleton
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prober defaults
+MAX_CONCURRENCY = 32
+RESULT_TTL = 10.0           # Seconds a probe result is reused by other callers
+BACKOFF_BASE = 30.0         # First backoff after repeated failures
+BACKOFF_MAX = 300.0         # Longest time between probes of a down port
+BACKOFF_AFTER_FAILURES = 2  # Consecutive failures before backoff starts
+
+# Result sources
+PROBED = "probed"
+CACHED = "cached"
+BACKED_OFF = "backed_off"
+
+class ProbeResult:
+    """
+    Last known state of one (host, port).
+    """
+
+    __slots__ = ('healthy', 'response_time_ms', 'checked_at', 'consecutive_failures', 'next_probe_at')
+
+    def __init__(self):
+        self.healthy = False
+        self.response_time_ms = 0.0
+        self.checked_at = 0.0
+        self.consecutive_failures = 0
+        self.next_probe_at = 0.0
+
+class PortProber:
+    """
+    Concurrent TCP connect prober with result caching and per-port backoff.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, result_ttl: float = RESULT_TTL,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX):
+        """
+        Initialize the prober.
+
+        Args:
+            max_concurrency: Probes in flight at once
+            result_ttl: Seconds a result is shared before the port is probed again
+            backoff_base: First backoff delay for a failing port
+            backoff_max: Maximum backoff delay
+        """
+        self.max_concurrency = max_concurrency
+        self.result_ttl = result_ttl
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.results: Dict[Tuple[str, int], ProbeResult] = {}
+        self.in_flight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+        # Counters
+        self.probe_count = 0
+        self.cached_count = 0
+        self.backoff_skip_count = 0
+
+    async def _connect(self, host: str, port: int, timeout: float) -> Tuple[bool, float]:
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            start = time.perf_counter()
+            try:
+                _reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+                elapsed = (time.perf_counter() - start) * 1000
+                writer.close()
+                try:
+                    await asyncio.wait_for(writer.wait_closed(), 1.0)
+                except Exception:
+                    pass
+                return True, elapsed
+            except (asyncio.TimeoutError, OSError) as e:
+                logger.debug(f"Probe {host}:{port} failed: {type(e).__name__} {str(e)}")
+                return False, (time.perf_counter() - start) * 1000
+
+    async def probe(self, host: str, port: int, timeout: float, force: bool = False) -> Tuple[bool, float, str]:
+        """
+        Check one port, reusing a fresh result or honouring backoff unless forced.
+
+        Args:
+            host: Host or IP address
+            port: TCP port
+            timeout: Connect timeout in seconds
+            force: Always open a new connection
+
+        Returns:
+            tuple: (is_healthy, response_time_ms, source) where source is
+                   PROBED, CACHED or BACKED_OFF
+        """
+        key = (host, port)
+        now = time.monotonic()
+        state = self.results.get(key)
+        if state is not None and not force:
+            if not state.healthy and now < state.next_probe_at:
+                self.backoff_skip_count += 1
+                return state.healthy, state.response_time_ms, BACKED_OFF
+            if now - state.checked_at < self.result_ttl:
+                self.cached_count += 1
+                return state.healthy, state.response_time_ms, CACHED
+
+        # Callers sweeping the same port at the same time share one connection attempt
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._probe_and_record(key, timeout))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _t: self.in_flight.pop(key, None))
+            self.probe_count += 1
+        healthy, elapsed = await asyncio.shield(task)
+        return healthy, elapsed, PROBED
+
+    async def _probe_and_record(self, key: Tuple[str, int], timeout: float) -> Tuple[bool, float]:
+        healthy, elapsed = await self._connect(key[0], key[1], timeout)
+        self._record(key, healthy, elapsed)
+        return healthy, elapsed
+
+    def _record(self, key: Tuple[str, int], healthy: bool, elapsed: float):
+        now = time.monotonic()
+        state = self.results.get(key)
+        if state is None:
+            state = ProbeResult()
+            self.results[key] = state
+        state.healthy = healthy
+        state.response_time_ms = elapsed
+        state.checked_at = now
+        if healthy:
+            state.consecutive_failures = 0
+            state.next_probe_at = 0.0
+        else:
+            state.consecutive_failures += 1
+            excess = state.consecutive_failures - BACKOFF_AFTER_FAILURES
+            if excess >= 0:
+                delay = min(self.backoff_base * (2 ** excess), self.backoff_max)
+                state.next_probe_at = now + delay
+                if excess == 0:
+                    logger.info(f"Port {key[0]}:{key[1]} down, backing off probes for {delay:.0f}s")
+
+    async def probe_many(self, targets: Iterable[Tuple[str, int, float]]) -> Dict[int, Tuple[bool, float, str]]:
+        """
+        Check many ports concurrently.
+
+        Args:
+            targets: (host, port, timeout) tuples
+
+        Returns:
+            dict: port -> (is_healthy, response_time_ms, source)
+        """
+        targets = list(targets)
+        results = await asyncio.gather(
+            *(self.probe(host, port, timeout) for host, port, timeout in targets),
+            return_exceptions=True
+        )
+        sweep: Dict[int, Tuple[bool, float, str]] = {}
+        for (host, port, _timeout), result in zip(targets, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Error probing {host}:{port}: {str(result)}")
+                continue
+            sweep[port] = result
+        return sweep
+
+    def get_stats(self) -> dict:
+        """
+        Get prober statistics.
+
+        Returns:
+            dict: Probe counters and backoff state
+        """
+        now = time.monotonic()
+        return {
+            'tracked_ports': len(self.results),
+            'backed_off_ports': sum(1 for s in self.results.values() if not s.healthy and now < s.next_probe_at),
+            'probes': self.probe_count,
+            'cached_results': self.cached_count,
+            'backoff_skips': self.backoff_skip_count,
+            'max_concurrency': self.max_concurrency,
+            'result_ttl': self.result_ttl
+        }
+
+# Process-wide prober shared by every manager's heartbeat handler
+port_prober = PortProber()
@@ -1,7 +1,7 @@
 # Name: rtls_message_router.py
-# Version: 0.1.1
+# Version: 0.1.3
 # Created: 971201
-# Modified: 250716
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin + Claude
 # Description: Protocol-agnostic RTLS message routing and filtering system - FIXED DATABASE QUERY
@@ -34,6 +34,22 @@ Key Features:
 - Customer-specific routing rules
 - Performance optimized for high-frequency location data
 
+Version 0.1.3 Changes:
+- Decision table keyed by (category bitmask, customer) only; rules never depend
+  on the tag class
+- RTLSMessage.message_categories and RoutedMessage.actions are annotated FrozenSet,
+  matching the shared decision sets they are assigned
+- MAX_DECISIONS and RoutingDecision comments describe the (bitmask, customer) key
+
+Version 0.1.2 Changes:
+- Rules are compiled into a decision table keyed by (category bitmask, customer),
+  so routing a message is one dict lookup instead of a rule walk
+- Configuration is refreshed in the background once the cache expires; only the
+  very first load is awaited by process_gis_message
+- Sensor payloads are not parsed when no rule needs payload-derived categories
+  or the sensor payload action
+- A failed refresh keeps the last good configuration
+
 Version 0.1.1 Changes:
 - Fixed database query to use inbound_message_routing table instead of non-existent v_customer_routing_config view
 - Updated load_routing_configuration method to work with actual database schema
@@ -41,7 +57,7 @@ Version 0.1.1 Changes:
 
 import asyncio
 import logging
-from typing import Dict, List, Set, Optional, Any, Union
+from typing import Dict, FrozenSet, List, Optional, Any, Tuple, Union
 from dataclasses import dataclass, field
 from enum import Enum
 import json
@@ -73,6 +89,24 @@ class MessageCategory(Enum):
     CONFIG = "CONFIG"
     DEBUG = "DEBUG"
 
+# One bit per category, so a message's category set is an int usable as a dict key
+CATEGORY_BITS: Dict[MessageCategory, int] = {category: 1 << i for i, category in enumerate(MessageCategory)}
+
+# Categories that only exist once the sensor payload has been parsed
+PAYLOAD_CATEGORIES = frozenset({
+    MessageCategory.PROX,
+    MessageCategory.RANGE,
+    MessageCategory.MOTION,
+    MessageCategory.BUTTON,
+    MessageCategory.SENSOR_PAYLOAD
+})
+
+# Decision table limit; real traffic produces few distinct category masks, this only guards odd input
+MAX_DECISIONS = 4096
+
+# Seconds before a failed background refresh is retried
+CONFIG_RETRY_DELAY = 30
+
 class RouteAction(Enum):
     """Message routing actions"""
     DASHBOARD = "dashboard"
@@ -98,7 +132,7 @@ class RTLSMessage:
     sensor_payload_raw: str = ""
     
     # Message metadata
-    message_categories: Set[MessageCategory] = field(default_factory=set)
+    message_categories: FrozenSet[MessageCategory] = field(default_factory=frozenset)
     original_protocol: str = "generic"
     processed_timestamp: datetime = field(default_factory=datetime.now)
 
@@ -114,12 +148,19 @@ class RoutingRule:
     priority: int
     filter_config: Optional[Dict[str, Any]] = None
 
+@dataclass
+class RoutingDecision:
+    """Compiled routing outcome for one (category bitmask, customer)"""
+    categories: FrozenSet[MessageCategory]
+    actions: FrozenSet[RouteAction]
+    priority: int
+
 @dataclass
 class RoutedMessage:
     """Message with routing information applied"""
     rtls_message: RTLSMessage
     customer_id: int
-    actions: Set[RouteAction]
+    actions: FrozenSet[RouteAction]
     priority: int
     route_timestamp: datetime
 
@@ -129,11 +170,13 @@ class SensorPayloadParser:
     def __init__(self):
         self.parsers: Dict[str, Dict[str, Any]] = {}
         
-    async def load_parsers(self) -> None:
-        """Load sensor payload parsers from database"""
+    async def load_parsers(self, conn: Optional[asyncpg.Connection] = None) -> None:
+        """Load sensor payload parsers from database, reusing conn when given"""
         try:
-            conn_str = config_helper.get_connection_string("ParcoRTLSMaint")
-            conn = await asyncpg.connect(conn_str)
+            own_conn = conn is None
+            if own_conn:
+                conn_str = config_helper.get_connection_string("ParcoRTLSMaint")
+                conn = await asyncpg.connect(conn_str)
             
             try:
                 # Updated query to check if table exists first
@@ -161,7 +204,8 @@ class SensorPayloadParser:
                     self._load_default_parsers()
                 
             finally:
-                await conn.close()
+                if own_conn:
+                    await conn.close()
                 
         except Exception as e:
             logger.error(f"Failed to load sensor payload parsers: {e}")
@@ -322,10 +366,18 @@ class RTLSMessageRouter:
         self.last_config_reload = datetime.min
         self.config_cache_duration = timedelta(minutes=5)
         
+        # Compiled routing state, rebuilt whenever routing_rules change
+        self.decisions: Dict[Tuple[int, int], Optional[RoutingDecision]] = {}
+        self.payload_needed = True
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.last_refresh_attempt = datetime.min
+        
         # Performance tracking
         self.processed_count = 0
         self.routed_count = 0
         self.last_stats_time = datetime.now()
+        self.decision_misses = 0
+        self.payload_parse_skipped = 0
         
         logger.info(f"Initialized RTLS message router for customer {customer_id}")
 
@@ -351,7 +403,7 @@ class RTLSMessageRouter:
                 
                 rows = await conn.fetch(query, self.customer_id)
                 
-                self.routing_rules = {}
+                routing_rules: Dict[MessageCategory, RoutingRule] = {}
                 for row in rows:
                     try:
                         category = MessageCategory(row['message_category'])
@@ -364,13 +416,14 @@ class RTLSMessageRouter:
                             sensor_payload_enabled=row['include_sensor_payload'],
                             priority=row['priority']
                         )
-                        self.routing_rules[category] = routing_rule
+                        routing_rules[category] = routing_rule
                     except ValueError:
                         logger.warning(f"Unknown message category: {row['message_category']}")
                 
-                # Load sensor payload parsers
-                await self.payload_parser.load_parsers()
+                # Load sensor payload parsers on the same connection
+                await self.payload_parser.load_parsers(conn)
                 
+                self._compile_rules(routing_rules)
                 self.last_config_reload = datetime.now()
                 logger.info(f"Loaded {len(self.routing_rules)} routing rules for customer {self.customer_id}")
                 
@@ -379,7 +432,33 @@ class RTLSMessageRouter:
                 
         except Exception as e:
             logger.error(f"Failed to load routing configuration: {e}")
-            await self._load_default_routing()
+            if self.last_config_reload == datetime.min:
+                await self._load_default_routing()
+            else:
+                logger.warning(f"Keeping routing configuration loaded at {self.last_config_reload.isoformat()}")
+
+    def _schedule_refresh(self) -> None:
+        """Refresh the configuration in the background once it has expired"""
+        now = datetime.now()
+        if (now - self.last_config_reload) < self.config_cache_duration:
+            return
+        if self.refresh_task is not None and not self.refresh_task.done():
+            return
+        if (now - self.last_refresh_attempt).total_seconds() < CONFIG_RETRY_DELAY:
+            return
+        self.last_refresh_attempt = now
+        self.refresh_task = asyncio.create_task(self.load_routing_configuration())
+
+    def _compile_rules(self, routing_rules: Dict[MessageCategory, RoutingRule]) -> None:
+        """Install routing rules and reset the decision table built from them"""
+        self.routing_rules = routing_rules
+        self.decisions = {}
+        # Parsing only matters if a payload-derived category is routed or a
+        # rule forwards the sensor payload
+        self.payload_needed = any(
+            rule.sensor_payload_enabled or category in PAYLOAD_CATEGORIES
+            for category, rule in routing_rules.items()
+        )
 
     async def _load_default_routing(self) -> None:
         """Load default essential routing as fallback"""
@@ -391,9 +470,9 @@ class RTLSMessageRouter:
             MessageCategory.HEARTBEAT
         ]
         
-        self.routing_rules = {}
+        routing_rules: Dict[MessageCategory, RoutingRule] = {}
         for category in essential_categories:
-            self.routing_rules[category] = RoutingRule(
+            routing_rules[category] = RoutingRule(
                 customer_id=self.customer_id,
                 category=category,
                 dashboard_visible=True,
@@ -402,25 +481,45 @@ class RTLSMessageRouter:
                 sensor_payload_enabled=False,
                 priority=1 if category in [MessageCategory.LOC_2D, MessageCategory.LOC_3D] else 2
             )
+        self._compile_rules(routing_rules)
         
         logger.warning(f"Loaded {len(self.routing_rules)} default routing rules as fallback")
 
     async def process_gis_message(self, gis_data: GISData, 
                                  sensor_payload_raw: str = "") -> Optional[RoutedMessage]:
         """Process GISData message into generic RTLS message with routing."""
-        self.processed_count += 1
+        rtls_message, mask = await self.prepare_message(gis_data, sensor_payload_raw)
+        return self.route_prepared(rtls_message, mask)
+
+    async def ensure_configuration(self) -> None:
+        """Load the configuration on first use, afterwards refresh it in the background"""
+        if self.last_config_reload == datetime.min and not self.routing_rules:
+            await self.load_routing_configuration()
+        else:
+            self._schedule_refresh()
+
+    async def prepare_message(self, gis_data: GISData,
+                              sensor_payload_raw: str = "") -> Tuple[RTLSMessage, int]:
+        """Build and categorize an RTLS message without routing it.
         
-        # Ensure routing configuration is loaded
-        await self.load_routing_configuration()
+        The result can be handed to route_prepared() of several customer routers,
+        so the payload is parsed and categorized once per message.
+        """
+        await self.ensure_configuration()
         
         # Create RTLS message from GISData
         rtls_message = await self._create_rtls_message(gis_data, sensor_payload_raw)
         
         # Categorize message
-        self._categorize_message(rtls_message)
+        mask = self._categorize_message(rtls_message)
+        return rtls_message, mask
+
+    def route_prepared(self, rtls_message: RTLSMessage, mask: int) -> Optional[RoutedMessage]:
+        """Route a message built by prepare_message() with this router's rules"""
+        self.processed_count += 1
         
         # Apply routing rules
-        routed_message = await self._apply_routing_rules(rtls_message)
+        routed_message = self._route(rtls_message, mask)
         
         if routed_message:
             self.routed_count += 1
@@ -437,13 +536,14 @@ class RTLSMessageRouter:
         rtls_message = RTLSMessage(gis_data=gis_data)
         
         # Extract sensor payload if present
-        if sensor_payload_raw:
-            rtls_message.sensor_payload_raw = sensor_payload_raw
-            rtls_message.sensor_payload = self.payload_parser.parse_payload(sensor_payload_raw)
-        elif gis_data.data:
-            # Use existing data field as sensor payload
-            rtls_message.sensor_payload_raw = gis_data.data
-            rtls_message.sensor_payload = self.payload_parser.parse_payload(gis_data.data)
+        raw_payload = sensor_payload_raw or gis_data.data
+        if raw_payload:
+            rtls_message.sensor_payload_raw = raw_payload
+            if not self.payload_needed:
+                # No rule can use the parsed payload, skip format detection and parsing
+                self.payload_parse_skipped += 1
+                return rtls_message
+            rtls_message.sensor_payload = self.payload_parser.parse_payload(raw_payload)
         
         # Extract additional RTLS data from payload if available
         if rtls_message.sensor_payload:
@@ -483,53 +583,65 @@ class RTLSMessageRouter:
         if button_fields:
             rtls_message.button_pressed = {field: payload[field] for field in button_fields}
 
-    def _categorize_message(self, rtls_message: RTLSMessage) -> None:
-        """Auto-categorize RTLS message based on content"""
-        categories = set()
-        
+    def _categorize_message(self, rtls_message: RTLSMessage) -> int:
+        """Auto-categorize RTLS message based on content, returning the category bitmask"""
         # Always has tag ID and datetime
-        categories.add(MessageCategory.TAG_ID)
-        categories.add(MessageCategory.DATETIME)
+        mask = CATEGORY_BITS[MessageCategory.TAG_ID] | CATEGORY_BITS[MessageCategory.DATETIME]
         
         # Location categories
         if rtls_message.gis_data.z != 0:
-            categories.add(MessageCategory.LOC_3D)
+            mask |= CATEGORY_BITS[MessageCategory.LOC_3D]
         else:
-            categories.add(MessageCategory.LOC_2D)
+            mask |= CATEGORY_BITS[MessageCategory.LOC_2D]
         
         # Proximity/Range
         if rtls_message.proximity_data:
-            categories.add(MessageCategory.PROX)
+            mask |= CATEGORY_BITS[MessageCategory.PROX]
         if rtls_message.range_data:
-            categories.add(MessageCategory.RANGE)
+            mask |= CATEGORY_BITS[MessageCategory.RANGE]
         
         # Motion
         if rtls_message.motion_detected is not None:
-            categories.add(MessageCategory.MOTION)
+            mask |= CATEGORY_BITS[MessageCategory.MOTION]
         
         # Button
         if rtls_message.button_pressed:
-            categories.add(MessageCategory.BUTTON)
+            mask |= CATEGORY_BITS[MessageCategory.BUTTON]
         
         # Sensor payload
         if rtls_message.sensor_payload:
-            categories.add(MessageCategory.SENSOR_PAYLOAD)
+            mask |= CATEGORY_BITS[MessageCategory.SENSOR_PAYLOAD]
         
         # System categories
         if rtls_message.gis_data.bat >= 0:
-            categories.add(MessageCategory.BATTERY)
+            mask |= CATEGORY_BITS[MessageCategory.BATTERY]
         if rtls_message.gis_data.type and 'heartbeat' in rtls_message.gis_data.type.lower():
-            categories.add(MessageCategory.HEARTBEAT)
+            mask |= CATEGORY_BITS[MessageCategory.HEARTBEAT]
         
-        rtls_message.message_categories = categories
+        rtls_message.message_categories = self._categories_for_mask(mask)
+        return mask
 
-    async def _apply_routing_rules(self, rtls_message: RTLSMessage) -> Optional[RoutedMessage]:
-        """Apply customer routing rules to message"""
+    @staticmethod
+    def _categories_for_mask(mask: int) -> FrozenSet[MessageCategory]:
+        """Expand a category bitmask back into categories"""
+        return frozenset(category for category, bit in CATEGORY_BITS.items() if mask & bit)
+
+    def _decide(self, mask: int) -> Optional[RoutingDecision]:
+        """Look up or compile the routing decision for a category bitmask"""
+        key = (mask, self.customer_id)
+        try:
+            return self.decisions[key]
+        except KeyError:
+            pass
+        
+        self.decision_misses += 1
         actions = set()
         highest_priority = 10
         
         # Check each message category against routing rules
-        for category in rtls_message.message_categories:
+        for category, bit in CATEGORY_BITS.items():
+            if not mask & bit:
+                continue
             rule = self.routing_rules.get(category)
             if not rule:
                 continue
@@ -541,7 +653,7 @@ class RTLSMessageRouter:
                 actions.add(RouteAction.LOGGING)
             if rule.realtime_enabled:
                 actions.add(RouteAction.REALTIME)
-            if rule.sensor_payload_enabled and rtls_message.sensor_payload:
+            if rule.sensor_payload_enabled and mask & CATEGORY_BITS[MessageCategory.SENSOR_PAYLOAD]:
                 actions.add(RouteAction.SENSOR_PAYLOAD)
             
             # Track highest priority
@@ -549,14 +661,36 @@ class RTLSMessageRouter:
                 highest_priority = rule.priority
         
         # Block message if no actions
-        if not actions:
+        decision = None
+        if actions:
+            decision = RoutingDecision(
+                categories=self._categories_for_mask(mask),
+                actions=frozenset(actions),
+                priority=highest_priority
+            )
+        
+        if len(self.decisions) >= MAX_DECISIONS:
+            self.decisions.clear()
+        self.decisions[key] = decision
+        return decision
+
+    async def _apply_routing_rules(self, rtls_message: RTLSMessage) -> Optional[RoutedMessage]:
+        """Apply customer routing rules to message"""
+        return self._route(rtls_message, self._categorize_message(rtls_message))
+
+    def _route(self, rtls_message: RTLSMessage, mask: int) -> Optional[RoutedMessage]:
+        """Route a categorized message through the decision table"""
+        decision = self._decide(mask)
+        if decision is None:
             return None
         
+        # Decisions are shared between messages, so hand out the frozen sets as-is
+        rtls_message.message_categories = decision.categories
         return RoutedMessage(
             rtls_message=rtls_message,
             customer_id=self.customer_id,
-            actions=actions,
-            priority=highest_priority,
+            actions=decision.actions,
+            priority=decision.priority,
             route_timestamp=datetime.now()
         )
 
@@ -589,6 +723,10 @@ class RTLSMessageRouter:
             "messages_per_second": self.processed_count / max(duration, 1),
             "category_counts": {cat.value: count for cat, count in self.message_counts.items()},
             "configured_rules": len(self.routing_rules),
+            "cached_decisions": len(self.decisions),
+            "decision_misses": self.decision_misses,
+            "payload_parse_skipped": self.payload_parse_skipped,
+            "payload_parsing": self.payload_needed,
             "last_config_reload": self.last_config_reload.isoformat(),
             "stats_duration_seconds": duration
         }
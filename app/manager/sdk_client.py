@@ -1,7 +1,7 @@
 # Name: sdk_client.py
-# Version: 0.1.0
+# Version: 0.1.3
 # Created: 971201
-# Modified: 250502
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: ParcoRTLS backend script
@@ -10,6 +10,8 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.3 - Event-driven delivery: asyncio.Queue drained as soon as a message is queued, per-tag coalescing and last-value dedup, queue metrics, bumped from 0.1.2
+
 """ # Name: sdk_client.py
 # Version: 0.1.2
 # Created: 971201
@@ -23,12 +25,13 @@
 # Dependent: TRUE
 """
 
-from queue import Queue
 import asyncio
-from typing import Dict, Optional, TYPE_CHECKING
+import time
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 from datetime import datetime
 from fastapi import WebSocket, WebSocketDisconnect
 from .models import Tag
+from .fanout import serialize_message
 import logging
 
 if TYPE_CHECKING:
@@ -36,6 +39,12 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+SDK_QUEUE_MAXSIZE = 10000  # Messages waiting for one client before the oldest is dropped
+SDK_BATCH_MAX = 500        # Messages taken from the queue per delivery pass
+
+# (tag_id or None, text frame, monotonic time queued)
+QueuedMessage = Tuple[Optional[str], str, float]
+
 class SDKClient:
     def __init__(self, websocket: WebSocket, client_id: str, zone_id: Optional[int] = None):
         self.websocket = websocket
@@ -51,12 +60,24 @@ class SDKClient:
         self.is_closing = False
         self.sent_req = False
         self.sent_begin_msg = False
-        self.q = Queue(maxsize=10000)
+        self.q: asyncio.Queue = asyncio.Queue(maxsize=SDK_QUEUE_MAXSIZE)
         self.parent = None
         self.last_sent_message = None
+        self.last_sent_by_tag: Dict[str, str] = {}  # Last frame delivered per tag, for dedup
         self.q_timer_task = None
         self._is_closed = False
 
+        # Delivery metrics
+        self.queued_count = 0
+        self.sent_count = 0
+        self.dropped_count = 0
+        self.coalesced_count = 0
+        self.duplicate_count = 0
+        self.batch_count = 0
+        self.high_water = 0
+        self.max_batch = 0
+        self.max_latency_ms = 0.0
+
         self.last_message_type: Optional[str] = None  # Tracks last message type received from client (e.g., HeartBeat, GISData)
 
     @property
@@ -71,32 +92,109 @@ class SDKClient:
         logger.debug(f"Setting zone_id for client {self.client_id} to {value}")
         self._zone_id = value
 
+    def enqueue(self, message: Any, tag_id: Optional[str] = None) -> bool:
+        """
+        Queue a message for delivery without waiting; the delivery task wakes immediately.
+
+        Args:
+            message: dict or already serialized JSON text
+            tag_id: Tag the message is about; only the latest queued message per tag
+                    is delivered, and it is skipped if identical to the last one sent
+
+        Returns:
+            bool: False if the client is closing
+        """
+        if self.is_closing:
+            return False
+        item: QueuedMessage = (tag_id, serialize_message(message), time.monotonic())
+        if self.q.full():
+            # Keep the newest data for a client that cannot keep up
+            self.q.get_nowait()
+            self.dropped_count += 1
+        self.q.put_nowait(item)
+        self.queued_count += 1
+        if self.q.qsize() > self.high_water:
+            self.high_water = self.q.qsize()
+        return True
+
+    def _coalesce(self, batch: List[QueuedMessage]) -> List[QueuedMessage]:
+        """Keep only the latest message per tag; untagged messages keep their order."""
+        frames: List[Optional[QueuedMessage]] = []
+        latest: Dict[str, int] = {}
+        for item in batch:
+            tag_id = item[0]
+            if tag_id is not None:
+                previous = latest.get(tag_id)
+                if previous is not None:
+                    frames[previous] = None
+                    self.coalesced_count += 1
+                latest[tag_id] = len(frames)
+            frames.append(item)
+        return [item for item in frames if item is not None]
+
     async def q_timer(self):
+        """Deliver queued messages as soon as they arrive, draining bursts in one pass."""
         while not self.is_closing:
             try:
-                logger.debug(f"q_timer for client {self.client_id}: checking queue, size={self.q.qsize()}")
-                while not self.q.empty():
+                batch = [await self.q.get()]
+                while len(batch) < SDK_BATCH_MAX and not self.q.empty():
+                    batch.append(self.q.get_nowait())
+                if len(batch) > self.max_batch:
+                    self.max_batch = len(batch)
+                self.batch_count += 1
+
+                for tag_id, msg, queued_at in self._coalesce(batch):
                     if self.is_closing:
                         logger.debug(f"q_timer for client {self.client_id}: exiting due to client closing")
                         return
-                    msg = self.q.get_nowait()
-                    if msg == self.last_sent_message:
-                        logger.debug(f"q_timer for client {self.client_id}: skipping duplicate message: {msg}")
+                    if tag_id is not None:
+                        if self.last_sent_by_tag.get(tag_id) == msg:
+                            self.duplicate_count += 1
+                            continue
+                    elif msg == self.last_sent_message:
+                        self.duplicate_count += 1
                         continue
                     await self.websocket.send_text(msg)
+                    self.sent_count += 1
                     self.last_sent_message = msg
-                    logger.debug(f"q_timer sent message to client {self.client_id}: {msg}")
+                    if tag_id is not None:
+                        self.last_sent_by_tag[tag_id] = msg
+                    latency_ms = (time.monotonic() - queued_at) * 1000
+                    if latency_ms > self.max_latency_ms:
+                        self.max_latency_ms = latency_ms
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"q_timer for client {self.client_id}: delivered batch of {len(batch)}, queue size={self.q.qsize()}")
             except WebSocketDisconnect:
                 logger.debug(f"q_timer for client {self.client_id}: WebSocket disconnected, exiting")
                 self.is_closing = True
                 return
+            except asyncio.CancelledError:
+                raise
             except Exception as ex:
                 logger.error(f"Hall QTimer Err for client {self.client_id}: {str(ex)}")
                 self.is_closing = True
                 return
-            logger.debug(f"q_timer for client {self.client_id}: sleeping for 5 seconds")
-            await asyncio.sleep(5)
-            logger.debug(f"q_timer for client {self.client_id}: finished sleeping")
+
+    def get_stats(self) -> dict:
+        """
+        Get delivery statistics for this client.
+
+        Returns:
+            dict: Queue depth, high-water mark and delivery counters
+        """
+        return {
+            'queued': self.q.qsize(),
+            'high_water': self.high_water,
+            'max_size': self.q.maxsize,
+            'enqueued': self.queued_count,
+            'sent': self.sent_count,
+            'dropped': self.dropped_count,
+            'coalesced': self.coalesced_count,
+            'duplicates_skipped': self.duplicate_count,
+            'batches': self.batch_count,
+            'max_batch': self.max_batch,
+            'max_latency_ms': round(self.max_latency_ms, 2)
+        }
 
     def start_q_timer(self):
         """Start the q_timer task and store it."""
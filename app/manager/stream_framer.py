@@ -0,0 +1,278 @@
+# Name: stream_framer.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Incremental XML/JSON frame splitter for the ParcoRTLS DataStream
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+Stream Framer Module for ParcoRTLS Manager
+
+Splits the ParcoRTLS engine stream into complete frames without re-scanning
+data it has already seen:
+
+- incoming chunks are appended to one bytearray; consumed frames are cut from
+  its front, so the buffer only ever holds the frame in progress
+- the frame type is decided once, from the first non-blank byte of the frame:
+  '<' starts a <parco> XML document, '{' a JSON object
+- XML bytes are fed to an XMLPullParser as they arrive, and the end of the
+  frame is found by searching only the new bytes for </parco>, so a frame is
+  parsed exactly once however many chunks it spans
+- JSON frames are delimited by brace depth, tracked across chunks together
+  with string and escape state
+- a frame that fails to parse is dropped and counted; scanning resumes at the
+  next frame instead of poisoning the buffer
+"""
+
+import json
+import logging
+import re
+import xml.etree.ElementTree as ET
+from typing import List, Optional, Tuple, Union
+
+from .utils import MessageUtilities
+
+logger = logging.getLogger(__name__)
+
+# Frame kinds returned by StreamFramer.feed
+XML_FRAME = "xml"
+JSON_FRAME = "json"
+
+# An unfinished frame larger than this is treated as garbage and dropped
+MAX_FRAME_BYTES = 1024 * 1024
+
+END_TAG = MessageUtilities.ParcoEndTag.encode('utf-8')
+
+_BLANK = b" \t\r\n\x00"
+_FRAME_START = re.compile(rb"[<{]")
+_JSON_TOKEN = re.compile(rb'[{}"]')
+_JSON_STRING_TOKEN = re.compile(rb'["\\]')
+
+# (kind, payload, raw) - payload is the <parco> Element for XML frames and the
+# decoded object for JSON frames; raw is the frame bytes (XML frames only)
+Frame = Tuple[str, Union[ET.Element, dict], Optional[bytes]]
+
+class StreamFramer:
+    """
+    Incremental frame splitter with explicit scanning state.
+    """
+
+    def __init__(self, max_frame_bytes: int = MAX_FRAME_BYTES):
+        """
+        Initialize the framer.
+
+        Args:
+            max_frame_bytes: Largest frame accepted before the buffer is resynchronized
+        """
+        self.max_frame_bytes = max_frame_bytes
+        self.buffer = bytearray()
+        self._reset_frame()
+
+        # Counters
+        self.xml_frames = 0
+        self.json_frames = 0
+        self.parse_errors = 0
+        self.discarded_bytes = 0
+
+    def _reset_frame(self):
+        """Forget the frame in progress (its bytes must already be cut from the buffer)."""
+        self.mode: Optional[str] = None
+        self.scan_pos = 0
+        # XML state
+        self.parser: Optional[ET.XMLPullParser] = None
+        self.root: Optional[ET.Element] = None
+        self.fed = 0
+        self.broken = False
+        # JSON state
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, data: Union[str, bytes, bytearray, memoryview]) -> List[Frame]:
+        """
+        Add a chunk and return every frame it completes.
+
+        Args:
+            data: Next chunk of the stream
+
+        Returns:
+            List[Frame]: Completed frames, in stream order
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.buffer += data
+
+        frames: List[Frame] = []
+        while self.buffer:
+            if self.mode is None and not self._detect_mode():
+                break
+            frame = self._scan_xml() if self.mode == XML_FRAME else self._scan_json()
+            if frame is None:
+                if len(self.buffer) > self.max_frame_bytes:
+                    logger.warning(f"Dropping {len(self.buffer)} byte unterminated {self.mode} frame")
+                    self._discard(len(self.buffer))
+                    self._reset_frame()
+                break
+            if frame is not False:
+                frames.append(frame)
+        return frames
+
+    def _discard(self, count: int):
+        self.discarded_bytes += count
+        del self.buffer[:count]
+
+    def _detect_mode(self) -> bool:
+        """Skip blanks and stray bytes, then pick the frame type from its first byte."""
+        buf = self.buffer
+        start = 0
+        while start < len(buf) and buf[start] in _BLANK:
+            start += 1
+        if start == len(buf):
+            del buf[:]
+            return False
+        if buf[start] not in b"<{":
+            match = _FRAME_START.search(buf, start)
+            skip = match.start() if match else len(buf)
+            logger.debug(f"Skipping {skip - start} bytes before next frame")
+            self.discarded_bytes += skip - start
+            start = skip
+        del buf[:start]
+        if not buf:
+            return False
+        if buf[0] == ord('<'):
+            self.mode = XML_FRAME
+            self.parser = ET.XMLPullParser(events=("start",))
+        else:
+            self.mode = JSON_FRAME
+        return True
+
+    def _feed_parser(self, end: int):
+        """Hand buffer[fed:end] to the pull parser, capturing the root element."""
+        if self.broken or end <= self.fed:
+            return
+        try:
+            self.parser.feed(bytes(self.buffer[self.fed:end]))  # type: ignore
+            if self.root is None:
+                for _event, elem in self.parser.read_events():  # type: ignore
+                    self.root = elem
+                    break
+        except ET.ParseError as e:
+            # Keep scanning for the end tag so the next frame starts cleanly
+            logger.warning(f"Dropping malformed XML frame: {str(e)}")
+            self.broken = True
+            self.parse_errors += 1
+        self.fed = end
+
+    def _scan_xml(self) -> Union[Frame, None, bool]:
+        """
+        Continue the XML frame in progress.
+
+        Returns:
+            Frame when complete, None when more data is needed, False when the
+            frame was dropped
+        """
+        buf = self.buffer
+        idx = buf.find(END_TAG, max(self.scan_pos - len(END_TAG) + 1, 0))
+        if idx < 0:
+            # Parse what has arrived so far; only unseen bytes are searched next time
+            self.scan_pos = len(buf)
+            self._feed_parser(len(buf))
+            return None
+
+        end = idx + len(END_TAG)
+        self._feed_parser(end)
+        root = self.root
+        if not self.broken:
+            try:
+                self.parser.close()  # type: ignore
+            except ET.ParseError as e:
+                logger.warning(f"Dropping malformed XML frame: {str(e)}")
+                self.parse_errors += 1
+                root = None
+        else:
+            root = None
+        raw = bytes(buf[:end])
+        del buf[:end]
+        self._reset_frame()
+
+        if root is None:
+            return False
+        self.xml_frames += 1
+        return XML_FRAME, root, raw
+
+    def _scan_json(self) -> Union[Frame, None, bool]:
+        """
+        Continue the JSON frame in progress.
+
+        Returns:
+            Frame when complete, None when more data is needed, False when the
+            frame was dropped
+        """
+        buf = self.buffer
+        pos = self.scan_pos
+        while True:
+            if self.in_string:
+                if self.escaped:
+                    # A chunk ended on a backslash; skip the character it escapes
+                    if pos >= len(buf):
+                        self.scan_pos = pos
+                        return None
+                    self.escaped = False
+                    pos += 1
+                match = _JSON_STRING_TOKEN.search(buf, pos)
+                if match is None:
+                    self.scan_pos = len(buf)
+                    return None
+                pos = match.end()
+                if buf[match.start()] == ord('\\'):
+                    self.escaped = True
+                else:
+                    self.in_string = False
+                continue
+
+            match = _JSON_TOKEN.search(buf, pos)
+            if match is None:
+                self.scan_pos = len(buf)
+                return None
+            pos = match.end()
+            token = buf[match.start()]
+            if token == ord('"'):
+                self.in_string = True
+            elif token == ord('{'):
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    break
+
+        text = bytes(buf[:pos])
+        del buf[:pos]
+        self._reset_frame()
+        try:
+            payload = json.loads(text)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logger.warning(f"Dropping malformed JSON frame: {str(e)}")
+            self.parse_errors += 1
+            return False
+        self.json_frames += 1
+        return JSON_FRAME, payload, None
+
+    def get_stats(self) -> dict:
+        """
+        Get framer statistics.
+
+        Returns:
+            dict: Frame counters and buffer size
+        """
+        return {
+            'xml_frames': self.xml_frames,
+            'json_frames': self.json_frames,
+            'parse_errors': self.parse_errors,
+            'discarded_bytes': self.discarded_bytes,
+            'buffered_bytes': len(self.buffer)
+        }
@@ -0,0 +1,134 @@
+# Name: tag_forwarding.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Tag-indexed GISData forwarding table for the ParcoRTLS RealTime WebSocket server
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+Tag Forwarding Table Module for ParcoRTLS RealTime Server
+
+Reverse index from (tag_id, zone_id) to the SDK clients subscribed to that tag,
+so forwarding a GISData frame is a dictionary lookup instead of a scan over
+every client and every tag it requested.
+
+A subscription made without a zone_id is stored under zone None and matches
+frames from any zone.
+"""
+
+import logging
+from typing import Dict, Iterable, Optional, Set, Tuple
+from .sdk_client import SDKClient
+
+logger = logging.getLogger(__name__)
+
+RouteKey = Tuple[str, Optional[str]]
+
+def _zone_key(zone_id) -> Optional[str]:
+    return str(zone_id) if zone_id is not None else None
+
+class TagForwardingTable:
+    """
+    (tag_id, zone_id) -> subscribed SDKClients for one manager.
+    """
+
+    def __init__(self):
+        self.routes: Dict[RouteKey, Set[SDKClient]] = {}
+        self.client_routes: Dict[SDKClient, Set[RouteKey]] = {}
+
+    def subscribe(self, client: SDKClient, tag_ids: Iterable[str], zone_id=None):
+        """
+        Add tag subscriptions for a client (BeginStream / AddTag).
+
+        Args:
+            client: Subscribing SDK client
+            tag_ids: Tag IDs to forward to the client
+            zone_id: Zone the subscription is limited to, None for all zones
+        """
+        zone = _zone_key(zone_id)
+        keys = self.client_routes.setdefault(client, set())
+        for tag_id in tag_ids:
+            key = (str(tag_id), zone)
+            self.routes.setdefault(key, set()).add(client)
+            keys.add(key)
+
+    def unsubscribe(self, client: SDKClient, tag_ids: Iterable[str]):
+        """
+        Remove tag subscriptions for a client in every zone (RemoveTag).
+
+        Args:
+            client: SDK client
+            tag_ids: Tag IDs to stop forwarding
+        """
+        keys = self.client_routes.get(client)
+        if not keys:
+            return
+        tag_set = {str(tag_id) for tag_id in tag_ids}
+        for key in [k for k in keys if k[0] in tag_set]:
+            self._drop_route(client, key)
+            keys.discard(key)
+        if not keys:
+            del self.client_routes[client]
+
+    def replace(self, client: SDKClient, tag_ids: Iterable[str], zone_id=None):
+        """
+        Replace all subscriptions of a client (BeginStream).
+
+        Args:
+            client: SDK client
+            tag_ids: Tag IDs to forward to the client
+            zone_id: Zone the subscription is limited to, None for all zones
+        """
+        self.remove_client(client)
+        self.subscribe(client, tag_ids, zone_id)
+
+    def remove_client(self, client: SDKClient):
+        """Drop every subscription of a client (EndStream / disconnect)."""
+        for key in self.client_routes.pop(client, ()):
+            self._drop_route(client, key)
+
+    def _drop_route(self, client: SDKClient, key: RouteKey):
+        clients = self.routes.get(key)
+        if clients is not None:
+            clients.discard(client)
+            if not clients:
+                del self.routes[key]
+
+    def recipients(self, tag_id, zone_id=None) -> Set[SDKClient]:
+        """
+        Get clients subscribed to a tag in a zone.
+
+        Args:
+            tag_id: Tag ID of the frame
+            zone_id: Zone ID of the frame
+
+        Returns:
+            Set[SDKClient]: Zone-specific subscribers plus all-zone subscribers
+        """
+        tag = str(tag_id)
+        found = self.routes.get((tag, None))
+        zone = _zone_key(zone_id)
+        if zone is None:
+            return set(found) if found else set()
+        zoned = self.routes.get((tag, zone))
+        if not found:
+            return set(zoned) if zoned else set()
+        return found | zoned if zoned else set(found)
+
+    def get_stats(self) -> dict:
+        """
+        Get table statistics.
+
+        Returns:
+            dict: Route and client counts
+        """
+        return {
+            'routes': len(self.routes),
+            'clients': len(self.client_routes),
+            'subscriptions': sum(len(keys) for keys in self.client_routes.values())
+        }
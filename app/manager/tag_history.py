@@ -0,0 +1,216 @@
+# Name: tag_history.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Compact per-tag position ring buffers with running sums for ParcoRTLS Manager averaging
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+Tag History Module for ParcoRTLS Manager
+
+Per-tag position history used for averaging. Each tag keeps only x, y, z and a
+monotonic timestamp in preallocated array('d') ring buffers, instead of a list
+of full GISData objects:
+
+- append and window eviction are O(1)
+- running sums make the average O(1)
+- samples older than the time window are evicted from the oldest end
+- tags not seen for idle_expiry seconds are dropped by expire_idle()
+"""
+
+import time
+import logging
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Averaging defaults
+DEFAULT_CAPACITY = 5
+DEFAULT_WINDOW_SECONDS = 30.0
+DEFAULT_IDLE_EXPIRY = 300.0
+
+class TagRingBuffer:
+    """
+    Fixed-capacity ring of (x, y, z, t) samples with running sums.
+    """
+
+    __slots__ = ('capacity', 'xs', 'ys', 'zs', 'ts', 'head', 'count',
+                 'sum_x', 'sum_y', 'sum_z', 'last_seen')
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.xs = array('d', bytes(8 * capacity))
+        self.ys = array('d', bytes(8 * capacity))
+        self.zs = array('d', bytes(8 * capacity))
+        self.ts = array('d', bytes(8 * capacity))
+        self.head = 0      # next write slot
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_z = 0.0
+        self.last_seen = 0.0
+
+    def append(self, x: float, y: float, z: float, t: Optional[float] = None):
+        """
+        Add a sample, overwriting the oldest one when the ring is full.
+
+        Args:
+            x, y, z: Position
+            t: Monotonic timestamp, defaults to now
+        """
+        if t is None:
+            t = time.monotonic()
+        i = self.head
+        if self.count == self.capacity:
+            self.sum_x -= self.xs[i]
+            self.sum_y -= self.ys[i]
+            self.sum_z -= self.zs[i]
+        else:
+            self.count += 1
+        self.xs[i] = x
+        self.ys[i] = y
+        self.zs[i] = z
+        self.ts[i] = t
+        self.sum_x += x
+        self.sum_y += y
+        self.sum_z += z
+        self.last_seen = t
+        self.head = (i + 1) % self.capacity
+        if self.head == 0:
+            # Re-sum once per lap so float error from running updates cannot build up
+            self._resum()
+
+    def _oldest_index(self) -> int:
+        return (self.head - self.count) % self.capacity
+
+    def _resum(self):
+        self.sum_x = self.sum_y = self.sum_z = 0.0
+        i = self._oldest_index()
+        for _ in range(self.count):
+            self.sum_x += self.xs[i]
+            self.sum_y += self.ys[i]
+            self.sum_z += self.zs[i]
+            i = (i + 1) % self.capacity
+
+    def evict_older_than(self, cutoff: float) -> int:
+        """
+        Drop samples with a timestamp before cutoff.
+
+        Args:
+            cutoff: Monotonic timestamp
+
+        Returns:
+            int: Number of samples evicted
+        """
+        evicted = 0
+        while self.count:
+            i = self._oldest_index()
+            if self.ts[i] >= cutoff:
+                break
+            self.sum_x -= self.xs[i]
+            self.sum_y -= self.ys[i]
+            self.sum_z -= self.zs[i]
+            self.count -= 1
+            evicted += 1
+        if not self.count:
+            self.sum_x = self.sum_y = self.sum_z = 0.0
+        return evicted
+
+    def mean(self) -> Tuple[float, float, float]:
+        """Mean (x, y, z) of the samples held; zeros when empty."""
+        if not self.count:
+            return (0.0, 0.0, 0.0)
+        return (self.sum_x / self.count, self.sum_y / self.count, self.sum_z / self.count)
+
+    def is_full(self) -> bool:
+        return self.count == self.capacity
+
+    def __len__(self) -> int:
+        return self.count
+
+class TagHistoryStore:
+    """
+    TagRingBuffer per tag ID with time-window and idle-tag eviction.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, window_seconds: Optional[float] = DEFAULT_WINDOW_SECONDS,
+                 idle_expiry: float = DEFAULT_IDLE_EXPIRY):
+        """
+        Initialize the store.
+
+        Args:
+            capacity: Samples kept per tag (the averaging window length)
+            window_seconds: Maximum sample age, None to keep samples until overwritten
+            idle_expiry: Seconds without samples before a tag is dropped
+        """
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.idle_expiry = idle_expiry
+        self.buffers: Dict[str, TagRingBuffer] = {}
+        self.expired_count = 0
+
+    def add(self, tag_id: str, x: float, y: float, z: float) -> TagRingBuffer:
+        """
+        Record a sample for a tag and apply the time window.
+
+        Args:
+            tag_id: Tag identifier
+            x, y, z: Position
+
+        Returns:
+            TagRingBuffer: The tag's buffer after the update
+        """
+        now = time.monotonic()
+        ring = self.buffers.get(tag_id)
+        if ring is None:
+            ring = TagRingBuffer(self.capacity)
+            self.buffers[tag_id] = ring
+        ring.append(x, y, z, now)
+        if self.window_seconds is not None:
+            ring.evict_older_than(now - self.window_seconds)
+        return ring
+
+    def get(self, tag_id: str) -> Optional[TagRingBuffer]:
+        return self.buffers.get(tag_id)
+
+    def expire_idle(self, now: Optional[float] = None) -> List[str]:
+        """
+        Drop tags that have not reported within idle_expiry seconds.
+
+        Args:
+            now: Monotonic timestamp, defaults to now
+
+        Returns:
+            List[str]: Tag IDs that were dropped
+        """
+        if now is None:
+            now = time.monotonic()
+        cutoff = now - self.idle_expiry
+        expired = [tag_id for tag_id, ring in self.buffers.items() if ring.last_seen < cutoff]
+        for tag_id in expired:
+            del self.buffers[tag_id]
+        if expired:
+            self.expired_count += len(expired)
+            logger.debug(f"Expired history for {len(expired)} idle tags")
+        return expired
+
+    def discard(self, tag_id: str):
+        self.buffers.pop(tag_id, None)
+
+    def clear(self):
+        self.buffers.clear()
+
+    def __contains__(self, tag_id: str) -> bool:
+        return tag_id in self.buffers
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.buffers)
+
+    def __len__(self) -> int:
+        return len(self.buffers)
@@ -0,0 +1,233 @@
+# Name: tetse_bridge.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Persistent batched WebSocket event bridge for RTLS -> TETSE forwarding (ports 8998 and 9000)
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+TETSE Event Bridge Module for ParcoRTLS
+
+One long-lived WebSocket connection per hop replaces a new connection per
+event (httpx POST from RealTime to :8998, websockets.connect from :8998 to
+:9000):
+
+- publish() is synchronous and fire-and-forget
+- Events wait in a bounded queue; the oldest is dropped on overflow
+- Queued events are sent together as one EventBatch frame
+- The receiving side answers each batch with {"type": "ack", "count": n}
+- The connection is re-opened with exponential backoff after a failure
+- HeartBeat frames from the server are echoed so HeartbeatManager stays satisfied
+
+Batch frame format:
+    {"type": "EventBatch", "events": [{"entity_id": "...", "event_data": {...}}, ...]}
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Deque, Optional
+import websockets
+
+logger = logging.getLogger(__name__)
+
+# Bridge defaults
+MAX_QUEUE_SIZE = 5000
+BATCH_SIZE = 100
+CONNECT_TIMEOUT = 5.0
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+BATCH_FRAME_TYPE = "EventBatch"
+ACK_FRAME_TYPE = "ack"
+
+def batch_events(frame: dict) -> list:
+    """
+    Get the events carried by a received frame.
+
+    Accepts EventBatch frames and legacy single-event frames.
+
+    Args:
+        frame: Decoded JSON frame
+
+    Returns:
+        list: Event dicts with entity_id and event_data
+    """
+    if frame.get("type") == BATCH_FRAME_TYPE:
+        return [e for e in frame.get("events", []) if isinstance(e, dict)]
+    return [frame]
+
+class EventBridge:
+    """
+    Persistent, batched, fire-and-forget WebSocket event publisher.
+    """
+
+    def __init__(self, url: str, max_queue_size: int = MAX_QUEUE_SIZE, batch_size: int = BATCH_SIZE):
+        """
+        Initialize the bridge. The connection is opened lazily on first publish.
+
+        Args:
+            url: WebSocket URL of the receiving endpoint
+            max_queue_size: Events held while disconnected or busy
+            batch_size: Maximum events per EventBatch frame
+        """
+        self.url = url
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+
+        self.queue: Deque[dict] = deque()
+        self.wakeup = asyncio.Event()
+        self.run_task: Optional[asyncio.Task] = None
+        self.connected = False
+
+        # Counters
+        self.enqueued_count = 0
+        self.sent_count = 0
+        self.acked_count = 0
+        self.dropped_count = 0
+        self.failed_count = 0
+        self.batch_count = 0
+        self.connect_count = 0
+        self.last_error: Optional[str] = None
+
+    def publish(self, entity_id: str, event_data: dict) -> bool:
+        """
+        Queue an event and return immediately.
+
+        Args:
+            entity_id: Entity the event belongs to
+            event_data: Event payload
+
+        Returns:
+            bool: True if queued without dropping an older event
+        """
+        if self.run_task is None or self.run_task.done():
+            try:
+                self.run_task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                logger.error("EventBridge.publish called without a running event loop")
+                self.failed_count += 1
+                return False
+
+        dropped = False
+        if len(self.queue) >= self.max_queue_size:
+            self.queue.popleft()
+            self.dropped_count += 1
+            dropped = True
+            if self.dropped_count % 1000 == 1:
+                logger.warning(f"Event bridge queue to {self.url} full ({self.max_queue_size}), dropped {self.dropped_count} events so far")
+
+        self.queue.append({"entity_id": entity_id, "event_data": event_data})
+        self.enqueued_count += 1
+        self.wakeup.set()
+        return not dropped
+
+    async def _run(self):
+        """Keep one connection open and drain the queue over it."""
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            try:
+                async with websockets.connect(self.url, open_timeout=CONNECT_TIMEOUT) as ws:
+                    self.connected = True
+                    self.connect_count += 1
+                    delay = RECONNECT_MIN_DELAY
+                    logger.info(f"Event bridge connected to {self.url}")
+                    receiver = asyncio.create_task(self._receive(ws))
+                    try:
+                        await self._send_loop(ws, receiver)
+                    finally:
+                        receiver.cancel()
+            except asyncio.CancelledError:
+                self.connected = False
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Event bridge to {self.url} unavailable: {str(e)}, retrying in {delay:.1f}s")
+            self.connected = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _send_loop(self, ws, receiver: asyncio.Task):
+        while not receiver.done():
+            if not self.queue:
+                self.wakeup.clear()
+                waiter = asyncio.create_task(self.wakeup.wait())
+                await asyncio.wait({waiter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                continue
+
+            batch = []
+            while self.queue and len(batch) < self.batch_size:
+                batch.append(self.queue.popleft())
+            try:
+                await ws.send(json.dumps({"type": BATCH_FRAME_TYPE, "events": batch}, default=str))
+            except Exception:
+                self.failed_count += len(batch)
+                raise
+            self.sent_count += len(batch)
+            self.batch_count += 1
+
+    async def _receive(self, ws):
+        """Count acknowledgements and answer heartbeats."""
+        async for message in ws:
+            try:
+                frame = json.loads(message)
+            except (json.JSONDecodeError, TypeError):
+                # Legacy plain-text confirmation for a single event
+                self.acked_count += 1
+                continue
+            if not isinstance(frame, dict):
+                continue
+            frame_type = frame.get("type")
+            if frame_type == ACK_FRAME_TYPE:
+                self.acked_count += int(frame.get("count", 0))
+            elif frame_type == "HeartBeat":
+                heartbeat_id = frame.get("data", {}).get("heartbeat_id")
+                await ws.send(json.dumps({
+                    "type": "HeartBeat",
+                    "ts": int(time.time() * 1000),
+                    "data": {"heartbeat_id": heartbeat_id}
+                }))
+            elif frame_type == "request" and frame.get("request") == "EndStream":
+                await ws.send(json.dumps({"type": "response", "request": "EndStream", "reqid": frame.get("reqid", "")}))
+
+    async def stop(self):
+        """Close the connection; queued events are discarded."""
+        if self.run_task is not None:
+            self.run_task.cancel()
+            try:
+                await self.run_task
+            except asyncio.CancelledError:
+                pass
+            self.run_task = None
+        if self.queue:
+            logger.warning(f"Event bridge to {self.url} stopped with {len(self.queue)} unsent events")
+        self.connected = False
+
+    def get_stats(self) -> dict:
+        """
+        Get bridge statistics.
+
+        Returns:
+            dict: Queue depth and event counters
+        """
+        return {
+            'url': self.url,
+            'connected': self.connected,
+            'queue_depth': len(self.queue),
+            'enqueued': self.enqueued_count,
+            'sent': self.sent_count,
+            'acked': self.acked_count,
+            'dropped': self.dropped_count,
+            'failed': self.failed_count,
+            'batches': self.batch_count,
+            'connects': self.connect_count,
+            'last_error': self.last_error
+        }
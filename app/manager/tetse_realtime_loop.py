@@ -1,7 +1,7 @@
 # Name: tetse_realtime_loop.py
-# Version: 0.1.1
+# Version: 0.1.2
 # Created: 971201
-# Modified: 250704
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: ParcoRTLS backend script
@@ -10,6 +10,8 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.2 - realtime_evaluate looks rules up by subject in a RuleSet instead of filtering the whole list, bumped from 0.1.1
+
 # File: tetse_realtime_loop.py
 # Version: 0.3.0 (Phase 6A Realtime Loop Prototype)
 # Created: 250615
@@ -31,6 +33,7 @@ from config import get_db_configs_sync
 
 from routes.tetse_rule_engine import evaluate_house_exclusion_rule
 from routes.subject_registry import get_subject_current_zone
+from routes.tetse_rule_registry import RuleSet
 
 # Setup logger
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -78,12 +81,14 @@ async def preload_rules():
         logging.error(f"Database error during rule preload: {str(db_error)}")
         return []
 
-async def realtime_evaluate(subject_id: str, all_rules: list):
+async def realtime_evaluate(subject_id: str, all_rules: RuleSet | list):
     """
     Called upon simulated live event for subject_id.
-    Filters relevant rules and evaluates them.
+    Looks up the subject's rules and evaluates them.
     """
-    matching_rules = [rule for rule in all_rules if rule["subject_id"] == subject_id]
+    if not isinstance(all_rules, RuleSet):
+        all_rules = RuleSet.from_rules(all_rules)
+    matching_rules = all_rules.for_subject(subject_id)
 
     if not matching_rules:
         logging.info(f"No rules applicable for subject_id: {subject_id}")
@@ -97,7 +102,7 @@ async def main():
     print("----- TETSE Real-Time Loop Test -----")
 
     # Preload all rules into memory at startup
-    all_rules = await preload_rules()
+    all_rules = RuleSet.from_rules(await preload_rules())
     print(f"Preloaded {len(all_rules)} TETSE rules.")
 
     # Simulated incoming live event:
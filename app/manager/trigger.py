@@ -1,7 +1,7 @@
 # Name: trigger.py
-# Version: 0.1.0
+# Version: 0.1.3
 # Created: 971201
-# Modified: 250724
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: Python script for ParcoRTLS backend
@@ -11,20 +11,23 @@
 # Dependent: TRUE
 
 # /home/parcoadmin/parco_fastapi/app/manager/trigger.py
+# Version: 1.0.25-261018 - State and region dumps in check_trigger/point_state only built when DEBUG is enabled, level from PARCO_LOG_LEVEL, bumped from 1.0.24
+# Version: 1.0.24-261018 - MQTT trigger events go through the persistent MQTTPublisher queue instead of publish.single, bumped from 1.0.23
+# Version: 1.0.23-261018 - check_trigger accepts a known_state from the spatial index, added is_settled_outside, bumped from 1.0.22
 # Version: 1.0.22-250724 - Fixed Pylance errors: async/await, type annotations, bumped from 1.0.21
 from typing import Dict, List, Optional, Callable, Union, Awaitable
 from .enums import TriggerDirections, TriggerState
 from .models import Tag
 from .region import Region3DCollection  # Kept for compatibility; using vertex data instead
 from .events import StreamDataEventArgs
-from .utils import MQTT_BROKER
-import paho.mqtt.publish as publish
+from .mqtt_publisher import get_mqtt_publisher
+from .line_limited_logging import log_level_from_env
 import logging
 import asyncio
 
 # Force logging configuration for this module
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(log_level_from_env(logging.DEBUG))
 handler = logging.StreamHandler()
 handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
 logger.handlers = []  # Clear any existing handlers
@@ -171,10 +174,27 @@ class Trigger:
             if not self.is_portable and self.zone_id:
                 await self.validate_trigger_within_zone()
 
-    async def check_trigger(self, tag: Tag) -> bool:
-        # Log entry for debugging trigger evaluation
-        logger.debug(f"Checking trigger {self.name} (ID: {self.i_trg}) for tag {tag.id} at ({tag.x}, {tag.y}, {tag.z})")
-        logger.debug(f"Current states: {self.states}")
+    def is_settled_outside(self, tag_id: str) -> bool:
+        # True when another OutSide observation cannot fire an event or change state
+        if self.direction == TriggerDirections.WhileOut:
+            return False
+        if self.direction == TriggerDirections.WhileIn:
+            return True
+        s = self.states.get(tag_id)
+        if s is None or s.state != TriggerState.OutSide:
+            return False
+        if self.direction == TriggerDirections.OnCross:
+            return s.cross_sequence == "Started"
+        return True
+
+    async def check_trigger(self, tag: Tag, known_state: Optional[TriggerState] = None) -> bool:
+        # known_state lets the caller (spatial index) skip the containment test
+        # when it already knows the tag is outside every region bounding box
+        # Log entry for debugging trigger evaluation; the state dumps are only built when DEBUG is on
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Checking trigger {self.name} (ID: {self.i_trg}) for tag {tag.id} at ({tag.x}, {tag.y}, {tag.z})")
+            logger.debug(f"Current states: {self.states}")
         
         # Validate trigger setup
         if not self.is_valid:
@@ -190,8 +210,9 @@ class Trigger:
         # Retrieve or initialize tag's previous state
         s = self.get_state(tag.id)
         # Determine current state (InSide or OutSide) based on position
-        new_state = self.point_state(pt_x, pt_y, pt_z)
-        logger.debug(f"Tag {tag.id} state: previous={s.state}, new={new_state}")
+        new_state = known_state if known_state is not None else self.point_state(pt_x, pt_y, pt_z)
+        if debug:
+            logger.debug(f"Tag {tag.id} state: previous={s.state}, new={new_state}")
 
         # Flag to indicate if an event should fire
         event = False
@@ -256,28 +277,33 @@ class Trigger:
                 callback_result = self.trigger_callback(StreamDataEventArgs(tag=tag))
                 if asyncio.iscoroutine(callback_result):
                     await callback_result
-            # Publish event to MQTT (full stream)
-            try:
-                publish.single("home/rtls/trigger", self.name, hostname=MQTT_BROKER)
-                logger.info(f"Published MQTT event for trigger {self.name}")
-            except Exception as e:
-                logger.error(f"Failed to publish MQTT event for trigger {self.name}: {str(e)}")
-            logger.debug(f"Updated states after event: {self.states}")
+            # Queue event for MQTT (full stream); the shared publisher sends it off the event loop
+            if get_mqtt_publisher().enqueue("home/rtls/trigger", self.name):
+                logger.info(f"Queued MQTT event for trigger {self.name}")
+            else:
+                logger.warning(f"MQTT event for trigger {self.name} queued with overflow or not queued")
+            if debug:
+                logger.debug(f"Updated states after event: {self.states}")
             return True
-        logger.debug(f"No event fired for trigger {self.name}")
-        logger.debug(f"Updated states: {self.states}")
+        if debug:
+            logger.debug(f"No event fired for trigger {self.name}")
+            logger.debug(f"Updated states: {self.states}")
         return False
 
     def point_state(self, x: float, y: float, z: float) -> TriggerState:
         # Determine if point is inside any region
-        logger.debug(f"Checking point ({x}, {y}, {z}) against trigger {self.name} (ID: {self.i_trg}) regions: {self.regions}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Checking point ({x}, {y}, {z}) against trigger {self.name} (ID: {self.i_trg}) regions: {self.regions}")
         for region in self.regions:
             if self.contains_point(x, y, z):
-                logger.debug(f"Point ({x}, {y}, {z}) inside region for trigger {self.name} (ID: {self.i_trg}): "
-                             f"min=({region.min_x}, {region.min_y}, {region.min_z}), "
-                             f"max=({region.max_x}, {region.max_y}, {region.max_z})")
+                if debug:
+                    logger.debug(f"Point ({x}, {y}, {z}) inside region for trigger {self.name} (ID: {self.i_trg}): "
+                                 f"min=({region.min_x}, {region.min_y}, {region.min_z}), "
+                                 f"max=({region.max_x}, {region.max_y}, {region.max_z})")
                 return TriggerState.InSide
-        logger.debug(f"Point ({x}, {y}, {z}) outside all regions of trigger {self.name} (ID: {self.i_trg})")
+        if debug:
+            logger.debug(f"Point ({x}, {y}, {z}) outside all regions of trigger {self.name} (ID: {self.i_trg})")
         return TriggerState.OutSide
 
     def get_state(self, tag_id: str) -> TagState:
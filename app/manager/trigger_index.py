@@ -0,0 +1,173 @@
+# Name: trigger_index.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Per-zone uniform grid spatial index over trigger bounding boxes for ParcoRTLS Manager
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+Trigger Spatial Index Module for ParcoRTLS Manager
+
+Static triggers are bucketed into a uniform 2D grid by the bounding box of each
+Region3D in their Region3DCollection. A position lookup touches a single grid
+cell and returns only the triggers whose boxes contain the point, so the full
+polygon test in Trigger.check_trigger runs for a handful of candidates instead
+of every trigger loaded for the zone.
+
+Portable triggers move with their assigned tag, so they are kept outside the
+grid and are always returned as candidates. The same applies to triggers that
+only carry vertex_regions and have no Region3D boxes to index.
+
+Triggers whose direction reacts to a tag being outside (WhileOut, OnExit,
+OnCross, OnEnter state tracking) are listed separately so the caller can still
+advance their state machines without a containment test.
+"""
+
+import math
+import logging
+from typing import Dict, List, Tuple, Set
+from manager.enums import TriggerDirections
+from manager.trigger import Trigger
+
+logger = logging.getLogger(__name__)
+
+# Default grid cell edge length in site units (feet)
+DEFAULT_CELL_SIZE = 25.0
+
+# Directions that must observe a tag even when it is outside the trigger box
+OUTSIDE_SENSITIVE_DIRECTIONS = (
+    TriggerDirections.WhileOut,
+    TriggerDirections.OnExit,
+    TriggerDirections.OnCross,
+    TriggerDirections.OnEnter,
+)
+
+class ZoneTriggerIndex:
+    """
+    Uniform grid index of the triggers loaded for a single zone.
+
+    Trigger positions in ``triggers`` preserve load order so evaluation order
+    (and therefore event order) matches the original linear scan.
+    """
+
+    def __init__(self, zone_id: int, triggers: List[Trigger], cell_size: float = DEFAULT_CELL_SIZE):
+        """
+        Build the index for a zone.
+
+        Args:
+            zone_id: Zone ID the triggers belong to
+            triggers: Triggers loaded for the zone, in evaluation order
+            cell_size: Grid cell edge length
+        """
+        self.zone_id = zone_id
+        self.cell_size = cell_size
+        self.triggers: List[Trigger] = list(triggers)
+        self.cells: Dict[Tuple[int, int], List[Tuple[int, float, float, float, float, float, float]]] = {}
+        self.unindexed: List[int] = []
+        self.outside_sensitive: List[int] = []
+
+        for position, trigger in enumerate(self.triggers):
+            if trigger.is_portable or trigger.regions.count() == 0:
+                self.unindexed.append(position)
+                continue
+            if trigger.direction in OUTSIDE_SENSITIVE_DIRECTIONS:
+                self.outside_sensitive.append(position)
+            for region in trigger.regions:
+                self._insert_box(position, region)
+
+        logger.debug(f"Built trigger index for zone {zone_id}: {len(self.triggers)} triggers, "
+                     f"{len(self.cells)} cells, {len(self.unindexed)} unindexed")
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def _insert_box(self, position: int, region) -> None:
+        """Register one region bounding box in every grid cell it overlaps."""
+        min_x, max_x = float(region.min_x), float(region.max_x)
+        min_y, max_y = float(region.min_y), float(region.max_y)
+        min_z, max_z = float(region.min_z), float(region.max_z)
+        entry = (position, min_x, max_x, min_y, max_y, min_z, max_z)
+        cx0, cy0 = self._cell(min_x, min_y)
+        cx1, cy1 = self._cell(max_x, max_y)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.cells.setdefault((cx, cy), []).append(entry)
+
+    def candidates(self, x: float, y: float, z: float) -> Set[int]:
+        """
+        Get positions of triggers whose bounding box contains the point.
+
+        Portable and unindexed triggers are always included.
+
+        Args:
+            x, y, z: Point coordinates
+
+        Returns:
+            Set[int]: Positions into ``triggers``
+        """
+        found: Set[int] = set(self.unindexed)
+        for position, min_x, max_x, min_y, max_y, min_z, max_z in self.cells.get(self._cell(x, y), ()):
+            if min_x <= x <= max_x and min_y <= y <= max_y and min_z <= z <= max_z:
+                found.add(position)
+        return found
+
+    def __len__(self) -> int:
+        return len(self.triggers)
+
+class TriggerSpatialIndex:
+    """
+    Collection of per-zone trigger indexes.
+
+    Zones are rebuilt individually whenever their trigger set changes, so a
+    reload of one zone never touches the index of another.
+    """
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.zones: Dict[int, ZoneTriggerIndex] = {}
+
+    def rebuild_zone(self, zone_id: int, triggers: List[Trigger]) -> ZoneTriggerIndex:
+        """
+        Rebuild the index for one zone from its current trigger list.
+
+        Args:
+            zone_id: Zone ID to rebuild
+            triggers: All triggers belonging to the zone, in evaluation order
+
+        Returns:
+            ZoneTriggerIndex: The new zone index
+        """
+        index = ZoneTriggerIndex(zone_id, triggers, self.cell_size)
+        self.zones[zone_id] = index
+        return index
+
+    def drop_zone(self, zone_id: int) -> None:
+        """Remove the index for a zone."""
+        self.zones.pop(zone_id, None)
+
+    def clear(self) -> None:
+        """Remove all zone indexes."""
+        self.zones.clear()
+
+    def get_zone(self, zone_id: int) -> ZoneTriggerIndex | None:
+        """Get the index for a zone, or None when nothing is indexed for it."""
+        return self.zones.get(zone_id)
+
+    def get_stats(self) -> dict:
+        """
+        Get index statistics.
+
+        Returns:
+            dict: Per-index counters
+        """
+        return {
+            'indexed_zones': len(self.zones),
+            'indexed_triggers': sum(len(z) for z in self.zones.values()),
+            'grid_cells': sum(len(z.cells) for z in self.zones.values()),
+            'cell_size': self.cell_size
+        }
@@ -0,0 +1,201 @@
+# Name: trigger_loader.py
+# Version: 0.1.2
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Bulk SQL trigger loading and LISTEN/NOTIFY change listener for ParcoRTLS Manager
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+# Version: 0.1.2 - Vertices of the first region only (as get_trigger_details), numeric columns coerced to float like the HTTP path, bumped from 0.1.1
+# Version: 0.1.1 - TriggerChangeListener takes the channel to LISTEN on so TETSE rule changes reuse it, bumped from 0.1.0
+
+"""
+Trigger Loader Module for ParcoRTLS Manager
+
+Loads every trigger of a zone, with region vertices for the static ones, in two
+queries on a shared maint pool. This replaces one FastAPI call for the trigger
+list plus one more call per static trigger for its vertices.
+
+Trigger writes made through the API send NOTIFY on TRIGGER_CHANGE_CHANNEL with
+the zone ID as payload (empty payload = all zones). TriggerChangeListener keeps
+a dedicated connection LISTENing on that channel and hands the zone to a
+callback so the manager can drop its cached zone state. The same listener
+serves other channels with an integer payload (TETSE rule changes).
+"""
+
+import asyncio
+import logging
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_CHANGE_CHANNEL = "trigger_changes"
+
+# Seconds between reconnect attempts of the change listener
+LISTENER_RETRY_DELAY = 10.0
+
+# Same stored procedure as /api/get_triggers_by_zone_with_id (6 decimal rounding)
+ZONE_TRIGGERS_QUERY = "SELECT * FROM usp_triggers_select_by_zone_with_rounded_coords($1)"
+
+# Vertices of all static triggers of a zone in one round trip, rounded like
+# usp_zone_vertices_select_by_region. Like /api/get_trigger_details, only one
+# region per trigger (the lowest i_rgn) makes up its polygon
+TRIGGER_VERTICES_QUERY = """
+    WITH trigger_region AS (
+        SELECT i_trg, MIN(i_rgn) AS i_rgn
+        FROM regions
+        WHERE i_trg = ANY($1::int[])
+        GROUP BY i_trg
+    )
+    SELECT r.i_trg,
+           ROUND(v.n_x::numeric, 6)::float8 AS x,
+           ROUND(v.n_y::numeric, 6)::float8 AS y,
+           ROUND(COALESCE(v.n_z, 0)::numeric, 6)::float8 AS z,
+           v.n_ord
+    FROM trigger_region r
+    JOIN vertices v ON v.i_rgn = r.i_rgn
+    ORDER BY r.i_trg, v.n_ord
+"""
+
+async def fetch_zone_triggers(pool: asyncpg.Pool, zone_id: int) -> List[dict]:
+    """
+    Fetch the triggers of a zone with their vertices.
+
+    Static triggers get a "vertices" list in the same shape as the
+    /api/get_trigger_details response; portable triggers have none. numeric
+    columns (radius_ft, z_min, z_max, ...) come back as float, as they did
+    through the JSON API.
+
+    Args:
+        pool: Maint database pool
+        zone_id: Zone ID
+
+    Returns:
+        List[dict]: Trigger rows
+    """
+    async with pool.acquire() as conn:
+        rows = [{key: float(value) if isinstance(value, Decimal) else value for key, value in row.items()}
+                for row in await conn.fetch(ZONE_TRIGGERS_QUERY, zone_id)]
+        static_ids = [row["trigger_id"] for row in rows if not row.get("is_portable")]
+        vertices: Dict[int, List[dict]] = {}
+        if static_ids:
+            for v in await conn.fetch(TRIGGER_VERTICES_QUERY, static_ids):
+                vertices.setdefault(v["i_trg"], []).append(
+                    {"x": v["x"], "y": v["y"], "z": v["z"], "n_ord": v["n_ord"]}
+                )
+
+    for row in rows:
+        if not row.get("is_portable"):
+            row["vertices"] = vertices.get(row["trigger_id"], [])
+    return rows
+
+def parse_change_payload(payload: str, channel: str = TRIGGER_CHANGE_CHANNEL) -> Optional[int]:
+    """
+    Get the zone ID (or other integer key) from a NOTIFY payload.
+
+    Args:
+        payload: Notification payload
+        channel: Channel the payload came from, for logging
+
+    Returns:
+        Optional[int]: Zone ID, or None when every zone should be invalidated
+    """
+    try:
+        return int(payload) if payload and payload.strip() else None
+    except ValueError:
+        logger.warning(f"Ignoring unexpected {channel} payload '{payload}', invalidating all")
+        return None
+
+class TriggerChangeListener:
+    """
+    Dedicated LISTEN connection for trigger change notifications.
+    """
+
+    def __init__(self, conn_string: str, on_change: Callable[[Optional[int]], None],
+                 channel: str = TRIGGER_CHANGE_CHANNEL):
+        """
+        Initialize the listener.
+
+        Args:
+            conn_string: Connection string of the database that sends the notifications
+            on_change: Called with the changed zone ID, or None for all zones
+            channel: Channel to LISTEN on
+        """
+        self.conn_string = conn_string
+        self.on_change = on_change
+        self.channel = channel
+        self.conn: Optional[asyncpg.Connection] = None
+        self.run_task: Optional[asyncio.Task] = None
+        self.lost = asyncio.Event()
+        self.notification_count = 0
+        self.connect_count = 0
+
+    def start(self):
+        """Start listening in the background."""
+        if self.run_task is None or self.run_task.done():
+            self.run_task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                self.lost.clear()
+                self.conn = await asyncpg.connect(self.conn_string)
+                self.conn.add_termination_listener(lambda _conn: self.lost.set())
+                await self.conn.add_listener(self.channel, self._notified)
+                self.connect_count += 1
+                logger.info(f"Listening for {self.channel} notifications")
+                # Changes made while disconnected were missed
+                if self.connect_count > 1:
+                    self.on_change(None)
+                await self.lost.wait()
+                logger.warning(f"{self.channel} listener connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.channel} listener unavailable: {str(e)}, retrying in {LISTENER_RETRY_DELAY}s")
+            await self._close_connection()
+            await asyncio.sleep(LISTENER_RETRY_DELAY)
+
+    def _notified(self, _conn, _pid, _channel, payload: str):
+        self.notification_count += 1
+        zone_id = parse_change_payload(payload, self.channel)
+        logger.debug(f"{self.channel} notification for {zone_id if zone_id is not None else 'ALL'}")
+        self.on_change(zone_id)
+
+    async def _close_connection(self):
+        if self.conn is not None:
+            try:
+                await self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+
+    async def stop(self):
+        """Stop listening and close the connection."""
+        if self.run_task is not None:
+            self.run_task.cancel()
+            try:
+                await self.run_task
+            except asyncio.CancelledError:
+                pass
+            self.run_task = None
+        await self._close_connection()
+
+    def get_stats(self) -> dict:
+        """
+        Get listener statistics.
+
+        Returns:
+            dict: Connection state and notification counts
+        """
+        return {
+            'listening': self.conn is not None and not self.conn.is_closed(),
+            'notifications': self.notification_count,
+            'connects': self.connect_count
+        }
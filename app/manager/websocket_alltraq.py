@@ -1,7 +1,7 @@
 # Name: websocket_alltraq.py
-# Version: 0.1.7
+# Version: 0.1.8
 # Created: 250717
-# Modified: 250717
+# Modified: 261018
 # Creator: AI Assistant
 # Modified By: AI Assistant
 # Description: AllTraq WebSocket Server on port 18002 to receive AllTraq data and forward to Control Manager
@@ -10,6 +10,7 @@
 # Status: Active
 # Dependent: TRUE
 #
+# Version: 0.1.8 - Dropped per-call file_handler.flush() (the queued writer flushes per burst), level from PARCO_LOG_LEVEL, bumped from 0.1.7
 # Version: 0.1.7 - FIXED: Removed timeout parameter causing connection failure, bumped from 0.1.6
 # Version: 0.1.6 - Fixed proper routing to Port 8001 Control Manager, bumped from 0.1.5
 # Version: 0.1.5 - Fixed proper routing to Port 8001 Control Manager, bumped from 0.1.4
@@ -37,7 +38,7 @@ import httpx
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_server_host
-from manager.line_limited_logging import LineLimitedFileHandler
+from manager.line_limited_logging import LineLimitedFileHandler, log_level_from_env
 
 # Log directory and file
 LOG_DIR = "/home/parcoadmin/parco_fastapi/app/logs"
@@ -48,7 +49,7 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 # Configure logging
 logger = logging.getLogger("manager.websocket_alltraq")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(log_level_from_env(logging.DEBUG))
 
 # StreamHandler for console
 stream_handler = logging.StreamHandler()
@@ -66,7 +67,6 @@ logger.handlers = [stream_handler, file_handler]
 logger.propagate = False
 
 logger.info("Starting AllTraq WebSocket Bridge server on port 18002")
-file_handler.flush()
 
 # Configuration
 DEFAULT_ZONE_ID = 451  # AllTraq default zone
@@ -107,7 +107,6 @@ async def connect_to_control_manager() -> bool:
     
     try:
         logger.info(f"Connecting to Control Manager at ws://{server_host}:{CONTROL_MANAGER_PORT}/ws/ControlManager")
-        file_handler.flush()
         
         # FIXED v0.1.7: Removed timeout parameter - not supported in this websockets version
         _CONTROL_MANAGER_WS = await websockets.connect(
@@ -116,7 +115,6 @@ async def connect_to_control_manager() -> bool:
         assert _CONTROL_MANAGER_WS is not None  # Type assertion for Pylance
         
         logger.info("✅ FIXED v0.1.7: Connected to Control Manager, sending BeginStream handshake")
-        file_handler.flush()
         
         # Send BeginStream for AllTraq tags - using a representative sample
         begin_stream_msg = {
@@ -133,7 +131,6 @@ async def connect_to_control_manager() -> bool:
         
         await _CONTROL_MANAGER_WS.send(json.dumps(begin_stream_msg))
         logger.info(f"📤 Sent BeginStream to Control Manager: {begin_stream_msg}")
-        file_handler.flush()
         
         # Wait for response using asyncio.wait_for for timeout
         try:
@@ -141,7 +138,6 @@ async def connect_to_control_manager() -> bool:
             response = json.loads(response_data)
             
             logger.info(f"📥 Received response from Control Manager: {response}")
-            file_handler.flush()
             
             if response.get("type") == "response" and response.get("request") == "BgnStrm":
                 if not response.get("message"):  # Empty message means success
@@ -164,7 +160,6 @@ async def connect_to_control_manager() -> bool:
             
     except Exception as e:
         logger.error(f"❌ Failed to connect to Control Manager: {str(e)}")
-        file_handler.flush()
         _CONTROL_MANAGER_WS = None
         _MANAGER_CONNECTED = False
         return False
@@ -183,12 +178,10 @@ async def listen_to_control_manager():
                 msg_type = data.get("type")
                 
                 logger.debug(f"📨 Received from Control Manager: {data}")
-                file_handler.flush()
                 
                 if msg_type == "PortRedirect":
                     port = data.get("port", REALTIME_MANAGER_PORT)
                     logger.info(f"🔄 Control Manager redirected to port {port}")
-                    file_handler.flush()
                     
                 elif msg_type == "HeartBeat":
                     # Respond to heartbeats
@@ -199,20 +192,16 @@ async def listen_to_control_manager():
                     if _CONTROL_MANAGER_WS is not None:
                         await _CONTROL_MANAGER_WS.send(json.dumps(heartbeat_response))
                         logger.debug(f"💓 Heartbeat response sent: {heartbeat_response}")
-                        file_handler.flush()
                     
             except json.JSONDecodeError as e:
                 logger.error(f"❌ Failed to parse Control Manager message: {e}")
-                file_handler.flush()
                 
     except websockets.exceptions.ConnectionClosed:
         logger.warning("⚠️ Control Manager connection closed")
         _CONTROL_MANAGER_WS = None
         _MANAGER_CONNECTED = False
-        file_handler.flush()
     except Exception as e:
         logger.error(f"❌ Error listening to Control Manager: {str(e)}")
-        file_handler.flush()
 
 async def forward_gis_data_to_control_manager(gis_data: dict):
     """
@@ -225,11 +214,9 @@ async def forward_gis_data_to_control_manager(gis_data: dict):
     
     if not _MANAGER_CONNECTED or _CONTROL_MANAGER_WS is None:
         logger.warning("⚠️ Control Manager not connected, attempting reconnection")
-        file_handler.flush()
         
         if not await connect_to_control_manager():
             logger.error("❌ Failed to connect to Control Manager, dropping GIS data")
-            file_handler.flush()
             return
     
     try:
@@ -237,11 +224,9 @@ async def forward_gis_data_to_control_manager(gis_data: dict):
         if _CONTROL_MANAGER_WS is not None:
             await _CONTROL_MANAGER_WS.send(json.dumps(gis_data))
             logger.info(f"✅ Forwarded GIS data to Control Manager for tag {gis_data.get('ID')}")
-            file_handler.flush()
         
     except Exception as e:
         logger.error(f"❌ Failed to forward GIS data to Control Manager: {str(e)}")
-        file_handler.flush()
         
         # Reset connection on error
         _CONTROL_MANAGER_WS = None
@@ -251,7 +236,6 @@ async def forward_gis_data_to_control_manager(gis_data: dict):
 async def lifespan(app: FastAPI):
     """Application lifespan manager."""
     logger.info("🚀 Starting AllTraq WebSocket Bridge")
-    file_handler.flush()
     
     # Attempt initial connection to Control Manager
     await connect_to_control_manager()
@@ -262,10 +246,8 @@ async def lifespan(app: FastAPI):
     if _CONTROL_MANAGER_WS is not None:
         await _CONTROL_MANAGER_WS.close()
         logger.info("🔌 Disconnected from Control Manager")
-        file_handler.flush()
     
     logger.info("🛑 AllTraq WebSocket Bridge shutdown")
-    file_handler.flush()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -279,7 +261,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 logger.debug(f"CORS middleware added with allow_origins: {cors_origins[0]}")
-file_handler.flush()
 
 @app.post("/broadcast_dashboard_message")
 async def broadcast_dashboard_message(message: DashboardMessage):
@@ -294,14 +275,12 @@ async def broadcast_dashboard_message(message: DashboardMessage):
     try:
         logger.info(f"📥 HTTP POST: Received AllTraq GIS data for tag {message.ID} in zone {message.zone_id}")
         logger.debug(f"📊 GIS Data: X={message.X}, Y={message.Y}, Z={message.Z}, CNF={message.CNF}")
-        file_handler.flush()
         
         # Convert message to dict for forwarding
         gis_data = message.dict()
         
         # CRITICAL FIX: Forward HTTP POST data to Control Manager
         logger.info(f"🔄 v0.1.7: Forwarding HTTP POST AllTraq data to Control Manager for tag {message.ID}")
-        file_handler.flush()
         
         # Forward to Control Manager for proper routing
         await forward_gis_data_to_control_manager(gis_data)
@@ -322,13 +301,11 @@ async def broadcast_dashboard_message(message: DashboardMessage):
             logger.info(f"🧹 Removed disconnected AllTraq client {client_id}")
         
         logger.info(f"✅ v0.1.7: Successfully processed HTTP POST for tag {message.ID} → Control Manager → RealTime")
-        file_handler.flush()
         
         return {"status": "success", "message": "GIS data forwarded to Control Manager via HTTP POST"}
         
     except Exception as e:
         logger.error(f"❌ Error processing AllTraq HTTP POST message: {str(e)}")
-        file_handler.flush()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.websocket("/ws/AllTraqAppAPIInbound")
@@ -344,12 +321,10 @@ async def websocket_alltraq_inbound(websocket: WebSocket):
     client_id = f"{client_host}:{client_port}"
     
     logger.info(f"🔗 AllTraq WebSocket connection attempt from {client_id}")
-    file_handler.flush()
     
     try:
         await websocket.accept()
         logger.info(f"✅ AllTraq WebSocket connection accepted for {client_id}")
-        file_handler.flush()
         
         # Track client
         _ALLTRAQ_CLIENTS[client_id] = websocket
@@ -363,7 +338,6 @@ async def websocket_alltraq_inbound(websocket: WebSocket):
                 # Receive data from AllTraq service
                 data = await websocket.receive_json()
                 logger.debug(f"📨 Received from AllTraq client {client_id}: {data}")
-                file_handler.flush()
                 
                 msg_type = data.get("type")
                 
@@ -383,7 +357,6 @@ async def websocket_alltraq_inbound(websocket: WebSocket):
                         
                         await websocket.send_json(response)
                         logger.info(f"✅ Sent BeginStream response to AllTraq client {client_id}")
-                        file_handler.flush()
                         
                     elif request_type == "EndStream":
                         # Send end response and break
@@ -397,13 +370,11 @@ async def websocket_alltraq_inbound(websocket: WebSocket):
                         
                         await websocket.send_json(response)
                         logger.info(f"✅ Sent EndStream response to AllTraq client {client_id}")
-                        file_handler.flush()
                         break
                         
                 elif msg_type == "GISData":
                     # Forward GIS data to Control Manager
                     logger.info(f"🔄 v0.1.7: Forwarding WebSocket GIS data to Control Manager for tag {data.get('ID')}")
-                    file_handler.flush()
                     await forward_gis_data_to_control_manager(data)
                     
                 elif msg_type == "HeartBeat":
@@ -416,26 +387,21 @@ async def websocket_alltraq_inbound(websocket: WebSocket):
                     }
                     await websocket.send_json(heartbeat_response)
                     logger.debug(f"💓 Heartbeat response sent to AllTraq client {client_id}")
-                    file_handler.flush()
                 
             except WebSocketDisconnect:
                 logger.info(f"🔌 AllTraq client {client_id} disconnected")
-                file_handler.flush()
                 break
             except Exception as e:
                 logger.error(f"❌ Error handling AllTraq client {client_id}: {str(e)}")
-                file_handler.flush()
                 break
                 
     except Exception as e:
         logger.error(f"❌ AllTraq WebSocket error for {client_id}: {str(e)}")
-        file_handler.flush()
     finally:
         # Clean up client tracking
         if client_id in _ALLTRAQ_CLIENTS:
             del _ALLTRAQ_CLIENTS[client_id]
             logger.info(f"🧹 Removed AllTraq client {client_id} from tracking")
-            file_handler.flush()
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,7 @@
 # Name: websocket_control.py
-# Version: 0.1.6
+# Version: 0.1.8
 # Created: 250513
-# Modified: 250717
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin & TC & AI Assistant
 # Description: Python script for ParcoRTLS Control WebSocket server on port 8001 - Added GISData forwarding to RealTime Manager - Added heartbeat integration for port monitoring and scaling - Added PortRedirect support for simulator v0.1.23 - Updated to use centralized configuration - Added message type tracking for heartbeat filtering
@@ -10,6 +10,9 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.8 - Dropped per-call file_handler.flush() (the queued writer flushes per burst), level from PARCO_LOG_LEVEL, bumped from 0.1.7
+# Version: 0.1.7 - Reuse shared asyncpg pools from db_pool_registry and cached tlkresources lookups instead of a pool per connection, bumped from 0.1.6
+
 import asyncio
 import logging
 import os
@@ -19,7 +22,6 @@ import websockets
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-import asyncpg
 import json
 from datetime import datetime
 from typing import Optional
@@ -30,11 +32,12 @@ from db_config_helper import config_helper
 from config import get_server_host
 
 from .manager import Manager
+from .db_pools import db_pool_registry
 from .sdk_client import SDKClient
 from .models import HeartBeat, Response, ResponseType, Request, Tag
 from .enums import RequestType, eMode
 from .constants import REQUEST_TYPE_MAP, NEW_REQUEST_TYPES
-from .line_limited_logging import LineLimitedFileHandler
+from .line_limited_logging import LineLimitedFileHandler, log_level_from_env
 from .heartbeat_manager import HeartbeatManager
 
 # Import heartbeat integration
@@ -54,7 +57,7 @@ except Exception as e:
 
 # Configure logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(log_level_from_env(logging.DEBUG))
 
 # StreamHandler for console
 stream_handler = logging.StreamHandler()
@@ -73,7 +76,6 @@ try:
     logger.addHandler(file_handler)
     logger.propagate = False
     logger.debug(f"Log directory {LOG_DIR} and file {LOG_FILE} initialized")
-    file_handler.flush()
 except Exception as e:
     logger.error(f"Failed to initialize file handler for {LOG_FILE}: {str(e)}")
     raise
@@ -146,12 +148,10 @@ async def connect_to_realtime_manager() -> bool:
         realtime_url = f"ws://{server_host}:{DEFAULT_REALTIME_PORT}/ws/RealTimeManager"
         
         logger.info(f"🔗 Connecting to RealTime Manager at {realtime_url}")
-        file_handler.flush()
         
         _realtime_manager_ws = await websockets.connect(realtime_url)
         
         logger.info("✅ Connected to RealTime Manager, sending BeginStream handshake")
-        file_handler.flush()
         
         # Send BeginStream for GIS data forwarding
         begin_stream_msg = {
@@ -168,7 +168,6 @@ async def connect_to_realtime_manager() -> bool:
         
         await _realtime_manager_ws.send(json.dumps(begin_stream_msg))  # type: ignore
         logger.info(f"📤 Sent BeginStream to RealTime Manager: {begin_stream_msg}")
-        file_handler.flush()
         
         # Wait for response
         try:
@@ -176,7 +175,6 @@ async def connect_to_realtime_manager() -> bool:
             response = json.loads(response_data)
             
             logger.info(f"📥 Received response from RealTime Manager: {response}")
-            file_handler.flush()
             
             if response.get("type") == "response" and response.get("request") == "BgnStrm":
                 if not response.get("message"):  # Empty message means success
@@ -195,7 +193,6 @@ async def connect_to_realtime_manager() -> bool:
             
     except Exception as e:
         logger.error(f"❌ Failed to connect to RealTime Manager: {str(e)}")
-        file_handler.flush()
         _realtime_manager_ws = None
         _realtime_connected = False
         return False
@@ -211,22 +208,18 @@ async def forward_gis_data_to_realtime(gis_data: dict):
     
     if not _realtime_connected or _realtime_manager_ws is None:
         logger.warning("⚠️ RealTime Manager not connected, attempting reconnection")
-        file_handler.flush()
         
         if not await connect_to_realtime_manager():
             logger.error("❌ Failed to connect to RealTime Manager, dropping GIS data")
-            file_handler.flush()
             return
     
     try:
         # Forward the GIS data to RealTime Manager
         await _realtime_manager_ws.send(json.dumps(gis_data))  # type: ignore
         logger.info(f"✅ Forwarded GIS data to RealTime Manager for tag {gis_data.get('ID')}")
-        file_handler.flush()
         
     except Exception as e:
         logger.error(f"❌ Failed to forward GIS data to RealTime Manager: {str(e)}")
-        file_handler.flush()
         
         # Reset connection on error
         _realtime_manager_ws = None
@@ -238,55 +231,44 @@ HEARTBEAT_INTERVAL = 30.0  # Heartbeat every 30 seconds
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.debug("Starting lifespan: Initializing connection string and DB pool")
-    file_handler.flush()
     try:
         # Initialize connection string
         maint_conn_string = await get_connection_string()
         
-        async with asyncpg.create_pool(maint_conn_string) as pool:
-            logger.debug("DB pool created successfully")
-            file_handler.flush()
-            async with pool.acquire() as conn:
-                managers = await conn.fetch("SELECT X_NM_RES, i_typ_res FROM tlkresources WHERE i_typ_res = $1", RESOURCE_TYPE)
-                logger.debug(f"Queried tlkresources, found {len(managers)} managers for i_typ_res={RESOURCE_TYPE}")
-                file_handler.flush()
-                for manager in managers:
-                    logger.info(f"Manager {manager['x_nm_res']} (type {manager['i_typ_res']}) ready")
-                    file_handler.flush()
-                    manager_name = manager['x_nm_res']
-                    if manager_name not in _MANAGER_INSTANCES:
-                        # Fix: Use default zone_id instead of None
-                        manager_instance = Manager(manager_name, zone_id=1)  
-                        _MANAGER_INSTANCES[manager_name] = manager_instance
-                        logger.debug(f"Starting manager {manager_name}")
-                        file_handler.flush()
-                        await manager_instance.start()
-                        logger.debug(f"Manager {manager_name} started successfully")
-                        file_handler.flush()
+        await db_pool_registry.get_pool(maint_conn_string)
+        logger.debug("Shared DB pool ready")
+        managers = await db_pool_registry.list_resources(maint_conn_string, RESOURCE_TYPE)
+        logger.debug(f"Queried tlkresources, found {len(managers)} managers for i_typ_res={RESOURCE_TYPE}")
+        for manager in managers:
+            logger.info(f"Manager {manager['x_nm_res']} (type {manager['i_typ_res']}) ready")
+            manager_name = manager['x_nm_res']
+            if manager_name not in _MANAGER_INSTANCES:
+                # Fix: Use default zone_id instead of None
+                manager_instance = Manager(manager_name, zone_id=1)  
+                _MANAGER_INSTANCES[manager_name] = manager_instance
+                logger.debug(f"Starting manager {manager_name}")
+                await manager_instance.start()
+                logger.debug(f"Manager {manager_name} started successfully")
                         
-                        # Register manager with heartbeat integration
-                        heartbeat_integration.register_manager(manager_name, manager_instance)
-                        logger.debug(f"Registered manager {manager_name} with heartbeat integration")
-                        file_handler.flush()
+                # Register manager with heartbeat integration
+                heartbeat_integration.register_manager(manager_name, manager_instance)
+                logger.debug(f"Registered manager {manager_name} with heartbeat integration")
         
         # NEW: Initialize connection to RealTime Manager
         logger.info("🔗 Initializing connection to RealTime Manager for GIS data forwarding")
-        file_handler.flush()
         await connect_to_realtime_manager()
                         
         yield
     except Exception as e:
         logger.error(f"Lifespan error: {str(e)}")
-        file_handler.flush()
         raise
     finally:
         # NEW: Cleanup RealTime Manager connection
         if _realtime_manager_ws is not None:
             await _realtime_manager_ws.close()  # type: ignore
             logger.info("🔌 Disconnected from RealTime Manager")
-            file_handler.flush()
+    await db_pool_registry.close_all()
     logger.info("Application shutdown")
-    file_handler.flush()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -303,7 +285,6 @@ async def configure_cors():
         allow_headers=["*"],
     )
     logger.debug(f"CORS middleware added with allow_origins: {cors_origins}")
-    file_handler.flush()
 
 _MANAGER_INSTANCES = {}
 _WEBSOCKET_CLIENTS = {}
@@ -315,20 +296,14 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
     client_port = websocket.client.port if websocket.client else 0
     client_id = f"{client_host}:{client_port}"
     logger.info(f"WebSocket connection attempt for /ws/{manager_name} from {client_id}")
-    file_handler.flush()
 
     maint_conn_string = await get_connection_string()
     
-    async with asyncpg.create_pool(maint_conn_string) as pool:
-        async with pool.acquire() as conn:
-            manager_info = await conn.fetchrow(
-                "SELECT i_typ_res FROM tlkresources WHERE X_NM_RES = $1 AND i_typ_res = $2", 
-                manager_name, RESOURCE_TYPE)
-            if not manager_info:
-                logger.error(f"Manager {manager_name} not found or invalid type")
-                file_handler.flush()
-                await websocket.close(code=1008, reason="Manager not found")
-                return
+    manager_info = await db_pool_registry.get_resource(maint_conn_string, manager_name, RESOURCE_TYPE)
+    if not manager_info:
+        logger.error(f"Manager {manager_name} not found or invalid type")
+        await websocket.close(code=1008, reason="Manager not found")
+        return
 
     sdk_client = None
     is_disconnected = False
@@ -336,7 +311,6 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
     try:
         await websocket.accept()
         logger.info(f"WebSocket connection accepted for /ws/{manager_name}")
-        file_handler.flush()
         
         if manager_name not in _MANAGER_INSTANCES:
             # Fix: Use default zone_id instead of None
@@ -363,7 +337,6 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
             try:
                 data = await websocket.receive_text()
                 logger.debug(f"Received WebSocket message from client {client_id}: {data}")
-                file_handler.flush()
                 
                 json_data = json.loads(data)
                 msg_type = json_data.get("type", "")
@@ -374,7 +347,6 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
                     sdk_client.heartbeat = hb.ticks
                     # Note: HeartbeatManager.handle_heartbeat may not exist, using basic heartbeat handling
                     logger.debug(f"Processed HeartBeat for client {client_id}, ts: {hb.ticks}")
-                    file_handler.flush()
                     continue
 
                 # NEW: GISData forwarding logic
@@ -386,13 +358,11 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
                     z = json_data.get("Z", 0.0)
                     
                     logger.info(f"🔄 Processing GISData for tag {tag_id} in zone {zone_id} from client {client_id}")
-                    file_handler.flush()
                     
                     # Forward GIS data to RealTime Manager
                     await forward_gis_data_to_realtime(json_data)
                     
                     logger.info(f"✅ GIS data processing complete for tag {tag_id}")
-                    file_handler.flush()
                     continue
 
                 elif msg_type == "request":
@@ -409,7 +379,6 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
                         )
                         await websocket.send_text(resp.to_json())
                         logger.debug(f"Sent error response to client {client_id}: {resp.to_json()}")
-                        file_handler.flush()
                         continue
 
                     req = Request(
@@ -426,7 +395,6 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
                             manager.zone_id = request_zone_id
                             await manager.load_triggers(request_zone_id)
                             logger.info(f"Manager {manager_name} zone changed to {request_zone_id}, triggers reloaded")
-                            file_handler.flush()
 
                     sdk_client.request_msg = req
                     resp = Response(response_type=ResponseType(req.req_type.value), req_id=req_id)
@@ -441,7 +409,6 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
                         sdk_client.sent_req = True
                         await websocket.send_text(resp.to_json())
                         logger.info(f"BeginStream processed for client {client_id}, tags: {[t.id for t in req.tags]}")
-                        file_handler.flush()
                         
                         if not resp.message:  # Only send PortRedirect if BeginStream was successful
                             # Send PortRedirect message to inform simulator of RealTime stream port
@@ -453,7 +420,6 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
                             }
                             await websocket.send_text(json.dumps(port_redirect_msg))
                             logger.info(f"Sent PortRedirect to client {client_id}, redirecting to port {DEFAULT_REALTIME_PORT}")
-                            file_handler.flush()
                         else:
                             await manager.close_client(sdk_client)
                             break
@@ -462,7 +428,6 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
                         await websocket.send_text(resp.to_json())
                         await manager.close_client(sdk_client)
                         logger.info(f"EndStream processed for client {client_id}")
-                        file_handler.flush()
                         break
                         
                     elif req.req_type == RequestType.AddTag:
@@ -470,7 +435,6 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
                             for t in req.tags:
                                 sdk_client.add_tag(t.id, t)
                             logger.info(f"AddTag processed for client {client_id}, tags: {[t.id for t in req.tags]}")
-                            file_handler.flush()
                         await websocket.send_text(resp.to_json())
                         
                     elif req.req_type == RequestType.RemoveTag:
@@ -478,29 +442,24 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
                             for t in req.tags:
                                 sdk_client.remove_tag(t.id)
                             logger.info(f"RemoveTag processed for client {client_id}, tags: {[t.id for t in req.tags]}")
-                            file_handler.flush()
                         await websocket.send_text(resp.to_json())
                         
                     else:
                         resp.message = f"Request type {request_type} not supported in Control stream."
                         await websocket.send_text(resp.to_json())
                         logger.debug(f"Unsupported request type {request_type} from client {client_id}")
-                        file_handler.flush()
 
                 else:
                     logger.warning(f"Unknown message type from client {client_id}: {msg_type}")
-                    file_handler.flush()
 
             except WebSocketDisconnect:
                 logger.info(f"WebSocket disconnected for /ws/{manager_name}")
-                file_handler.flush()
                 is_disconnected = True
                 if sdk_client:
                     await sdk_client.close()
                 break
             except Exception as e:
                 logger.error(f"Error in WebSocket handler: {str(e)}")
-                file_handler.flush()
                 break
     finally:
         if sdk_client and not is_disconnected:
@@ -510,12 +469,11 @@ async def websocket_endpoint_control(websocket: WebSocket, manager_name: str):
         if manager_name in _WEBSOCKET_CLIENTS and sdk_client and sdk_client in _WEBSOCKET_CLIENTS[manager_name]:
             _WEBSOCKET_CLIENTS[manager_name].remove(sdk_client)
         logger.info(f"WebSocket cleanup completed for client {client_id}")
-        file_handler.flush()
 
 def refresh_connection_config():
     """Clear cached connection configuration to force reload"""
     global _cached_connection_string, _cached_cors_origins
     _cached_connection_string = None
     _cached_cors_origins = None
+    db_pool_registry.invalidate_resources()
     logger.info("Connection configuration cache cleared")
-    file_handler.flush()
\ No newline at end of file
@@ -1,7 +1,7 @@
 # Name: websocket_historical.py
-# Version: 0.2.1
+# Version: 0.2.2
 # Created: 250513
-# Modified: 250704
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: Python script for ParcoRTLS HistoricalData WebSocket server on port 8003 - Updated to use database-driven configuration
@@ -11,6 +11,7 @@
 # Dependent: TRUE
 
 # /home/parcoadmin/parco_fastapi/app/manager/websocket_historical.py
+# Version: 0.2.2 - Reuse shared asyncpg pools from db_pool_registry and cached tlkresources lookups instead of a pool per connection, bumped from 0.2.1
 # Version: 0.2.1 - Updated with centralized IP configuration and syntax fixes, bumped from 0.2.0
 # Version: 0.2.0 - Updated to use database-driven configuration instead of hardcoded IP addresses, bumped from 0.1.9
 # Previous: Moved manager.start() to lifespan to ensure heartbeat loop runs, bumped from 0.1.8
@@ -35,7 +36,6 @@ from typing import Optional, Dict, List
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-import asyncpg
 import json
 from datetime import datetime, timedelta
 
@@ -47,6 +47,7 @@ from db_config_helper import config_helper
 from config import get_server_host, get_db_configs_sync
 
 from .manager import Manager
+from .db_pools import db_pool_registry
 from .sdk_client import SDKClient
 from .models import HeartBeat, Response, ResponseType, Request, Tag
 from .enums import RequestType, eMode
@@ -136,51 +137,51 @@ async def fetch_historical_data(data_type: str, tag_id: str, start_time: str, en
     
     try:
         if data_type == "2D_3D":
-            async with asyncpg.create_pool(conn_strings['hist_r']) as pool:
-                async with pool.acquire() as conn:
-                    query = """
-                    SELECT timestamp, x, y, z, confidence 
-                    FROM positionhistory 
-                    WHERE tag_id = $1 AND timestamp BETWEEN $2 AND $3 
-                    ORDER BY timestamp
-                    """
-                    rows = await conn.fetch(query, tag_id, start_time, end_time)
-                    return [dict(row) for row in rows]
+            pool = await db_pool_registry.get_pool(conn_strings['hist_r'])
+            async with pool.acquire() as conn:
+                query = """
+                SELECT timestamp, x, y, z, confidence 
+                FROM positionhistory 
+                WHERE tag_id = $1 AND timestamp BETWEEN $2 AND $3 
+                ORDER BY timestamp
+                """
+                rows = await conn.fetch(query, tag_id, start_time, end_time)
+                return [dict(row) for row in rows]
                     
         elif data_type == "range_hallway":
-            async with asyncpg.create_pool(conn_strings['hist_o']) as pool:
-                async with pool.acquire() as conn:
-                    query = """
-                    SELECT timestamp, range_value, hallway_id 
-                    FROM positionhistory 
-                    WHERE tag_id = $1 AND timestamp BETWEEN $2 AND $3 
-                    ORDER BY timestamp
-                    """
-                    rows = await conn.fetch(query, tag_id, start_time, end_time)
-                    return [dict(row) for row in rows]
+            pool = await db_pool_registry.get_pool(conn_strings['hist_o'])
+            async with pool.acquire() as conn:
+                query = """
+                SELECT timestamp, range_value, hallway_id 
+                FROM positionhistory 
+                WHERE tag_id = $1 AND timestamp BETWEEN $2 AND $3 
+                ORDER BY timestamp
+                """
+                rows = await conn.fetch(query, tag_id, start_time, end_time)
+                return [dict(row) for row in rows]
                     
         elif data_type == "proximity" and tag_id_2:
-            async with asyncpg.create_pool(conn_strings['hist_p']) as pool:
-                async with pool.acquire() as conn:
-                    # Query to find proximity data between two tags within 15-minute window
-                    query = """
-                    WITH tag1_pos AS (
-                        SELECT timestamp, x, y, z FROM positionhistory 
-                        WHERE tag_id = $1 AND timestamp BETWEEN $3 AND $4
-                    ),
-                    tag2_pos AS (
-                        SELECT timestamp, x, y, z FROM positionhistory 
-                        WHERE tag_id = $2 AND timestamp BETWEEN $3 AND $4
-                    )
-                    SELECT 
-                        t1.timestamp,
-                        SQRT(POWER(t1.x - t2.x, 2) + POWER(t1.y - t2.y, 2) + POWER(t1.z - t2.z, 2)) as distance
-                    FROM tag1_pos t1
-                    JOIN tag2_pos t2 ON ABS(EXTRACT(EPOCH FROM (t1.timestamp - t2.timestamp))) <= 900  -- 15 minutes
-                    ORDER BY t1.timestamp
-                    """
-                    rows = await conn.fetch(query, tag_id, tag_id_2, start_time, end_time)
-                    return [dict(row) for row in rows]
+            pool = await db_pool_registry.get_pool(conn_strings['hist_p'])
+            async with pool.acquire() as conn:
+                # Query to find proximity data between two tags within 15-minute window
+                query = """
+                WITH tag1_pos AS (
+                    SELECT timestamp, x, y, z FROM positionhistory 
+                    WHERE tag_id = $1 AND timestamp BETWEEN $3 AND $4
+                ),
+                tag2_pos AS (
+                    SELECT timestamp, x, y, z FROM positionhistory 
+                    WHERE tag_id = $2 AND timestamp BETWEEN $3 AND $4
+                )
+                SELECT 
+                    t1.timestamp,
+                    SQRT(POWER(t1.x - t2.x, 2) + POWER(t1.y - t2.y, 2) + POWER(t1.z - t2.z, 2)) as distance
+                FROM tag1_pos t1
+                JOIN tag2_pos t2 ON ABS(EXTRACT(EPOCH FROM (t1.timestamp - t2.timestamp))) <= 900  -- 15 minutes
+                ORDER BY t1.timestamp
+                """
+                rows = await conn.fetch(query, tag_id, tag_id_2, start_time, end_time)
+                return [dict(row) for row in rows]
         else:
             return []
             
@@ -195,25 +196,25 @@ async def lifespan(app: FastAPI):
         # Initialize connection strings
         conn_strings = await get_connection_strings()
         
-        async with asyncpg.create_pool(conn_strings['maint']) as pool:
-            logger.debug("DB pool created successfully")
-            async with pool.acquire() as conn:
-                managers = await conn.fetch("SELECT X_NM_RES, i_typ_res FROM tlkresources WHERE i_typ_res = $1", RESOURCE_TYPE)
-                logger.debug(f"Queried tlkresources, found {len(managers)} managers for i_typ_res={RESOURCE_TYPE}")
-                for manager in managers:
-                    logger.info(f"Manager {manager['x_nm_res']} (type {manager['i_typ_res']}) ready")
-                    # Start the manager instance for each resource type
-                    manager_name = manager['x_nm_res']
-                    if manager_name not in _MANAGER_INSTANCES:
-                        manager_instance = Manager(manager_name, zone_id=0)
-                        _MANAGER_INSTANCES[manager_name] = manager_instance
-                        logger.debug(f"Starting manager {manager_name}")
-                        await manager_instance.start()
-                        logger.debug(f"Manager {manager_name} started successfully")
+        await db_pool_registry.get_pool(conn_strings['maint'])
+        logger.debug("Shared DB pool ready")
+        managers = await db_pool_registry.list_resources(conn_strings['maint'], RESOURCE_TYPE)
+        logger.debug(f"Queried tlkresources, found {len(managers)} managers for i_typ_res={RESOURCE_TYPE}")
+        for manager in managers:
+            logger.info(f"Manager {manager['x_nm_res']} (type {manager['i_typ_res']}) ready")
+            # Start the manager instance for each resource type
+            manager_name = manager['x_nm_res']
+            if manager_name not in _MANAGER_INSTANCES:
+                manager_instance = Manager(manager_name, zone_id=0)
+                _MANAGER_INSTANCES[manager_name] = manager_instance
+                logger.debug(f"Starting manager {manager_name}")
+                await manager_instance.start()
+                logger.debug(f"Manager {manager_name} started successfully")
         yield
     except Exception as e:
         logger.error(f"Lifespan error: {str(e)}\n{traceback.format_exc()}")
         raise
+    await db_pool_registry.close_all()
     logger.info("Application shutdown")
 
 app = FastAPI(lifespan=lifespan)
@@ -243,15 +244,11 @@ async def websocket_endpoint_historical(websocket: WebSocket, manager_name: str)
     
     conn_strings = await get_connection_strings()
     
-    async with asyncpg.create_pool(conn_strings['maint']) as pool:
-        async with pool.acquire() as conn:
-            manager_info = await conn.fetchrow(
-                "SELECT i_typ_res FROM tlkresources WHERE X_NM_RES = $1 AND i_typ_res = $2", 
-                manager_name, RESOURCE_TYPE)
-            if not manager_info:
-                logger.error(f"Manager {manager_name} not found or invalid type")
-                await websocket.close(code=1008, reason="Manager not found")
-                return
+    manager_info = await db_pool_registry.get_resource(conn_strings['maint'], manager_name, RESOURCE_TYPE)
+    if not manager_info:
+        logger.error(f"Manager {manager_name} not found or invalid type")
+        await websocket.close(code=1008, reason="Manager not found")
+        return
     
     sdk_client = None
     client_id = None
@@ -395,4 +392,5 @@ def refresh_connection_strings():
     """Clear cached connection strings to force reload"""
     global _cached_connection_strings
     _cached_connection_strings = None
+    db_pool_registry.invalidate_resources()
     logger.info("Connection strings cache cleared")
\ No newline at end of file
@@ -1,7 +1,7 @@
 # Name: websocket_odata.py
-# Version: 0.1.0
+# Version: 0.1.1
 # Created: 250516
-# Modified: 250704
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: Python script for ParcoRTLS OData WebSocket server on port 8006
@@ -9,6 +9,8 @@
 # Role: Backend
 # Status: Active
 # Dependent: TRUE
+
+# Version: 0.1.1 - Reuse shared asyncpg pools from db_pool_registry and cached tlkresources lookups instead of a pool per connection, bumped from 0.1.0
 # Note: This server handles O Data (range/hallway) streaming for ParcoRTLS, using O Data Raw FS (i_typ_res=3).
 
 import asyncio
@@ -18,10 +20,10 @@ import os
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-import asyncpg
 import json
 from datetime import datetime
 from .manager import Manager
+from .db_pools import db_pool_registry
 from .sdk_client import SDKClient
 from .models import HeartBeat, Response, ResponseType, Request, Tag
 from .enums import RequestType, eMode
@@ -59,24 +61,24 @@ MAINT_CONN_STRING = f"postgresql://{maint_config['user']}:{maint_config['passwor
 async def lifespan(app: FastAPI):
     logger.debug("Starting lifespan: Initializing DB pool")
     try:
-        async with asyncpg.create_pool(MAINT_CONN_STRING) as pool:
-            logger.debug("DB pool created successfully")
-            async with pool.acquire() as conn:
-                managers = await conn.fetch("SELECT X_NM_RES, i_typ_res FROM tlkresources WHERE i_typ_res = $1", RESOURCE_TYPE)
-                logger.debug(f"Queried tlkresources, found {len(managers)} managers for i_typ_res={RESOURCE_TYPE}")
-                for manager in managers:
-                    logger.info(f"Manager {manager['x_nm_res']} (type {manager['i_typ_res']}) ready")
-                    manager_name = manager['x_nm_res']
-                    if manager_name not in _MANAGER_INSTANCES:
-                        manager_instance = Manager(manager_name, zone_id=0)
-                        _MANAGER_INSTANCES[manager_name] = manager_instance
-                        logger.debug(f"Starting manager {manager_name}")
-                        await manager_instance.start()
-                        logger.debug(f"Manager {manager_name} started successfully")
+        await db_pool_registry.get_pool(MAINT_CONN_STRING)
+        logger.debug("Shared DB pool ready")
+        managers = await db_pool_registry.list_resources(MAINT_CONN_STRING, RESOURCE_TYPE)
+        logger.debug(f"Queried tlkresources, found {len(managers)} managers for i_typ_res={RESOURCE_TYPE}")
+        for manager in managers:
+            logger.info(f"Manager {manager['x_nm_res']} (type {manager['i_typ_res']}) ready")
+            manager_name = manager['x_nm_res']
+            if manager_name not in _MANAGER_INSTANCES:
+                manager_instance = Manager(manager_name, zone_id=0)
+                _MANAGER_INSTANCES[manager_name] = manager_instance
+                logger.debug(f"Starting manager {manager_name}")
+                await manager_instance.start()
+                logger.debug(f"Manager {manager_name} started successfully")
         yield
     except Exception as e:
         logger.error(f"Lifespan error: {str(e)}")
         raise
+    await db_pool_registry.close_all()
     logger.info("Application shutdown")
 
 app = FastAPI(lifespan=lifespan)
@@ -102,15 +104,11 @@ async def websocket_endpoint_odata(websocket: WebSocket, manager_name: str):
     client_port = websocket.client.port if websocket.client else 0
     logger.info(f"WebSocket connection attempt for /ws/{manager_name} from {client_host}:{client_port}")
     
-    async with asyncpg.create_pool(MAINT_CONN_STRING) as pool:
-        async with pool.acquire() as conn:
-            manager_info = await conn.fetchrow(
-                "SELECT i_typ_res FROM tlkresources WHERE X_NM_RES = $1 AND i_typ_res = $2", 
-                manager_name, RESOURCE_TYPE)
-            if not manager_info:
-                logger.error(f"Manager {manager_name} not found or invalid type")
-                await websocket.close(code=1008, reason="Manager not found")
-                return
+    manager_info = await db_pool_registry.get_resource(MAINT_CONN_STRING, manager_name, RESOURCE_TYPE)
+    if not manager_info:
+        logger.error(f"Manager {manager_name} not found or invalid type")
+        await websocket.close(code=1008, reason="Manager not found")
+        return
     
     sdk_client = None
     client_id = None
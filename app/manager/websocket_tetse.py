@@ -1,7 +1,7 @@
 # Name: websocket_tetse.py
-# Version: 0.1.8
+# Version: 0.1.12
 # Created: 250526
-# Modified: 250704
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: AI Assistant
 # Description: WebSocket Server on port 8998 to forward events from main app to TETSE WebSocket server - Updated with centralized IP configuration
@@ -10,6 +10,10 @@
 # Status: Active
 # Dependent: TRUE
 #
+# Version: 0.1.12 - Rules looked up by subject in the tetse_rule_registry RuleSet, reloaded incrementally on tetse_rule_changes NOTIFY, bumped from 0.1.11
+# Version: 0.1.11 - Dropped per-call file_handler.flush() (the queued writer flushes per burst), level from PARCO_LOG_LEVEL, bumped from 0.1.10
+# Version: 0.1.10 - Feed position updates into the TETSE subject current-zone cache, bumped from 0.1.9
+# Version: 0.1.9 - Added /ws/bridge_events for batched bridge frames, forward to port 9000 over a persistent EventBridge instead of websockets.connect per event, bumped from 0.1.8
 # Version: 0.1.8 - Updated to use centralized IP configuration and fixed syntax errors, bumped from 0.1.7
 # Version: 0.1.7 - Enhanced with HTTP endpoint for position events and TETSE rule evaluation, bumped from 0.1.6
 # Version: 0.1.6 - Increased response timeout, added detailed logging, bumped from 0.1.5
@@ -26,13 +30,18 @@ import asyncio
 import json
 import sys
 import websockets
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from manager.line_limited_logging import LineLimitedFileHandler
+from manager.line_limited_logging import LineLimitedFileHandler, log_level_from_env
 from .heartbeat_manager import HeartbeatManager
+from .tetse_bridge import EventBridge, batch_events, ACK_FRAME_TYPE
+from .trigger_loader import TriggerChangeListener
 from routes.device_registry import get_subject_for_tag
-from routes import tetse_reload
+from routes import tetse_reload  # Schedules the initial rule load on import
+from routes.tetse_rule_registry import tetse_rule_registry, TETSE_RULE_CHANGE_CHANNEL
 from routes.tetse_rule_engine import evaluate_rule
+from routes.tetse_data import subject_zone_cache, get_data_connection_string
 from routes.tetse_output_handler import process_tetse_result
 from pydantic import BaseModel
 from typing import Optional
@@ -47,7 +56,7 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 # Configure logging
 logger = logging.getLogger("manager.websocket_tetse")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(log_level_from_env(logging.DEBUG))
 
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%y%m%d %H%M%S'))
@@ -63,9 +72,24 @@ logger.handlers = [console_handler, file_handler]
 logger.propagate = False
 
 logger.info("Starting WebSocket TETSE Forwarding server on port 8998 - Enhanced for position events")
-file_handler.flush()
 
-app = FastAPI()
+# Persistent forwarding connection to the TETSE WebSocket server on port 9000
+TETSE_EVENT_URL = f"ws://{get_server_host()}:9000/broadcast_event_ws"
+TETSE_EVENT_BRIDGE = EventBridge(TETSE_EVENT_URL)
+
+# Rule writes made through the API reload the rule registry incrementally
+RULE_CHANGE_LISTENER = TriggerChangeListener(get_data_connection_string(), tetse_rule_registry.request_reload,
+                                             channel=TETSE_RULE_CHANGE_CHANNEL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    RULE_CHANGE_LISTENER.start()
+    yield
+    await RULE_CHANGE_LISTENER.stop()
+    await TETSE_EVENT_BRIDGE.stop()
+    logger.info("Application shutdown")
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -75,84 +99,143 @@ app.add_middleware(
     allow_headers=["*"],
 )
 logger.debug("CORS middleware added with allow_origins: *")
-file_handler.flush()
 
 class EventBroadcast(BaseModel):
     entity_id: str
     event_data: dict
 
+async def evaluate_position_event(event_data: dict):
+    """
+    Run TETSE rule evaluation for a position update from the RTLS bridge.
+
+    Args:
+        event_data: position_update payload with tag_id and zone_id
+    """
+    tag_id = event_data.get("tag_id")
+    zone_id = event_data.get("zone_id")
+    
+    logger.debug(f"🔄 TETSE BRIDGE: Processing position update for tag_id={tag_id}, zone_id={zone_id}")
+    
+    # TETSE rule evaluation (moved from RealTime WebSocket)
+    try:
+        # Ensure tag_id is a string before passing to get_subject_for_tag
+        if tag_id is not None and isinstance(tag_id, (str, int)):
+            tag_id_str = str(tag_id)
+            subject_id = get_subject_for_tag(tag_id_str)
+            logger.debug(f"🔄 TETSE BRIDGE: tag_id={tag_id_str}, subject_id={subject_id}")
+            
+            if zone_id is not None and isinstance(zone_id, (str, int)):
+                # Keep rule lookups of this tag (e.g. proximity targets) off the database
+                subject_zone_cache.update(tag_id_str, int(zone_id))
+                if subject_id:
+                    subject_zone_cache.update(subject_id, int(zone_id))
+            
+            if subject_id:
+                logger.debug(f"🔄 TETSE BRIDGE: Found subject {subject_id}, checking rules for zone {zone_id}")
+                
+                matching_rules = tetse_rule_registry.rule_set.for_subject(subject_id)
+                logger.debug(f"🔄 TETSE BRIDGE: Found {len(matching_rules)} matching rules for subject {subject_id}")
+                
+                for rule in matching_rules:
+                    logger.debug(f"🔄 TETSE BRIDGE: Evaluating rule {rule.get('name', 'unnamed')} for subject {subject_id}")
+                    # FIXED: Ensure zone_id is an integer before passing to evaluate_rule
+                    if zone_id is not None and isinstance(zone_id, (str, int)):
+                        zone_id_int = int(zone_id)
+                        result = await evaluate_rule(rule, current_zone_id=zone_id_int)
+                        logger.debug(f"🔄 TETSE BRIDGE: Rule evaluation result: {result}")
+                        logger.info(f"TETSE Bridge Eval: Subject={subject_id} Rule={rule['name']} Result={result}")
+                        await process_tetse_result(subject_id, rule, result)
+                    else:
+                        logger.warning(f"🔄 TETSE BRIDGE: Invalid zone_id: {zone_id}")
+            else:
+                logger.debug(f"🔄 TETSE BRIDGE: No subject mapping found for tag {tag_id_str}")
+        else:
+            logger.warning(f"🔄 TETSE BRIDGE: Invalid tag_id: {tag_id}")
+            
+    except Exception as e:
+        logger.error(f"🔄 TETSE BRIDGE: Exception in TETSE evaluation: {str(e)}")
+
+async def handle_bridge_event(entity_id: str, event_data: dict):
+    """
+    Evaluate a bridged event and queue it for the TETSE WebSocket server.
+
+    Args:
+        entity_id: Entity the event belongs to
+        event_data: Event payload
+    """
+    if event_data.get("event_type") == "position_update":
+        await evaluate_position_event(event_data)
+    TETSE_EVENT_BRIDGE.publish(entity_id, event_data)
+
 @app.post("/broadcast_event")
 async def broadcast_event_http(event: EventBroadcast):
     """
     HTTP endpoint to receive events from RealTime WebSocket and process them for TETSE.
     This is the clean event bridge that separates RTLS from TETSE logic.
+    Forwarding to port 9000 goes through the persistent TETSE_EVENT_BRIDGE connection.
     """
     try:
         logger.info(f"Received event from RTLS bridge for entity {event.entity_id}")
-        
-        # Extract position data from event
-        event_data = event.event_data
-        if event_data.get("event_type") == "position_update":
-            tag_id = event_data.get("tag_id")
-            zone_id = event_data.get("zone_id")
-            
-            logger.debug(f"🔄 TETSE BRIDGE: Processing position update for tag_id={tag_id}, zone_id={zone_id}")
-            
-            # TETSE rule evaluation (moved from RealTime WebSocket)
-            try:
-                # Ensure tag_id is a string before passing to get_subject_for_tag
-                if tag_id is not None and isinstance(tag_id, (str, int)):
-                    tag_id_str = str(tag_id)
-                    subject_id = get_subject_for_tag(tag_id_str)
-                    logger.debug(f"🔄 TETSE BRIDGE: tag_id={tag_id_str}, subject_id={subject_id}")
-                    
-                    if subject_id:
-                        logger.debug(f"🔄 TETSE BRIDGE: Found subject {subject_id}, checking rules for zone {zone_id}")
-                        
-                        matching_rules = [r for r in tetse_reload.ACTIVE_TETSE_RULES if r["subject_id"] == subject_id]
-                        logger.debug(f"🔄 TETSE BRIDGE: Found {len(matching_rules)} matching rules for subject {subject_id}")
-                        
-                        for rule in matching_rules:
-                            logger.debug(f"🔄 TETSE BRIDGE: Evaluating rule {rule.get('name', 'unnamed')} for subject {subject_id}")
-                            # FIXED: Ensure zone_id is an integer before passing to evaluate_rule
-                            if zone_id is not None and isinstance(zone_id, (str, int)):
-                                zone_id_int = int(zone_id)
-                                result = await evaluate_rule(rule, current_zone_id=zone_id_int)
-                                logger.debug(f"🔄 TETSE BRIDGE: Rule evaluation result: {result}")
-                                logger.info(f"TETSE Bridge Eval: Subject={subject_id} Rule={rule['name']} Result={result}")
-                                await process_tetse_result(subject_id, rule, result)
-                            else:
-                                logger.warning(f"🔄 TETSE BRIDGE: Invalid zone_id: {zone_id}")
-                    else:
-                        logger.debug(f"🔄 TETSE BRIDGE: No subject mapping found for tag {tag_id_str}")
-                else:
-                    logger.warning(f"🔄 TETSE BRIDGE: Invalid tag_id: {tag_id}")
-                    
-            except Exception as e:
-                logger.error(f"🔄 TETSE BRIDGE: Exception in TETSE evaluation: {str(e)}")
-        
-        # Forward to TETSE WebSocket server (existing logic)
-        server_host = get_server_host()
-        tetse_url = f"ws://{server_host}:9000/broadcast_event_ws"
-        async with websockets.connect(tetse_url, timeout=5.0) as tetse_ws:
-            await tetse_ws.send(json.dumps({
-                "entity_id": event.entity_id,
-                "event_data": event.event_data
-            }))
-            
-            # Wait for response
-            try:
-                response = await asyncio.wait_for(tetse_ws.recv(), timeout=5.0)
-                logger.debug(f"TETSE server response: {response}")
-                return {"status": "success", "tetse_response": response}
-            except asyncio.TimeoutError:
-                logger.warning("TETSE server response timeout")
-                return {"status": "success", "note": "TETSE processing initiated"}
-                
+        await handle_bridge_event(event.entity_id, event.event_data)
+        return {"status": "success", "note": "TETSE processing initiated"}
     except Exception as e:
         logger.error(f"Failed to process event: {str(e)}")
         return {"status": "error", "error": str(e)}
 
+@app.websocket("/ws/bridge_events")
+async def bridge_events_handler(websocket: WebSocket):
+    """
+    Persistent WebSocket endpoint for the RealTime server's EventBridge.
+    Each EventBatch frame is processed in order and acknowledged with one ack frame.
+    """
+    client_host = getattr(websocket.client, 'host', 'unknown') if websocket.client else 'unknown'
+    client_port = getattr(websocket.client, 'port', 0) if websocket.client else 0
+    client_id = f"{client_host}:{client_port}"
+
+    await websocket.accept()
+    logger.info(f"Event bridge connection accepted for {client_id}")
+
+    heartbeat_manager = HeartbeatManager(websocket, client_id=client_id, interval=30, timeout=5)
+    heartbeat_task = asyncio.create_task(heartbeat_loop(heartbeat_manager))
+    try:
+        while True:
+            frame = await websocket.receive_json()
+            if frame.get("type") == "HeartBeat":
+                heartbeat_manager.validate_response(frame)
+                continue
+
+            events = batch_events(frame)
+            processed = 0
+            for event in events:
+                entity_id = event.get("entity_id")
+                event_data = event.get("event_data")
+                if not entity_id or not isinstance(event_data, dict):
+                    logger.error(f"Invalid bridged event from {client_id}: {event}")
+                    continue
+                await handle_bridge_event(str(entity_id), event_data)
+                processed += 1
+            await websocket.send_json({"type": ACK_FRAME_TYPE, "count": processed})
+            logger.debug(f"Processed batch of {processed}/{len(events)} bridged events from {client_id}")
+    except WebSocketDisconnect:
+        logger.info(f"Event bridge disconnected for {client_id}")
+    except Exception as e:
+        logger.error(f"Event bridge error for {client_id}: {str(e)}")
+    finally:
+        heartbeat_task.cancel()
+
+@app.get("/bridge_stats")
+async def bridge_stats():
+    """Get statistics for the forwarding connection to port 9000."""
+    return TETSE_EVENT_BRIDGE.get_stats()
+
+@app.get("/rule_stats")
+async def rule_stats():
+    """Get statistics for the TETSE rule registry and its change listener."""
+    return {
+        "registry": tetse_rule_registry.get_stats(),
+        "listener": RULE_CHANGE_LISTENER.get_stats()
+    }
+
 @app.websocket("/ws/forward_event")
 async def forward_event_handler(websocket: WebSocket):
     """
@@ -163,7 +246,6 @@ async def forward_event_handler(websocket: WebSocket):
     client_port = getattr(websocket.client, 'port', 0) if websocket.client else 0
     client_id = f"{client_host}:{client_port}"
     logger.info(f"WebSocket connection attempt for /ws/forward_event from {client_id}")
-    file_handler.flush()
 
     # Initialize HeartbeatManager
     heartbeat_manager = HeartbeatManager(websocket, client_id=client_id, interval=30, timeout=5)
@@ -172,21 +254,18 @@ async def forward_event_handler(websocket: WebSocket):
     try:
         await websocket.accept()
         logger.info(f"WebSocket connection accepted for {client_id}")
-        file_handler.flush()
 
         # Connect to the TETSE WebSocket server on port 9000
         server_host = get_server_host()
         tetse_url = f"ws://{server_host}:9000/broadcast_event_ws"
         async with websockets.connect(tetse_url) as tetse_ws:
             logger.info(f"Connected to TETSE WebSocket server on port 9000 from {client_id}")
-            file_handler.flush()
 
             try:
                 while True:
                     # Receive event data from the main app
                     data = await websocket.receive_json()
                     logger.debug(f"Received event data from {client_id}: {data}")
-                    file_handler.flush()
 
                     # Handle heartbeat messages
                     if data.get("type") == "HeartBeat":
@@ -203,7 +282,6 @@ async def forward_event_handler(websocket: WebSocket):
                     logger.debug(f"Sending event data to TETSE WebSocket server for {client_id}")
                     await tetse_ws.send(json.dumps(data))
                     logger.debug(f"Forwarded event data to TETSE WebSocket server: {data}")
-                    file_handler.flush()
 
                     # Receive confirmation from the TETSE WebSocket server
                     try:
@@ -217,37 +295,30 @@ async def forward_event_handler(websocket: WebSocket):
                             except json.JSONDecodeError:
                                 # Non-JSON response (e.g., plain string)
                                 logger.debug(f"Received non-JSON response from TETSE WebSocket server: {response}")
-                                file_handler.flush()
 
                                 # Send the response back to the main app
                                 # Fixed: Ensure response is a string before sending
                                 response_str = response if isinstance(response, str) else str(response)
                                 await websocket.send_text(response_str)
                                 logger.debug(f"Sent response to {client_id}: {response_str}")
-                                file_handler.flush()
                                 break
 
                             logger.debug(f"Received JSON response from TETSE WebSocket server: {response}")
-                            file_handler.flush()
 
                             # Send the response back to the main app
                             # Fixed: Ensure response is a string before sending
                             response_str = response if isinstance(response, str) else str(response)
                             await websocket.send_text(response_str)
                             logger.debug(f"Sent response to {client_id}: {response_str}")
-                            file_handler.flush()
                             break
                     except asyncio.TimeoutError:
                         logger.warning(f"No valid response received from TETSE WebSocket server for {client_id}")
                         await websocket.send_text("No response from TETSE server")
-                        file_handler.flush()
 
             except WebSocketDisconnect:
                 logger.info(f"WebSocket disconnected for {client_id}")
-                file_handler.flush()
             except Exception as e:
                 logger.error(f"Error in WebSocket connection for {client_id}: {str(e)}")
-                file_handler.flush()
                 raise
 
     except Exception as e:
@@ -264,18 +335,14 @@ async def forward_event_handler(websocket: WebSocket):
             try:
                 await websocket.send_json(end_stream)
                 logger.info(f"Sent EndStream to {client_id}: {end_stream}")
-                file_handler.flush()
                 # Fixed: Use receive_text() for WebSocket instead of recv()
                 message = await asyncio.wait_for(websocket.receive_text(), timeout=10.0)
                 data = json.loads(message)
                 logger.info(f"Received response to EndStream from {client_id}: {data}")
-                file_handler.flush()
             except Exception as e:
                 logger.error(f"Failed to send/receive EndStream for {client_id}: {str(e)}")
-                file_handler.flush()
             await websocket.close()
             logger.info(f"Closed WebSocket connection for {client_id}")
-            file_handler.flush()
 
 async def heartbeat_loop(hbm):
     while True:
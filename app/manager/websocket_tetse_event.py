@@ -1,7 +1,7 @@
 # Name: websocket_tetse_event.py
-# Version: 0.1.23
+# Version: 0.1.27
 # Created: 250525
-# Modified: 250704
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: TETSE EventStream WebSocket Server (port 9000)
@@ -10,6 +10,10 @@
 # Status: Active
 # Dependent: TRUE
 #
+# Version: 0.1.27 - Batch frames isolate errors per event again: invalid or rejected events are logged and dropped, the rest are written and broadcast, bumped from 0.1.26
+# Version: 0.1.26 - event_log rows go through the shared batched EventLogWriter instead of a pool per event, cached event type IDs, batch frames broadcast in one pass, bumped from 0.1.25
+# Version: 0.1.25 - Dropped per-call file_handler.flush() (the queued writer flushes per burst), level from PARCO_LOG_LEVEL, bumped from 0.1.24
+# Version: 0.1.24 - /broadcast_event_ws accepts EventBatch frames from the persistent 8998 bridge and acknowledges each batch, bumped from 0.1.23
 # Version: 0.1.23 - Updated with centralized IP configuration, bumped from 0.1.22
 # Version: 0.1.22 - Fixed bug in event broadcast where 'dict' object had no attribute 'entity'; now uses event['entity_id'], bumped from 0.1.21
 # Version: 0.1.21 - Added in remarks removed by AI in TETSE section
@@ -38,22 +42,27 @@ import logging
 import os
 import asyncio
 import json
+import time
 import websockets
-import asyncpg
 import sys
+from contextlib import asynccontextmanager
+from typing import Dict, List, Tuple
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from manager.line_limited_logging import LineLimitedFileHandler
+from manager.line_limited_logging import LineLimitedFileHandler, log_level_from_env
 from manager.manager import Manager
 from pydantic import BaseModel
 from .heartbeat_manager import HeartbeatManager
+from .tetse_bridge import batch_events, BATCH_FRAME_TYPE, ACK_FRAME_TYPE
+from .event_writer import get_event_log_writer
 from datetime import datetime, timezone
 from routes.llm_bridge import ask_openai
 from routes.llm_bridge import construct_prompt
 
 # Import centralized configuration
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import get_server_host, get_db_configs_sync
+from config import get_server_host
+from routes.tetse_data import get_data_pool
 
 # Log directory
 LOG_DIR = "/home/parcoadmin/parco_fastapi/app/logs"
@@ -61,7 +70,7 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 # Configure logging
 logger = logging.getLogger("manager.websocket_tetse_event")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(log_level_from_env(logging.DEBUG))
 
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%y%m%d %H%M%S'))
@@ -77,9 +86,14 @@ logger.handlers = [console_handler, file_handler]
 logger.propagate = False
 
 logger.info("Starting WebSocket TETSE Event server on port 9000")
-file_handler.flush()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await get_event_log_writer().stop()
+    logger.info("Application shutdown")
+
+app = FastAPI(lifespan=lifespan)
 
 # Get centralized configuration
 server_host = get_server_host()
@@ -93,19 +107,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 logger.debug(f"CORS middleware added with allow_origins: {cors_origins[0]}")
-file_handler.flush()
 
 # Create a Manager instance for TETSE events
 TETSE_MANAGER = Manager("TETSE", zone_id=0)
 logger.debug(f"Initialized TETSE_MANAGER instance: {id(TETSE_MANAGER)}")
-file_handler.flush()
 
-# Get database configuration
-db_configs = get_db_configs_sync()
-data_config = db_configs['data']
+DEFAULT_EVENT_TYPE_ID = 5  # TestEvent
+EVENT_TYPE_TTL = 300.0     # Seconds an event type lookup is reused
+AI_SUMMARY_CONCURRENCY = 4 # AI summaries requested at once for a batch
 
-# Database connection string
-MAINT_CONN_STRING = f"postgresql://{data_config['user']}:{data_config['password']}@{server_host}:{data_config['port']}/{data_config['database']}"
+# event type name -> (event_type_id or None, looked up at)
+_event_type_ids: Dict[str, Tuple[int | None, float]] = {}
+_ai_summary_slots = asyncio.Semaphore(AI_SUMMARY_CONCURRENCY)
 
 class EventBroadcast(BaseModel):
     entity_id: str
@@ -124,6 +137,135 @@ async def broadcast_event(event: EventBroadcast):
         logger.error(f"Failed to broadcast event: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def get_event_type_id(event_type_name: str) -> int:
+    """
+    Resolve an event type name to its tlk_event_type ID, cached for EVENT_TYPE_TTL.
+
+    Args:
+        event_type_name: Event type name from the event payload
+
+    Returns:
+        int: Event type ID, or DEFAULT_EVENT_TYPE_ID when the name is unknown
+    """
+    cached = _event_type_ids.get(event_type_name)
+    if cached is not None and time.monotonic() - cached[1] < EVENT_TYPE_TTL:
+        event_type_id = cached[0]
+    else:
+        pool = await get_data_pool()
+        async with pool.acquire() as conn:
+            event_type_id = await conn.fetchval("SELECT id FROM tlk_event_type WHERE name = $1", event_type_name)
+        _event_type_ids[event_type_name] = (event_type_id, time.monotonic())
+        if not event_type_id:
+            logger.warning(f"No event_type_id for {event_type_name}, using default ID: {DEFAULT_EVENT_TYPE_ID}")
+    return event_type_id or DEFAULT_EVENT_TYPE_ID
+
+async def add_ai_summary(entity_id: str, event_data: dict):
+    """Add the AI summary to an event (a placeholder when generation fails)."""
+    # --- BEGIN AI SUMMARY GENERATION [Added in 0.1.20] ---
+    ai_summary = "[AI summary unavailable]"
+    entity_id_safe = entity_id or "UNKNOWN_ENTITY"
+    try:
+        async with _ai_summary_slots:
+            prompt = await construct_prompt(event_data)
+            ai_summary = await ask_openai(prompt)
+        event_data["ai_summary"] = ai_summary
+        logger.info(f"AI Summary generated for entity {entity_id_safe}: {ai_summary}")
+    except Exception as ai_error:
+        logger.warning(f"AI Summary generation failed for entity {entity_id_safe}: {str(ai_error)}")
+        event_data["ai_summary"] = ai_summary
+    # --- END AI SUMMARY GENERATION ---
+
+async def event_log_row(entity_id: str, event_data: dict) -> tuple:
+    """
+    Build the event_log row for an event, with the defaults usp_event_log_add callers used.
+
+    Returns:
+        tuple: (entity_id, event_type_id, reason_id, value, unit, ts)
+    """
+    event_type_id = await get_event_type_id(event_data.get("event_type", "Unknown"))
+    reason_id = event_data.get("reason_id", 4)
+    value = event_data.get("value")
+    if isinstance(value, str):
+        try:
+            value = float(value) if value else 1.0
+        except ValueError:
+            value = 1.0
+    elif value is None:
+        value = 1.0
+    unit = event_data.get("unit", "percent")
+    ts_str = event_data.get("timestamp")
+    ts = datetime.fromisoformat(ts_str.replace('Z', '+00:00')) if ts_str else datetime.now(timezone.utc)
+    return entity_id, event_type_id, reason_id, value, unit, ts
+
+async def log_and_broadcast_events(events: List[Tuple[str, dict]]) -> int:
+    """
+    Add AI summaries, log events to event_log and broadcast them.
+
+    Errors are isolated per event: an event that cannot be turned into a row
+    (bad timestamp, ...) or that event_log rejects (unknown type, numeric
+    overflow, ...) is logged and dropped; the others share the writer's
+    batched flush and are broadcast together.
+
+    Args:
+        events: (entity_id, event_data) pairs
+
+    Returns:
+        int: Number of events logged and broadcast
+    """
+    if not events:
+        return 0
+    await asyncio.gather(*(add_ai_summary(entity_id, event_data) for entity_id, event_data in events))
+
+    pending = []
+    rows = []
+    for entity_id, event_data in events:
+        try:
+            rows.append(await event_log_row(entity_id, event_data))
+            pending.append((entity_id, event_data))
+        except Exception as e:
+            logger.error(f"Dropping invalid event for entity {entity_id}: {str(e)}")
+
+    writer = get_event_log_writer()
+    results = await asyncio.gather(*(writer.add(*row) for row in rows), return_exceptions=True)
+    logged = []
+    for (entity_id, event_data), result in zip(pending, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Failed to log event for entity {entity_id}: {str(result)}")
+        else:
+            logged.append((entity_id, event_data))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Logged {len(logged)} of {len(events)} events to event_log")
+
+    # Broadcast Events
+    if logged:
+        TETSE_MANAGER.broadcast_events_instance(logged)
+    return len(logged)
+
+async def log_and_broadcast_event(entity_id: str, event_data: dict):
+    """
+    Add the AI summary, log the event to event_log and broadcast it to subscribers.
+
+    Args:
+        entity_id: Entity the event belongs to
+        event_data: Event payload
+
+    Raises:
+        Exception: When the event could not be logged; it is not broadcast then
+    """
+    await add_ai_summary(entity_id, event_data)
+    event_id = await get_event_log_writer().add(*await event_log_row(entity_id, event_data))
+    logger.debug(f"Logged event for entity {entity_id}: id {event_id}")
+
+    # Broadcast Event
+    TETSE_MANAGER.broadcast_events_instance([(entity_id, event_data)])
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Broadcasted event for entity {entity_id}: {event_data}")
+
+@app.get("/event_log_stats")
+async def event_log_stats():
+    """Get statistics for the batched event_log writer."""
+    return get_event_log_writer().get_stats()
+
 @app.websocket("/broadcast_event_ws")
 async def broadcast_event_ws(websocket: WebSocket):
     """
@@ -133,7 +275,6 @@ async def broadcast_event_ws(websocket: WebSocket):
     client_port = websocket.client.port if websocket.client else 0
     client_id = f"{client_host}:{client_port}"
     logger.info(f"WebSocket connection attempt for /broadcast_event_ws from {client_id}")
-    file_handler.flush()
 
     heartbeat_manager = HeartbeatManager(websocket, client_id=client_id, interval=30, timeout=5)
     heartbeat_task = asyncio.create_task(heartbeat_loop(heartbeat_manager))
@@ -141,13 +282,11 @@ async def broadcast_event_ws(websocket: WebSocket):
     try:
         await websocket.accept()
         logger.info(f"WebSocket connection accepted for {client_id}")
-        file_handler.flush()
 
         try:
             while True:
                 data = await websocket.receive_json()
                 logger.debug(f"Received event data from {client_id}: {data}")
-                file_handler.flush()
 
                 if data.get("type") == "HeartBeat":
                     result = heartbeat_manager.validate_response(data)
@@ -171,59 +310,28 @@ async def broadcast_event_ws(websocket: WebSocket):
                     logger.info(f"Sent EndStream response to {client_id}: {response}")
                     break
 
+                if data.get("type") == BATCH_FRAME_TYPE:
+                    # Persistent bridge from port 8998: one ack per batch, events share the writer's flushes
+                    valid = []
+                    for event in batch_events(data):
+                        entity_id = event.get("entity_id")
+                        event_data = event.get("event_data")
+                        if entity_id and isinstance(event_data, dict):
+                            valid.append((entity_id, event_data))
+                        else:
+                            logger.error(f"Invalid event in batch from {client_id}: {event}")
+                    try:
+                        processed = await log_and_broadcast_events(valid)
+                    except Exception as e:
+                        processed = 0
+                        logger.error(f"Failed to process batch of {len(valid)} events from {client_id}: {str(e)}")
+                    await websocket.send_json({"type": ACK_FRAME_TYPE, "count": processed})
+                    continue
+
                 entity_id = data.get("entity_id")
                 event_data = data.get("event_data")
                 if entity_id and event_data:
-                    # Resolved event_type_id
-                    # --- BEGIN AI SUMMARY GENERATION [Added in 0.1.20] ---
-                    ai_summary = "[AI summary unavailable]"
-                    try:
-                        entity_id_safe = data.get("entity_id", "UNKNOWN_ENTITY")
-                        prompt = await construct_prompt(event_data)
-                        ai_summary = await ask_openai(prompt)
-                        event_data["ai_summary"] = ai_summary
-                        logger.info(f"AI Summary generated for entity {entity_id_safe}: {ai_summary}")
-                    except Exception as ai_error:
-                        logger.warning(f"AI Summary generation failed for entity {entity_id_safe}: {str(ai_error)}")
-                        event_data["ai_summary"] = ai_summary
-                    # --- END AI SUMMARY GENERATION ---
-
-                    event_type_name = event_data.get("event_type", "Unknown")
-                    async with asyncpg.create_pool(MAINT_CONN_STRING) as pool:
-                        async with pool.acquire() as conn:
-                            result = await conn.fetchval("SELECT id FROM tlk_event_type WHERE name = $1", event_type_name)
-                            event_type_id = result if result else 5 #TestEvent
-                            if not result:
-                                logger.warning(f"No event_type_id for {event_type_name}, using default ID: {event_type_id}")
-                            
-                            # Set defaults
-                            reason_id = event_data.get("reason_id", 4)
-                            value = event_data.get("value")
-                            if isinstance(value, str):
-                                try:
-                                    value = float(value) if value else 1.0
-                                except ValueError:
-                                    value = 1.0
-                            elif value is None:
-                                value = 1.0
-                            unit = event_data.get("unit", "percent")
-                            ts_str = event_data.get("timestamp")
-                            ts = datetime.fromisoformat(ts_str.replace('Z', '+00:00')) if ts_str else datetime.now(timezone.utc)
-
-                            # Log to event_log
-                            result = await conn.fetchval(
-                                "SELECT usp_event_log_add($1, $2, $3, $4, $5, $6)",
-                                entity_id, event_type_id, reason_id, value, unit, ts
-                            )
-                            if result:
-                                logger.debug(f"Logged event for entity {entity_id} via usp_event_log_add: {result}")
-                            else:
-                                logger.error(f"Failed to log event for entity {entity_id}")
-
-                    # Broadcast Event
-                    await TETSE_MANAGER.broadcast_event_instance(entity_id, event_data)
-                    logger.debug(f"Broadcasted event for entity {entity_id}: {event_data}")
-                    file_handler.flush()
+                    await log_and_broadcast_event(entity_id, event_data)
                     await websocket.send_text("Event broadcasted and logged successfully")
                 else:
                     logger.error(f"Invalid event data received: {data}")
@@ -231,10 +339,8 @@ async def broadcast_event_ws(websocket: WebSocket):
 
         except WebSocketDisconnect:
             logger.info(f"WebSocket disconnected for {client_id}")
-            file_handler.flush()
         except Exception as e:
             logger.error(f"Error in WebSocket connection for {client_id}: {str(e)}")
-            file_handler.flush()
             raise
 
     except Exception as e:
@@ -251,17 +357,13 @@ async def broadcast_event_ws(websocket: WebSocket):
             try:
                 await websocket.send_json(end_stream)
                 logger.info(f"Sent EndStream to {client_id}: {end_stream}")
-                file_handler.flush()
                 message = await asyncio.wait_for(websocket.receive_text(), timeout=10.0)
                 data = json.loads(message)
                 logger.info(f"Received response to EndStream from {client_id}: {data}")
-                file_handler.flush()
             except Exception as e:
                 logger.error(f"Failed to send/receive EndStream for {client_id}: {str(e)}")
-                file_handler.flush()
             await websocket.close()
             logger.info(f"Closed WebSocket connection for {client_id}")
-            file_handler.flush()
 
 @app.websocket("/ws/tetse_event/{entity_id}")
 async def tetse_event_handler(websocket: WebSocket, entity_id: str):
@@ -274,7 +376,6 @@ async def tetse_event_handler(websocket: WebSocket, entity_id: str):
     client_id = f"{client_host}:{client_port}"
     client_type = "client"
     logger.info(f"WebSocket connection attempt for /ws/tetse_event/{entity_id} from {client_id} ({client_type})")
-    file_handler.flush()
 
     heartbeat_manager = HeartbeatManager(websocket, client_id=client_id, interval=30, timeout=5)
     heartbeat_task = asyncio.create_task(heartbeat_loop(heartbeat_manager))
@@ -288,18 +389,15 @@ async def tetse_event_handler(websocket: WebSocket, entity_id: str):
         topic = f"ws_event_{entity_id}"
         await websocket.accept()
         logger.info(f"WebSocket connection accepted for {topic} from {client_id} ({client_type})")
-        file_handler.flush()
 
         logger.debug(f"Using TETSE_MANAGER instance: {id(TETSE_MANAGER)}")
         await TETSE_MANAGER.add_client(topic, websocket)
         logger.debug(f"After adding client, TETSE_MANAGER.clients: {TETSE_MANAGER.clients}")
-        file_handler.flush()
 
         try:
             while True:
                 await websocket.send_json({"type": "ping"})
                 logger.debug(f"Sent ping to {client_id} ({client_type}) on topic {topic}")
-                file_handler.flush()
                 await asyncio.sleep(30)
 
                 try:
@@ -330,12 +428,10 @@ async def tetse_event_handler(websocket: WebSocket, entity_id: str):
             logger.info(f"Client disconnected from {topic} ({client_id}, {client_type})")
             await TETSE_MANAGER.remove_client(topic, websocket)
             logger.debug(f"After removing client, TETSE_MANAGER.clients: {TETSE_MANAGER.clients}")
-            file_handler.flush()
         except Exception as e:
             logger.error(f"Error on {topic} for client {client_id} ({client_type}): {str(e)}")
             await TETSE_MANAGER.remove_client(topic, websocket)
             logger.debug(f"After removing client due to error, TETSE_MANAGER.clients: {TETSE_MANAGER.clients}")
-            file_handler.flush()
             await websocket.close(code=1000, reason="Server error")
 
     except Exception as e:
@@ -346,7 +442,6 @@ async def tetse_event_handler(websocket: WebSocket, entity_id: str):
         if websocket.state == websockets.State.OPEN:
             await websocket.close()
             logger.info(f"Closed WebSocket connection for {client_id}")
-            file_handler.flush()
 
 async def heartbeat_loop(hbm):
     while True:
@@ -0,0 +1,381 @@
+# Name: zone_index.py
+# Version: 0.1.2
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: In-memory zone geometry index (hierarchy + uniform grid) for point-to-zone resolution in ParcoRTLS
+# Location: /home/parcoadmin/parco_fastapi/app/manager
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+# Version: 0.1.2 - Vertex bounds from the zone's lowest i_rgn region only, the region rule trigger polygons use, bumped from 0.1.1
+# Version: 0.1.1 - smallest_vertex_zone for portable trigger zone resolution, bumped from 0.1.0
+
+"""
+Zone Geometry Index Module for ParcoRTLS
+
+Loads zones, their own regions (i_trg IS NULL) and region vertices once and
+answers "which zones contain this point" from memory:
+
+- zone bounding boxes are bucketed into a uniform 2D grid, so a lookup only
+  tests the zones registered in one cell
+- zones too large for the grid (campus outlines) are kept in a short list that
+  is always tested
+- the i_pnt_zn parent chain is resolved once, so the most specific containing
+  zone and its campus-to-zone path need no further queries
+
+Two boxes are kept per zone because the existing endpoints differ:
+- region bounds (regions.n_min_x ... n_max_z), used by get_best_zone_for_point
+- vertex bounds (min/max over the rounded vertices), used by zones_by_point.
+  Like a trigger's polygon (trigger_loader.TRIGGER_VERTICES_QUERY), a zone's
+  outline is the vertices of its lowest i_rgn region only
+
+The index is rebuilt by ZoneIndexCache when it is older than its TTL or after
+invalidate() is called by a zone, region or vertex write.
+"""
+
+import asyncio
+import math
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default grid cell edge length in site units (feet)
+DEFAULT_CELL_SIZE = 50.0
+
+# Zones spanning more cells than this are tested on every lookup instead
+MAX_CELLS_PER_ZONE = 1024
+
+# Seconds a built index is used before it is rebuilt
+ZONE_INDEX_TTL = 60.0
+
+# Zone type of a campus (L1) zone
+CAMPUS_ZONE_TYPE = 1
+
+ZONES_QUERY = "SELECT i_zn, x_nm_zn, i_typ_zn, i_pnt_zn FROM zones"
+
+ZONE_REGIONS_QUERY = """
+    SELECT i_rgn, i_zn, n_min_x, n_max_x, n_min_y, n_max_y, n_min_z, n_max_z
+    FROM regions
+    WHERE i_trg IS NULL AND i_zn IS NOT NULL
+"""
+
+ZONE_VERTICES_QUERY = """
+    SELECT r.i_zn, r.i_rgn,
+           ROUND(v.n_x::numeric, 6)::float8 AS n_x,
+           ROUND(v.n_y::numeric, 6)::float8 AS n_y,
+           ROUND(COALESCE(v.n_z, 0)::numeric, 6)::float8 AS n_z
+    FROM vertices v
+    JOIN regions r ON r.i_rgn = v.i_rgn
+    WHERE r.i_trg IS NULL AND r.i_zn IS NOT NULL
+"""
+
+Box = Tuple[float, float, float, float, float, float]  # min_x, max_x, min_y, max_y, min_z, max_z
+
+def _box_contains(box: Box, x: float, y: float, z: float) -> bool:
+    return box[0] <= x <= box[1] and box[2] <= y <= box[3] and box[4] <= z <= box[5]
+
+class ZoneGeometry:
+    """
+    One zone with its region boxes, vertex box and parent link.
+    """
+
+    __slots__ = ('zone_id', 'name', 'zone_type', 'parent_id', 'region_boxes', 'region_id', 'has_vertices',
+                 'vertex_box', 'vertex_count')
+
+    def __init__(self, zone_id: int, name: str, zone_type: int, parent_id: Optional[int]):
+        self.zone_id = zone_id
+        self.name = name
+        self.zone_type = zone_type
+        self.parent_id = parent_id
+        self.region_boxes: List[Box] = []
+        self.region_id: Optional[int] = None   # Lowest i_rgn; its vertices make up vertex_box
+        self.has_vertices = False              # Any of the zone's regions has vertices
+        self.vertex_box: Optional[Box] = None
+        self.vertex_count = 0
+
+    def add_vertex(self, x: float, y: float, z: float):
+        """Extend vertex_box by a vertex of the zone's lowest region."""
+        b = self.vertex_box
+        if b is None:
+            self.vertex_box = (x, x, y, y, z, z)
+        else:
+            self.vertex_box = (min(b[0], x), max(b[1], x), min(b[2], y), max(b[3], y), min(b[4], z), max(b[5], z))
+        self.vertex_count += 1
+
+    def contains(self, x: float, y: float, z: float) -> bool:
+        """Point inside any of the zone's region bounds (zone must have vertices)."""
+        return self.has_vertices and any(_box_contains(b, x, y, z) for b in self.region_boxes)
+
+    def vertex_box_contains(self, x: float, y: float, z: float) -> bool:
+        """Point inside the bounds of the zone's lowest-region vertices (needs at least 3)."""
+        return self.vertex_count >= 3 and _box_contains(self.vertex_box, x, y, z)  # type: ignore
+
+    def footprint(self) -> Optional[Box]:
+        """Box covering region and vertex bounds, used for grid placement."""
+        boxes = list(self.region_boxes)
+        if self.vertex_box is not None:
+            boxes.append(self.vertex_box)
+        if not boxes:
+            return None
+        return (min(b[0] for b in boxes), max(b[1] for b in boxes),
+                min(b[2] for b in boxes), max(b[3] for b in boxes),
+                min(b[4] for b in boxes), max(b[5] for b in boxes))
+
+    def to_dict(self) -> dict:
+        return {"i_zn": self.zone_id, "x_nm_zn": self.name, "i_typ_zn": self.zone_type, "i_pnt_zn": self.parent_id}
+
+class ZoneGeometryIndex:
+    """
+    Grid index over all zones with geometry, plus the zone hierarchy.
+    """
+
+    def __init__(self, zones: Dict[int, ZoneGeometry], cell_size: float = DEFAULT_CELL_SIZE):
+        """
+        Build the grid.
+
+        Args:
+            zones: Zone ID -> ZoneGeometry, including zones without geometry
+            cell_size: Grid cell edge length
+        """
+        self.zones = zones
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[ZoneGeometry]] = {}
+        self.large: List[ZoneGeometry] = []
+        self.built_at = time.monotonic()
+
+        for zone in sorted(zones.values(), key=lambda zn: zn.zone_id):
+            box = zone.footprint()
+            if box is None:
+                continue
+            cx0, cy0 = self._cell(box[0], box[2])
+            cx1, cy1 = self._cell(box[1], box[3])
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > MAX_CELLS_PER_ZONE:
+                self.large.append(zone)
+                continue
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self.cells.setdefault((cx, cy), []).append(zone)
+
+        logger.debug(f"Built zone index: {len(zones)} zones, {len(self.cells)} cells, {len(self.large)} large zones")
+
+    @classmethod
+    def from_rows(cls, zone_rows, region_rows, vertex_rows, cell_size: float = DEFAULT_CELL_SIZE) -> "ZoneGeometryIndex":
+        """
+        Build an index from ZONES_QUERY, ZONE_REGIONS_QUERY and ZONE_VERTICES_QUERY rows.
+        """
+        zones: Dict[int, ZoneGeometry] = {}
+        for row in zone_rows:
+            zones[row["i_zn"]] = ZoneGeometry(row["i_zn"], row["x_nm_zn"], row["i_typ_zn"], row["i_pnt_zn"])
+        for row in region_rows:
+            zone = zones.get(row["i_zn"])
+            if zone is None:
+                continue
+            if zone.region_id is None or row["i_rgn"] < zone.region_id:
+                zone.region_id = row["i_rgn"]
+            if row["n_min_x"] is None:
+                continue
+            zone.region_boxes.append((
+                float(row["n_min_x"]), float(row["n_max_x"]),
+                float(row["n_min_y"]), float(row["n_max_y"]),
+                float(row["n_min_z"] or 0.0), float(row["n_max_z"] or 0.0)
+            ))
+        for row in vertex_rows:
+            zone = zones.get(row["i_zn"])
+            if zone is None:
+                continue
+            zone.has_vertices = True
+            if row["i_rgn"] == zone.region_id:
+                zone.add_vertex(float(row["n_x"]), float(row["n_y"]), float(row["n_z"]))
+        return cls(zones, cell_size)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def _candidates(self, x: float, y: float) -> List[ZoneGeometry]:
+        cell = self.cells.get(self._cell(x, y))
+        if not self.large:
+            return cell or []
+        return (cell or []) + self.large
+
+    def zones_containing(self, x: float, y: float, z: float) -> List[ZoneGeometry]:
+        """
+        Zones whose region bounds contain the point, ordered by zone ID.
+        """
+        return sorted((zn for zn in self._candidates(x, y) if zn.contains(x, y, z)), key=lambda zn: zn.zone_id)
+
+    def zones_containing_vertices(self, x: float, y: float, z: float, zone_type: int = 0) -> List[ZoneGeometry]:
+        """
+        Zones whose vertex bounds contain the point, ordered by zone ID.
+
+        Args:
+            x, y, z: Point coordinates
+            zone_type: Only zones of this type, 0 for all
+        """
+        return sorted(
+            (zn for zn in self._candidates(x, y)
+             if (zone_type <= 0 or zn.zone_type == zone_type) and zn.vertex_box_contains(x, y, z)),
+            key=lambda zn: zn.zone_id
+        )
+
+    def smallest_vertex_zone(self, x: float, y: float, z: float) -> Optional[ZoneGeometry]:
+        """
+        Zone with the smallest vertex-bounds area containing a point.
+
+        The rule portable triggers use to pick their zone; /api/zones_by_point
+        returns the same candidates, so callers without the index apply it there.
+        """
+        zones = self.zones_containing_vertices(x, y, z)
+        if not zones:
+            return None
+        return min(zones, key=lambda zn: (zn.vertex_box[1] - zn.vertex_box[0]) *  # type: ignore
+                                         (zn.vertex_box[3] - zn.vertex_box[2]))  # type: ignore
+
+    def best_zone(self, x: float, y: float, z: float) -> Tuple[Optional[ZoneGeometry], List[ZoneGeometry]]:
+        """
+        Most specific zone containing a point.
+
+        Among the containing zones, those that are not the parent of another
+        containing zone are preferred, then the highest zone type.
+
+        Returns:
+            Tuple: (best zone or None, all containing zones)
+        """
+        containing = self.zones_containing(x, y, z)
+        if not containing:
+            return None, containing
+        parents = {zn.parent_id for zn in containing}
+        leaves = [zn for zn in containing if zn.zone_id not in parents]
+        best = max(leaves or containing, key=lambda zn: zn.zone_type)
+        return best, containing
+
+    def hierarchy(self, zone_id: int) -> dict:
+        """
+        Campus-to-zone path for a zone, in the get_zone_hierarchy response format.
+
+        Args:
+            zone_id: Zone ID
+
+        Returns:
+            dict: target_zone, campus, full_hierarchy, full_path; empty if unknown
+        """
+        chain: List[ZoneGeometry] = []
+        seen = set()
+        zone = self.zones.get(zone_id)
+        while zone is not None and zone.zone_id not in seen:
+            seen.add(zone.zone_id)
+            chain.append(zone)
+            zone = self.zones.get(zone.parent_id) if zone.parent_id is not None else None
+        if not chain:
+            return {}
+
+        hierarchy = []
+        for level in range(len(chain) - 1, -1, -1):
+            entry = chain[level].to_dict()
+            entry["level"] = level
+            hierarchy.append(entry)
+        return {
+            "target_zone": hierarchy[-1],
+            "campus": next((h for h in hierarchy if h["i_typ_zn"] == CAMPUS_ZONE_TYPE), None),
+            "full_hierarchy": hierarchy,
+            "full_path": " > ".join(h["x_nm_zn"] for h in hierarchy)
+        }
+
+    def get_stats(self) -> dict:
+        """
+        Get index statistics.
+
+        Returns:
+            dict: Zone and grid counters
+        """
+        return {
+            'zones': len(self.zones),
+            'zones_with_geometry': sum(1 for zn in self.zones.values() if zn.has_vertices),
+            'grid_cells': len(self.cells),
+            'large_zones': len(self.large),
+            'cell_size': self.cell_size,
+            'age_seconds': round(time.monotonic() - self.built_at, 1)
+        }
+
+FetchRows = Callable[[str], Awaitable[list]]
+
+class ZoneIndexCache:
+    """
+    Lazily built, periodically refreshed ZoneGeometryIndex.
+    """
+
+    def __init__(self, ttl: float = ZONE_INDEX_TTL, cell_size: float = DEFAULT_CELL_SIZE):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds before the index is rebuilt
+            cell_size: Grid cell edge length
+        """
+        self.ttl = ttl
+        self.cell_size = cell_size
+        self.index: Optional[ZoneGeometryIndex] = None
+        self.lock = asyncio.Lock()
+        self.build_count = 0
+        self.failed_count = 0
+
+    def is_stale(self) -> bool:
+        return self.index is None or time.monotonic() - self.index.built_at >= self.ttl
+
+    async def get(self, fetch: FetchRows) -> ZoneGeometryIndex:
+        """
+        Get the current index, rebuilding it if it is missing or stale.
+
+        A failed rebuild keeps serving the previous index.
+
+        Args:
+            fetch: Async callable running a query on the maint database and returning rows
+
+        Returns:
+            ZoneGeometryIndex: Current index
+
+        Raises:
+            Exception: When no index could ever be built
+        """
+        if not self.is_stale():
+            return self.index  # type: ignore
+        async with self.lock:
+            if self.is_stale():
+                try:
+                    zone_rows = await fetch(ZONES_QUERY)
+                    region_rows = await fetch(ZONE_REGIONS_QUERY)
+                    vertex_rows = await fetch(ZONE_VERTICES_QUERY)
+                    self.index = ZoneGeometryIndex.from_rows(zone_rows, region_rows, vertex_rows, self.cell_size)
+                    self.build_count += 1
+                except Exception as e:
+                    self.failed_count += 1
+                    if self.index is None:
+                        raise
+                    logger.warning(f"Zone index rebuild failed, keeping previous index: {str(e)}")
+                    self.index.built_at = time.monotonic()
+        return self.index  # type: ignore
+
+    def invalidate(self):
+        """Force a rebuild on the next lookup."""
+        if self.index is not None:
+            self.index.built_at = -math.inf
+
+    def get_stats(self) -> dict:
+        """
+        Get cache statistics.
+
+        Returns:
+            dict: Build counters and index statistics
+        """
+        return {
+            'builds': self.build_count,
+            'failed_builds': self.failed_count,
+            'index': self.index.get_stats() if self.index else None
+        }
+
+# Process-wide cache shared by the API routes and the managers
+zone_index_cache = ZoneIndexCache()
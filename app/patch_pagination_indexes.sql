@@ -0,0 +1,43 @@
+-- Name: patch_pagination_indexes.sql
+-- Version: 0.1.1
+-- Created: 261018
+-- Modified: 261018
+-- Creator: ParcoAdmin
+-- Modified By: ParcoAdmin
+-- Description: Composite indexes for keyset-paginated event, text and position history queries
+-- Location: /home/parcoadmin/parco_fastapi/app
+-- Role: Database
+-- Status: Active
+-- Dependent: TRUE
+-- Version: 0.1.1 - positionhistory index on its real columns (x_id_dev, d_pos_bgn), bumped from 0.1.0
+--
+-- Each index matches the ORDER BY of its endpoint, so a page is an index range
+-- scan that stops after LIMIT rows:
+--   /event_by_entity/{entity_id}         event_log    (entity_id, ts DESC, id DESC)
+--   /get_text_events_by_device/{device}  textdata     (x_id_dev, d_ts DESC, i_dat DESC)
+--   /get_history_by_device/{device}      positionhistory (x_id_dev, d_pos_bgn)
+--
+-- Built CONCURRENTLY so writers are not blocked; run with psql outside a
+-- transaction (no -1 / --single-transaction):
+--   psql -U parcoadmin -h localhost -d postgres -f patch_pagination_indexes.sql
+
+--
+-- ParcoRTLSData
+--
+
+\connect ParcoRTLSData
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_eventlog_entity_ts_id ON public.event_log USING btree (entity_id, ts DESC, id DESC);
+
+-- Covered by idx_eventlog_entity_ts_id
+DROP INDEX CONCURRENTLY IF EXISTS public.idx_eventlog_entity_ts;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_textdata_dev_ts_id ON public.textdata USING btree (x_id_dev, d_ts DESC, i_dat DESC);
+
+--
+-- ParcoRTLSHistR
+--
+
+\connect ParcoRTLSHistR
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_positionhistory_dev_bgn ON public.positionhistory USING btree (x_id_dev, d_pos_bgn);
@@ -1,7 +1,7 @@
 # Name: dashboard.py
-# Version: 0.1.2
+# Version: 0.1.3
 # Created: 250711
-# Modified: 250712
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin + Claude
 # Description: FastAPI routes for ParcoRTLS Dashboard with dynamic device categories
@@ -10,11 +10,17 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version 0.1.3 asyncpg on a shared pool instead of a psycopg2 connection per request, concurrent /overview with a short TTL cache, bumped from 0.1.2
+
 from fastapi import APIRouter, HTTPException
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, List, Any, Optional
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Tuple
 import logging
+import asyncpg
+
+from manager.db_pools import db_pool_registry
 
 logger = logging.getLogger(__name__)
 
@@ -32,39 +38,62 @@ DASHBOARD_DB_PARAMS = {
     "port": "5432"
 }
 
-def get_dashboard_connection():
-    """Get connection to ParcoRTLSDashboard database"""
+DASHBOARD_CONN_STRING = (
+    f"postgresql://{DASHBOARD_DB_PARAMS['user']}:{DASHBOARD_DB_PARAMS['password']}"
+    f"@{DASHBOARD_DB_PARAMS['host']}:{DASHBOARD_DB_PARAMS['port']}/{DASHBOARD_DB_PARAMS['dbname']}"
+)
+
+# /overview runs its eight queries at once, so the pool holds all of them
+DASHBOARD_POOL_MAX_SIZE = 10
+
+# Seconds an /overview result is shared by every dashboard polling that customer
+OVERVIEW_CACHE_TTL = 2.0
+
+# customer_id -> (expires_at, overview)
+_overview_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+# customer_id -> overview being computed, awaited by concurrent requests
+_overview_inflight: Dict[int, asyncio.Task] = {}
+
+async def get_dashboard_pool() -> asyncpg.Pool:
+    """Get the shared pool for the ParcoRTLSDashboard database"""
     try:
-        conn = psycopg2.connect(
-            dbname=DASHBOARD_DB_PARAMS["dbname"],
-            user=DASHBOARD_DB_PARAMS["user"],
-            password=DASHBOARD_DB_PARAMS["password"],
-            host=DASHBOARD_DB_PARAMS["host"],
-            port=DASHBOARD_DB_PARAMS["port"]
-        )
-        return conn
+        return await db_pool_registry.get_pool(DASHBOARD_CONN_STRING, max_size=DASHBOARD_POOL_MAX_SIZE)
     except Exception as e:
         logger.error(f"Dashboard database connection error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
 
+async def _fetch(query: str, *args) -> List[Dict[str, Any]]:
+    pool = await get_dashboard_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    return [dict(row) for row in rows]
+
+async def _fetchrow(query: str, *args) -> Optional[Dict[str, Any]]:
+    pool = await get_dashboard_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(query, *args)
+    return dict(row) if row else None
+
+async def _execute(query: str, *args) -> int:
+    """Run a write and return the number of affected rows. Cached overviews are dropped."""
+    pool = await get_dashboard_pool()
+    async with pool.acquire() as conn:
+        status = await conn.execute(query, *args)
+    _overview_cache.clear()
+    try:
+        return int(status.split()[-1])
+    except (ValueError, IndexError):
+        return 0
+
 @router.get("/metrics")
 async def get_dashboard_metrics():
     """Get all dashboard metrics (tag counts, receiver counts, etc.)"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
-            SELECT metric_name, metric_value, metric_type, last_updated 
-            FROM dashboard_metrics 
+        return await _fetch("""
+            SELECT metric_name, metric_value, metric_type, last_updated
+            FROM dashboard_metrics
             ORDER BY metric_name
         """)
-        
-        metrics = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return [dict(metric) for metric in metrics]
     except Exception as e:
         logger.error(f"Error fetching dashboard metrics: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching metrics: {str(e)}")
@@ -73,21 +102,12 @@ async def get_dashboard_metrics():
 async def get_dashboard_locations():
     """Get all dashboard locations with their counts"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
+        return await _fetch("""
             SELECT id, location_name, location_type, display_order, is_active
-            FROM dashboard_locations 
+            FROM dashboard_locations
             WHERE is_active = true
             ORDER BY display_order, location_name
         """)
-        
-        locations = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return [dict(location) for location in locations]
     except Exception as e:
         logger.error(f"Error fetching dashboard locations: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching locations: {str(e)}")
@@ -96,25 +116,16 @@ async def get_dashboard_locations():
 async def get_device_categories(customer_id: int):
     """Get device categories for a specific customer"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
-            SELECT 
+        return await _fetch("""
+            SELECT
                 ddc.id, ddc.category_key, ddc.category_label, ddc.metric_name,
                 ddc.display_order, ddc.icon_name, ddc.is_active,
                 dm.metric_value
             FROM dashboard_device_categories ddc
             LEFT JOIN dashboard_metrics dm ON ddc.metric_name = dm.metric_name
-            WHERE ddc.customer_id = %s AND ddc.is_active = true
+            WHERE ddc.customer_id = $1 AND ddc.is_active = true
             ORDER BY ddc.display_order, ddc.category_label
-        """, (customer_id,))
-        
-        categories = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return [dict(category) for category in categories]
+        """, customer_id)
     except Exception as e:
         logger.error(f"Error fetching device categories for customer {customer_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching device categories: {str(e)}")
@@ -123,23 +134,16 @@ async def get_device_categories(customer_id: int):
 async def get_customer_config(customer_id: int):
     """Get customer configuration"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
+        config = await _fetchrow("""
             SELECT customer_id, customer_name, dashboard_title, created_at, updated_at
-            FROM dashboard_customer_config 
-            WHERE customer_id = %s
-        """, (customer_id,))
-        
-        config = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
+            FROM dashboard_customer_config
+            WHERE customer_id = $1
+        """, customer_id)
+
         if not config:
             raise HTTPException(status_code=404, detail=f"Customer {customer_id} not found")
-        
-        return dict(config)
+
+        return config
     except HTTPException:
         raise
     except Exception as e:
@@ -157,19 +161,12 @@ async def add_device_category(
 ):
     """Add new device category for a customer"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO dashboard_device_categories 
+        await _execute("""
+            INSERT INTO dashboard_device_categories
             (customer_id, category_key, category_label, metric_name, display_order, icon_name)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (customer_id, category_key, category_label, metric_name, display_order, icon_name))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+            VALUES ($1, $2, $3, $4, $5, $6)
+        """, customer_id, category_key, category_label, metric_name, display_order, icon_name)
+
         return {"message": f"Device category '{category_label}' added successfully"}
     except Exception as e:
         logger.error(f"Error adding device category: {str(e)}")
@@ -186,52 +183,36 @@ async def update_device_category(
 ):
     """Update device category"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor()
-        
         # Build dynamic update query
         update_fields = []
-        values = []
-        
-        if category_label is not None:
-            update_fields.append("category_label = %s")
-            values.append(category_label)
-        if metric_name is not None:
-            update_fields.append("metric_name = %s")
-            values.append(metric_name)
-        if display_order is not None:
-            update_fields.append("display_order = %s")
-            values.append(display_order)
-        if icon_name is not None:
-            update_fields.append("icon_name = %s")
-            values.append(icon_name)
-        if is_active is not None:
-            update_fields.append("is_active = %s")
-            values.append(is_active)
-        
+        values: List[Any] = []
+
+        for column, value in (
+            ("category_label", category_label),
+            ("metric_name", metric_name),
+            ("display_order", display_order),
+            ("icon_name", icon_name),
+            ("is_active", is_active)
+        ):
+            if value is not None:
+                values.append(value)
+                update_fields.append(f"{column} = ${len(values)}")
+
         if not update_fields:
             raise HTTPException(status_code=400, detail="No fields to update")
-        
+
         update_fields.append("updated_at = CURRENT_TIMESTAMP")
         values.append(category_id)
-        
+
         query = f"""
-            UPDATE dashboard_device_categories 
+            UPDATE dashboard_device_categories
             SET {', '.join(update_fields)}
-            WHERE id = %s
+            WHERE id = ${len(values)}
         """
-        
-        cursor.execute(query, values)
-        
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
+
+        if await _execute(query, *values) == 0:
             raise HTTPException(status_code=404, detail=f"Device category {category_id} not found")
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+
         return {"message": f"Device category {category_id} updated successfully"}
     except HTTPException:
         raise
@@ -243,24 +224,15 @@ async def update_device_category(
 async def delete_device_category(category_id: int):
     """Delete device category (soft delete by setting is_active = false)"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE dashboard_device_categories 
+        updated = await _execute("""
+            UPDATE dashboard_device_categories
             SET is_active = false, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (category_id,))
-        
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
+            WHERE id = $1
+        """, category_id)
+
+        if updated == 0:
             raise HTTPException(status_code=404, detail=f"Device category {category_id} not found")
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+
         return {"message": f"Device category {category_id} deleted successfully"}
     except HTTPException:
         raise
@@ -272,25 +244,16 @@ async def delete_device_category(category_id: int):
 async def get_dashboard_activity(limit: int = 50):
     """Get recent dashboard activity feed"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
-            SELECT 
-                da.id, da.activity_type, da.description, da.device_id, 
+        return await _fetch("""
+            SELECT
+                da.id, da.activity_type, da.description, da.device_id,
                 da.severity, da.event_timestamp,
                 dl.location_name
             FROM dashboard_activity da
             LEFT JOIN dashboard_locations dl ON da.location_id = dl.id
             ORDER BY da.event_timestamp DESC
-            LIMIT %s
-        """, (limit,))
-        
-        activity = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return [dict(item) for item in activity]
+            LIMIT $1
+        """, limit)
     except Exception as e:
         logger.error(f"Error fetching dashboard activity: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching activity: {str(e)}")
@@ -299,11 +262,8 @@ async def get_dashboard_activity(limit: int = 50):
 async def get_dashboard_autoclave():
     """Get autoclave cycle data for the current year"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
-            SELECT 
+        return await _fetch("""
+            SELECT
                 dc.cycle_date, dc.cycle_count, dc.cycle_type,
                 dl.location_name
             FROM dashboard_autoclave dc
@@ -311,12 +271,6 @@ async def get_dashboard_autoclave():
             WHERE EXTRACT(YEAR FROM dc.cycle_date) = EXTRACT(YEAR FROM CURRENT_DATE)
             ORDER BY dc.cycle_date
         """)
-        
-        autoclave_data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return [dict(item) for item in autoclave_data]
     except Exception as e:
         logger.error(f"Error fetching autoclave data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching autoclave data: {str(e)}")
@@ -325,11 +279,8 @@ async def get_dashboard_autoclave():
 async def get_dashboard_alerts():
     """Get dashboard alerts summary"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
-            SELECT 
+        alert_counts = await _fetchrow("""
+            SELECT
                 COUNT(*) FILTER (WHERE alert_timestamp::date = CURRENT_DATE) as today_count,
                 COUNT(*) FILTER (WHERE EXTRACT(MONTH FROM alert_timestamp) = EXTRACT(MONTH FROM CURRENT_DATE)
                                 AND EXTRACT(YEAR FROM alert_timestamp) = EXTRACT(YEAR FROM CURRENT_DATE)) as month_count,
@@ -337,12 +288,8 @@ async def get_dashboard_alerts():
             FROM dashboard_alerts
             WHERE status = 'active'
         """)
-        
-        alert_counts = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        return dict(alert_counts) if alert_counts else {"today_count": 0, "month_count": 0, "year_count": 0}
+
+        return alert_counts if alert_counts else {"today_count": 0, "month_count": 0, "year_count": 0}
     except Exception as e:
         logger.error(f"Error fetching alert counts: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching alerts: {str(e)}")
@@ -351,11 +298,8 @@ async def get_dashboard_alerts():
 async def get_dashboard_sensors():
     """Get current sensor readings"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
-            SELECT 
+        return await _fetch("""
+            SELECT
                 ds.sensor_id, ds.sensor_type, ds.reading_value, ds.unit_of_measure,
                 ds.status, ds.last_reading,
                 dl.location_name
@@ -363,40 +307,53 @@ async def get_dashboard_sensors():
             LEFT JOIN dashboard_locations dl ON ds.location_id = dl.id
             ORDER BY ds.last_reading DESC
         """)
-        
-        sensors = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return [dict(sensor) for sensor in sensors]
     except Exception as e:
         logger.error(f"Error fetching sensor data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching sensors: {str(e)}")
 
+async def _build_overview(customer_id: int) -> Dict[str, Any]:
+    """Run all overview queries concurrently and cache the combined result"""
+    (customer_config, metrics, locations, device_categories,
+     activity, autoclave, alerts, sensors) = await asyncio.gather(
+        get_customer_config(customer_id),
+        get_dashboard_metrics(),
+        get_dashboard_locations(),
+        get_device_categories(customer_id),
+        get_dashboard_activity(10),  # Limited for overview
+        get_dashboard_autoclave(),
+        get_dashboard_alerts(),
+        get_dashboard_sensors()
+    )
+
+    overview = {
+        "customer_config": customer_config,
+        "metrics": metrics,
+        "locations": locations,
+        "device_categories": device_categories,
+        "recent_activity": activity,
+        "autoclave_data": autoclave,
+        "alert_summary": alerts,
+        "sensor_readings": sensors,
+        "last_updated": datetime.now(timezone.utc).isoformat()
+    }
+    _overview_cache[customer_id] = (time.monotonic() + OVERVIEW_CACHE_TTL, overview)
+    return overview
+
 @router.get("/overview/{customer_id}")
 async def get_dashboard_overview(customer_id: int = 1):
     """Get complete dashboard overview data for a specific customer"""
+    cached = _overview_cache.get(customer_id)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+
     try:
-        metrics = await get_dashboard_metrics()
-        locations = await get_dashboard_locations()
-        device_categories = await get_device_categories(customer_id)
-        activity = await get_dashboard_activity(10)  # Limited for overview
-        autoclave = await get_dashboard_autoclave()
-        alerts = await get_dashboard_alerts()
-        sensors = await get_dashboard_sensors()
-        customer_config = await get_customer_config(customer_id)
-        
-        return {
-            "customer_config": customer_config,
-            "metrics": metrics,
-            "locations": locations,
-            "device_categories": device_categories,
-            "recent_activity": activity,
-            "autoclave_data": autoclave,
-            "alert_summary": alerts,
-            "sensor_readings": sensors,
-            "last_updated": "2025-07-12T12:00:00Z"
-        }
+        # Dashboards polling together share one computation
+        task = _overview_inflight.get(customer_id)
+        if task is None:
+            task = asyncio.ensure_future(_build_overview(customer_id))
+            _overview_inflight[customer_id] = task
+            task.add_done_callback(lambda _t: _overview_inflight.pop(customer_id, None))
+        return await asyncio.shield(task)
     except Exception as e:
         logger.error(f"Error fetching dashboard overview for customer {customer_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching overview: {str(e)}")
@@ -405,24 +362,15 @@ async def get_dashboard_overview(customer_id: int = 1):
 async def update_dashboard_metric(metric_name: str, value: int):
     """Update a specific dashboard metric"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE dashboard_metrics 
-            SET metric_value = %s, last_updated = CURRENT_TIMESTAMP
-            WHERE metric_name = %s
-        """, (value, metric_name))
-        
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
+        updated = await _execute("""
+            UPDATE dashboard_metrics
+            SET metric_value = $1, last_updated = CURRENT_TIMESTAMP
+            WHERE metric_name = $2
+        """, value, metric_name)
+
+        if updated == 0:
             raise HTTPException(status_code=404, detail=f"Metric '{metric_name}' not found")
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+
         return {"message": f"Metric '{metric_name}' updated to {value}"}
     except Exception as e:
         logger.error(f"Error updating metric {metric_name}: {str(e)}")
@@ -438,19 +386,12 @@ async def add_dashboard_activity(
 ):
     """Add new activity item to dashboard feed"""
     try:
-        conn = get_dashboard_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        await _execute("""
             INSERT INTO dashboard_activity (activity_type, description, device_id, location_id, severity)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (activity_type, description, device_id, location_id, severity))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+            VALUES ($1, $2, $3, $4, $5)
+        """, activity_type, description, device_id, location_id, severity)
+
         return {"message": "Activity added successfully"}
     except Exception as e:
         logger.error(f"Error adding activity: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error adding activity: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error adding activity: {str(e)}")
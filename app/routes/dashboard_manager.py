@@ -1,7 +1,7 @@
 # Name: dashboard_manager.py
-# Version: 0.1.3
+# Version: 0.1.4
 # Created: 250713
-# Modified: 250713
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin + Claude
 # Description: FastAPI routes for Dashboard Manager API endpoints - Enhanced with subprocess service management
@@ -463,7 +463,7 @@ async def get_manager_health():
             "healthy": manager.is_healthy(),
             "run_state": manager.run_state.name,
             "customers_active": len(manager.dashboard_customers),
-            "queue_size": manager.message_queue.qsize() if hasattr(manager, 'message_queue') else 0,
+            "queue_size": len(manager.pending_positions) if hasattr(manager, 'pending_positions') else 0,
             "timestamp": asyncio.get_event_loop().time()
         }
         
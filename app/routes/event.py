@@ -1,7 +1,7 @@
 # Name: event.py
-# Version: 0.1.11
+# Version: 0.1.13
 # Created: 250525
-# Modified: 250528
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: Event Engine for Backend (TETSE - Temporal Entity Trigger State Engine)
@@ -10,6 +10,8 @@
 # Status: Active
 # Dependent: TRUE
 #
+# Version: 0.1.13 - /event_by_entity pages with a (ts, id) keyset cursor, optional start_date/end_date, streamed large pages, bumped from 0.1.12
+# Version: 0.1.12 - /event writes through the shared batched EventLogWriter, added POST /event/batch with one batched broadcast, bumped from 0.1.11
 # Version: 0.1.11 - Added defaults for reason_id, value, unit in /event, bumped from 0.1.10
 # Version: 0.1.10 - Added debug logging for TETSE_MANAGER instance in broadcast, bumped from 0.1.9
 # Version: 0.1.9 - Use TETSE_MANAGER.broadcast_event_instance() to fix broadcasting, bumped from 0.1.8
@@ -19,16 +21,21 @@
 # Version: 0.1.5 - (Prior version assumed based on user input)
 
 from manager.websocket_tetse_event import TETSE_MANAGER
-from fastapi import APIRouter, HTTPException, status
+from manager.event_writer import get_event_log_writer, EventLogWriterFull
+from fastapi import APIRouter, HTTPException, Query, status
 from pydantic import BaseModel
 from datetime import datetime, timezone
 from typing import Optional, List
 from database.db import execute_raw_query
+from routes.pagination import PAGE_DEFAULT, PAGE_MAX, decode_cursor, next_id_cursor, page_response
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["event"])
 
+# Largest number of events accepted by POST /event/batch
+EVENT_BATCH_MAX = 5000
+
 class EventIn(BaseModel):
     entity_id: str
     event_type_id: int
@@ -40,53 +47,112 @@ class EventIn(BaseModel):
 class EventOut(EventIn):
     id: int
 
+def _with_defaults(event: EventIn) -> dict:
+    """Event fields with the /event defaults applied."""
+    event_data = event.model_dump()
+    event_data.update({
+        "ts": event.ts or datetime.now(timezone.utc),
+        "reason_id": event.reason_id or 4,  # Analyst override
+        "value": event.value if event.value is not None else 1.0,
+        "unit": event.unit or "percent"
+    })
+    return event_data
+
+async def _write_events(events: List[EventIn]) -> List[dict]:
+    """Write events through the shared event_log writer and return them with their IDs."""
+    rows = [_with_defaults(event) for event in events]
+    ids = await get_event_log_writer().add_many([
+        (row["entity_id"], row["event_type_id"], row["reason_id"], row["value"], row["unit"], row["ts"])
+        for row in rows
+    ])
+    for row, event_id in zip(rows, ids):
+        row["id"] = event_id
+    return rows
+
+def _broadcast_payload(row: dict) -> dict:
+    """JSON-safe copy of a written event for WebSocket subscribers."""
+    return {**row, "ts": row["ts"].isoformat()}
+
 @router.post("/event", response_model=EventOut)
 async def log_event(event: EventIn):
     """
     Insert a new event into the event_log table.
     This endpoint supports symbolic and financial event tracking
     as part of the TETSE (Temporal Entity Trigger State Engine) layer.
+    Concurrent requests share multi-row writes.
     """
     try:
-        ts = event.ts or datetime.now(timezone.utc)
-        reason_id = event.reason_id or 4  # Analyst override
-        value = event.value if event.value is not None else 1.0
-        unit = event.unit or "percent"
-        query = """
-            INSERT INTO event_log (entity_id, event_type_id, reason_id, value, unit, ts)
-            VALUES ($1, $2, $3, $4, $5, $6)
-            RETURNING id;
-        """
-        result = await execute_raw_query("data", query,
-                                         event.entity_id, event.event_type_id,
-                                         reason_id, value, unit, ts)
-        if result and isinstance(result, list) and result:
-            event_data = event.model_dump()
-            event_data["id"] = result[0]["id"]
-            event_data.update({"reason_id": reason_id, "value": value, "unit": unit})
-            logger.info(f"Event logged with ID {event_data['id']}")
-            logger.debug(f"Before broadcast, using TETSE_MANAGER instance: {id(TETSE_MANAGER)}")
-            await TETSE_MANAGER.broadcast_event_instance(event.entity_id, event_data)
-            return EventOut(**event_data)
-        raise HTTPException(status_code=500, detail="Insert failed")
+        event_data = (await _write_events([event]))[0]
+        logger.info(f"Event logged with ID {event_data['id']}")
+        await TETSE_MANAGER.broadcast_event_instance(event.entity_id, _broadcast_payload(event_data))
+        return EventOut(**event_data)
+    except EventLogWriterFull as e:
+        logger.warning(f"Event rejected: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to log event: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/event/batch", response_model=List[EventOut])
+async def log_events(events: List[EventIn]):
+    """
+    Insert several events into the event_log table in bulk and broadcast them.
+    Events are written with multi-row writes and returned with their IDs, in request order.
+    """
+    if len(events) > EVENT_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {EVENT_BATCH_MAX} events per batch")
+    try:
+        rows = await _write_events(events)
+        TETSE_MANAGER.broadcast_events_instance((row["entity_id"], _broadcast_payload(row)) for row in rows)
+        logger.info(f"Logged batch of {len(rows)} events")
+        return [EventOut(**row) for row in rows]
+    except EventLogWriterFull as e:
+        logger.warning(f"Event batch rejected: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to log event batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/event_by_entity/{entity_id}", response_model=List[EventOut])
-async def get_event_by_entity(entity_id: str):
+async def get_event_by_entity(
+    entity_id: str,
+    limit: int = Query(PAGE_DEFAULT, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
     """
-    Retrieve all event(s) associated with a specific entity_id, ordered by most recent timestamp.
+    Retrieve event(s) associated with a specific entity_id, most recent first, one page at a time.
+    Pass the X-Next-Cursor response header back as cursor to get the next page;
+    start_date/end_date optionally bound ts (inclusive).
     """
+    after = decode_cursor(cursor)
+    # Conditions are only added when used so every shape keeps its index plan
+    # on idx_eventlog_entity_ts_id (entity_id, ts DESC, id DESC)
+    conditions = ["entity_id = $1"]
+    args: list = [entity_id]
+    if start_date is not None:
+        args.append(start_date)
+        conditions.append(f"ts >= ${len(args)}")
+    if end_date is not None:
+        args.append(end_date)
+        conditions.append(f"ts <= ${len(args)}")
+    if after is not None:
+        args.extend(after)
+        conditions.append(f"(ts, id) < (${len(args) - 1}, ${len(args)})")
+    args.append(limit + 1)
     try:
-        query = """
+        query = f"""
             SELECT id, entity_id, event_type_id, reason_id, value, unit, ts
             FROM event_log
-            WHERE entity_id = $1
-            ORDER BY ts DESC;
+            WHERE {' AND '.join(conditions)}
+            ORDER BY ts DESC, id DESC
+            LIMIT ${len(args)};
         """
-        results = await execute_raw_query("data", query, entity_id)
-        return [EventOut(**row) for row in results] if results else []
+        results = await execute_raw_query("data", query, *args)
+        next_cursor = next_id_cursor(results, limit, "ts", "id")
+        return page_response(results, next_cursor)
     except Exception as e:
         logger.error(f"Failed to fetch event(s) for entity {entity_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve event(s).")
\ No newline at end of file
@@ -1,9 +1,11 @@
 # Name: history.py
-# Version: 0.1.1
+# Version: 0.1.3
 # Created: 971201
-# Modified: 250502
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
+# Version 0.1.3 History query uses the real positionhistory columns (x_id_dev, d_pos_bgn, n_x, ...), keeping usp_history_by_id's row shape, bumped from 0.1.2
+# Version 0.1.2 get_history_by_device pages positionhistory with a keyset cursor instead of returning all of usp_history_by_id, bumped from 0.1.1
 # Version 0.1.1 Converted to external descriptions using load_description()
 # Description: Python script for ParcoRTLS backend
 # Location: /home/parcoadmin/parco_fastapi/app/routes
@@ -28,14 +30,17 @@ Historical data and positioning endpoints for ParcoRTLS FastAPI application.
 // # Licensed under AGPL-3.0: https://www.gnu.org/licenses/agpl-3.0.en.html
 """
 
-from fastapi import APIRouter, HTTPException, Form
-from database.db import call_stored_procedure, DatabaseError
+from fastapi import APIRouter, HTTPException, Form, Query
+from database.db import call_stored_procedure, execute_raw_query, DatabaseError
 from models import PositionRequest
 from datetime import datetime
+from typing import Optional
 import logging
 
 from pathlib import Path
 
+from routes.pagination import PAGE_DEFAULT, PAGE_MAX, decode_cursor, next_offset_cursor, page_response
+
 logger = logging.getLogger(__name__)
 
 def load_description(endpoint_name: str) -> str:
@@ -101,11 +106,37 @@ async def insert_position(device_id: str = Form(...), x: float = Form(...), y: f
     description=load_description("get_history_by_device"),
     tags=["triggers"]
 )
-async def get_history_by_device(device_id: str, start_date: datetime, end_date: datetime):
+async def get_history_by_device(
+    device_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    limit: int = Query(PAGE_DEFAULT, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None
+):
+    # Same row shape as usp_history_by_id (the positionhistory columns, as every
+    # hist_r procedure returns them). There is no row ID, so the cursor carries the
+    # last d_pos_bgn and the rows already returned at it; ties are ordered by
+    # position to stay stable
+    after = decode_cursor(cursor)
+    since = start_date
+    skip = 0
+    if after is not None and after[0] >= start_date:
+        since, skip = after
     try:
-        result = await call_stored_procedure("hist_r", "usp_history_by_id", device_id, start_date, end_date)
-        if result and isinstance(result, list) and result:
-            return result
+        result = await execute_raw_query(
+            "hist_r",
+            """
+            SELECT x_id_dev, d_pos_bgn, d_pos_end, n_x, n_y, n_z, cnf, gwid, bat
+            FROM positionhistory
+            WHERE x_id_dev = $1 AND d_pos_bgn >= $2 AND d_pos_bgn <= $3
+            ORDER BY d_pos_bgn, n_x, n_y, n_z
+            OFFSET $4 LIMIT $5
+            """,
+            device_id, since, end_date, skip, limit + 1
+        )
+        if result or cursor:
+            next_cursor = next_offset_cursor(result, limit, "d_pos_bgn", after)
+            return page_response(result, next_cursor)
         raise HTTPException(status_code=404, detail="No history found for device")
     except DatabaseError as e:
         logger.error(f"Database error fetching history: {e.message}")
@@ -0,0 +1,389 @@
+# Name: map_image_cache.py
+# Version: 0.1.2
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Shared map image cache - encoded and decoded floorplans, thumbnails, crops and ETag responses
+# Location: /home/parcoadmin/parco_fastapi/app/routes
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+# Version: 0.1.2 - Thumbnails and crops bounded by encoded bytes instead of entry count, bumped from 0.1.1
+# Version: 0.1.1 - Decoded images bounded by bytes and a short TTL, per-map load locks dropped when the load finishes, bumped from 0.1.0
+
+"""
+Map Image Cache
+
+Map images live as bytea in maps.img_data and are never updated in place, so
+one read per map is enough until the map is deleted or re-uploaded:
+
+- images are kept per (map_id, version); version is a local generation number
+  bumped by invalidate(), which the map upload/delete routes call. A TTL covers
+  changes made by other processes
+- each image gets a content ETag when it is loaded; routes answer
+  If-None-Match with 304 through conditional_response()
+- decoding, thumbnail scaling and crops run in a worker thread, never on the
+  event loop; thumbnails and crops are kept in an LRU bounded by their encoded
+  bytes, and one larger than that bound is served but not kept. Decoded images only
+  serve a burst of crops, so they are bounded by total pixel bytes and expire
+  after MAP_DECODED_TTL; an image larger than the byte bound is decoded for
+  each build and never kept
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import Response
+from PIL import Image
+
+from database.db import execute_raw_query
+
+logger = logging.getLogger(__name__)
+
+MAP_CACHE_MAX_IMAGES = 16      # Encoded images kept
+MAP_CACHE_MAX_DECODED_BYTES = 256 * 1024 * 1024  # Pixel bytes of decoded images kept
+MAP_CACHE_MAX_DERIVED_BYTES = 64 * 1024 * 1024  # Encoded bytes of thumbnails and crops kept
+MAP_CACHE_TTL = 600.0          # Seconds before an image is re-read from the database
+MAP_DECODED_TTL = 60.0         # Seconds a decoded image is kept after its last use
+
+# Requested thumbnail sizes snap up to one of these so the LRU stays small
+THUMBNAIL_SIZES = (256, 512, 1024, 2048)
+
+# Browsers reuse the image briefly and then revalidate with If-None-Match
+MAP_CACHE_CONTROL = "private, max-age=60, must-revalidate"
+
+MAP_IMAGE_QUERY = "SELECT img_data, x_format FROM maps WHERE i_map = $1;"
+
+# x_format values that PIL knows under another name
+PIL_FORMATS = {"JPG": "JPEG"}
+
+class MapImage:
+    """
+    One encoded map image with the metadata needed to serve it.
+    """
+
+    __slots__ = ('map_id', 'version', 'data', 'x_format', 'etag', 'width', 'height', 'loaded_at')
+
+    def __init__(self, map_id: int, version: int, data: bytes, x_format: Optional[str],
+                 etag: str, width: int, height: int):
+        self.map_id = map_id
+        self.version = version
+        self.data = data
+        self.x_format = x_format
+        self.etag = etag
+        self.width = width
+        self.height = height
+        self.loaded_at = time.monotonic()
+
+def _inspect(data: bytes) -> Tuple[str, int, int]:
+    """Content ETag and pixel size; PIL only reads the header here."""
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+    except Exception as e:
+        logger.warning(f"Could not read map image header: {str(e)}")
+        width = height = 0
+    return f'"{digest}"', width, height
+
+def _decode(data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+def _decoded_bytes(image: Image.Image) -> int:
+    """Approximate memory held by a decoded image."""
+    return image.width * image.height * len(image.getbands())
+
+def _encode(image: Image.Image, x_format: str) -> bytes:
+    if x_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=x_format)
+    return buffer.getvalue()
+
+def _scale(image: Image.Image, size: int, x_format: str) -> bytes:
+    ratio = min(size / image.width, size / image.height)
+    scaled = image.resize((max(1, round(image.width * ratio)), max(1, round(image.height * ratio))),
+                          Image.LANCZOS)
+    return _encode(scaled, x_format)
+
+def _crop(image: Image.Image, box: Tuple[int, int, int, int], x_format: str) -> bytes:
+    return _encode(image.crop(box), x_format)
+
+def pil_format(x_format: Optional[str]) -> str:
+    """PIL format name for an x_format value (PNG when unknown)."""
+    name = (x_format or "PNG").upper()
+    return PIL_FORMATS.get(name, name)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value covers the ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def conditional_response(if_none_match: Optional[str], etag: str, content: bytes, media_type: str,
+                         headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Build an image response, or a 304 when the client already has this ETag.
+    """
+    response_headers = {"ETag": etag, "Cache-Control": MAP_CACHE_CONTROL}
+    if headers:
+        response_headers.update(headers)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=response_headers)
+    return Response(content=content, media_type=media_type, headers=response_headers)
+
+class MapImageCache:
+    """
+    LRU cache of map images and images derived from them.
+    """
+
+    def __init__(self, max_images: int = MAP_CACHE_MAX_IMAGES, max_decoded_bytes: int = MAP_CACHE_MAX_DECODED_BYTES,
+                 max_derived_bytes: int = MAP_CACHE_MAX_DERIVED_BYTES, ttl: float = MAP_CACHE_TTL,
+                 decoded_ttl: float = MAP_DECODED_TTL):
+        """
+        Initialize the cache.
+
+        Args:
+            max_images: Encoded images kept
+            max_decoded_bytes: Pixel bytes of decoded images kept
+            max_derived_bytes: Encoded bytes of thumbnails and crops kept
+            ttl: Seconds before an image is re-read from the database
+            decoded_ttl: Seconds a decoded image is kept after its last use
+        """
+        self.max_images = max_images
+        self.max_decoded_bytes = max_decoded_bytes
+        self.max_derived_bytes = max_derived_bytes
+        self.ttl = ttl
+        self.decoded_ttl = decoded_ttl
+        self.images: "OrderedDict[int, MapImage]" = OrderedDict()
+        # (map_id, version) -> (decoded image, pixel bytes, monotonic time of last use)
+        self.decoded: "OrderedDict[Tuple[int, int], Tuple[Image.Image, int, float]]" = OrderedDict()
+        self.decoded_bytes = 0
+        self.derived: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.derived_bytes = 0
+        self.versions: Dict[int, int] = {}
+        # Per-map load locks, only while a load is running or awaited
+        self.locks: Dict[int, asyncio.Lock] = {}
+        self.lock_users: Dict[int, int] = {}
+
+        # Counters
+        self.hits = 0
+        self.loads = 0
+        self.decodes = 0
+        self.derived_hits = 0
+        self.derived_builds = 0
+
+    def _fresh(self, map_id: int) -> Optional[MapImage]:
+        image = self.images.get(map_id)
+        if image is None or image.version != self.versions.get(map_id, 0):
+            return None
+        if time.monotonic() - image.loaded_at >= self.ttl:
+            return None
+        self.images.move_to_end(map_id)
+        return image
+
+    async def get(self, map_id: int) -> Optional[MapImage]:
+        """
+        Get the encoded image of a map, reading it from the database when needed.
+
+        Returns:
+            Optional[MapImage]: None when the map does not exist or has no image
+        """
+        image = self._fresh(map_id)
+        if image is not None:
+            self.hits += 1
+            return image
+
+        lock = self.locks.setdefault(map_id, asyncio.Lock())
+        self.lock_users[map_id] = self.lock_users.get(map_id, 0) + 1
+        try:
+            async with lock:
+                # Another request may have loaded it while we waited
+                image = self._fresh(map_id)
+                if image is not None:
+                    self.hits += 1
+                    return image
+                return await self._load(map_id)
+        finally:
+            users = self.lock_users[map_id] - 1
+            if users:
+                self.lock_users[map_id] = users
+            else:
+                del self.lock_users[map_id]
+                del self.locks[map_id]
+
+    async def _load(self, map_id: int) -> Optional[MapImage]:
+        """Read a map image from the database; called with the map's lock held."""
+        version = self.versions.get(map_id, 0)
+        result = await execute_raw_query("maint", MAP_IMAGE_QUERY, map_id)
+        if not result or not result[0]["img_data"]:
+            return None
+        data = bytes(result[0]["img_data"])
+        etag, width, height = await asyncio.to_thread(_inspect, data)
+        image = MapImage(map_id, version, data, result[0]["x_format"], etag, width, height)
+        if version == self.versions.get(map_id, 0):
+            self.images[map_id] = image
+            self.images.move_to_end(map_id)
+            while len(self.images) > self.max_images:
+                self.images.popitem(last=False)
+        self.loads += 1
+        logger.debug(f"Loaded map {map_id} image ({len(data)} bytes, {width}x{height})")
+        return image
+
+    async def get_decoded(self, map_id: int) -> Optional[Tuple[MapImage, Image.Image]]:
+        """
+        Get a map image decoded by PIL. Treat the returned image as read-only.
+        """
+        image = await self.get(map_id)
+        if image is None:
+            return None
+        self._expire_decoded()
+        key = (map_id, image.version)
+        entry = self.decoded.pop(key, None)
+        if entry is None:
+            decoded = await asyncio.to_thread(_decode, image.data)
+            self.decodes += 1
+            size = _decoded_bytes(decoded)
+        else:
+            decoded, size, _used = entry
+            self.decoded_bytes -= size
+        if size <= self.max_decoded_bytes:
+            previous = self.decoded.pop(key, None)
+            if previous is not None:
+                # Decoded concurrently by another request
+                self.decoded_bytes -= previous[1]
+            self.decoded[key] = (decoded, size, time.monotonic())
+            self.decoded_bytes += size
+            while self.decoded_bytes > self.max_decoded_bytes:
+                _key, (_image, evicted, _used) = self.decoded.popitem(last=False)
+                self.decoded_bytes -= evicted
+        return image, decoded
+
+    def _expire_decoded(self):
+        """Drop decoded images not used within decoded_ttl (oldest use first)."""
+        cutoff = time.monotonic() - self.decoded_ttl
+        while self.decoded:
+            key, (_image, size, used) = next(iter(self.decoded.items()))
+            if used >= cutoff:
+                break
+            del self.decoded[key]
+            self.decoded_bytes -= size
+
+    async def _derived(self, key: tuple, map_id: int, build, *args) -> Optional[Tuple[MapImage, bytes]]:
+        image = await self.get(map_id)
+        if image is None:
+            return None
+        key = (map_id, image.version) + key
+        data = self.derived.get(key)
+        if data is not None:
+            self.derived_hits += 1
+            self.derived.move_to_end(key)
+            return image, data
+
+        decoded = await self.get_decoded(map_id)
+        if decoded is None:
+            return None
+        data = await asyncio.to_thread(build, decoded[1], *args)
+        self.derived_builds += 1
+        if len(data) <= self.max_derived_bytes and image.version == self.versions.get(map_id, 0):
+            previous = self.derived.pop(key, None)
+            if previous is not None:
+                # Built concurrently by another request
+                self.derived_bytes -= len(previous)
+            self.derived[key] = data
+            self.derived_bytes += len(data)
+            while self.derived_bytes > self.max_derived_bytes:
+                _key, evicted = self.derived.popitem(last=False)
+                self.derived_bytes -= len(evicted)
+        return image, data
+
+    async def get_thumbnail(self, map_id: int, max_size: int) -> Optional[Tuple[str, bytes, str]]:
+        """
+        Get a map image scaled to fit a square of one of THUMBNAIL_SIZES.
+
+        Args:
+            map_id: Map ID
+            max_size: Longest edge wanted; rounded up to the next THUMBNAIL_SIZES entry
+
+        Returns:
+            Optional[tuple]: (ETag, encoded bytes, PIL format) or None if the map has no image
+        """
+        size = next((s for s in THUMBNAIL_SIZES if s >= max_size), THUMBNAIL_SIZES[-1])
+        image = await self.get(map_id)
+        if image is None:
+            return None
+        x_format = "JPEG" if pil_format(image.x_format) == "JPEG" else "PNG"
+        if image.width and image.height and max(image.width, image.height) <= size:
+            if pil_format(image.x_format) == x_format:
+                return image.etag, image.data, x_format
+        result = await self._derived(("thumb", size), map_id, _scale, size, x_format)
+        if result is None:
+            return None
+        return f'{result[0].etag[:-1]}-{size}"', result[1], x_format
+
+    async def get_crop(self, map_id: int, box: Tuple[int, int, int, int],
+                       x_format: Optional[str] = None) -> Optional[Tuple[MapImage, bytes]]:
+        """
+        Get a pixel crop (left, upper, right, lower) of a map image, encoded like the source.
+        """
+        image = await self.get(map_id)
+        if image is None:
+            return None
+        target = pil_format(x_format or image.x_format)
+        return await self._derived(("crop", box, target), map_id, _crop, box, target)
+
+    def invalidate(self, map_id: Optional[int] = None):
+        """Drop a map (or every map) and everything derived from it."""
+        if map_id is None:
+            for cached_id in set(self.versions) | set(self.images):
+                self.versions[cached_id] = self.versions.get(cached_id, 0) + 1
+            self.images.clear()
+            self.decoded.clear()
+            self.decoded_bytes = 0
+            self.derived.clear()
+            self.derived_bytes = 0
+            return
+        self.versions[map_id] = self.versions.get(map_id, 0) + 1
+        self.images.pop(map_id, None)
+        for key in [k for k in self.decoded if k[0] == map_id]:
+            self.decoded_bytes -= self.decoded.pop(key)[1]
+        for key in [k for k in self.derived if k[0] == map_id]:
+            self.derived_bytes -= len(self.derived.pop(key))
+
+    def get_stats(self) -> dict:
+        """
+        Get cache statistics.
+
+        Returns:
+            dict: Entry counts and hit/load counters
+        """
+        return {
+            'images': len(self.images),
+            'decoded': len(self.decoded),
+            'decoded_bytes': self.decoded_bytes,
+            'loading': len(self.locks),
+            'derived': len(self.derived),
+            'derived_bytes': self.derived_bytes,
+            'cached_bytes': sum(len(image.data) for image in self.images.values()),
+            'hits': self.hits,
+            'loads': self.loads,
+            'decodes': self.decodes,
+            'derived_hits': self.derived_hits,
+            'derived_builds': self.derived_builds
+        }
+
+# Process-wide cache shared by the map and zone routes
+map_image_cache = MapImageCache()
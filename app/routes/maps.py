@@ -1,7 +1,7 @@
 # Name: maps.py
-# Version: 0.1.15
+# Version: 0.1.17
 # Created: 971201
-# Modified: 250719
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin, TC and Nexus, Claude AI & AI Assistant
 # Description: Python script for ParcoRTLS backend with pure coordinate-based map cropping functionality - TBI-friendly - Updated to use centralized configuration
@@ -12,6 +12,11 @@
 
 """
 Maps management endpoints for ParcoRTLS FastAPI application.
+# CHANGED: Bumped version from 0.1.16 to 0.1.17
+# REMOVED: Unused Response import
+# CHANGED: Bumped version from 0.1.15 to 0.1.16
+# ADDED: Map images served from the shared map_image_cache with ETag/Cache-Control, get_map_thumbnail endpoint
+# CHANGED: get_image_metadata and create_coordinate_crop use cached image size, decoded image and crop LRU
 # CHANGED: Bumped version from 0.1.14 to 0.1.15
 # FIXED: Syntax errors - unclosed parenthesis on line 600 and incomplete decorator on line 845
 # REMOVED: Duplicate get_map_bounds_3d endpoint definition
@@ -25,16 +30,15 @@ Maps management endpoints for ParcoRTLS FastAPI application.
 #
 # Licensed under AGPL-3.0: https://www.gnu.org/licenses/agpl-3.0.en.html
 """
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, HTTPException, Header, Query
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from database.db import call_stored_procedure, execute_raw_query
+from routes.map_image_cache import map_image_cache, conditional_response
 import logging
 
 from pathlib import Path
 
-from PIL import Image
-import io
 import asyncpg
 
 # Import centralized configuration
@@ -110,22 +114,41 @@ async def get_maps():
     description=load_description("get_map"),
     tags=["triggers"]
 )
-async def get_map(map_id: int):
+async def get_map(map_id: int, if_none_match: Optional[str] = Header(None)):
     try:
-        query = "SELECT img_data, x_format FROM maps WHERE i_map = $1;"
-        result = await execute_raw_query("maint", query, map_id)
+        image = await map_image_cache.get(map_id)
 
-        if not result or not result[0]["img_data"]:
+        if image is None:
             logger.warning(f"No image found for map_id={map_id}")
             raise HTTPException(status_code=404, detail="Map image not found")
 
-        img_data = result[0]["img_data"]
-        img_format = result[0]["x_format"] or "png"
-        return Response(content=img_data, media_type=f"image/{img_format.lower()}")
+        img_format = image.x_format or "png"
+        return conditional_response(if_none_match, image.etag, image.data, f"image/{img_format.lower()}")
     except Exception as e:
         logger.error(f"Error retrieving map image: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving map image")
 
+@router.get(
+    "/get_map_thumbnail/{map_id}",
+    summary="Retrieves a scaled-down copy of a map image for previews and map lists",
+    description="Returns the map image scaled to fit within max_size pixels (rounded up to 256, 512, 1024 or 2048). Thumbnails are generated once per map version and cached.",
+    tags=["triggers"]
+)
+async def get_map_thumbnail(map_id: int, max_size: int = Query(512, ge=1), if_none_match: Optional[str] = Header(None)):
+    try:
+        result = await map_image_cache.get_thumbnail(map_id, max_size)
+        if result is None:
+            logger.warning(f"No image found for map_id={map_id}")
+            raise HTTPException(status_code=404, detail="Map image not found")
+
+        etag, data, img_format = result
+        return conditional_response(if_none_match, etag, data, f"image/{img_format.lower()}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving map thumbnail: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving map thumbnail")
+
 @router.get(
     "/get_map_data/{zone_id}",
     summary="Retrieves map data (image URL and bounds) for a specific zone in the ParcoRTLS system",
@@ -195,6 +218,7 @@ async def add_map(request: MapAddRequest):
 async def delete_map(map_id: int):
     try:
         result = await call_stored_procedure("maint", "usp_map_delete", map_id)
+        map_image_cache.invalidate(map_id)
         if result:
             logger.info(f"Map {map_id} deleted successfully")
             return {"message": f"Map {map_id} deleted successfully"}
@@ -438,18 +462,14 @@ async def get_campus_zones(campus_id: int):
 @router.get("/get_image_metadata/{map_id}")
 async def get_image_metadata(map_id: int):
     try:
-        query = "SELECT img_data, x_format FROM maps WHERE i_map = $1;"
-        result = await execute_raw_query("maint", query, map_id)
-        if not result:
+        image = await map_image_cache.get(map_id)
+        if image is None:
             raise HTTPException(status_code=404, detail="Map not found")
         
-        img_data, file_format = result[0]["img_data"], result[0]["x_format"]
-        image = Image.open(io.BytesIO(img_data))
-        
         return {
             "width": image.width,
             "height": image.height,
-            "format": file_format
+            "format": image.x_format
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -622,7 +642,7 @@ async def create_coordinate_crop(request: CoordinateCropRequest):
         # 1. Validate source map exists and get its metadata
         source_map_query = """
             SELECT i_map, x_nm_map, min_x, min_y, min_z, max_x, max_y, max_z, 
-                   lat_origin, lon_origin, img_data, x_format
+                   lat_origin, lon_origin, x_format
             FROM maps WHERE i_map = $1
         """
         source_map_result = await execute_raw_query("maint", source_map_query, request.source_map_id)
@@ -650,9 +670,11 @@ async def create_coordinate_crop(request: CoordinateCropRequest):
         source_width = source_map['max_x'] - source_map['min_x']
         source_height = source_map['max_y'] - source_map['min_y']
         
-        # Get actual image dimensions
-        source_image = Image.open(io.BytesIO(source_map['img_data']))
-        img_width, img_height = source_image.size
+        # Get actual image dimensions (from the cached image header)
+        source_image = await map_image_cache.get(request.source_map_id)
+        if source_image is None:
+            raise HTTPException(status_code=404, detail=f"Source map {request.source_map_id} has no image")
+        img_width, img_height = source_image.width, source_image.height
         
         # Calculate scale factors from coordinate space to pixels
         pixels_per_foot_x = img_width / source_width
@@ -679,16 +701,17 @@ async def create_coordinate_crop(request: CoordinateCropRequest):
                 detail=f"Crop area extends beyond image bounds"
             )
         
-        # Perform the actual image crop
+        # Perform the actual image crop (decoded source and crop results are cached)
         try:
-            cropped_image = source_image.crop((crop_pixel_x1, crop_pixel_y1_flipped, crop_pixel_x2, crop_pixel_y2_flipped))
-            logger.info(f"Cropped image size: {cropped_image.size}")
-            
-            # Convert cropped image to bytes
-            img_buffer = io.BytesIO()
-            cropped_image.save(img_buffer, format=source_map['x_format'])
-            cropped_img_data = img_buffer.getvalue()
+            crop_box = (crop_pixel_x1, crop_pixel_y1_flipped, crop_pixel_x2, crop_pixel_y2_flipped)
+            crop_result = await map_image_cache.get_crop(request.source_map_id, crop_box, source_map['x_format'])
+            if crop_result is None:
+                raise HTTPException(status_code=404, detail=f"Source map {request.source_map_id} has no image")
+            cropped_img_data = crop_result[1]
+            logger.info(f"Cropped image size: {crop_pixel_x2 - crop_pixel_x1}x{crop_pixel_y2_flipped - crop_pixel_y1_flipped}")
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Image cropping failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Image cropping failed: {str(e)}")
@@ -1,9 +1,11 @@
 # Name: maps_upload.py
-# Version: 0.1.1
+# Version: 0.1.3
 # Created: 971201
-# Modified: 250502
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
+# Version 0.1.3 Removed unused Response import
+# Version 0.1.2 map_image served from the shared map image cache with ETag, cache invalidated on upload and delete
 # Version 0.1.1 Converted to external descriptions using load_description()
 # Description: Python script for ParcoRTLS backend
 # Location: /home/parcoadmin/parco_fastapi/app/routes
@@ -24,9 +26,10 @@
 #
 # Licensed under AGPL-3.0: https://www.gnu.org/licenses/agpl-3.0.en.html
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header
 from database.db import execute_raw_query
+from routes.map_image_cache import map_image_cache, conditional_response
+from typing import Optional
 from datetime import datetime
 import logging
 
@@ -90,6 +93,7 @@ async def upload_map(
         )
 
         if result:
+            map_image_cache.invalidate(result[0]["i_map"])
             logger.info(f"Map uploaded successfully: ID {result[0]['i_map']}")
             return {"message": "Map uploaded successfully", "map_id": result[0]["i_map"]}
         else:
@@ -106,15 +110,13 @@ async def upload_map(
     description=load_description("get_map_image"),
     tags=["triggers"]
 )
-async def get_map_image(map_id: int):
-    query = "SELECT img_data, x_format FROM maps WHERE i_map = $1;"
+async def get_map_image(map_id: int, if_none_match: Optional[str] = Header(None)):
     try:
-        result = await execute_raw_query("maint", query, map_id)
-        if not result:
+        image = await map_image_cache.get(map_id)
+        if image is None:
             raise HTTPException(status_code=404, detail="Map not found")
 
-        img_data, file_format = result[0]["img_data"], result[0]["x_format"]
-        return Response(content=img_data, media_type=f"image/{file_format.lower()}")
+        return conditional_response(if_none_match, image.etag, image.data, f"image/{image.x_format.lower()}")
     except Exception as e:
         logger.error(f"Error retrieving map image: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving map image")
@@ -168,6 +170,7 @@ async def delete_map(map_id: int):
     try:
         query = "DELETE FROM maps WHERE i_map = $1 RETURNING i_map;"
         result = await execute_raw_query("maint", query, map_id)
+        map_image_cache.invalidate(map_id)
 
         if result:
             logger.info(f"Map deleted successfully: ID {map_id}")
@@ -1,7 +1,7 @@
 # Name: openai_trigger_api.py
-# Version: 0.4.0
+# Version: 0.4.1
 # Created: 250617
-# Modified: 250705
+# Modified: 261018
 # Author: ParcoAdmin + QuantumSage AI
 # Modified By: ParcoAdmin + Claude
 # Purpose: Enhanced TETSE Rule Management with delete functionality, proximity conditions, layered triggers, and zone transitions
@@ -10,6 +10,7 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.4.1 - NOTIFY tetse_rule_changes after rule inserts and deletes so the TETSE registry reloads the rule, bumped from 0.4.0
 # Version: 0.4.0 - Added delete_tetse_rule and delete_tetse_rules endpoints for rule deletion, bumped from 0.3.3
 # Version: 0.3.3 - Added get_tetse_rules endpoint for TETSE to Triggers tab
 # Version: 0.3.1 - Added get_tetse_rules endpoint for TETSE to Triggers tab
@@ -52,6 +53,7 @@ from typing import List
 from database.db import get_async_db_pool
 from .tetse_rule_interpreter import parse_natural_language
 from .tetse_rule_adapter import adapt_rulebuilder_to_tetse
+from .tetse_rule_registry import notify_rule_change
 from .llm_bridge import ask_openai
 from .mqtt_actions import MQTTClient
 from manager.line_limited_logging import LineLimitedFileHandler
@@ -167,6 +169,7 @@ async def handle_zone_entry_monitoring_rule(parsed_rule, input_data, data_pool,
             )
         
         logger.info(f"Successfully created zone entry monitoring rule ID {rule_id}")
+        await notify_rule_change(rule_id)
         
         return {
             "success": True,
@@ -305,6 +308,7 @@ async def delete_tetse_rule(rule_id: int, data_pool: asyncpg.Pool = Depends(get_
                 raise HTTPException(status_code=500, detail=f"Failed to delete TETSE rule {rule_id}")
             
         logger.info(f"Successfully deleted TETSE rule {rule_id}: {rule_info['name']}")
+        await notify_rule_change(rule_id)
         
         return {
             "success": True,
@@ -380,6 +384,8 @@ async def delete_tetse_rules(input_data: DeleteRulesInput, data_pool: asyncpg.Po
         ]
         
         logger.info(f"Successfully deleted {deleted_count} TETSE rules")
+        if deleted_count:
+            await notify_rule_change()
         
         return {
             "success": True,
@@ -518,6 +524,7 @@ async def handle_proximity_condition_rule(parsed_rule, input_data, data_pool, ma
         
         rule_id = result["id"]
         logger.info(f"Successfully created proximity condition rule ID {rule_id}")
+        await notify_rule_change(rule_id)
         
         return {
             "success": True,
@@ -581,6 +588,7 @@ async def handle_layered_trigger_rule(parsed_rule, input_data, data_pool, maint_
         
         rule_id = result["id"]
         logger.info(f"Successfully created layered trigger rule ID {rule_id}")
+        await notify_rule_change(rule_id)
         
         return {
             "success": True,
@@ -642,6 +650,7 @@ async def handle_zone_transition_rule(parsed_rule, input_data, data_pool, maint_
         
         rule_id = result["id"]
         logger.info(f"Successfully created zone transition rule ID {rule_id}")
+        await notify_rule_change(rule_id)
         
         return {
             "success": True,
@@ -739,6 +748,7 @@ async def handle_zone_stay_rule(parsed_rule, input_data, data_pool, maint_pool):
             )
 
         logger.info(f"Successfully created zone stay rule ID {rule_id} for {tetse_rule['subject_id']} in Zone {tetse_rule['zone']}")
+        await notify_rule_change(rule_id)
         return {
             "success": True,
             "message": "Zone stay rule created successfully", 
@@ -0,0 +1,142 @@
+# Name: pagination.py
+# Version: 0.1.0
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Keyset (cursor) pagination helpers and streamed JSON page responses for history-style endpoints
+# Location: /home/parcoadmin/parco_fastapi/app/routes
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+"""
+Keyset Pagination Helpers
+
+Per-entity history endpoints (event_log, textdata, positionhistory) return one
+page at a time instead of every row the entity ever produced:
+
+- a page is fetched with LIMIT page_size + 1 on an index ordered like the
+  query, so each page costs the same however deep the client has paged
+- the continuation point is an opaque cursor: the (timestamp, key) of the last
+  row returned, base64url encoded. key is the row ID where the table has one,
+  otherwise the number of rows already returned at that timestamp
+- the body stays a plain JSON list, so existing clients keep working; the
+  cursor for the next page is sent in the X-Next-Cursor header (absent on the
+  last page)
+- large pages are encoded and sent in chunks through a StreamingResponse
+  instead of being built as one JSON document
+"""
+
+import base64
+import binascii
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+PAGE_DEFAULT = 1000         # Rows per page when the client does not ask
+PAGE_MAX = 10000            # Largest page a client may ask for
+PAGE_STREAM_THRESHOLD = 500 # Pages with more rows than this are streamed
+STREAM_CHUNK_ROWS = 500     # Rows encoded per streamed chunk
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PAGE_SIZE_HEADER = "X-Page-Size"
+
+Cursor = Tuple[datetime, int]
+
+def encode_cursor(ts: datetime, key: int) -> str:
+    """Opaque cursor for the row at (ts, key)."""
+    raw = json.dumps({"ts": ts.isoformat(), "k": int(key)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    """
+    Decode a cursor from encode_cursor().
+
+    Raises:
+        HTTPException (400): When the cursor is not one of ours
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return datetime.fromisoformat(payload["ts"]), int(payload["k"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Rejected pagination cursor '{cursor}': {str(e)}")
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def next_id_cursor(rows: List[Dict[str, Any]], limit: int, ts_field: str, id_field: str) -> Optional[str]:
+    """
+    Trim a LIMIT limit + 1 result to the page and return the cursor after it.
+
+    For queries ordered by (ts_field, id_field); None when this is the last page.
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return encode_cursor(last[ts_field], last[id_field])
+
+def next_offset_cursor(rows: List[Dict[str, Any]], limit: int, ts_field: str,
+                       cursor: Optional[Cursor]) -> Optional[str]:
+    """
+    Trim a LIMIT limit + 1 result to the page and return the cursor after it.
+
+    For tables without a row ID: the cursor keeps the last timestamp and how
+    many rows at that timestamp were already returned, which the next query
+    skips with OFFSET.
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last_ts = rows[-1][ts_field]
+    seen = 0
+    for row in reversed(rows):
+        if row[ts_field] != last_ts:
+            break
+        seen += 1
+    if seen == len(rows) and cursor is not None and cursor[0] == last_ts:
+        # The whole page sat on the cursor's timestamp
+        seen += cursor[1]
+    return encode_cursor(last_ts, seen)
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+async def _stream_rows(rows: Sequence[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    yield b"["
+    for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+        chunk = ",".join(_dumps(row) for row in rows[start:start + STREAM_CHUNK_ROWS])
+        yield ((b"," if start else b"") + chunk.encode("utf-8"))
+    yield b"]"
+
+def page_response(rows: Sequence[Dict[str, Any]], next_cursor: Optional[str]) -> Response:
+    """
+    JSON list response for one page, with the next cursor in X-Next-Cursor.
+
+    Rows are encoded directly (datetime as ISO 8601, numeric as float) rather
+    than validated through a response model.
+    """
+    headers = {PAGE_SIZE_HEADER: str(len(rows))}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    if len(rows) > PAGE_STREAM_THRESHOLD:
+        return StreamingResponse(_stream_rows(rows), media_type="application/json", headers=headers)
+    return Response(content=_dumps(list(rows)), media_type="application/json", headers=headers)
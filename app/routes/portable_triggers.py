@@ -1,8 +1,8 @@
 # /home/parcoadmin/parco_fastapi/app/routes/portable_triggers.py
 # Name: portable_triggers.py
-# Version: 0.1.5
+# Version: 0.1.7
 # Created: 250607
-# Modified: 250711
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: FastAPI routes for managing portable triggers in ParcoRTLS
@@ -11,6 +11,8 @@
 # Status: Active
 # Dependent: TRUE
 #
+# Version 0.1.7 - Edit endpoints notify only the zones of the edited trigger, bumped from 0.1.6
+# Version 0.1.6 - Send trigger_changes NOTIFY after portable trigger writes and from /api/reload_triggers, bumped from 0.1.5
 # Version 0.1.5 - Added edit endpoints for portable trigger name, radius, and zone, bumped from 0.1.4
 # Version 0.1.4 - Simplified /api/reload_triggers endpoint, bumped from 0.1.3
 # Version 0.1.3 - Added /api/reload_triggers endpoint, bumped from 0.1.2
@@ -32,6 +34,7 @@ from pydantic import BaseModel
 import asyncpg
 import logging
 from database.db import execute_raw_query
+from routes.trigger import notify_trigger_change
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["portable_triggers"])
@@ -137,6 +140,7 @@ async def add_portable_trigger(request: TriggerAddRequest):
         )
         trigger_id = result[0]["i_trg"]
         logger.info(f"Portable trigger {trigger_id} created: {request.name}")
+        await notify_trigger_change(request.zone_id)
         return {"message": "Portable trigger added successfully", "trigger_id": trigger_id}
     except asyncpg.exceptions.UniqueViolationError:
         logger.error(f"Trigger name '{request.name}' already exists")
@@ -190,7 +194,7 @@ async def edit_trigger_name(trigger_id: int, request: TriggerNameEditRequest):
     logger.debug(f"Received edit_trigger_name request for trigger {trigger_id}: {request.dict()}")
     try:
         # Check if trigger exists and is portable
-        check_query = "SELECT is_portable FROM triggers WHERE i_trg = $1"
+        check_query = "SELECT is_portable, i_zn FROM triggers WHERE i_trg = $1"
         trigger_check = await execute_raw_query("maint", check_query, trigger_id)
         if not trigger_check:
             raise HTTPException(status_code=404, detail=f"Trigger {trigger_id} not found")
@@ -202,6 +206,7 @@ async def edit_trigger_name(trigger_id: int, request: TriggerNameEditRequest):
         await execute_raw_query("maint", update_query, request.name, trigger_id)
         
         logger.info(f"Trigger {trigger_id} name updated to: {request.name}")
+        await notify_trigger_change(trigger_check[0]["i_zn"])
         return {"message": "Trigger name updated successfully"}
     except asyncpg.exceptions.UniqueViolationError:
         logger.error(f"Trigger name '{request.name}' already exists")
@@ -259,7 +264,7 @@ async def edit_trigger_radius(trigger_id: int, request: TriggerRadiusEditRequest
             raise HTTPException(status_code=400, detail="radius_ft must be positive")
 
         # Check if trigger exists and is portable
-        check_query = "SELECT is_portable FROM triggers WHERE i_trg = $1"
+        check_query = "SELECT is_portable, i_zn FROM triggers WHERE i_trg = $1"
         trigger_check = await execute_raw_query("maint", check_query, trigger_id)
         if not trigger_check:
             raise HTTPException(status_code=404, detail=f"Trigger {trigger_id} not found")
@@ -271,6 +276,7 @@ async def edit_trigger_radius(trigger_id: int, request: TriggerRadiusEditRequest
         await execute_raw_query("maint", update_query, request.radius_ft, trigger_id)
         
         logger.info(f"Trigger {trigger_id} radius updated to: {request.radius_ft}ft")
+        await notify_trigger_change(trigger_check[0]["i_zn"])
         return {"message": "Trigger radius updated successfully"}
     except Exception as e:
         logger.error(f"Error updating trigger radius: {str(e)}")
@@ -321,7 +327,7 @@ async def edit_trigger_zone(trigger_id: int, request: TriggerZoneEditRequest):
     logger.debug(f"Received edit_trigger_zone request for trigger {trigger_id}: {request.dict()}")
     try:
         # Check if trigger exists and is portable
-        check_query = "SELECT is_portable FROM triggers WHERE i_trg = $1"
+        check_query = "SELECT is_portable, i_zn FROM triggers WHERE i_trg = $1"
         trigger_check = await execute_raw_query("maint", check_query, trigger_id)
         if not trigger_check:
             raise HTTPException(status_code=404, detail=f"Trigger {trigger_id} not found")
@@ -339,6 +345,14 @@ async def edit_trigger_zone(trigger_id: int, request: TriggerZoneEditRequest):
         await execute_raw_query("maint", update_query, request.zone_id, trigger_id)
         
         logger.info(f"Trigger {trigger_id} zone updated to: {request.zone_id}")
+        # The trigger leaves its old zone and joins the new one
+        old_zone_id = trigger_check[0]["i_zn"]
+        if old_zone_id is None:
+            await notify_trigger_change()
+        else:
+            await notify_trigger_change(old_zone_id)
+            if old_zone_id != request.zone_id:
+                await notify_trigger_change(request.zone_id)
         return {"message": "Trigger zone updated successfully"}
     except Exception as e:
         logger.error(f"Error updating trigger zone: {str(e)}")
@@ -375,11 +389,12 @@ async def reload_triggers():
 
     Hint:
         - Called after adding or updating triggers via /api/add_portable_trigger or /api/add_trigger.
-        - Relies on manager runtime to reload triggers (e.g., via parser_data_arrived).
+        - Sends a trigger_changes NOTIFY; managers reload triggers on their next message (parser_data_arrived).
     """
     logger.info("Received reload_triggers request")
     try:
-        # No direct call to load_triggers; manager reloads triggers via runtime logic
+        # Managers LISTEN on the trigger change channel and reload on their next message
+        await notify_trigger_change()
         logger.info("Triggers reload signaled successfully")
         return {"message": "Triggers reload signaled successfully"}
     except Exception as e:
@@ -1,9 +1,10 @@
 # Name: region.py
-# Version: 0.1.1
+# Version: 0.1.2
 # Created: 971201
-# Modified: 250502
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
+# Version 0.1.2 Invalidate the in-memory zone geometry index after region writes
 # Version 0.1.1 Converted to external descriptions using load_description()
 # Description: Python script for ParcoRTLS backend
 # Location: /home/parcoadmin/parco_fastapi/app/routes
@@ -32,6 +33,7 @@ Region management endpoints for ParcoRTLS FastAPI application.
 from fastapi import APIRouter, HTTPException
 from database.db import call_stored_procedure, DatabaseError, execute_raw_query
 from models import RegionRequest
+from manager.zone_index import zone_index_cache
 import logging
 
 from pathlib import Path
@@ -66,6 +68,7 @@ async def add_region(request: RegionRequest):
             request.region_id, request.zone_id, request.region_name, request.max_x, request.max_y, request.max_z,
             request.min_x, request.min_y, request.min_z, request.trigger_id
         )
+        zone_index_cache.invalidate()
         if result and isinstance(result, (int, str)):
             return {"message": "Region added successfully", "region_id": result[0]["i_rgn"] if isinstance(result, list) and result else result}
         raise HTTPException(status_code=500, detail="Failed to add region")
@@ -85,6 +88,7 @@ async def add_region(request: RegionRequest):
 async def delete_region(region_id: int):
     try:
         result = await call_stored_procedure("maint", "usp_region_delete", region_id)
+        zone_index_cache.invalidate()
         if result and isinstance(result, (int, str)):
             return {"message": "Region deleted successfully"}
         raise HTTPException(status_code=500, detail="Failed to delete region")
@@ -108,6 +112,7 @@ async def edit_region(request: RegionRequest):
             request.region_id, request.zone_id, request.region_name, request.max_x, request.max_y, request.max_z,
             request.min_x, request.min_y, request.min_z, request.trigger_id
         )
+        zone_index_cache.invalidate()
         if result and isinstance(result, (int, str)):
             return {"message": "Region edited successfully"}
         raise HTTPException(status_code=500, detail="Failed to edit region")
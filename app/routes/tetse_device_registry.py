@@ -1,7 +1,7 @@
 # Name: tetse_device_registry.py
-# Version: 0.1.10
+# Version: 0.1.12
 # Created: 250623
-# Modified: 250704
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: TETSE Device Registry - Maps physical tags to virtual subjects with database persistence
@@ -22,18 +22,12 @@ Virtual Device Ranges:
 - Zone Type: 901 ("Virtual Subject Zone")
 """
 
-# Import centralized configuration
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import get_server_host, get_db_configs_sync
-
 import logging
-import asyncpg
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional, Dict, List
-from database.db import get_async_db_pool
+from routes.tetse_data import get_maint_pool
+from manager.zone_index import zone_index_cache
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -58,19 +52,6 @@ class CreateMappingRequest(BaseModel):
     subject_name: str
     campus_id: int = 422
 
-async def get_maint_pool():
-    """Get ParcoRTLSMaint database pool using centralized configuration"""
-    server_host = get_server_host()
-    db_configs = get_db_configs_sync()
-    maint_config = db_configs['maint']
-    conn_string = f"postgresql://{maint_config['user']}:{maint_config['password']}@{server_host}:{maint_config['port']}/{maint_config['database']}"
-    
-    return await asyncpg.create_pool(
-        conn_string,
-        min_size=1,
-        max_size=10
-    )
-
 async def get_next_virtual_device_id() -> str:
     """Generate next available virtual device ID in range 900-999"""
     pool = await get_maint_pool()
@@ -93,8 +74,6 @@ async def get_next_virtual_device_id() -> str:
             raise HTTPException(status_code=400, detail="Virtual device range exhausted")
             
         return f"{next_id}v"
-    
-    await pool.close()
 
 async def get_next_virtual_zone_id() -> int:
     """Generate next available virtual zone ID in range 9000-9999"""
@@ -114,8 +93,6 @@ async def get_next_virtual_zone_id() -> int:
             if next_id > VIRTUAL_ZONE_RANGE[1]:
                 raise HTTPException(status_code=400, detail="Virtual zone range exhausted")
             return next_id
-    
-    await pool.close()
 
 @router.post("/mapping", response_model=DeviceMapping)
 async def create_device_mapping(request: CreateMappingRequest):
@@ -161,7 +138,7 @@ async def create_device_mapping(request: CreateMappingRequest):
                     VALUES ($1, $2, $3, NOW(), false, $4)
                 """, virtual_device_id, VIRTUAL_DEVICE_TYPE, request.physical_id, virtual_zone_id)
         
-        await pool.close()
+        zone_index_cache.invalidate()
         
         return DeviceMapping(
             physical_id=request.physical_id,
@@ -198,8 +175,6 @@ async def get_device_mapping(physical_id: str):
             
             if not mapping or not mapping["virtual_id"]:
                 return None
-                
-        await pool.close()
         
         return DeviceMapping(**dict(mapping))
         
@@ -228,8 +203,6 @@ async def get_all_mappings():
                 ORDER BY v.x_id_dev
             """, VIRTUAL_DEVICE_TYPE, VIRTUAL_ZONE_TYPE)
         
-        await pool.close()
-        
         return [DeviceMapping(**dict(mapping)) for mapping in mappings]
         
     except Exception as e:
@@ -256,8 +229,6 @@ async def update_subject_zone(physical_id: str, zone_id: int):
             if result == "UPDATE 0":
                 raise HTTPException(status_code=404, detail=f"No mapping found for device {physical_id}")
         
-        await pool.close()
-        
         return {"success": True, "message": f"Updated zone for {physical_id} to {zone_id}"}
         
     except Exception as e:
@@ -293,7 +264,7 @@ async def delete_device_mapping(physical_id: str):
                     DELETE FROM zones WHERE i_zn = $1 AND i_typ_zn = $2
                 """, virtual_device["zone_id"], VIRTUAL_ZONE_TYPE)
         
-        await pool.close()
+        zone_index_cache.invalidate()
         
         return {"success": True, "message": f"Deleted mapping for {physical_id}"}
         
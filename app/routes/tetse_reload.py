@@ -1,7 +1,7 @@
 # Name: tetse_reload.py
-# Version: 0.1.0
+# Version: 0.1.1
 # Created: 971201
-# Modified: 250502
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: ParcoRTLS backend script
@@ -10,6 +10,8 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.1 - Reload through the subject-indexed tetse_rule_registry; ACTIVE_TETSE_RULES kept as a flat view, bumped from 0.1.0
+
 # File: tetse_reload.py
 # Version: 0.2.1
 # Created: 250616
@@ -21,7 +23,7 @@
 import asyncio
 import logging
 import os
-from routes import tetse_rule_loader
+from routes.tetse_rule_registry import tetse_rule_registry
 from logging.handlers import RotatingFileHandler
 
 # Setup logging
@@ -40,20 +42,25 @@ file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelnam
 logger.handlers = [console_handler, file_handler]
 logger.propagate = False
 
-# Shared singleton rule cache
+# Rule list as of the last reload_rules() call, for callers that list rules;
+# evaluation looks rules up by subject in tetse_rule_registry.rule_set, which
+# NOTIFY-driven reloads also keep current
 ACTIVE_TETSE_RULES = []
 
-async def reload_rules():
+async def reload_rules(full: bool = False):
     """
-    Reload rules from DB into shared cache.
+    Reload rules from DB into the shared registry.
+
+    Args:
+        full: Re-parse every rule instead of only new or changed ones
     """
     global ACTIVE_TETSE_RULES
     try:
-        rules = await tetse_rule_loader.preload_rules()
-        ACTIVE_TETSE_RULES.clear()  # Clear existing rules
-        ACTIVE_TETSE_RULES.extend(rules)  # Add new rules
+        rule_set = await tetse_rule_registry.reload(full=full)
+        ACTIVE_TETSE_RULES = rule_set.all()
         logger.info(f"Reloaded {len(ACTIVE_TETSE_RULES)} TETSE rules")
-        logger.debug(f"Active rules: {[r.get('name', 'unnamed') for r in ACTIVE_TETSE_RULES]}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Active rules: {[r.get('name', 'unnamed') for r in ACTIVE_TETSE_RULES]}")
     except Exception as e:
         logger.error(f"Failed to reload rules: {str(e)}")
 
@@ -1,7 +1,7 @@
 # Name: tetse_rule_loader.py
-# Version: 0.1.1
+# Version: 0.1.2
 # Created: 971201
-# Modified: 250704
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
 # Description: ParcoRTLS backend script
@@ -10,6 +10,8 @@
 # Status: Active
 # Dependent: TRUE
 
+# Version: 0.1.2 - preload_rules and /tetse/reload_rules use the shared tetse_rule_registry (incremental, atomic swap) and notify rule-evaluating processes, bumped from 0.1.1
+
 # TECHNICAL DEBT: zone 422 is hardcoded
 # File: tetse_rule_loader.py
 # Version: 0.3.4
@@ -22,20 +24,16 @@
 # Location: /home/parcoadmin/parco_fastapi/app/routes
 # Update: Filtered None rules, fixed import; bumped from 0.3.3
 
-# Import centralized configuration
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import get_server_host, get_db_configs_sync
 
 import asyncio
-import asyncpg
-import json
 import logging
 from fastapi import APIRouter
 from routes.temporal_context import get_house_exclusion_context
 from routes.tetse_zone_utils import get_zone_descendants_raw
-from routes.tetse_rule_parser import parse_tetse_rule
+from routes.tetse_rule_registry import tetse_rule_registry, notify_rule_change
 from .tetse_zone_map import load_zone_map
 from logging.handlers import RotatingFileHandler
 
@@ -57,54 +55,20 @@ file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelnam
 logger.handlers = [console_handler, file_handler]
 logger.propagate = False
 
-# DB Connection using centralized configuration
-server_host = get_server_host()
-db_configs = get_db_configs_sync()
-data_config = db_configs['data']
-DATA_CONN_STRING = f"postgresql://{data_config['user']}:{data_config['password']}@{server_host}:{data_config['port']}/{data_config['database']}"
-
-async def preload_rules():
+async def preload_rules(full: bool = False):
     """
     Load all enabled rules from tlk_rules table.
+
+    Goes through the shared rule registry, so only new or changed rules are
+    parsed unless full is set.
     """
-    query = "SELECT id, name, conditions FROM tlk_rules WHERE is_enabled = TRUE"
-    rules = []
     try:
-        async with asyncpg.create_pool(DATA_CONN_STRING) as pool:
-            async with pool.acquire() as conn:
-                rows = await conn.fetch(query)
-                logger.info(f"Found {len(rows)} enabled rules in database")
-                for row in rows:
-                    try:
-                        condition_data = row["conditions"]
-                        if isinstance(condition_data, str):
-                            condition_data = json.loads(condition_data)
-                        
-                        # Enhanced debug logging
-                        logger.debug(f"Processing rule id={row['id']}, name={row['name']}")
-                        logger.debug(f"Raw condition_data: {condition_data}")
-                        logger.debug(f"Subject_id: {condition_data.get('subject_id')}")
-                        logger.debug(f"Rule_type: {condition_data.get('rule_type', 'zone_stay')}")
-                        
-                        rule = parse_tetse_rule(row["id"], row["name"], condition_data)
-                        
-                        logger.debug(f"Parsed rule result: {rule is not None}")
-                        if rule:
-                            logger.debug(f"Successfully parsed rule: {rule}")
-                            rules.append(rule)
-                        else:
-                            logger.warning(f"FAILED to parse rule id={row['id']}, name={row['name']}, skipping")
-                            logger.warning(f"Failed rule condition_data was: {condition_data}")
-                            
-                    except Exception as e:
-                        logger.error(f"Exception while parsing rule id={row['id']}: {str(e)}")
-                        logger.error(f"Exception rule condition_data was: {condition_data}")
-                        
-                logger.info(f"Successfully parsed {len(rules)} out of {len(rows)} rules")
-                        
+        rule_set = await tetse_rule_registry.reload(full=full)
+        logger.info(f"Loaded {len(rule_set)} enabled rules")
+        return rule_set.all()
     except Exception as e:
         logger.error(f"Database load failed: {str(e)}")
-    return rules
+        return []
 
 async def evaluate_house_exclusion_rule(rule):
     """
@@ -146,15 +110,21 @@ if __name__ == "__main__":
     asyncio.run(main())
 
 @router.post("/tetse/reload_rules")
-async def api_reload_rules():
+async def api_reload_rules(full: bool = False):
     """
     API endpoint to reload rules on demand.
+
+    Changed rules are parsed into a new rule set that replaces the current one
+    in a single step; pass full=true to re-parse every rule (after zone renames).
+    Processes evaluating rules are notified to reload as well.
     """
     try:
         await load_zone_map()
-        rules = await preload_rules()
-        logger.info(f"Reloaded {len(rules)} rules via API")
-        return {"status": "success", "message": f"Reloaded {len(rules)} rules"}
+        rule_set = await tetse_rule_registry.reload(full=full)
+        await notify_rule_change()
+        logger.info(f"Reloaded {len(rule_set)} rules via API")
+        return {"status": "success", "message": f"Reloaded {len(rule_set)} rules",
+                "registry": tetse_rule_registry.get_stats()}
     except Exception as e:
         logger.error(f"Failed to reload rules via API: {str(e)}")
         return {"status": "error", "message": str(e)}
\ No newline at end of file
@@ -1,7 +1,7 @@
 # Name: tetse_rule_parser.py
-# Version: 0.3.0
+# Version: 0.3.1
 # Created: 971201
-# Modified: 250621
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin + Claude
 # Description: Enhanced TETSE rule parser supporting all v0.1.92+ rule types
@@ -12,6 +12,7 @@
 
 """
 /home/parcoadmin/parco_fastapi/app/routes/tetse_rule_parser.py
+# Version: 0.3.1 - Per-rule debug output (zone map dump, parsed rule) only built when DEBUG is enabled
 # Version: 0.3.0 - Enhanced to support all v0.1.92+ rule types: zone_stay, zone_transition, layered_trigger, proximity_condition
 # Previous: 0.2.3 - Parse enriched rule JSON, map zone names to IDs using cached zone map
 # Previous: 0.2.2 - Skipped empty conditions, allowed int zone IDs
@@ -78,7 +79,9 @@ def parse_tetse_rule(id: int, name: str, conditions: dict) -> dict | None:
     Returns:
         Parsed rule dict or None if invalid
     """
-    logger.debug(f"Parsing TETSE rule id={id}, name={name}, conditions={conditions}")
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug(f"Parsing TETSE rule id={id}, name={name}, conditions={conditions}")
     
     try:
         # Skip empty conditions
@@ -88,7 +91,8 @@ def parse_tetse_rule(id: int, name: str, conditions: dict) -> dict | None:
 
         # Detect rule type from conditions
         rule_type = conditions.get("rule_type", "zone_stay")
-        logger.debug(f"Detected rule type: {rule_type} for rule id={id}")
+        if debug:
+            logger.debug(f"Detected rule type: {rule_type} for rule id={id}")
 
         # Route to appropriate parser based on rule type
         if rule_type == "zone_stay":
@@ -147,7 +151,8 @@ def parse_zone_stay_rule(id: int, name: str, conditions: dict) -> dict | None:
             rule_data["conditions"]["exclude_parent_zone"] = exclude_zone_id
 
         parsed = rule.model_dump()
-        logger.debug(f"Parsed zone stay rule: {parsed}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Parsed zone stay rule: {parsed}")
         return parsed
         
     except ValidationError as e:
@@ -171,7 +176,8 @@ def parse_zone_transition_rule(id: int, name: str, conditions: dict) -> dict | N
         rule = EnhancedRuleObject(id=id, name=name, **rule_data)
         
         parsed = rule.model_dump()
-        logger.debug(f"Parsed zone transition rule: {parsed}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Parsed zone transition rule: {parsed}")
         return parsed
         
     except ValidationError as e:
@@ -196,7 +202,8 @@ def parse_layered_trigger_rule(id: int, name: str, conditions: dict) -> dict | N
         rule = EnhancedRuleObject(id=id, name=name, **rule_data)
         
         parsed = rule.model_dump()
-        logger.debug(f"Parsed layered trigger rule: {parsed}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Parsed layered trigger rule: {parsed}")
         return parsed
         
     except ValidationError as e:
@@ -222,7 +229,8 @@ def parse_proximity_condition_rule(id: int, name: str, conditions: dict) -> dict
         rule = EnhancedRuleObject(id=id, name=name, **rule_data)
         
         parsed = rule.model_dump()
-        logger.debug(f"Parsed proximity condition rule: {parsed}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Parsed proximity condition rule: {parsed}")
         return parsed
         
     except ValidationError as e:
@@ -261,7 +269,8 @@ def parse_legacy_rule(id: int, name: str, conditions: dict) -> dict | None:
             rule_data["conditions"]["exclude_parent_zone"] = exclude_zone_id
 
         parsed = rule.model_dump()
-        logger.debug(f"Parsed legacy rule: {parsed}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Parsed legacy rule: {parsed}")
         return parsed
         
     except ValidationError as e:
@@ -341,7 +350,8 @@ def resolve_zone_id(input_val):
         return input_val
         
     zone_map = get_zone_hierarchy()
-    logger.debug(f"Zone map for input {input_val}: {zone_map}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Zone map for input {input_val}: {zone_map}")
 
     # Accept integer ID directly
     try:
@@ -0,0 +1,256 @@
+# Name: tetse_rule_registry.py
+# Version: 0.1.1
+# Created: 261018
+# Modified: 261018
+# Creator: ParcoAdmin
+# Modified By: ParcoAdmin
+# Description: Compiled TETSE rule registry indexed by subject, zone and rule type with incremental reload
+# Location: /home/parcoadmin/parco_fastapi/app/routes
+# Role: Backend
+# Status: Active
+# Dependent: TRUE
+
+# Version: 0.1.1 - Data pool and connection string come from tetse_data, bumped from 0.1.0
+
+"""
+TETSE Rule Registry
+
+Enabled tlk_rules rows are parsed once into rule dicts and kept in an
+immutable RuleSet indexed by subject, zone and rule type, so an event only
+looks at the rules of its own subject:
+
+- reload() lists (id, updated_at, digest) of the enabled rules, which is cheap,
+  and fetches and parses only rules that are new or changed; rules that were
+  deleted or disabled are dropped. full=True re-parses every rule (zone names
+  are resolved at parse time, so use it after zone changes)
+- each reload builds a new RuleSet and swaps it in with one assignment;
+  evaluation keeps using the previous RuleSet until then and never waits
+- rule writes made through the API send NOTIFY on TETSE_RULE_CHANGE_CHANNEL;
+  processes that evaluate rules listen on it and call request_reload()
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.db import notify_channel
+from .tetse_data import get_data_pool
+from .tetse_rule_parser import parse_tetse_rule
+
+logger = logging.getLogger(__name__)
+
+TETSE_RULE_CHANGE_CHANNEL = "tetse_rule_changes"
+
+# Rules parsed between yields to the event loop during a reload
+PARSE_BATCH_SIZE = 50
+
+# Change detection without reading the conditions; the digest also catches
+# writes that did not touch updated_at
+RULE_VERSIONS_QUERY = """
+    SELECT id, COALESCE(updated_at, created_at) AS updated_at,
+           md5(name || COALESCE(conditions::text, '')) AS digest
+    FROM tlk_rules
+    WHERE is_enabled = TRUE
+"""
+
+RULES_BY_ID_QUERY = """
+    SELECT id, name, conditions
+    FROM tlk_rules
+    WHERE id = ANY($1::int[]) AND is_enabled = TRUE
+"""
+
+async def notify_rule_change(rule_id: Optional[int] = None):
+    """Tell rule-evaluating processes that a rule (or every rule, when None) changed."""
+    await notify_channel("data", TETSE_RULE_CHANGE_CHANNEL, str(rule_id) if rule_id is not None else "")
+
+def _zone_keys(rule: dict) -> Iterable[Any]:
+    """Zones a rule refers to (IDs, names or layered aliases)."""
+    for field in ("zone", "from_zone", "to_zone"):
+        value = rule.get(field)
+        if value is not None:
+            yield value
+
+class RuleSet:
+    """
+    Immutable snapshot of the compiled rules with subject, zone and type indexes.
+    """
+
+    def __init__(self, rules: Dict[int, dict], versions: Dict[int, tuple]):
+        """
+        Build the snapshot.
+
+        Args:
+            rules: rule ID -> parsed rule dict
+            versions: rule ID -> (updated_at, digest) the rule was parsed from
+        """
+        self.rules = rules
+        self.versions = versions
+        by_subject: Dict[Optional[str], List[dict]] = {}
+        by_zone: Dict[Any, List[dict]] = {}
+        by_type: Dict[str, List[dict]] = {}
+        # Keep the database order for evaluation
+        for rule_id in sorted(rules):
+            rule = rules[rule_id]
+            by_subject.setdefault(rule.get("subject_id"), []).append(rule)
+            for zone in set(_zone_keys(rule)):
+                by_zone.setdefault(zone, []).append(rule)
+            by_type.setdefault(rule.get("rule_type", "zone_stay"), []).append(rule)
+        self.by_subject: Dict[Optional[str], Tuple[dict, ...]] = {k: tuple(v) for k, v in by_subject.items()}
+        self.by_zone: Dict[Any, Tuple[dict, ...]] = {k: tuple(v) for k, v in by_zone.items()}
+        self.by_type: Dict[str, Tuple[dict, ...]] = {k: tuple(v) for k, v in by_type.items()}
+        self.built_at = time.time()
+
+    @classmethod
+    def from_rules(cls, rules: Iterable[dict]) -> 'RuleSet':
+        """Build from parsed rule dicts (rules without a version are always re-parsed)."""
+        compiled = {rule["id"]: rule for rule in rules}
+        return cls(compiled, {})
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def all(self) -> List[dict]:
+        """Every rule, in rule ID order."""
+        return [self.rules[rule_id] for rule_id in sorted(self.rules)]
+
+    def for_subject(self, subject_id: Optional[str]) -> Tuple[dict, ...]:
+        return self.by_subject.get(subject_id, ())
+
+    def for_zone(self, zone: Any) -> Tuple[dict, ...]:
+        return self.by_zone.get(zone, ())
+
+    def for_type(self, rule_type: str) -> Tuple[dict, ...]:
+        return self.by_type.get(rule_type, ())
+
+class TetseRuleRegistry:
+    """
+    Holder of the current RuleSet with incremental, non-blocking reloads.
+    """
+
+    def __init__(self):
+        self.rule_set = RuleSet({}, {})
+        self.lock = asyncio.Lock()
+        self.reload_pending = False
+        self.reload_task: Optional[asyncio.Task] = None
+
+        # Counters
+        self.reload_count = 0
+        self.failed_count = 0
+        self.parsed_count = 0
+        self.parse_failures = 0
+        self.last_reload_ms = 0.0
+
+    async def reload(self, full: bool = False) -> RuleSet:
+        """
+        Bring the rules up to date with tlk_rules and swap in a new RuleSet.
+
+        Args:
+            full: Re-parse every rule instead of only new or changed ones
+
+        Returns:
+            RuleSet: The rule set in use after the reload
+
+        Raises:
+            Exception: When the rules could not be read; the previous set stays in use
+        """
+        async with self.lock:
+            start = time.perf_counter()
+            try:
+                pool = await get_data_pool()
+                async with pool.acquire() as conn:
+                    version_rows = await conn.fetch(RULE_VERSIONS_QUERY)
+                    current = self.rule_set
+                    versions = {row["id"]: (row["updated_at"], row["digest"]) for row in version_rows}
+                    changed = [rule_id for rule_id, version in versions.items()
+                               if full or current.versions.get(rule_id) != version]
+                    rows = await conn.fetch(RULES_BY_ID_QUERY, changed) if changed else []
+            except Exception:
+                self.failed_count += 1
+                raise
+
+            removed = len(set(current.versions) - set(versions))
+            if not changed and not removed:
+                # Nothing to swap; readers keep the current set
+                self.reload_count += 1
+                self.last_reload_ms = (time.perf_counter() - start) * 1000
+                return current
+
+            # Unchanged rules keep their compiled form; deleted and disabled ones drop out
+            changed_ids = set(changed)
+            rules = {rule_id: current.rules[rule_id] for rule_id in versions
+                     if rule_id in current.rules and rule_id not in changed_ids}
+            kept_versions = {rule_id: versions[rule_id] for rule_id in versions
+                             if rule_id not in changed_ids and rule_id in current.versions}
+            for count, row in enumerate(rows, 1):
+                rule = self._compile(row)
+                if rule is not None:
+                    rules[row["id"]] = rule
+                # Failed rules keep their version too, so they are only retried once they change
+                kept_versions[row["id"]] = versions[row["id"]]
+                if count % PARSE_BATCH_SIZE == 0:
+                    await asyncio.sleep(0)
+
+            self.rule_set = RuleSet(rules, kept_versions)
+            self.reload_count += 1
+            self.last_reload_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"TETSE rules reloaded: {len(rules)} active, {len(rows)} parsed, {removed} removed "
+                        f"({self.last_reload_ms:.1f} ms)")
+            return self.rule_set
+
+    def _compile(self, row) -> Optional[dict]:
+        """Parse one tlk_rules row; failures are logged and the rule skipped."""
+        conditions = row["conditions"]
+        try:
+            if isinstance(conditions, str):
+                conditions = json.loads(conditions)
+            rule = parse_tetse_rule(row["id"], row["name"], conditions)
+        except Exception as e:
+            rule = None
+            logger.error(f"Exception while parsing rule id={row['id']}: {str(e)}")
+        self.parsed_count += 1
+        if rule is None:
+            self.parse_failures += 1
+            logger.warning(f"FAILED to parse rule id={row['id']}, name={row['name']}, skipping")
+        return rule
+
+    def request_reload(self, rule_id: Optional[int] = None):
+        """
+        Schedule an incremental reload; notifications arriving during a reload
+        are coalesced into one more pass. Safe to call from a LISTEN callback.
+        """
+        self.reload_pending = True
+        if self.reload_task is None or self.reload_task.done():
+            self.reload_task = asyncio.create_task(self._reload_pending())
+
+    async def _reload_pending(self):
+        while self.reload_pending:
+            self.reload_pending = False
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.warning(f"TETSE rule reload failed, keeping previous rules: {str(e)}")
+
+    def get_stats(self) -> dict:
+        """
+        Get registry statistics.
+
+        Returns:
+            dict: Rule counts and reload counters
+        """
+        return {
+            'rules': len(self.rule_set),
+            'subjects': len(self.rule_set.by_subject),
+            'reloads': self.reload_count,
+            'failed_reloads': self.failed_count,
+            'parsed': self.parsed_count,
+            'parse_failures': self.parse_failures,
+            'last_reload_ms': round(self.last_reload_ms, 1)
+        }
+
+# Process-wide registry shared by the TETSE engine and the API routes
+tetse_rule_registry = TetseRuleRegistry()
@@ -1,9 +1,10 @@
 # Name: text.py
-# Version: 0.1.0
+# Version: 0.1.1
 # Created: 971201
-# Modified: 250502
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
+# Version 0.1.1 get_text_events_by_device pages textdata with a (d_ts, i_dat) keyset cursor and optional time bounds, bumped from 0.1.0
 # Description: Python script for ParcoRTLS backend
 # Location: /home/parcoadmin/parco_fastapi/app/routes
 # Role: Backend
@@ -15,13 +16,16 @@ routes/text.py
 Text data storage endpoints for ParcoRTLS FastAPI application.
 """
 
-from fastapi import APIRouter, HTTPException, Form
-from database.db import call_stored_procedure, DatabaseError
+from fastapi import APIRouter, HTTPException, Form, Query
+from database.db import call_stored_procedure, execute_raw_query, DatabaseError
 from models import TextEventRequest
 from datetime import datetime
+from typing import Optional
 import asyncio
 import logging
 
+from routes.pagination import PAGE_DEFAULT, PAGE_MAX, decode_cursor, next_id_cursor, page_response
+
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["text"])
 
@@ -52,12 +56,40 @@ async def log_text_event(device_id: str = Form(...), event_data: str = Form(...)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/get_text_events_by_device/{device_id}")
-async def get_text_events_by_device(device_id: str):
+async def get_text_events_by_device(
+    device_id: str,
+    limit: int = Query(PAGE_DEFAULT, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    # Newest first; same columns as usp_textdata_all_by_device
+    after = decode_cursor(cursor)
+    conditions = ["x_id_dev = $1"]
+    args: list = [device_id]
+    if start_date is not None:
+        args.append(start_date)
+        conditions.append(f"d_ts >= ${len(args)}")
+    if end_date is not None:
+        args.append(end_date)
+        conditions.append(f"d_ts <= ${len(args)}")
+    if after is not None:
+        args.extend(after)
+        conditions.append(f"(d_ts, i_dat) < (${len(args) - 1}, ${len(args)})")
+    args.append(limit + 1)
+    query = f"""
+        SELECT i_dat, x_id_dev, x_dat, d_ts, d_crt
+        FROM textdata
+        WHERE {' AND '.join(conditions)}
+        ORDER BY d_ts DESC, i_dat DESC
+        LIMIT ${len(args)}
+    """
     try:
         async with asyncio.timeout(30):
-            result = await call_stored_procedure("data", "usp_textdata_all_by_device", device_id)
-        if result and isinstance(result, list) and result:
-            return result
+            result = await execute_raw_query("data", query, *args)
+        if result or cursor:
+            next_cursor = next_id_cursor(result, limit, "d_ts", "i_dat")
+            return page_response(result, next_cursor)
         raise HTTPException(status_code=404, detail="No text events found for device")
     except asyncio.TimeoutError:
         logger.error("Timeout occurred while fetching text events for ParcoRTLSData")
@@ -1,10 +1,13 @@
 # /home/parcoadmin/parco_fastapi/app/routes/trigger.py
 # Name: trigger.py
-# Version: 0.1.70
+# Version: 0.1.73
 # Created: 971201
-# Modified: 250725
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin & Claude AI
+# Version 0.1.73 delete_trigger and move_trigger notify only the trigger's zone instead of every zone
+# Version 0.1.72 zones_by_point served from the in-memory zone geometry index and returns the zone bounding box
+# Version 0.1.71 Send trigger_changes NOTIFY after trigger add, move and delete so running managers reload the zone
 # Version 0.1.70 Fixed trigger coordinate precision by replacing raw trigger queries with stored procedure calls for 6 decimal place rounding on radius_ft, z_min, z_max
 # Version 0.1.69 Fixed coordinate precision by replacing raw vertex queries with stored procedure calls for 6 decimal place rounding
 # Version 0.1.68 Enhanced error messages for boundary violations with detailed coordinate information
@@ -34,12 +37,14 @@
 # Licensed under AGPL-3.0: https://www.gnu.org/licenses/agpl-3.0.en.html
 
 from fastapi import APIRouter, HTTPException, Form
-from database.db import call_stored_procedure, DatabaseError, execute_raw_query
+from database.db import call_stored_procedure, DatabaseError, execute_raw_query, notify_channel
 from config import MQTT_BROKER
 from models import TriggerAddRequest, TriggerMoveRequest
 from manager.region import Region3D, Region3DCollection
 from manager.portable_trigger import PortableTrigger
 from manager.enums import TriggerDirections
+from manager.trigger_loader import TRIGGER_CHANGE_CHANNEL
+from routes.zone import get_zone_index
 import paho.mqtt.publish as publish
 import logging
 
@@ -47,6 +52,28 @@ from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+TRIGGER_ZONE_QUERY = """
+    SELECT COALESCE(t.i_zn, r.i_zn) AS zone_id
+    FROM triggers t
+    LEFT JOIN regions r ON r.i_trg = t.i_trg
+    WHERE t.i_trg = $1
+    ORDER BY r.i_rgn
+    LIMIT 1
+"""
+
+async def notify_trigger_change(zone_id: int | None = None):
+    """Tell running managers to reload triggers for a zone (None = all zones)."""
+    await notify_channel("maint", TRIGGER_CHANGE_CHANNEL, str(zone_id) if zone_id is not None else "")
+
+async def get_trigger_zone_id(trigger_id: int) -> int | None:
+    """Zone of a trigger (trigger zone, else its region's zone); None when unknown."""
+    try:
+        rows = await execute_raw_query("maint", TRIGGER_ZONE_QUERY, trigger_id)
+    except Exception as e:
+        logger.warning(f"Could not look up zone of trigger {trigger_id}: {str(e)}")
+        return None
+    return rows[0]["zone_id"] if rows else None
+
 def load_description(endpoint_name: str) -> str:
     """Load endpoint description from external file"""
     try:
@@ -291,6 +318,7 @@ async def add_trigger(request: TriggerAddRequest):
 
             if not region_result:
                 logger.warning(f"Trigger {trigger_id} created, but no region was assigned.")
+                await notify_trigger_change(zone_id)
                 return {
                     "message": "Trigger added successfully, but no region was assigned",
                     "trigger_id": trigger_id
@@ -309,6 +337,7 @@ async def add_trigger(request: TriggerAddRequest):
             vertices_result = await call_stored_procedure("maint", "usp_zone_vertices_select_by_region", region_id)
             if not vertices_result or len(vertices_result) < 3:
                 logger.warning(f"Region {region_id} assigned to trigger {trigger_id}, but has insufficient vertices.")
+                await notify_trigger_change(zone_id)
                 return {
                     "message": "Trigger added successfully, but region lacks sufficient vertices",
                     "trigger_id": trigger_id,
@@ -323,6 +352,7 @@ async def add_trigger(request: TriggerAddRequest):
         else:
             message = base_message
 
+        await notify_trigger_change(zone_id)
         return {
             "message": message,
             "trigger_id": trigger_id,
@@ -355,6 +385,9 @@ async def add_trigger(request: TriggerAddRequest):
 )
 async def delete_trigger(trigger_id: int):
     try:
+        # The zone must be known before the trigger and its region are gone
+        zone_id = await get_trigger_zone_id(trigger_id)
+
         # Step 1: Find the region associated with the trigger
         find_region_query = """
             SELECT i_rgn FROM public.regions WHERE i_trg = $1
@@ -386,6 +419,7 @@ async def delete_trigger(trigger_id: int):
 
         # If result is TRUE, return success
         if result and result[0]["usp_trigger_delete"] is True:
+            await notify_trigger_change(zone_id)
             return {"message": f"Trigger {trigger_id} deleted successfully"}
 
         # If result is FALSE, trigger was not found
@@ -527,6 +561,7 @@ async def move_trigger(trigger_id: int, new_x: float, new_y: float, new_z: float
     try:
         result = await call_stored_procedure("maint", "usp_trigger_move", trigger_id, new_x, new_y, new_z)
         if result is None:
+            await notify_trigger_change(await get_trigger_zone_id(trigger_id))
             return {"message": f"Trigger {trigger_id} moved by ({new_x}, {new_y}, {new_z})"}
         raise HTTPException(status_code=500, detail="Failed to move trigger")
     except DatabaseError as e:
@@ -773,64 +808,22 @@ async def trigger_contains_point(trigger_id: int, x: float, y: float, z: float =
 )
 async def zones_by_point(x: float, y: float, z: float, zone_type: int = 0):
     try:
-        # Get all zones (with optional type filter)
-        zone_query = "SELECT i_zn, x_nm_zn FROM zones"
-        if zone_type > 0:
-            zone_query += " WHERE i_typ_zn = $1"
-            zones = await execute_raw_query("maint", zone_query, zone_type)
-        else:
-            zones = await execute_raw_query("maint", zone_query)
-        
+        # Zones whose vertex bounding box contains the point, from the in-memory zone index
+        index = await get_zone_index()
         result = []
-        for zone in zones:
-            zone_id = zone["i_zn"]
-            zone_name = zone["x_nm_zn"]
-            
-            try:
-                # Use the same dynamic bounding box logic as get_zone_bounding_box
-                bbox_query = """
-                    SELECT r.i_rgn
-                    FROM regions r
-                    WHERE r.i_zn = $1 AND r.i_trg IS NULL
-                """
-                region_result = await execute_raw_query("maint", bbox_query, zone_id)
-                if not region_result:
-                    continue  # Skip zones without regions
-                
-                region_id = region_result[0]["i_rgn"]
-                
-                # Use stored procedure for rounded coordinates
-                vertices = await call_stored_procedure("maint", "usp_zone_vertices_select_by_region", region_id)
-                if not vertices or len(vertices) < 3:
-                    continue  # Skip zones with insufficient vertices
-                
-                # Calculate dynamic bounding box from rounded coordinates
-                min_x = min(float(v["n_x"]) for v in vertices)
-                max_x = max(float(v["n_x"]) for v in vertices)
-                min_y = min(float(v["n_y"]) for v in vertices)
-                max_y = max(float(v["n_y"]) for v in vertices)
-                min_z = min(float(v["n_z"]) for v in vertices)
-                max_z = max(float(v["n_z"]) for v in vertices)
-                
-                # Check if point is within calculated bounding box
-                contains = (
-                    min_x <= x <= max_x and
-                    min_y <= y <= max_y and
-                    min_z <= z <= max_z
-                )
-                
-                # Only include zones that actually contain the point
-                if contains:
-                    result.append({
-                        "zone_id": zone_id,
-                        "zone_name": zone_name,
-                        "contains": True
-                    })
-                    
-            except Exception as zone_error:
-                # Skip zones with errors (missing regions, etc.)
-                logger.debug(f"Skipping zone {zone_id} due to error: {zone_error}")
-                continue
+        for zone in index.zones_containing_vertices(x, y, z, zone_type):
+            min_x, max_x, min_y, max_y, min_z, max_z = zone.vertex_box
+            result.append({
+                "zone_id": zone.zone_id,
+                "zone_name": zone.name,
+                "contains": True,
+                "n_min_x": min_x,
+                "n_max_x": max_x,
+                "n_min_y": min_y,
+                "n_max_y": max_y,
+                "n_min_z": min_z,
+                "n_max_z": max_z
+            })
         
         return result
         
@@ -1,9 +1,10 @@
 # Name: vertex.py
-# Version: 0.1.1
+# Version: 0.1.2
 # Created: 971201
-# Modified: 250502
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
+# Version 0.1.2 Invalidate the in-memory zone geometry index after vertex writes
 # Version 0.1.1 Converted to external descriptions using load_description()
 # Description: Python script for ParcoRTLS backend
 # Location: /home/parcoadmin/parco_fastapi/app/routes
@@ -39,6 +40,7 @@ and select, and raw queries for add/edit (edit updated to match Zone Viewer appr
 from fastapi import APIRouter, HTTPException, Form
 from database.db import call_stored_procedure, DatabaseError, execute_raw_query
 from typing import List
+from manager.zone_index import zone_index_cache
 import logging
 
 from pathlib import Path
@@ -74,6 +76,7 @@ async def delete_vertex(vertex_id: int):
 
         logger.debug(f"Calling usp_vertex_delete with vertex_id={vertex_id}")
         result = await call_stored_procedure("maint", "usp_vertex_delete", vertex_id)
+        zone_index_cache.invalidate()
         if result is None:  # Assuming usp_vertex_delete returns void on success
             logger.info(f"Vertex ID {vertex_id} deleted successfully")
             return {"message": "Vertex deleted successfully"}
@@ -123,6 +126,7 @@ async def edit_vertex(vertex_id: int = Form(...), region_id: int = Form(...), x:
             RETURNING i_vtx;
         """
         result = await execute_raw_query("maint", query, x, y, z, order, region_id, vertex_id)
+        zone_index_cache.invalidate()
         logger.debug(f"Update query result: {result}")
 
         if result and isinstance(result, list) and result:
@@ -200,6 +204,7 @@ async def add_vertex(region_id: int = Form(...), x: float = Form(...), y: float
             RETURNING i_vtx;
         """
         result = await execute_raw_query("maint", query, region_id, x, y, z, order)
+        zone_index_cache.invalidate()
         if result and isinstance(result, list) and result:
             logger.info(f"Added new vertex with vertex_id={result[0]['i_vtx']}")
             return {"message": "Vertex added successfully", "vertex_id": result[0]["i_vtx"]}
@@ -251,6 +256,7 @@ async def update_vertices(vertices: List[dict]):
                 updated_count += 1
                 logger.debug(f"Updated vertex_id={vertex_id}")
 
+        zone_index_cache.invalidate()
         if updated_count == len(vertices):
             logger.info(f"Successfully updated {updated_count} vertices")
             return {"message": "Vertices updated successfully"}
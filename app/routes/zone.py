@@ -1,9 +1,11 @@
 # Name: zone.py
-# Version: 0.1.8
+# Version: 0.1.10
 # Created: 971201
-# Modified: 250715
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin & Claude AI
+# Version 0.1.10 get_map served from the shared map image cache with ETag/Cache-Control
+# Version 0.1.9 get_best_zone_for_point answered from the shared in-memory zone geometry index
 # Version 0.1.8 Enhanced zone endpoints to return full hierarchy including campus context to prevent coordinate conflicts
 # Version 0.1.7 Added get_tag_current_zone and get_tag_last_known_zone convenience endpoints for tray tracking
 # Version 0.1.6 Added get_zone_by_id, list_zones, and zones_by_point endpoints
@@ -16,10 +18,12 @@
 
 """
 /home/parcoadmin/parco_fastapi/app/routes/zone.py
-Version: 0.1.8 (Enhanced with full hierarchy and campus context)
+Version: 0.1.10 (get_map served from the shared map image cache)
 Zone management endpoints for ParcoRTLS FastAPI application.
-# VERSION 250715 /home/parcoadmin/parco_fastapi/app/routes/zone.py 0.1.8
-# CHANGED: Enhanced zone endpoints to return full hierarchy including campus context to prevent coordinate conflicts; bumped to 0.1.8
+# VERSION 261018 /home/parcoadmin/parco_fastapi/app/routes/zone.py 0.1.10
+# CHANGED: get_map reads the image from the shared map image cache (one query for the zone's map instead of three) and answers If-None-Match with 304; bumped to 0.1.10
+# PREVIOUS: get_best_zone_for_point uses the shared in-memory zone geometry index instead of a query plus O(n^2) parent check; bumped to 0.1.9
+# PREVIOUS: Enhanced zone endpoints to return full hierarchy including campus context to prevent coordinate conflicts; bumped to 0.1.8
 # PREVIOUS: Added get_tag_current_zone and get_tag_last_known_zone convenience endpoints for tray tracking; bumped to 0.1.7
 # PREVIOUS: Added get_zone_by_id, list_zones, and zones_by_point endpoints for enhanced zone tracking; bumped to 0.1.6
 # PREVIOUS: Enhanced endpoint documentation for clarity and usability, version 0.1.5
@@ -36,12 +40,15 @@ Zone management endpoints for ParcoRTLS FastAPI application.
 
 """
 
-from fastapi import APIRouter, HTTPException, Response, Query
+from fastapi import APIRouter, HTTPException, Response, Query, Header
 from database.db import call_stored_procedure, DatabaseError, execute_raw_query
 from models import ZoneRequest
+from manager.zone_index import zone_index_cache, ZoneGeometryIndex
+from routes.map_image_cache import map_image_cache, conditional_response
 import json
 import logging
 from datetime import datetime, timedelta
+from typing import Optional
 
 from pathlib import Path
 
@@ -115,59 +122,33 @@ async def get_zone_hierarchy(zone_id: int) -> dict:
         logger.error(f"Error getting zone hierarchy for zone {zone_id}: {str(e)}")
         return {}
 
+async def _fetch_maint_rows(query: str) -> list:
+    return await execute_raw_query("maint", query)
+
+async def get_zone_index() -> ZoneGeometryIndex:
+    """Get the shared in-memory zone geometry index, rebuilding it when stale."""
+    return await zone_index_cache.get(_fetch_maint_rows)
+
 async def get_best_zone_for_point(x: float, y: float, z: float) -> dict:
     """
     Find the most specific zone containing a point and return with full hierarchy.
-    First gets all zones containing the point, then finds the most specific one.
+    Answered from the in-memory zone index: containing zones come from the grid,
+    the most specific one is a zone that is not the parent of another containing zone.
     """
     try:
-        # Step 1: Get ALL zones that contain this point
-        all_zones_query = """
-        SELECT DISTINCT z.i_zn, z.x_nm_zn, z.i_typ_zn, z.i_pnt_zn
-        FROM zones z
-        JOIN regions r ON z.i_zn = r.i_zn
-        JOIN vertices v ON r.i_rgn = v.i_rgn
-        WHERE r.n_min_x <= $1 AND r.n_max_x >= $1
-        AND r.n_min_y <= $2 AND r.n_max_y >= $2
-        AND r.n_min_z <= $3 AND r.n_max_z >= $3
-        GROUP BY z.i_zn, z.x_nm_zn, z.i_typ_zn, z.i_pnt_zn
-        ORDER BY z.i_zn;
-        """
-        
-        all_zones = await execute_raw_query("maint", all_zones_query, x, y, z)
+        index = await get_zone_index()
+        best_zone, all_zones = index.best_zone(x, y, z)
         
-        if not all_zones:
+        if best_zone is None:
             return {}
         
-        logger.info(f"Found {len(all_zones)} zones containing point ({x}, {y}, {z})")
-        for zone in all_zones:
-            logger.info(f"  - Zone {zone['i_zn']}: {zone['x_nm_zn']} (type {zone['i_typ_zn']}, parent: {zone['i_pnt_zn']})")
-        
-        # Step 2: Find the most specific zone (one that is NOT a parent of any other zone in the list)
-        zone_ids = [z['i_zn'] for z in all_zones]
-        
-        # Find zones that are NOT parents of other zones in our list
-        most_specific_zones = []
-        for zone in all_zones:
-            is_parent_of_others = any(other['i_pnt_zn'] == zone['i_zn'] for other in all_zones)
-            if not is_parent_of_others:
-                most_specific_zones.append(zone)
-        
-        if not most_specific_zones:
-            # Fallback: pick zone with highest zone_type
-            best_zone = max(all_zones, key=lambda z: z['i_typ_zn'])
-        else:
-            # Pick from most specific zones, prefer highest zone_type
-            best_zone = max(most_specific_zones, key=lambda z: z['i_typ_zn'])
-        
-        logger.info(f"Selected most specific zone: {best_zone['x_nm_zn']} (ID: {best_zone['i_zn']}, type: {best_zone['i_typ_zn']})")
-        
-        hierarchy = await get_zone_hierarchy(best_zone['i_zn'])
+        logger.debug(f"Found {len(all_zones)} zones containing point ({x}, {y}, {z}), "
+                     f"selected {best_zone.name} (ID: {best_zone.zone_id}, type: {best_zone.zone_type})")
         
         return {
-            "zone": best_zone,
-            "hierarchy": hierarchy,
-            "all_containing_zones": [dict(z) for z in all_zones]  # For debugging
+            "zone": best_zone.to_dict(),
+            "hierarchy": index.hierarchy(best_zone.zone_id),
+            "all_containing_zones": [zn.to_dict() for zn in all_zones]  # For debugging
         }
         
     except Exception as e:
@@ -778,7 +759,7 @@ async def get_children(parent_id: int):
     description=load_description("get_map"),
     tags=["zones"]
 )
-async def get_map(zone_id: int):
+async def get_map(zone_id: int, if_none_match: Optional[str] = Header(None)):
     try:
         # Get map ID from zone
         zone_query = "SELECT i_map FROM zones WHERE i_zn = $1;"
@@ -788,23 +769,19 @@ async def get_map(zone_id: int):
             raise HTTPException(status_code=404, detail=f"No zone found for zone_id={zone_id}")
         i_map = i_map[0]["i_map"]
 
-        # Get map image data
-        map_query = "SELECT img_data FROM maps WHERE i_map = $1;"
-        img_data_result = await execute_raw_query("maint", map_query, i_map)
-        if not img_data_result or not img_data_result[0]["img_data"]:
+        # Get map image data and format
+        image = await map_image_cache.get(i_map)
+        if image is None:
             logger.warning(f"No map found for map_id={i_map}")
             raise HTTPException(status_code=404, detail=f"No map found for map_id={i_map}")
-        img_data = img_data_result[0]["img_data"]
-
-        # Get map format
-        format_query = "SELECT x_format FROM maps WHERE i_map = $1;"
-        format_result = await execute_raw_query("maint", format_query, i_map)
-        file_format = format_result[0]["x_format"] if format_result and format_result[0]["x_format"] else "image/png"
+        file_format = image.x_format or "image/png"
 
         logger.info(f"Retrieved map for zone_id={zone_id}, map_id={i_map}")
-        return Response(
-            content=img_data,
-            media_type=file_format,
+        return conditional_response(
+            if_none_match,
+            image.etag,
+            image.data,
+            file_format,
             headers={"Content-Disposition": f"attachment; filename=map_zone_{zone_id}.{file_format.split('/')[-1]}"}
         )
     except HTTPException as e:
@@ -1,9 +1,13 @@
 # Name: zonebuilder_routes.py
-# Version: 0.1.2
+# Version: 0.1.6
 # Created: 971201
-# Modified: 250502
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin
+# Version 0.1.6 The TETSE zone hierarchy follows the zone index, so create_zone only invalidates the zone index
+# Version 0.1.5 get_map served from the shared map image cache with ETag/Cache-Control
+# Version 0.1.4 Invalidate the TETSE zone hierarchy cache after create_zone
+# Version 0.1.3 Invalidate the in-memory zone geometry index after create_zone
 # Version 0.1.2 Fixed Pylance syntax errors - null checks, image access, psycopg2 connection
 # Description: Python script for ParcoRTLS backend
 # Location: /home/parcoadmin/parco_fastapi/app/routes
@@ -26,12 +30,15 @@
 #
 # Licensed under AGPL-3.0: https://www.gnu.org/licenses/agpl-3.0.en.html
 
-from fastapi import APIRouter, Depends, HTTPException, Response, Form, Body
+from fastapi import APIRouter, Depends, HTTPException, Response, Form, Body, Header
 from database.db import execute_raw_query, get_async_db_pool
+from manager.zone_index import zone_index_cache
+from routes.map_image_cache import map_image_cache, conditional_response
 import logging
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from PIL import Image
+from typing import Optional
 import sys
 
 from pathlib import Path
@@ -388,6 +395,7 @@ async def create_zone(data: dict):
                 )
                 logger.info(f"✅ Inserted Vertex: {vertex}")
 
+        zone_index_cache.invalidate()
         return {"zone_id": zone_id, "message": "Zone created successfully"}
     except Exception as e:
         logger.error(f"Error creating zone: {e}")
@@ -399,17 +407,13 @@ async def create_zone(data: dict):
     description=load_description("get_map"),
     tags=["triggers"]
 )
-async def get_map(map_id: int):
+async def get_map(map_id: int, if_none_match: Optional[str] = Header(None)):
     try:
-        map_data = await execute_raw_query(
-            "maint",
-            "SELECT img_data, x_format FROM maps WHERE i_map = $1",
-            map_id
-        )
-        if not map_data:
+        image = await map_image_cache.get(map_id)
+        if image is None:
             raise HTTPException(status_code=404, detail=f"No map found for map_id={map_id}")
         logger.info(f"Fetched map image for map_id={map_id}")
-        return Response(content=map_data[0]["img_data"], media_type=f"image/{map_data[0]['x_format'].lower()}")
+        return conditional_response(if_none_match, image.etag, image.data, f"image/{image.x_format.lower()}")
     except Exception as e:
         logger.error(f"Error retrieving map {map_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving map: {str(e)}")
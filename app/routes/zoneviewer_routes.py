@@ -1,9 +1,12 @@
 # Name: zoneviewer_routes.py
-# Version: 0.1.2
+# Version: 0.1.5
 # Created: 971201
-# Modified: 250703
+# Modified: 261018
 # Creator: ParcoAdmin
 # Modified By: ParcoAdmin & AI Assistant
+# Version 0.1.5 The TETSE zone hierarchy follows the zone index, so delete_zone_recursive only invalidates the zone index, bumped from 0.1.4
+# Version 0.1.4 Invalidate the zone geometry index after update_vertices, delete_vertex and add_vertex, bumped from 0.1.3
+# Version 0.1.3 Invalidate the zone geometry index and TETSE zone hierarchy after delete_zone_recursive
 # Version 0.1.2 Updated to use centralized configuration instead of hardcoded IP addresses, bumped from 0.1.1
 # Version 0.1.1 Converted to external descriptions using load_description()
 # Description: Python script for ParcoRTLS backend - Updated to use centralized configuration
@@ -35,6 +38,7 @@ Zone Viewer & Editor endpoints for ParcoRTLS FastAPI application.
 from fastapi import APIRouter, HTTPException, Response
 from pydantic import BaseModel
 from database.db import execute_raw_query
+from manager.zone_index import zone_index_cache
 import logging
 from sqlalchemy import create_engine, text
 from contextlib import asynccontextmanager
@@ -381,6 +385,8 @@ async def update_vertices(vertices: list[dict]):
             )
             if result:
                 updated_count += 1
+        if updated_count:
+            zone_index_cache.invalidate()
         if updated_count == len(vertices):
             logger.info(f"Updated {updated_count} vertices successfully")
             return {"message": "Vertices updated successfully"}
@@ -407,6 +413,7 @@ async def delete_vertex(vertex_id: int):
         if not result:
             logger.warning(f"Vertex {vertex_id} not found")
             raise HTTPException(status_code=404, detail=f"Vertex {vertex_id} not found")
+        zone_index_cache.invalidate()
         logger.info(f"Deleted vertex {vertex_id}")
         return {"message": "Vertex deleted successfully", "vertex_id": vertex_id}
     except Exception as e:
@@ -460,6 +467,7 @@ async def add_vertex(request: AddVertexRequest):
             logger.error("Failed to add vertex: no rows inserted")
             raise HTTPException(status_code=500, detail="Failed to add vertex")
 
+        zone_index_cache.invalidate()
         new_vertex = result[0]
         new_vertex["zone_id"] = request.zone_id
         logger.info(f"Added vertex {new_vertex['vertex_id']} to zone_id={request.zone_id}")
@@ -519,6 +527,7 @@ async def delete_zone_recursive(zone_id: int):
                 {"zone_ids": tuple(zone_ids)}
             )
 
+        zone_index_cache.invalidate()
         logger.info(f"Successfully deleted zone {zone_id} and its {len(zone_ids)} progeny")
         return {"message": f"Deleted zone {zone_id} and its progeny successfully"}
     except Exception as e: